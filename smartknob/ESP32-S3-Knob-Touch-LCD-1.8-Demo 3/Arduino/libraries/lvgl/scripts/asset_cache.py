@@ -0,0 +1,99 @@
+'''
+Persistent content-hash cache for the asset converter scripts
+
+A conversion is skipped when the hash of its input bytes, the converter
+version and the settings match the previous run and the outputs still
+exist. The cache is a small JSON file:
+
+    cache = AssetCache(".sjpg_cache.json", "jpg_to_sjpg 2.0")
+    key = cache.key(input_bytes, settings_dict)
+    if not cache.hit(path, key, outputs):
+        ... convert, write the outputs with write_atomic() ...
+        cache.store(path, key, outputs)
+    cache.save()
+'''
+
+import contextlib
+import hashlib
+import json
+import os
+import stat
+import tempfile
+
+
+def _file_mode(path):
+    '''
+    Permissions for the new content of `path`: those of the file it replaces,
+    else what open() would give under the umask (mkstemp creates 0600 files).
+    '''
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+@contextlib.contextmanager
+def open_atomic(path, mode="wb"):
+    '''
+    Open a temporary file next to `path` for writing and rename it over `path`
+    when the block completes; on an exception the temporary file is removed.
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix="." + os.path.basename(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.chmod(tmp, _file_mode(path))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def write_atomic(path, data, mode="wb"):
+    '''Write `data` to a temporary file next to `path` and rename it over `path`.'''
+    with open_atomic(path, mode) as f:
+        f.write(data)
+
+
+class AssetCache:
+    def __init__(self, path, converter_version):
+        self.path = path
+        self.converter_version = converter_version
+        self.hits = 0
+        self.misses = 0
+        self.entries = {}
+        try:
+            with open(path, "r") as f:
+                content = json.load(f)
+            if content.get("converter") == converter_version:
+                self.entries = content.get("entries", {})
+        except (OSError, ValueError):
+            pass
+
+    def key(self, data, settings):
+        '''Hash of the input bytes, the converter version and the settings.'''
+        h = hashlib.sha256()
+        h.update(self.converter_version.encode("utf-8"))
+        h.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+        h.update(data)
+        return h.hexdigest()
+
+    def hit(self, name, key, outputs):
+        '''True if `name` was converted with `key` before and all `outputs` exist.'''
+        entry = self.entries.get(name)
+        if entry and entry["key"] == key and entry["outputs"] == sorted(outputs) and \
+                all(os.path.exists(o) for o in outputs):
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def store(self, name, key, outputs):
+        self.entries[name] = {"key": key, "outputs": sorted(outputs)}
+
+    def save(self):
+        content = {"converter": self.converter_version, "entries": self.entries}
+        write_atomic(self.path, json.dumps(content, indent=1, sort_keys=True), "w")
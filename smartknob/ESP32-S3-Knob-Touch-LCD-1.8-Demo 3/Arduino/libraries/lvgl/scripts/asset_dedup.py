@@ -0,0 +1,731 @@
+#!/usr/bin/env python3
+##################################################################
+# Find the generated C arrays (images, fonts, firmware blobs) and
+# raw files holding the same bytes, report the flash each group of
+# duplicates wastes and optionally make the copies share one symbol.
+# Dependencies: (PYTHON-3), numpy for the similar blob search
+#
+#   asset_dedup.py ../demos/music/assets ../examples/assets ../src/font
+#   asset_dedup.py --raw '../../../../ESP-IDF/**/firmware/*.fw' ../../../../ESP-IDF
+#   asset_dedup.py --json dups.json -D LV_COLOR_DEPTH=32 ../src/font
+#   asset_dedup.py --rewrite --dry-run ../src/font
+#
+# Every `<int type> name[] = { ... };` of the .c/.h files is parsed
+# (uint8_t/char, 16 and 32-bit arrays; struct arrays are skipped),
+# including the `#if LV_COLOR_DEPTH == ...` variants inside the
+# initializer. The bytes compared are the ones compiled with the
+# configuration of lv_conf.h and lvgl.h (see --conf and -D). A
+# group is "linked" when the guards around its arrays, e.g.
+# `#if LV_FONT_MONTSERRAT_14`, are true in that configuration.
+#
+# Similar blobs are found by content-defined chunking: a chunk ends
+# where a hash of the last 8 bytes has its top bits clear, so equal
+# runs of bytes give equal chunks wherever they start. Pairs sharing
+# at least --near of the smaller blob are reported.
+#
+# --rewrite keeps one array of a group (made global if it was
+# static) and turns the others into extern declarations of it. A
+# group is rewritten only when its arrays are const, in .c files,
+# have the same type, are equal in every #if variant and aren't
+# used by other files (searched in --ref-dir, by default the common
+# directory of the inputs). The kept definition moves to the end of
+# its file under the OR of the guards of all the copies, so it is
+# compiled whenever one of them is; the macros of those guards must
+# be visible there (lv_conf.h settings are).
+##################################################################
+import argparse, array, ast, glob, hashlib, json, os, re, sys
+from concurrent.futures import ProcessPoolExecutor
+
+from asset_cache import open_atomic
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CONF = [os.path.join(SCRIPT_DIR, "..", "..", "lv_conf.h"), os.path.join(SCRIPT_DIR, "..", "lvgl.h")]
+SOURCE_EXTENSIONS = (".c", ".h")
+REF_EXTENSIONS = (".c", ".h", ".cpp", ".hpp", ".cc", ".ino")
+
+DEFAULT_MIN_SIZE = 64
+DEFAULT_NEAR = 0.5
+# Chunks: a cut where the top CHUNK_BITS of the window hash are 0, at least CHUNK_MIN bytes apart
+CHUNK_WINDOW = 8
+CHUNK_BITS = 6
+CHUNK_MIN = 32
+# Chunks found in more blobs than this are common patterns, not a sign of shared content
+CHUNK_MAX_BLOBS = 16
+
+ELEMENT_SIZES = {"char": 1, "int8_t": 1, "uint8_t": 1, "int16_t": 2, "uint16_t": 2, "int32_t": 4, "uint32_t": 4}
+
+_ATTR = r"(?:LV_ATTRIBUTE_\w+|__attribute__\s*\(\(.*?\)\))"
+ARRAY_RE = re.compile(r"\s*(?P<decl>(?:(?:static|const|volatile|%s)\s+)*"
+                      r"(?P<type>(?:(?:un)?signed\s+)?char|u?int(?:8|16|32)_t)\s+(?:(?:const|%s)\s+)*)"
+                      r"(?P<name>[A-Za-z_]\w*)\s*\[[^\]]*\]\s*(?:%s\s*)*=\s*\{" % (_ATTR, _ATTR, _ATTR))
+DIRECTIVE_RE = re.compile(r"\s*#\s*(\w+)\s*(.*?)\s*$")
+DEFINE_RE = re.compile(r"([A-Za-z_]\w*)(?!\()\s*(.*)$")
+_COMMENT_RE = re.compile(r"/\*.*?\*/|//.*|\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*'")
+_DEFINED_RE = re.compile(r"\bdefined\s*(?:\(\s*(\w+)\s*\)|(\w+))")
+_VERSION_CHECK_RE = re.compile(r"\bLV_VERSION_CHECK\s*\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*\)")
+_TOKEN_RE = re.compile(r"\s*(?:(?P<num>0[xX][0-9a-fA-F]+|\d+)[uUlL]*|(?P<id>[A-Za-z_]\w*)|"
+                       r"(?P<op>&&|\|\||==|!=|<=|>=|<<|>>|[-+*/%()<>!~&|^]))")
+_OPERATORS = {"&&": " and ", "||": " or ", "!": " not ", "/": "//"}
+_ALLOWED_NODES = (ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+                  ast.Invert, ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.FloorDiv, ast.Mod, ast.LShift,
+                  ast.RShift, ast.BitAnd, ast.BitOr, ast.BitXor, ast.Compare, ast.Eq, ast.NotEq, ast.Lt,
+                  ast.LtE, ast.Gt, ast.GtE, ast.Constant)
+
+
+def evaluate(expr, defines, depth=0):
+    '''Value of a preprocessor condition with `defines` (name: text), ValueError if it can't be evaluated.'''
+    if depth > 16:
+        raise ValueError("recursive macro in '%s'" % expr)
+    expr = _DEFINED_RE.sub(lambda m: "1" if (m.group(1) or m.group(2)) in defines else "0", expr)
+
+    def version_check(m):
+        try:
+            current = tuple(evaluate(defines["LVGL_VERSION_" + part], defines, depth + 1)
+                            for part in ("MAJOR", "MINOR", "PATCH"))
+        except KeyError:
+            raise ValueError("LV_VERSION_CHECK needs LVGL_VERSION_MAJOR/MINOR/PATCH")
+        x, y, z = (int(g) for g in m.groups())
+        return "1" if current[0] == x and current[1:] >= (y, z) else "0"
+    expr = _VERSION_CHECK_RE.sub(version_check, expr)
+
+    out = []
+    pos = 0
+    while pos < len(expr):
+        m = _TOKEN_RE.match(expr, pos)
+        if not m:
+            if expr[pos:].strip():
+                raise ValueError("can't evaluate '%s'" % expr)
+            break
+        pos = m.end()
+        if m.group("num"):
+            num = m.group("num")
+            octal = len(num) > 1 and num[0] == "0" and num[1] not in "xX"
+            out.append(str(int(num, 8) if octal else int(num, 0)))
+        elif m.group("id"):
+            name = m.group("id")
+            if expr[pos:].lstrip().startswith("("):
+                raise ValueError("function-like macro %s in '%s'" % (name, expr))
+            value = defines.get(name)
+            out.append(str(evaluate(value, defines, depth + 1)) if value else "0")
+        else:
+            out.append(_OPERATORS.get(m.group("op"), m.group("op")))
+    try:
+        tree = ast.parse("".join(out).strip(), mode="eval")
+        if not all(isinstance(node, _ALLOWED_NODES) for node in ast.walk(tree)):
+            raise ValueError
+        return int(eval(compile(tree, "<condition>", "eval"), {"__builtins__": {}}))
+    except (SyntaxError, ValueError, ZeroDivisionError):
+        raise ValueError("can't evaluate '%s'" % expr)
+
+
+def holds(conditions, defines):
+    return all(evaluate(c, defines) for c in conditions)
+
+
+def code_lines(lines):
+    '''
+    Yield (index, code) of every line with the comments removed, strings kept.
+    A line continued with a backslash is joined to the next ones, which yield "".
+    '''
+    in_comment = False
+    pending = None
+    for i, line in enumerate(lines):
+        if in_comment:
+            end = line.find("*/")
+            if end < 0:
+                yield i, ""
+                continue
+            line = " " + line[end + 2:]
+            in_comment = False
+        if "/" in line or '"' in line or "'" in line:
+            line = _COMMENT_RE.sub(lambda m: " " if m.group().startswith("/") else m.group(), line)
+            start = line.find("/*")
+            if start >= 0:
+                line = line[:start]
+                in_comment = True
+        if pending is not None:
+            yield i, ""
+            line = pending[1] + " " + line
+            i = pending[0]
+            pending = None
+        if line.rstrip().endswith("\\"):
+            pending = (i, line.rstrip()[:-1])
+            continue
+        yield i, line
+    if pending is not None:
+        yield pending
+
+
+class Frames:
+    '''Stack of the enclosing #if/#elif/#else blocks, as conditions that all hold.'''
+
+    def __init__(self):
+        self.stack = []
+
+    def directive(self, keyword, arg):
+        '''Apply a conditional directive, return False for the other directives.'''
+        if keyword in ("if", "ifdef", "ifndef"):
+            cond = {"if": arg, "ifdef": "defined(%s)" % arg, "ifndef": "!defined(%s)" % arg}[keyword]
+            self.stack.append([[], cond])
+        elif keyword == "elif" and self.stack:
+            self.stack[-1][0].append(self.stack[-1][1])
+            self.stack[-1][1] = arg
+        elif keyword == "else" and self.stack:
+            self.stack[-1][0].append(self.stack[-1][1])
+            self.stack[-1][1] = None
+        elif keyword == "endif":
+            if self.stack:
+                self.stack.pop()
+        else:
+            return keyword in ("elif", "else")
+        return True
+
+    def conditions(self):
+        conds = []
+        for prior, current in self.stack:
+            conds += ["!(%s)" % c for c in prior]
+            if current is not None:
+                conds.append(current)
+        return tuple(conds)
+
+
+def load_config(path, defines):
+    '''Add the #defines of a header active with `defines` (like lv_conf.h, following its #if).'''
+    with open(path, encoding="utf-8", errors="replace") as f:
+        lines = f.read().splitlines()
+    stack = []  # [enclosing block active, a branch was taken, this branch active]
+
+    def test(cond):
+        try:
+            return evaluate(cond, defines) != 0
+        except ValueError:
+            return False
+
+    for _, code in code_lines(lines):
+        m = DIRECTIVE_RE.match(code)
+        if not m:
+            continue
+        keyword, arg = m.groups()
+        active = stack[-1][2] if stack else True
+        if keyword in ("if", "ifdef", "ifndef"):
+            value = active and {"if": lambda: test(arg), "ifdef": lambda: arg in defines,
+                                "ifndef": lambda: arg not in defines}[keyword]()
+            stack.append([active, value, value])
+        elif keyword == "elif" and stack:
+            stack[-1][2] = stack[-1][0] and not stack[-1][1] and test(arg)
+            stack[-1][1] = stack[-1][1] or stack[-1][2]
+        elif keyword == "else" and stack:
+            stack[-1][2] = stack[-1][0] and not stack[-1][1]
+            stack[-1][1] = True
+        elif keyword == "endif":
+            if stack:
+                stack.pop()
+        elif active and keyword == "define":
+            d = DEFINE_RE.match(arg)
+            if d:
+                defines[d.group(1)] = d.group(2).strip()
+        elif active and keyword == "undef":
+            defines.pop(arg, None)
+    return defines
+
+
+def _parse_int(token):
+    '''Value of a C integer or character literal.'''
+    token = token.strip()
+    sign = -1 if token.startswith("-") else 1
+    token = token.lstrip("+-").strip().rstrip("uUlL")
+    if len(token) >= 3 and token[0] == token[-1] == "'":
+        body = token[1:-1].encode().decode("unicode_escape")
+        if len(body) != 1:
+            raise ValueError("unsupported character literal %s" % token)
+        return sign * ord(body)
+    if len(token) > 1 and token[0] == "0" and token[1] not in "xX":
+        return sign * int(token, 8)
+    return sign * int(token, 0)
+
+
+def to_bytes(text, elem_size):
+    '''Bytes of the comma separated values of an initializer, little endian like the ESP32.'''
+    items = text.replace(",", " ").split()
+    try:
+        values = [int(t, 0) for t in items]
+    except ValueError:
+        values = [_parse_int(t) for t in re.split(r"\s*,\s*", text.strip().rstrip(",")) if t]
+    if elem_size == 1:
+        return bytes(v & 0xFF for v in values)
+    mask = (1 << 8 * elem_size) - 1
+    typecode = next(t for t in "HILQ" if array.array(t).itemsize == elem_size)
+    data = array.array(typecode, [v & mask for v in values])
+    if sys.byteorder == "big":
+        data.byteswap()
+    return data.tobytes()
+
+
+class CArray:
+    '''An integer array definition of a source file, with its #if variants.'''
+
+    def __init__(self, path, name, ctype, decl, start):
+        self.path = path
+        self.name = name
+        self.ctype = ctype
+        self.decl = decl
+        self.elem_size = ELEMENT_SIZES[ctype.split()[-1]]
+        self.static = re.search(r"\bstatic\b", decl) is not None
+        self.const = re.search(r"\bconst\b", decl) is not None
+        self.start = start
+        self.end = start
+        self.guard = ()
+        self.segments = []  # (conditions, bytes) in the order of the initializer
+
+    @property
+    def has_variants(self):
+        return any(conds for conds, _ in self.segments)
+
+    def content(self, defines):
+        return b"".join(data for conds, data in self.segments if holds(conds, defines))
+
+    def variant_key(self):
+        '''Hash of every variant, equal for arrays that are equal whatever the configuration.'''
+        h = hashlib.sha256()
+        for conds, data in self.segments:
+            h.update(repr(conds).encode())
+            h.update(hashlib.sha256(data).digest())
+        return h.hexdigest()
+
+
+def scan_file(path):
+    '''Return (arrays, local #defines as (line, conditions, name, value)) of a source file.'''
+    with open(path, encoding="utf-8", errors="replace") as f:
+        lines = f.read().splitlines()
+    arrays = []
+    local_defines = []
+    frames = Frames()
+    current = None
+    inner = None
+    texts = None
+
+    def finish():
+        try:
+            current.segments = [(conds, to_bytes(" ".join(parts), current.elem_size)) for conds, parts in texts]
+            arrays.append(current)
+        except ValueError:
+            pass  # string initializers or macros in the values
+
+    for i, code in code_lines(lines):
+        if current is not None:
+            m = DIRECTIVE_RE.match(code)
+            if m:
+                inner.directive(m.group(1), m.group(2))
+                texts.append((inner.conditions(), []))
+                continue
+            end = code.find("}")
+            texts[-1][1].append(code if end < 0 else code[:end])
+            if end >= 0:
+                current.end = i
+                finish()
+                current = None
+            continue
+
+        m = DIRECTIVE_RE.match(code)
+        if m:
+            if not frames.directive(m.group(1), m.group(2)) and m.group(1) == "define":
+                d = DEFINE_RE.match(m.group(2))
+                if d:
+                    local_defines.append((i, frames.conditions(), d.group(1), d.group(2).strip()))
+            continue
+        m = ARRAY_RE.match(code)
+        if not m:
+            continue
+        current = CArray(path, m.group("name"), " ".join(m.group("type").split()), m.group("decl"), i)
+        current.guard = frames.conditions()
+        inner = Frames()
+        rest = code[m.end():]
+        texts = [((), [rest if "}" not in rest else rest[:rest.find("}")]])]
+        if "}" in rest:
+            finish()
+            current = None
+    return arrays, local_defines
+
+
+def file_defines(local_defines, defines, line):
+    '''`defines` plus the #defines of a file before `line` active with them, e.g. `#ifndef X #define X 1`.'''
+    defines = dict(defines)
+    for i, conds, name, value in local_defines:
+        if i >= line:
+            break
+        try:
+            if holds(conds, defines):
+                defines[name] = value
+        except ValueError:
+            pass
+    return defines
+
+
+def expand_inputs(patterns, extensions):
+    '''Files of the patterns, directories searched recursively for `extensions`.'''
+    files = []
+    for pattern in patterns:
+        paths = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        for path in paths:
+            if os.path.isdir(path):
+                for root, dirs, names in os.walk(path):
+                    dirs.sort()
+                    files += [os.path.join(root, n) for n in sorted(names) if n.endswith(extensions)]
+            elif os.path.isfile(path) or not glob.has_magic(pattern):
+                files.append(path)
+    return list(dict.fromkeys(os.path.normpath(f) for f in files))
+
+
+class Blob:
+    '''Bytes compared: an array in the configuration, or a whole raw file.'''
+
+    def __init__(self, data, path, array=None, linked=True):
+        self.data = data
+        self.path = path
+        self.array = array
+        self.linked = linked
+
+    @property
+    def label(self):
+        path = os.path.relpath(self.path)
+        return "%s:%s" % (path, self.array.name) if self.array else path
+
+
+def exact_groups(blobs, min_size):
+    '''Groups of 2+ blobs with the same bytes, the largest waste first.'''
+    by_hash = {}
+    for blob in blobs:
+        if len(blob.data) >= min_size:
+            by_hash.setdefault(hashlib.sha256(blob.data).hexdigest(), []).append(blob)
+    groups = [{"sha256": key, "size": len(members[0].data), "blobs": members}
+              for key, members in by_hash.items() if len(members) > 1]
+    for group in groups:
+        group["saved"] = (len(group["blobs"]) - 1) * group["size"]
+        linked = sum(b.linked for b in group["blobs"])
+        group["saved_linked"] = max(0, linked - 1) * group["size"]
+    groups.sort(key=lambda g: (-g["saved"], g["blobs"][0].label))
+    return groups
+
+
+def chunk_hashes(data, np):
+    '''Return {chunk hash: (size, count)} of the content-defined chunks of `data`.'''
+    a = np.frombuffer(data, np.uint8)
+    n = len(a) - CHUNK_WINDOW + 1
+    cuts = []
+    if n > 0:
+        key = np.zeros(n, np.uint64)
+        for i in range(CHUNK_WINDOW):
+            key |= a[i:i + n].astype(np.uint64) << np.uint64(8 * i)
+        key *= np.uint64(0x9E3779B97F4A7C15)
+        cuts = (np.flatnonzero((key >> np.uint64(64 - CHUNK_BITS)) == 0) + CHUNK_WINDOW).tolist()
+    chunks = {}
+    start = 0
+    for cut in cuts + [len(data)]:
+        if cut - start < CHUNK_MIN and cut != len(data):
+            continue
+        chunk = data[start:cut]
+        start = cut
+        if len(chunk) < CHUNK_MIN or chunk.count(chunk[:1]) == len(chunk):
+            continue  # tails and runs of one byte value are in everything
+        digest = hashlib.blake2b(chunk, digest_size=8).digest()
+        size, count = chunks.get(digest, (len(chunk), 0))
+        chunks[digest] = (size, count + 1)
+    return chunks
+
+
+def similar_pairs(blobs, threshold, min_size, np):
+    '''Pairs of different blobs sharing at least `threshold` of the smaller one, most shared bytes first.'''
+    unique = {}
+    for blob in blobs:
+        if len(blob.data) >= min_size:
+            unique.setdefault(hashlib.sha256(blob.data).digest(), blob)
+    blobs = list(unique.values())
+    index = {}
+    for i, blob in enumerate(blobs):
+        for digest, (size, count) in chunk_hashes(blob.data, np).items():
+            index.setdefault(digest, []).append((i, size, count))
+    shared = {}
+    for entries in index.values():
+        if len(entries) < 2 or len(entries) > CHUNK_MAX_BLOBS:
+            continue
+        for x, (i, size, count_i) in enumerate(entries):
+            for j, _, count_j in entries[x + 1:]:
+                shared[i, j] = shared.get((i, j), 0) + size * min(count_i, count_j)
+    pairs = []
+    for (i, j), common in shared.items():
+        smaller = min(len(blobs[i].data), len(blobs[j].data))
+        if common >= threshold * smaller:
+            pairs.append({"a": blobs[i], "b": blobs[j], "shared": common, "ratio": common / smaller})
+    pairs.sort(key=lambda p: (-p["shared"], p["a"].label, p["b"].label))
+    return pairs
+
+
+def external_references(arrays, ref_files):
+    '''Return {array: [other files using its name]} for the global arrays.'''
+    found = {}
+    names = {}
+    for arr in arrays:
+        if not arr.static:
+            names.setdefault(arr.name, []).append(arr)
+    for path in ref_files:
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                text = f.read()
+        except OSError:
+            continue
+        for name, owners in names.items():
+            if name in text and re.search(r"\b%s\b" % re.escape(name), text):
+                for arr in owners:
+                    if not os.path.samefile(path, arr.path):
+                        found.setdefault(arr, []).append(path)
+    return found
+
+
+def rewrite_problem(group, refs):
+    '''Why a group can't share one symbol, None if it can.'''
+    arrays = [b.array for b in group["blobs"]]
+    if any(a is None for a in arrays):
+        return "raw files"
+    first = arrays[0]
+    for arr in arrays:
+        if not arr.path.endswith(".c"):
+            return "%s is a header" % os.path.relpath(arr.path)
+        if not arr.const:
+            return "%s isn't const" % arr.name
+        if arr.ctype != first.ctype:
+            return "different types"
+        if arr.variant_key() != first.variant_key():
+            return "different in other configurations"
+        if arr in refs:
+            return "%s used in %s" % (arr.name, os.path.relpath(refs[arr][0]))
+    if len({(os.path.abspath(a.path), a.name) for a in arrays}) != len(arrays):
+        return "same array found twice"
+    return None
+
+
+def _guard_text(arr):
+    return " && ".join("(%s)" % c for c in arr.guard) if arr.guard else "1"
+
+
+def plan_rewrite(groups):
+    '''Return {path: edits} making every rewritable group use the array of one file.'''
+    edits = {}
+    symbols = set()
+
+    def file_edits(path):
+        return edits.setdefault(path, {"replace": {}, "rename": {}, "append": []})
+
+    for group in groups:
+        if group.get("problem"):
+            continue
+        arrays = sorted((b.array for b in group["blobs"]), key=lambda a: (a.static, a.path, a.name))
+        keep = arrays[0]
+        shared = keep.name
+        if keep.static:
+            stem = re.sub(r"\W", "_", os.path.splitext(os.path.basename(keep.path))[0])
+            shared = "%s_%s" % (stem, keep.name)
+            while shared in symbols:
+                shared += "_"
+        symbols.add(shared)
+        group["symbol"] = shared
+        count = "[]" if keep.has_variants else "[%d]" % (len(group["blobs"][0].data) // keep.elem_size)
+        extern = "extern const %s %s%s;" % (keep.ctype, shared, count)
+
+        with open(keep.path, encoding="utf-8", errors="replace") as f:
+            lines = f.read().splitlines()
+        definition = lines[keep.start:keep.end + 1]
+        definition[0] = re.sub(r"\bstatic\s+", "", definition[0], count=1)
+        definition[0] = re.sub(r"\b%s(\s*\[)" % re.escape(keep.name), shared + r"\1", definition[0], count=1)
+        copies = arrays[1:]
+        block = ["", "/* Also the content of these arrays, merged by asset_dedup.py:"]
+        block += [" * %s:%s" % (os.path.relpath(a.path, os.path.dirname(keep.path)), a.name) for a in copies]
+        block.append(" */")
+        for attr in dict.fromkeys(re.findall(r"\bLV_ATTRIBUTE_\w+", keep.decl)):
+            block += ["#ifndef %s" % attr, "#define %s" % attr, "#endif"]
+        guards = list(dict.fromkeys(_guard_text(a) for a in arrays))
+        conditional = "1" not in guards
+        if conditional:
+            block.append("#if " + " || \\\n    ".join(guards))
+        block += definition
+        if conditional:
+            block.append("#endif")
+        e = file_edits(keep.path)
+        e["replace"][keep.start] = (keep.end, [extern + " /* defined at the end of the file */"])
+        if shared != keep.name:
+            e["rename"][keep.name] = shared
+        e["append"] += block
+
+        for arr in copies:
+            where = os.path.relpath(keep.path, os.path.dirname(arr.path))
+            e = file_edits(arr.path)
+            e["replace"][arr.start] = (arr.end, ["/* %s: the same bytes as %s of %s, merged by asset_dedup.py */"
+                                                 % (arr.name, keep.name, where), extern])
+            if shared != arr.name:
+                e["rename"][arr.name] = shared
+    return edits
+
+
+def apply_edits(path, e):
+    '''Return the new text of a file.'''
+    with open(path, encoding="utf-8", errors="replace", newline="") as f:
+        text = f.read()
+    newline = "\r\n" if "\r\n" in text else "\n"
+    lines = text.splitlines()
+    rename = None
+    if e["rename"]:
+        names = "|".join(re.escape(n) for n in e["rename"])
+        pattern = re.compile(r"(?<![.\w])(?<!->)\b(%s)\b" % names)
+        rename = lambda line: pattern.sub(lambda m: e["rename"][m.group(1)], line)
+    out = []
+    i = 0
+    while i < len(lines):
+        if i in e["replace"]:
+            end, new = e["replace"][i]
+            out += new
+            i = end + 1
+            continue
+        out.append(rename(lines[i]) if rename else lines[i])
+        i += 1
+    out += e["append"]
+    return newline.join(out) + newline
+
+
+def _size(n):
+    return "%.1f KB" % (n / 1024) if n >= 1024 else "%d B" % n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the generated C arrays and raw files holding the same "
+                                                 "bytes, optionally make the copies share one symbol")
+    parser.add_argument('input', nargs='*', help='Source files, directories or glob patterns (.c and .h)')
+    parser.add_argument('--raw', action='append', default=[], metavar='pattern',
+                        help='Binary files compared whole (.bin, .fw, ...), can be repeated')
+    parser.add_argument('--conf', action='append', metavar='file.h',
+                        help='Headers with the configuration (default: lv_conf.h and lvgl.h)')
+    parser.add_argument('-D', dest='define', action='append', default=[], metavar='NAME[=VALUE]',
+                        help='Set a macro, after the --conf headers')
+    parser.add_argument('--min-size', type=int, default=DEFAULT_MIN_SIZE, metavar='N',
+                        help='Ignore blobs smaller than N bytes (default: %(default)s)')
+    parser.add_argument('--near', type=float, default=DEFAULT_NEAR, metavar='RATIO',
+                        help='Report blobs sharing this part of the smaller one, 0: off (default: %(default)s)')
+    parser.add_argument('--top', type=int, default=20, metavar='N', help='Groups and pairs listed (default: 20)')
+    parser.add_argument('--json', metavar='file', help='Write the full report as JSON ("-": stdout)')
+    parser.add_argument('--rewrite', action='store_true', help='Make the duplicate arrays share one symbol')
+    parser.add_argument('--dry-run', action='store_true', help='With --rewrite, only list the files changed')
+    parser.add_argument('--ref-dir', action='append', metavar='dir',
+                        help='Where to look for uses of the global arrays (default: common directory of the inputs)')
+    parser.add_argument('-j', '--jobs', type=int, metavar='N', help='Parallel parsing (default: CPU count)')
+    args = parser.parse_intermixed_args()
+
+    sources = expand_inputs(args.input, SOURCE_EXTENSIONS)
+    raws = expand_inputs(args.raw, ())
+    if not sources and not raws:
+        parser.error("no input file")
+
+    defines = {}
+    for conf in args.conf or [c for c in DEFAULT_CONF if os.path.exists(c)]:
+        try:
+            load_config(conf, defines)
+        except OSError as e:
+            parser.error(str(e))
+    for d in args.define:
+        name, _, value = d.partition("=")
+        defines[name] = value or "1"
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        scanned = list(pool.map(scan_file, sources, chunksize=4))
+
+    blobs = []
+    arrays = []
+    skipped = []
+    for path, (file_arrays, local_defines) in zip(sources, scanned):
+        for arr in file_arrays:
+            try:
+                data = arr.content(defines)
+                linked = holds(arr.guard, file_defines(local_defines, defines, arr.start))
+            except ValueError as e:
+                skipped.append("%s:%s: %s" % (os.path.relpath(path), arr.name, e))
+                continue
+            arrays.append(arr)
+            blobs.append(Blob(data, path, arr, linked))
+    for path in raws:
+        with open(path, "rb") as f:
+            blobs.append(Blob(f.read(), path))
+
+    groups = exact_groups(blobs, args.min_size)
+    pairs = []
+    if args.near > 0:
+        try:
+            import numpy
+        except ImportError:
+            print("numpy isn't installed, no search for similar blobs", file=sys.stderr)
+        else:
+            pairs = similar_pairs(blobs, args.near, args.min_size, numpy)
+
+    if args.rewrite:
+        candidates = [b.array for g in groups for b in g["blobs"] if b.array]
+        ref_dirs = args.ref_dir
+        if not ref_dirs and sources:
+            ref_dirs = [os.path.commonpath([os.path.abspath(os.path.dirname(p)) for p in sources])]
+        refs = external_references(candidates, expand_inputs(ref_dirs, REF_EXTENSIONS))
+        for group in groups:
+            group["problem"] = rewrite_problem(group, refs)
+
+    total = sum(len(b.data) for b in blobs)
+    print("%d arrays in %d files and %d raw files: %s" % (len(arrays), len(sources), len(raws), _size(total)))
+    print("%d groups of identical blobs, %s duplicated (%s in linked arrays)" %
+          (len(groups), _size(sum(g["saved"] for g in groups)), _size(sum(g["saved_linked"] for g in groups))))
+    for n, group in enumerate(groups[:args.top], 1):
+        note = ""
+        if "problem" in group:
+            note = ", kept: %s" % group["problem"] if group["problem"] else ", merged"
+        print("\n  #%d  %d x %s, saves %s (%s linked)%s" % (n, len(group["blobs"]), _size(group["size"]),
+                                                           _size(group["saved"]), _size(group["saved_linked"]), note))
+        for blob in group["blobs"]:
+            print("      %s%s" % (blob.label, "" if blob.linked else "  (not linked)"))
+    if len(groups) > args.top:
+        print("\n  ... %d more groups" % (len(groups) - args.top))
+    if args.near > 0 and pairs:
+        print("\n%d pairs of similar blobs (common chunks >= %d%% of the smaller one)" % (len(pairs), args.near * 100))
+        for pair in pairs[:args.top]:
+            print("  %s in common (%d%%)\n      %s (%s)\n      %s (%s)" %
+                  (_size(pair["shared"]), pair["ratio"] * 100, pair["a"].label, _size(len(pair["a"].data)),
+                   pair["b"].label, _size(len(pair["b"].data))))
+    for line in skipped:
+        print("skipped %s" % line, file=sys.stderr)
+
+    if args.rewrite:
+        edits = plan_rewrite(groups)
+        merged = [g for g in groups if g.get("symbol")]
+        for path in sorted(edits):
+            if args.dry_run:
+                print("would rewrite %s" % os.path.relpath(path))
+            else:
+                text = apply_edits(path, edits[path])
+                with open_atomic(path, "w") as out:
+                    out.write(text)
+        print("%s %d groups in %d files, %s saved" % ("Would merge" if args.dry_run else "Merged", len(merged),
+                                                     len(edits), _size(sum(g["saved"] for g in merged))))
+
+    if args.json:
+        def member(blob):
+            return {"path": blob.path, "name": blob.array.name if blob.array else None, "linked": blob.linked}
+        report = {
+            "bytes": total,
+            "groups": [{"sha256": g["sha256"], "size": g["size"], "saved": g["saved"],
+                        "saved_linked": g["saved_linked"], "rewrite": g.get("problem", "not requested") or "merged",
+                        "symbol": g.get("symbol"), "members": [member(b) for b in g["blobs"]]} for g in groups],
+            "similar": [{"a": member(p["a"]), "b": member(p["b"]), "shared": p["shared"],
+                         "ratio": round(p["ratio"], 4)} for p in pairs],
+            "skipped": skipped,
+        }
+        if args.json == "-":
+            json.dump(report, sys.stdout, indent=1)
+            print()
+        else:
+            with open_atomic(args.json, "w") as out:
+                json.dump(report, out, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+'''
+Packed asset archive for LVGL ("LVPK")
+
+Bundles images, fonts, SJPG files and audio into one file read through lv_fs
+by the asset_pack component of ESP-IDF/08_LVGL_Test, from a flash partition
+(memory mapped: members are read in place, images can be drawn from flash
+without a copy) or from a file on the SD card. Updating the assets then means
+writing the archive, not relinking and flashing the app:
+
+    python3 asset_pack.py -o assets.lvpk icons/ fonts/ wallpaper.jpg music.pcm=canon.pcm
+    python3 asset_pack.py list assets.lvpk
+    python3 asset_pack.py get assets.lvpk icons/play.bin -o play.bin
+    parttool.py write_partition --partition-name assets --input assets.lvpk
+
+The inputs are converted by extension:
+    .png .bmp .gif      LVGL v8 image file (.bin) made by img_conv.py, true
+                        color, or true color with alpha when the image has
+                        transparency, in the color format of lv_conf.h (see
+                        --color-depth, --swap)
+    .jpg .jpeg          SJPG (.sjpg) decoded strip by strip by lv_sjpg
+    anything else       stored as is: .bin (LVGL image), .fnt (lv_font_load),
+                        .sjpg, .pcm, .adpcm (pcm_to_adpcm.py), ...
+A directory adds its files named by their path in it, `name=path` names a
+file. Members are opened as "A:icons/play.bin" (A: is the drive letter given
+to asset_pack_register_fs()).
+
+Layout (little endian, offsets from the start of the file):
+    0   4  magic "LVPK"
+    4   2  version (1)
+    6   2  member alignment
+    8   4  member count
+    12  4  names offset
+    16  4  names size
+    20  4  data offset
+    24  4  file size
+    28  4  CRC-32 of the index and the names
+    32     index: one 24 byte entry per member, sorted by name hash then name
+           (a binary search finds a name in O(log n)):
+               u32 FNV-1a hash of the name    u32 name offset in the names
+               u32 data offset                u32 size
+               u32 CRC-32 of the data         u8 type, u8 0, u16 name length
+           names: NUL terminated UTF-8
+           data: every member aligned, identical members stored once
+
+ESP-IDF/08_LVGL_Test/components/asset_pack/host_test reads the archives with
+asset_pack.c on the host.
+
+Dependencies: (PYTHON-3) pillow and numpy for images
+'''
+
+import argparse
+import os
+import struct
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from asset_cache import open_atomic
+
+MAGIC = b"LVPK"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIIIIII")
+ENTRY = struct.Struct("<IIIIIBxH")
+DEFAULT_ALIGN = 4
+
+TYPE_RAW = 0
+TYPE_IMAGE = 1
+TYPE_FONT = 2
+TYPE_SJPG = 3
+TYPE_PCM = 4
+TYPE_ADPCM = 5
+TYPE_NAMES = {TYPE_RAW: "raw", TYPE_IMAGE: "image", TYPE_FONT: "font", TYPE_SJPG: "sjpg",
+              TYPE_PCM: "pcm", TYPE_ADPCM: "adpcm"}
+TYPE_OF_EXTENSION = {".bin": TYPE_IMAGE, ".fnt": TYPE_FONT, ".sjpg": TYPE_SJPG, ".pcm": TYPE_PCM,
+                     ".adpcm": TYPE_ADPCM}
+IMAGE_EXTENSIONS = (".png", ".bmp", ".gif")
+JPEG_EXTENSIONS = (".jpg", ".jpeg")
+
+
+def fnv1a(data):
+    '''32-bit FNV-1a hash, the one of asset_pack.c.'''
+    h = 0x811C9DC5
+    for b in data:
+        h = ((h ^ b) * 0x01000193) & 0xFFFFFFFF
+    return h
+
+
+def member_name(name):
+    '''Name as looked up by the C side: forward slashes, no leading slash.'''
+    name = name.replace(os.sep, "/").lstrip("/")
+    if not name or "\0" in name:
+        raise ValueError("invalid member name '%s'" % name)
+    return name
+
+
+def convert(job):
+    '''Return (name, type, data) of one input, converted by its extension.'''
+    name, path, color_depth, swap = job
+    ext = os.path.splitext(path)[1].lower()
+    if ext in IMAGE_EXTENSIONS + JPEG_EXTENSIONS:
+        from PIL import Image
+        with Image.open(path) as im:
+            if ext in JPEG_EXTENSIONS:
+                import sjpg
+                data = sjpg.encode_sjpg(im.convert("RGB"), workers=1)
+                return os.path.splitext(name)[0] + ".sjpg", TYPE_SJPG, data
+            import img_conv
+            return os.path.splitext(name)[0] + ".bin", TYPE_IMAGE, img_conv.to_bin(im, None, color_depth, swap)
+    with open(path, "rb") as f:
+        return name, TYPE_OF_EXTENSION.get(ext, TYPE_RAW), f.read()
+
+
+def build(members, align=DEFAULT_ALIGN):
+    '''Return the archive of `members`, a list of (name, type, data).'''
+    if align < 1 or align > 0xFFFF or align & (align - 1):
+        raise ValueError("the alignment must be a power of 2")
+    entries = []
+    seen = set()
+    for name, mtype, data in members:
+        encoded = member_name(name).encode()
+        if encoded in seen:
+            raise ValueError("duplicate member name '%s'" % name)
+        seen.add(encoded)
+        entries.append([fnv1a(encoded), encoded, mtype, data])
+    entries.sort(key=lambda e: (e[0], e[1]))
+
+    names = bytearray()
+    name_offsets = []
+    for e in entries:
+        name_offsets.append(len(names))
+        names += e[1] + b"\0"
+    names_offset = HEADER.size + len(entries) * ENTRY.size
+    data_offset = names_offset + len(names)
+    data_offset += -data_offset % align
+
+    data = bytearray()
+    stored = {}
+    index = bytearray()
+    for e, name_offset in zip(entries, name_offsets):
+        h, encoded, mtype, payload = e
+        key = zlib.crc32(payload), payload
+        if key not in stored:
+            data += bytes(-len(data) % align)
+            stored[key] = data_offset + len(data)
+            data += payload
+        index += ENTRY.pack(h, name_offset, stored[key], len(payload), key[0], mtype, len(encoded))
+    size = data_offset + len(data)
+    if size > 0xFFFFFFFF:
+        raise ValueError("archive larger than 4 GB")
+    header = HEADER.pack(MAGIC, VERSION, align, len(entries), names_offset, len(names), data_offset, size,
+                         zlib.crc32(bytes(index) + bytes(names)))
+    return header + bytes(index) + bytes(names) + bytes(-(HEADER.size + len(index) + len(names)) % align) + bytes(data)
+
+
+def read_index(data):
+    '''Return the entries of an archive as dicts, checking its structure and index CRC.'''
+    if len(data) < HEADER.size:
+        raise ValueError("file too short")
+    magic, version, align, count, names_offset, names_size, data_offset, size, crc = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not an LVPK archive")
+    if size != len(data) or names_offset != HEADER.size + count * ENTRY.size or \
+            names_offset + names_size > data_offset or data_offset > size:
+        raise ValueError("truncated or damaged archive")
+    if zlib.crc32(data[HEADER.size:names_offset + names_size]) != crc:
+        raise ValueError("index CRC mismatch")
+    entries = []
+    for i in range(count):
+        h, name_offset, offset, length, data_crc, mtype, name_len = ENTRY.unpack_from(data, HEADER.size + i * ENTRY.size)
+        start = names_offset + name_offset
+        if name_offset + name_len >= names_size or offset < data_offset or offset + length > size:
+            raise ValueError("entry %d out of bounds" % i)
+        name = bytes(data[start:start + name_len])
+        entries.append({"hash": h, "name": name.decode(), "offset": offset, "size": length, "crc": data_crc,
+                        "type": mtype})
+    return entries
+
+
+def find(data, entries, name):
+    '''Binary search of `name` in the index, like asset_pack_find(). Return the entry or None.'''
+    encoded = member_name(name).encode()
+    key = fnv1a(encoded), encoded
+    lo, hi = 0, len(entries)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        e = entries[mid]
+        if (e["hash"], e["name"].encode()) < key:
+            lo = mid + 1
+        else:
+            hi = mid
+    if lo < len(entries) and entries[lo]["name"].encode() == encoded:
+        return entries[lo]
+    return None
+
+
+def expand_inputs(inputs):
+    '''Return (name, path) of the inputs: files, `name=path` or directories.'''
+    files = []
+    for arg in inputs:
+        name, sep, path = arg.partition("=")
+        if not sep:
+            name, path = None, arg
+        if os.path.isdir(path):
+            for root, dirs, filenames in os.walk(path):
+                dirs.sort()
+                for f in sorted(filenames):
+                    full = os.path.join(root, f)
+                    rel = os.path.relpath(full, os.path.dirname(os.path.normpath(path)))
+                    files.append((os.path.join(name, os.path.relpath(full, path)) if name else rel, full))
+        else:
+            files.append((name or os.path.basename(path), path))
+    return files
+
+
+def default_color_format():
+    '''LV_COLOR_DEPTH and LV_COLOR_16_SWAP of lv_conf.h, (16, False) without it.'''
+    import asset_dedup
+    defines = {}
+    for conf in asset_dedup.DEFAULT_CONF:
+        if os.path.exists(conf):
+            asset_dedup.load_config(conf, defines)
+    try:
+        return (asset_dedup.evaluate(defines.get("LV_COLOR_DEPTH", "16"), defines),
+                bool(asset_dedup.evaluate(defines.get("LV_COLOR_16_SWAP", "0"), defines)))
+    except ValueError:
+        return 16, False
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in ("list", "get"):
+        parser = argparse.ArgumentParser(prog="asset_pack.py " + argv[0],
+                                         description="List the members of an archive and check their CRC"
+                                         if argv[0] == "list" else "Extract a member of an archive")
+        parser.add_argument("archive")
+        if argv[0] == "get":
+            parser.add_argument("name")
+            parser.add_argument("-o", "--output", required=True)
+        args = parser.parse_args(argv[1:])
+        try:
+            with open(args.archive, "rb") as f:
+                data = f.read()
+            entries = read_index(data)
+        except (OSError, ValueError) as e:
+            print("error: %s" % e, file=sys.stderr)
+            return 1
+        if argv[0] == "get":
+            entry = find(data, entries, args.name)
+            if entry is None:
+                print("error: no member '%s'" % args.name, file=sys.stderr)
+                return 1
+            with open(args.output, "wb") as f:
+                f.write(data[entry["offset"]:entry["offset"] + entry["size"]])
+            return 0
+        bad = 0
+        for e in sorted(entries, key=lambda e: e["name"]):
+            ok = zlib.crc32(data[e["offset"]:e["offset"] + e["size"]]) == e["crc"]
+            bad += not ok
+            print("%10d  %08x  %-6s %s%s" % (e["size"], e["offset"], TYPE_NAMES.get(e["type"], "?"), e["name"],
+                                            "" if ok else "  CRC MISMATCH"))
+        print("%d members, %d bytes" % (len(entries), len(data)))
+        return 1 if bad else 0
+
+    depth, swap = default_color_format()
+    parser = argparse.ArgumentParser(description="Pack LVGL images, fonts, SJPG and audio files into one archive "
+                                                 "(use `list` or `get` to read one)")
+    parser.add_argument("input", nargs="+", help="files, directories or name=path")
+    parser.add_argument("-o", "--output", required=True, help="archive file")
+    parser.add_argument("--align", type=int, default=DEFAULT_ALIGN,
+                        help="alignment of every member, a power of 2 (default: %(default)s)")
+    parser.add_argument("--color-depth", type=int, choices=(8, 16, 32), default=depth,
+                        help="of the converted images (default: %(default)s, from lv_conf.h)")
+    parser.add_argument("--swap", type=int, choices=(0, 1), default=int(swap),
+                        help="swap the bytes of 16-bit colors (default: %(default)s, from lv_conf.h)")
+    parser.add_argument("--max-size", type=lambda s: int(s, 0), help="fail if the archive is larger, "
+                                                                     "e.g. the size of the assets partition")
+    parser.add_argument("-j", "--jobs", type=int, help="parallel conversions (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    try:
+        files = expand_inputs(args.input)
+        jobs = [(name, path, args.color_depth, bool(args.swap)) for name, path in files]
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            members = list(pool.map(convert, jobs))
+        data = build(members, args.align)
+    except (OSError, ValueError) as e:
+        print("error: %s" % e, file=sys.stderr)
+        return 1
+    if args.max_size is not None and len(data) > args.max_size:
+        print("error: %d bytes, more than %d" % (len(data), args.max_size), file=sys.stderr)
+        return 1
+    with open_atomic(args.output) as out:
+        out.write(data)
+    payload = sum(len(m[2]) for m in members)
+    print("Wrote %s: %d members, %d bytes of data, %d bytes" % (args.output, len(members), payload, len(data)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+'''
+Streaming C array writer shared by the asset converter scripts
+
+Bytes are formatted a block of lines at a time (bytes.hex() with a separator,
+or a 256 entry lookup table for formats hex() can't produce), so the time is
+linear in the input size and memory use is constant for file sources:
+
+    with open("image_map.c", "w") as out:
+        write_c_array(out, "image_map", open("image.bin", "rb"), align=4,
+                      section=".rodata.assets")
+
+Every byte is written with `item_format` ("0x%02x, " gives `0x3f, `), a line
+holds `line_width` bytes (0: everything on one line) and starts with `indent`.
+Used by jpg_to_sjpg.py, filetohex.py, the image scripts and SensorLib's fw2h
+tools (through their fw_io.py).
+
+Dependencies: (PYTHON-3)
+'''
+
+import io
+
+DEFAULT_ITEM_FORMAT = "0x%02x, "
+DEFAULT_LINE_WIDTH = 16
+DEFAULT_INDENT = "    "
+
+# Bytes read and formatted at once, a multiple of every usual line width
+_BLOCK_SIZE = 1 << 16
+
+# Separator for bytes.hex(), it can't appear in hex digits
+_HEX_SEP = "|"
+
+
+def _formatter(item_format):
+    '''Return a function formatting a bytes object with `item_format` per byte.'''
+    if item_format.count("%02x") == 1 and item_format.count("%") == 1:
+        before, after = item_format.split("%02x")
+        joint = after + before
+
+        def fast(data):
+            if not data:
+                return ""
+            return before + data.hex(_HEX_SEP).replace(_HEX_SEP, joint) + after
+        return fast
+
+    table = [item_format % b for b in range(256)]
+
+    def lookup(data):
+        return "".join(map(table.__getitem__, data))
+    return lookup
+
+
+def _iter_blocks(source, block_size):
+    '''Yield the bytes of `source` (a bytes-like or a binary file object) in blocks.'''
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source).cast("B")
+        for pos in range(0, len(view), block_size):
+            yield view[pos:pos + block_size]
+        return
+    while True:
+        block = source.read(block_size)
+        if not block:
+            return
+        yield block
+
+
+def write_bytes(out, source, line_width=DEFAULT_LINE_WIDTH, item_format=DEFAULT_ITEM_FORMAT,
+                indent=DEFAULT_INDENT, newline="\n"):
+    '''
+    Write the bytes of `source` to the text stream `out`, a `newline` after
+    every `line_width` bytes (so a last, shorter line isn't terminated).
+    Return the number of bytes written.
+    '''
+    fmt = _formatter(item_format)
+    if line_width <= 0:
+        block_size = _BLOCK_SIZE
+    else:
+        block_size = max(1, _BLOCK_SIZE // line_width) * line_width
+
+    count = 0
+    for block in _iter_blocks(source, block_size):
+        if line_width <= 0:
+            if count == 0:
+                out.write(indent)
+            out.write(fmt(block))
+        else:
+            # `count` is a multiple of `line_width` here unless the source returned a short read
+            buf = io.StringIO()
+            pos = 0
+            partial = count % line_width
+            if partial:
+                pos = min(line_width - partial, len(block))
+                buf.write(fmt(block[:pos]))
+                if partial + pos == line_width:
+                    buf.write(newline)
+            for start in range(pos, len(block), line_width):
+                line = block[start:start + line_width]
+                buf.write(indent)
+                buf.write(fmt(line))
+                if len(line) == line_width:
+                    buf.write(newline)
+            out.write(buf.getvalue())
+        count += len(block)
+    return count
+
+
+def attributes(align=None, section=None, extra=()):
+    '''Return the GCC attribute list for the array declaration, e.g. ` __attribute__((aligned(4)))`.'''
+    attrs = []
+    if align:
+        attrs.append("aligned(%d)" % align)
+    if section:
+        attrs.append('section("%s")' % section)
+    attrs.extend(extra)
+    return " __attribute__((%s))" % ", ".join(attrs) if attrs else ""
+
+
+def write_c_array(out, name, source, ctype="const uint8_t", align=None, section=None,
+                  line_width=DEFAULT_LINE_WIDTH, item_format=DEFAULT_ITEM_FORMAT, indent=DEFAULT_INDENT):
+    '''
+    Write `<ctype> <name>[] = { ... };` listing the bytes of `source`, with the
+    optional alignment and section attributes. Return the number of bytes.
+    '''
+    out.write("%s %s[]%s = {\n" % (ctype, name, attributes(align, section)))
+    count = write_bytes(out, source, line_width, item_format, indent)
+    if line_width <= 0 or count % line_width:
+        out.write("\n")
+    out.write("};\n")
+    return count
+
@@ -1,11 +1,149 @@
 #!/usr/bin/env python3
-import sys
+##################################################################
+# Print the bytes of a file as a C initializer list, or pack many
+# files into one header with an index table.
+# Dependencies: (PYTHON-3)
+#
+#   filetohex.py font.bin > font.inc                   # 0x1c, 0x0, ... on one line
+#   filetohex.py -w 16 -f "0x%02x, " font.bin
+#   filetohex.py -o assets.h --name assets fonts/*.bin img/*.bin
+#
+# The files are read in binary mode block by block, so any content and
+# size works. With -o every file is converted in a separate process and
+# assets.h holds `assets_data[]` (each file aligned to --align bytes),
+# `assets_index[]` with the name, offset and size of every file and
+# assets_find(name).
+##################################################################
+import argparse, glob, io, os, re, sys
+from concurrent.futures import ProcessPoolExecutor
 
-with open(sys.argv[1], 'r') as file:
-    s = file.read()
+import c_array
+from asset_cache import open_atomic
 
-b = bytearray()
-b.extend(map(ord, s))
+LEGACY_ITEM_FORMAT = "0x%x, "
 
-for a in b: print(hex(a), end =", ")
 
+def expand_inputs(patterns):
+    '''Expand files and glob patterns, keeping the command line order.'''
+    files = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            files += sorted(f for f in glob.glob(pattern, recursive=True) if os.path.isfile(f))
+        else:
+            files.append(pattern)
+    return list(dict.fromkeys(files))
+
+
+def convert_file(job):
+    '''Return (size, text) of one file of a batch, the text padded to `align` bytes.'''
+    path, align, line_width, item_format, indent = job
+    size = os.path.getsize(path)
+    pad = -size % align
+    out = io.StringIO()
+    with open(path, "rb") as f:
+        c_array.write_bytes(out, f, line_width, item_format, indent)
+    if pad:
+        # The padding continues the last line of the file
+        if line_width > 0 and size % line_width == 0:
+            out.write(indent)
+        c_array.write_bytes(out, bytes(pad), 0, item_format, "")
+    return size, out.getvalue()
+
+
+def write_batch(out, prefix, files, names, align, line_width, item_format, indent, jobs):
+    '''Write the header packing `files` to the text stream `out`.'''
+    guard = "__%s_H__" % prefix.upper()
+    out.write("/* Generated by filetohex.py from %d files, do not edit */\n" % len(files))
+    out.write("#ifndef %s\n#define %s\n\n#include <stdint.h>\n#include <string.h>\n\n" % (guard, guard))
+    out.write("typedef struct {\n    const char *name;\n    uint32_t offset;\n    uint32_t size;\n} %s_entry_t;\n\n"
+              % prefix)
+    out.write("static const uint8_t %s_data[]%s = {\n" % (prefix, c_array.attributes(align if align > 1 else None)))
+
+    index = []
+    offset = 0
+    job_list = [(path, align, line_width, item_format, indent) for path in files]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        # map() keeps the order, every file is written as soon as the ones before it are done
+        for name, (size, text) in zip(names, pool.map(convert_file, job_list)):
+            out.write("%s/* %s */\n" % (indent, name))
+            out.write(text)
+            if text and not text.endswith("\n"):
+                out.write("\n")
+            index.append((name, offset, size))
+            offset += size + (-size % align)
+    if offset == 0:
+        # Only empty files, C doesn't allow an empty initializer
+        out.write("%s0\n" % indent)
+    out.write("};\n\n")
+
+    out.write("static const %s_entry_t %s_index[] = {\n" % (prefix, prefix))
+    for name, offset, size in index:
+        out.write('    {"%s", %d, %d},\n' % (name.replace("\\", "\\\\").replace('"', '\\"'), offset, size))
+    out.write("};\n\n#define %s_COUNT %d\n\n" % (prefix.upper(), len(index)))
+    out.write("static inline const %s_entry_t *%s_find(const char *name)\n{\n" % (prefix, prefix))
+    out.write("    for (uint32_t i = 0; i < %s_COUNT; i++) {\n" % prefix.upper())
+    out.write("        if (strcmp(%s_index[i].name, name) == 0) return &%s_index[i];\n" % (prefix, prefix))
+    out.write("    }\n    return NULL;\n}\n\n#endif /* %s */\n" % guard)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the bytes of a file as C hex values, "
+                                                 "or pack several files into one header with -o")
+    parser.add_argument('input', nargs='+', help='Files or glob patterns')
+    parser.add_argument('-w', '--line-width', type=int, default=None, metavar='N',
+                        help='Bytes per line, 0: one line (default: 0, 16 with -o)')
+    parser.add_argument('-f', '--format', default=None, metavar='fmt',
+                        help='Format of a byte (default: "0x%%x, ", "0x%%02x, " with -o)')
+    parser.add_argument('-o', '--output', metavar='file.h', help='Batch mode: write one header with every file')
+    batch = parser.add_argument_group('batch', 'Used with -o')
+    batch.add_argument('--name', metavar='prefix', help='Prefix of the C names (default: from the output file)')
+    batch.add_argument('--align', type=int, default=4, metavar='N', help='Alignment of every file (default: 4)')
+    batch.add_argument('--keep-paths', action='store_true',
+                       help='Use the paths as given in the index instead of the file names')
+    batch.add_argument('-j', '--jobs', type=int, metavar='N', help='Parallel conversions (default: CPU count)')
+    args = parser.parse_args()
+
+    files = expand_inputs(args.input)
+    if not files:
+        parser.error("no input file")
+    if args.format is not None:
+        try:
+            args.format % 0
+        except (TypeError, ValueError):
+            parser.error("the format must contain one integer conversion, e.g. 0x%02x")
+
+    if not args.output:
+        item_format = args.format or LEGACY_ITEM_FORMAT
+        line_width = args.line_width or 0
+        for path in files:
+            with open(path, "rb") as f:
+                count = c_array.write_bytes(sys.stdout, f, line_width, item_format, "")
+            if line_width > 0 and count % line_width:
+                sys.stdout.write("\n")
+        return
+
+    if args.align < 1:
+        parser.error("--align must be at least 1")
+    prefix = args.name or os.path.splitext(os.path.basename(args.output))[0]
+    prefix = re.sub(r"\W", "_", prefix)
+    if not prefix.isidentifier():
+        parser.error("invalid name '%s', use --name" % prefix)
+    if args.keep_paths:
+        names = [f.replace(os.sep, "/") for f in files]
+    else:
+        names = [os.path.basename(f) for f in files]
+    duplicates = sorted(n for n in set(names) if names.count(n) > 1)
+    if duplicates:
+        parser.error("duplicate names %s, use --keep-paths" % ", ".join(duplicates))
+
+    line_width = 16 if args.line_width is None else args.line_width
+    with open_atomic(args.output, "w") as out:
+        index = write_batch(out, prefix, files, names, args.align, line_width,
+                            args.format or c_array.DEFAULT_ITEM_FORMAT, c_array.DEFAULT_INDENT, args.jobs)
+    total = index[-1][1] + index[-1][2]
+    print("Wrote %s: %d files, %d bytes" % (args.output, len(index), total), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+'''
+Image atlas for LVGL v8: an icon set in one array, an lv_img_dsc_t per icon
+
+The icons are converted by img_conv.py and laid end to end in one
+`<name>_map` array; every icon gets an lv_img_dsc_t pointing to its block,
+named as the C file of img_conv.py would name it, so the atlas replaces the
+separate files without changes to the code using them:
+
+    python3 img_atlas.py -o music_btn.c --prefix img_lv_demo_music_ \\
+        --guard 'LV_USE_DEMO_MUSIC && !LV_DEMO_MUSIC_LARGE' ../demos/music/assets/272_png/btn_*.png
+    python3 img_atlas.py -o icons.c --data icons.bin --color-depth 16 --swap 1 icons/
+
+An lv_img_dsc_t has no row stride: an image is its rows one after the
+other, so an icon can't be a rectangle inside a 2D atlas, the way GPUs use
+them. Each icon is a contiguous block instead, drawn in place by the SW
+renderer like any C array image (transformed too), and the blocks follow
+each other without padding: the atlas has the size of its pixels, identical
+icons are stored once. Icons drawn together are close in memory, in the
+order of the arguments.
+
+--data writes the pixels to a file (for the display's --color-depth and
+--swap) instead of the array. The C file then reserves the RAM buffer
+`uint8_t <name>_data[]` (LV_ATTRIBUTE_LARGE_RAM_ARRAY, e.g. to put it in
+PSRAM) the descriptors point into, and the application reads the file into
+it once, from the SD card or an asset archive, before drawing the images.
+The descriptors stay `const lv_img_dsc_t`, as LV_IMG_DECLARE() declares them.
+
+The header next to the C file declares the descriptors (and <name>_data).
+
+Dependencies: (PYTHON-3) pillow, numpy
+'''
+
+import argparse
+import os
+import sys
+
+import img_conv
+from c_array import write_bytes
+
+
+def _px_size(cf):
+    '''C expression of the bytes per pixel of a true color format, None for the others.'''
+    if cf == "TRUE_COLOR_ALPHA":
+        return "LV_IMG_PX_SIZE_ALPHA_BYTE"
+    if cf in img_conv.TRUE_COLOR_FORMATS:
+        return "(LV_COLOR_SIZE / 8)"
+    return None
+
+
+def layout(images):
+    '''
+    Blocks of a list of (name, PIL image): a list of (name, image, index of
+    the block), the images identical to an earlier one sharing its block.
+    '''
+    seen = {}
+    blocks = []
+    for name, image in images:
+        key = (image.size, img_conv.to_rgba(image).tobytes())
+        if key not in seen:
+            seen[key] = len(seen)
+        blocks.append((name, image, seen[key]))
+    return blocks
+
+
+def _first(blocks):
+    '''(name, image) of the first image of every block, in block order.'''
+    first = {}
+    for name, image, block in blocks:
+        first.setdefault(block, (name, image))
+    return [first[b] for b in sorted(first)]
+
+
+def atlas_data(blocks, cf, color_depth=16, swap=False, **options):
+    '''(data of the atlas, byte offset of every block) for one color depth.'''
+    data = [img_conv.convert(image, cf, color_depth, swap, **options) for _, image in _first(blocks)]
+    offsets = [sum(len(d) for d in data[:i]) for i in range(len(data))]
+    return b"".join(data), offsets
+
+
+def _descriptor(out, name, image, cf, data_size, data):
+    w, h = image.size
+    out.write("const lv_img_dsc_t %s = {\n"
+              "  .header.always_zero = 0,\n"
+              "  .header.w = %d,\n"
+              "  .header.h = %d,\n"
+              "  .data_size = %s,\n"
+              "  .header.cf = LV_IMG_CF_%s,\n"
+              "  .data = %s,\n"
+              "};\n\n" % (name, w, h, data_size, cf, data))
+
+
+def write_c(out, name, blocks, cf, include="lvgl.h", guard=None, data_file=None, color_depth=16, swap=False,
+            **options):
+    '''
+    Write the C file of an atlas: the `<name>_map` array and a descriptor
+    per image, or with `data_file` the `<name>_data` buffer the content of
+    the file is loaded into, and the descriptors pointing into it.
+    '''
+    out.write('#include "%s"\n\n' % include)
+    if guard:
+        out.write("#if %s\n\n" % guard)
+
+    if data_file:
+        data, offsets = atlas_data(blocks, cf, color_depth, swap, **options)
+        out.write("#ifndef LV_ATTRIBUTE_LARGE_RAM_ARRAY\n#define LV_ATTRIBUTE_LARGE_RAM_ARRAY\n#endif\n\n"
+                  "/*Load the %d bytes of %s (LV_COLOR_DEPTH %d%s) here before the images are drawn*/\n"
+                  "LV_ATTRIBUTE_LARGE_RAM_ARRAY uint8_t %s_data[%d];\n\n"
+                  % (len(data), os.path.basename(data_file), color_depth,
+                     ", LV_COLOR_16_SWAP 1" if swap and color_depth == 16 else "", name, len(data)))
+        for n, image, block in blocks:
+            size = len(img_conv.convert(image, cf, color_depth, swap, **options))
+            _descriptor(out, n, image, cf, "%d" % size, "%s_data + %d" % (name, offsets[block]))
+    else:
+        attr = "LV_ATTRIBUTE_IMG_" + name.upper()
+        out.write("#ifndef LV_ATTRIBUTE_MEM_ALIGN\n#define LV_ATTRIBUTE_MEM_ALIGN\n#endif\n\n"
+                  "#ifndef %s\n#define %s\n#endif\n\n" % (attr, attr))
+        out.write("const LV_ATTRIBUTE_MEM_ALIGN LV_ATTRIBUTE_LARGE_CONST %s uint8_t %s_map[] = {\n" % (attr, name))
+        px = _px_size(cf)
+        for cond, depth, swap_, plain, with_alpha in img_conv.VARIANTS if px else ((None, 16, False, None, None),):
+            if cond:
+                out.write("#if %s\n  /*Pixel format: %s*/\n" % (
+                    cond, with_alpha if cf == "TRUE_COLOR_ALPHA" else plain))
+            for n, image in _first(blocks):
+                data = img_conv.convert(image, cf, depth, swap_, **options)
+                out.write("  /*%s: %dx%d*/\n" % (n, image.size[0], image.size[1]))
+                line = len(data) // image.size[1]
+                if write_bytes(out, data, line, indent="  ") % line:
+                    out.write("\n")
+            if cond:
+                out.write("#endif\n")
+        out.write("};\n\n")
+
+        if px:
+            # Offsets in pixels, the size of a pixel depends on LV_COLOR_DEPTH
+            areas = [im.size[0] * im.size[1] for _, im in _first(blocks)]
+            offsets = [sum(areas[:i]) for i in range(len(areas))]
+        else:
+            _, offsets = atlas_data(blocks, cf, **options)
+        for n, image, block in blocks:
+            w, h = image.size
+            if px:
+                _descriptor(out, n, image, cf, "%d * %s" % (w * h, px),
+                            "%s_map + %d * %s" % (name, offsets[block], px))
+            else:
+                size = len(img_conv.convert(image, cf, **options))
+                _descriptor(out, n, image, cf, "%d" % size, "%s_map + %d" % (name, offsets[block]))
+    if guard:
+        out.write("#endif /*%s*/\n" % guard)
+
+
+def write_h(out, name, blocks, include="lvgl.h", data_size=None):
+    '''Write the header declaring the descriptors of an atlas (and its `data_size` bytes buffer).'''
+    guard = name.upper() + "_H"
+    out.write("#ifndef %s\n#define %s\n\n#include \"%s\"\n\n" % (guard, guard, include))
+    out.write("#ifdef __cplusplus\nextern \"C\" {\n#endif\n\n")
+    for n, _, _ in blocks:
+        out.write("extern const lv_img_dsc_t %s;\n" % n)
+    if data_size is not None:
+        out.write("\nextern uint8_t %s_data[%d];\n" % (name, data_size))
+    out.write("\n#ifdef __cplusplus\n}\n#endif\n\n#endif /*%s*/\n" % guard)
+
+
+def main(argv=None):
+    from asset_pack import default_color_format
+    depth, swap = default_color_format()
+    parser = argparse.ArgumentParser(description="Combine images into one LVGL v8 C array with an lv_img_dsc_t "
+                                                 "per image")
+    parser.add_argument("input", nargs="+", help="image files, directories or glob patterns, in atlas order")
+    parser.add_argument("-o", "--output", required=True, help="C file, the header is written next to it")
+    parser.add_argument("--name", help="C name of the atlas (default: from the output file name)")
+    parser.add_argument("--prefix", default="", help="of the image names, e.g. img_lv_demo_music_")
+    parser.add_argument("-f", "--cf", metavar="FORMAT", type=img_conv.color_format,
+                        help="color format of all the images, not RAW (default: TRUE_COLOR_ALPHA if one has "
+                             "transparency, else TRUE_COLOR)")
+    parser.add_argument("--include", default="lvgl.h", help="header included by the C file (default: %(default)s)")
+    parser.add_argument("--guard", help="condition around the C file, e.g. 'LV_USE_DEMO_MUSIC'")
+    parser.add_argument("--data", metavar="FILE", help="write the pixels to this file instead of the C array")
+    parser.add_argument("--color-depth", type=int, choices=(8, 16, 32), default=depth,
+                        help="of the --data file (default: %(default)s, from lv_conf.h)")
+    parser.add_argument("--swap", type=int, choices=(0, 1), default=int(swap),
+                        help="swap the bytes of 16-bit colors of the --data file (default: %(default)s, from "
+                             "lv_conf.h)")
+    parser.add_argument("--background", type=lambda s: int(s, 16), default=img_conv.DEFAULT_BACKGROUND,
+                        help="RRGGBB transparent pixels are blended onto without alpha (default: ffffff)")
+    args = parser.parse_args(argv)
+
+    from PIL import Image
+    files = img_conv.expand_inputs(args.input)
+    names = [args.prefix + img_conv.c_name(f) for f in files]
+    dup = next((n for n in names if names.count(n) > 1), None)
+    if dup:
+        parser.error("several inputs named '%s'" % dup)
+    if args.cf in img_conv.RAW_FORMATS:
+        parser.error("the RAW formats can't be in an atlas")
+    if args.output.endswith(("/", os.sep)) or os.path.isdir(args.output):
+        parser.error("-o is the C file to write, not a directory: %s" % args.output)
+    name = args.name or img_conv.c_name(args.output)
+    header = os.path.splitext(args.output)[0] + ".h"
+
+    try:
+        images = []
+        for path in files:
+            with Image.open(path) as im:
+                im.load()
+                images.append(im)
+        cf = args.cf or ("TRUE_COLOR_ALPHA" if any(img_conv.auto_format(im) == "TRUE_COLOR_ALPHA" for im in images)
+                         else "TRUE_COLOR")
+        blocks = layout(list(zip(names, images)))
+        options = {"background": args.background}
+        data, _ = atlas_data(blocks, cf, args.color_depth, bool(args.swap), **options)
+        with img_conv.open_atomic(args.output, "w") as out:
+            write_c(out, name, blocks, cf, args.include, args.guard, args.data, args.color_depth, bool(args.swap),
+                    **options)
+        with img_conv.open_atomic(header, "w") as out:
+            write_h(out, name, blocks, args.include, len(data) if args.data else None)
+        if args.data:
+            with img_conv.open_atomic(args.data) as out:
+                out.write(data)
+    except (OSError, ValueError) as e:
+        print("error: %s" % e, file=sys.stderr)
+        return 1
+    shared = len(blocks) - len(set(b for _, _, b in blocks))
+    print("Wrote %s: %d images (%d shared), %s, %d bytes at LV_COLOR_DEPTH %d" % (
+        args.output, len(blocks), shared, cf, len(data), args.color_depth))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
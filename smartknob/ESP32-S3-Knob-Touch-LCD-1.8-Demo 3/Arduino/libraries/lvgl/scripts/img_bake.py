@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+'''
+Pre-blended and premultiplied image variants for static backgrounds
+
+An icon with alpha (TRUE_COLOR_ALPHA) is alpha blended by the SW renderer
+of lvgl/src/draw/sw at every redraw, though it always lands on the same
+background. Baked against that background, a plain color or the region of
+a background image under the icon, it becomes an opaque TRUE_COLOR image:
+a copy of its pixels, no blending, and one byte less per pixel:
+
+    python3 img_bake.py -b 101010 -o assets/ icons/*.png
+    python3 img_bake.py --background-image wallpaper.png -o assets/ play.png@188,300 next.png@300,300
+    python3 img_bake.py --premultiply --format bin -o assets/ glow.png
+    python3 img_bake.py validate assets/bake.json -b 101010
+
+The icon is blended with its full 8-bit channels, rounded, then converted
+like img_conv.py converts the background: transparent pixels get exactly
+the color of the background as it's drawn, so the edge is invisible
+(convert the background image without --dither, the pattern would not
+match).
+
+--premultiply keeps the alpha of the icons that move or sit on changing
+content, and stores the colors multiplied by it (TRUE_COLOR_ALPHA layout,
+c * a / 255): a blend is then src + dst * (255 - a) / 255. LVGL v8 has no
+premultiplied color format and would draw such an image darkened at its
+edges: it's for draw code that blends it itself (an LV_EVENT_DRAW_MAIN
+handler, a DMA2D-like GPU, ARGB8888_PREMULTIPLIED of LVGL v9).
+
+Every run records its assets in the manifest (bake.json in the output
+directory): source and output hashes, and the background each one was
+baked against, the color or the image, position and a hash of the region.
+`validate` flags the assets whose source, output or background region
+changed since, and, given the background the UI now uses (-b or
+--background-image), the ones baked against another one.
+
+Dependencies: (PYTHON-3) pillow, numpy
+'''
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+
+import img_conv
+
+MANIFEST_NAME = "bake.json"
+MANIFEST_VERSION = 1
+DEFAULT_BACKGROUND = 0x000000
+
+
+def _rgb(color):
+    '''(R, G, B) of a 0xRRGGBB color.'''
+    return (color >> 16) & 0xFF, (color >> 8) & 0xFF, color & 0xFF
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def bake(rgba, background):
+    '''
+    Opaque RGBA array of `rgba` blended onto `background`, a 0xRRGGBB color
+    or an H x W x 3 array of the same size, rounded to the nearest.
+    '''
+    import numpy as np
+    a = rgba[..., 3:4].astype(np.uint32)
+    if isinstance(background, int):
+        bg = np.array(_rgb(background), np.uint32)
+    else:
+        bg = np.asarray(background, np.uint32)
+        if bg.shape[:2] != rgba.shape[:2]:
+            raise ValueError("background region of %dx%d for an image of %dx%d" % (
+                bg.shape[1], bg.shape[0], rgba.shape[1], rgba.shape[0]))
+    out = np.empty_like(rgba)
+    out[..., :3] = (rgba[..., :3] * a + bg * (255 - a) + 127) // 255
+    out[..., 3] = 255
+    return out
+
+
+def premultiply(rgba):
+    '''RGBA array with the colors multiplied by the alpha, rounded to the nearest.'''
+    import numpy as np
+    out = rgba.copy()
+    out[..., :3] = (rgba[..., :3].astype(np.uint32) * rgba[..., 3:4] + 127) // 255
+    return out
+
+
+def load_background(path, color=DEFAULT_BACKGROUND):
+    '''H x W x 3 array of a background image, its transparent parts blended onto `color`.'''
+    from PIL import Image
+    with Image.open(path) as im:
+        return img_conv.flatten(img_conv.to_rgba(im), color)[..., :3]
+
+
+def region(background, x, y, width, height):
+    '''The `width` x `height` region of a background array at (x, y).'''
+    h, w = background.shape[:2]
+    if x < 0 or y < 0 or x + width > w or y + height > h:
+        raise ValueError("%dx%d at %d,%d is outside the %dx%d background" % (width, height, x, y, w, h))
+    return background[y:y + height, x:x + width]
+
+
+def parse_input(arg):
+    '''(path, (x, y) or None) of an input argument "icon.png" or "icon.png@x,y".'''
+    m = re.fullmatch(r"(.+)@(\d+),(\d+)", arg)
+    return (m.group(1), (int(m.group(2)), int(m.group(3)))) if m else (arg, None)
+
+
+def load_manifest(path):
+    '''Content of a manifest, an empty one if the file doesn't exist.'''
+    if not os.path.exists(path):
+        return {"version": MANIFEST_VERSION, "assets": {}}
+    with open(path, "r") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError("%s: unsupported manifest version %s" % (path, manifest.get("version")))
+    return manifest
+
+
+def save_manifest(path, manifest):
+    with img_conv.open_atomic(path, "w") as out:
+        json.dump(manifest, out, indent=1, sort_keys=True)
+        out.write("\n")
+
+
+def _background_of(entry):
+    '''Text of the background an asset was baked against.'''
+    bg = entry.get("background")
+    if bg is None:
+        return "none (premultiplied)"
+    if isinstance(bg, str):
+        return "#" + bg
+    return "%s at %d,%d" % (bg["image"], bg["x"], bg["y"])
+
+
+def validate(manifest_path, background=None, background_image=None):
+    '''
+    Check the assets of a manifest, return a list of (output, message) for
+    the ones that changed or don't match `background` (a 0xRRGGBB color) or
+    `background_image` (a path), the background the UI uses now.
+    '''
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    manifest = load_manifest(manifest_path)
+    problems = []
+    images = {}
+    for output, entry in sorted(manifest["assets"].items()):
+        def problem(msg):
+            problems.append((output, msg))
+
+        try:
+            with open(os.path.join(base, output), "rb") as f:
+                if _sha256(f.read()) != entry["output_sha256"]:
+                    problem("modified since it was baked")
+        except OSError:
+            problem("missing")
+        source = os.path.join(base, entry["source"])
+        try:
+            with open(source, "rb") as f:
+                if _sha256(f.read()) != entry["source_sha256"]:
+                    problem("%s changed since, bake it again" % entry["source"])
+        except OSError:
+            problem("source %s missing" % entry["source"])
+
+        bg = entry.get("background")
+        if isinstance(bg, dict):
+            path = os.path.join(base, bg["image"])
+            try:
+                if path not in images:
+                    images[path] = load_background(path, int(bg.get("color", "000000"), 16))
+                w, h = entry["size"]
+                if _sha256(region(images[path], bg["x"], bg["y"], w, h).tobytes()) != bg["sha256"]:
+                    problem("the region of %s under it changed, bake it again" % bg["image"])
+            except (OSError, ValueError) as e:
+                problem("background %s: %s" % (bg["image"], e))
+        if entry["mode"] != "baked":
+            continue
+        if background is not None and bg != "%06x" % background:
+            problem("baked against %s, the UI uses #%06x" % (_background_of(entry), background))
+        if background_image is not None and not (isinstance(bg, dict) and os.path.realpath(
+                os.path.join(base, bg["image"])) == os.path.realpath(background_image)):
+            problem("baked against %s, the UI uses %s" % (_background_of(entry), background_image))
+    return problems
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "validate":
+        parser = argparse.ArgumentParser(prog="img_bake.py validate",
+                                         description="Check the assets of a manifest and the background they were "
+                                                     "baked against")
+        parser.add_argument("manifest")
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument("-b", "--background", type=lambda s: int(s, 16),
+                           help="RRGGBB the UI draws the baked assets on")
+        group.add_argument("--background-image", help="image the UI draws the baked assets on")
+        args = parser.parse_args(argv[1:])
+        try:
+            problems = validate(args.manifest, args.background, args.background_image)
+            count = len(load_manifest(args.manifest)["assets"])
+        except (OSError, ValueError) as e:
+            print("error: %s" % e, file=sys.stderr)
+            return 1
+        for output, msg in problems:
+            print("%s: %s" % (output, msg))
+        print("%d assets, %d problems" % (count, len(problems)))
+        return 1 if problems else 0
+
+    from asset_pack import default_color_format
+    depth, swap = default_color_format()
+    parser = argparse.ArgumentParser(description="Bake images with alpha against their static background into "
+                                                 "opaque LVGL images, or premultiply them "
+                                                 "(use `validate` to check a manifest)")
+    parser.add_argument("input", nargs="+", help="image files, with @x,y: the position on --background-image")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("-b", "--background", type=lambda s: int(s, 16), default=DEFAULT_BACKGROUND,
+                       help="RRGGBB to bake against (default: 000000)")
+    group.add_argument("--background-image", help="image to bake against, at the position of each input")
+    group.add_argument("--premultiply", action="store_true",
+                       help="keep the alpha, premultiply the colors (TRUE_COLOR_ALPHA)")
+    parser.add_argument("--format", choices=("c", "bin"), default="c", help="output (default: %(default)s)")
+    parser.add_argument("-o", "--output", default=".", help="output directory (default: %(default)s)")
+    parser.add_argument("--manifest", help="manifest to update (default: %s in the output directory)"
+                                           % MANIFEST_NAME)
+    parser.add_argument("--include", default="lvgl.h", help="header included by the C files (default: %(default)s)")
+    parser.add_argument("--color-depth", type=int, choices=(8, 16, 32), default=depth,
+                        help="of a .bin file (default: %(default)s, from lv_conf.h)")
+    parser.add_argument("--swap", type=int, choices=(0, 1), default=int(swap),
+                        help="swap the bytes of 16-bit colors of a .bin file (default: %(default)s, from lv_conf.h)")
+    args = parser.parse_args(argv)
+
+    inputs = []
+    for arg in args.input:
+        path, pos = parse_input(arg)
+        if pos is not None and not args.background_image:
+            parser.error("%s: a position needs --background-image" % arg)
+        inputs.extend((f, pos or (0, 0)) for f in img_conv.expand_inputs([path]))
+    names = [img_conv.c_name(f) for f, _ in inputs]
+    dup = next((n for n in names if names.count(n) > 1), None)
+    if dup:
+        parser.error("several inputs named '%s'" % dup)
+    manifest_path = args.manifest or os.path.join(args.output, MANIFEST_NAME)
+    base = os.path.dirname(os.path.abspath(manifest_path))
+
+    from PIL import Image
+    try:
+        os.makedirs(args.output, exist_ok=True)
+        manifest = load_manifest(manifest_path)
+        bg_image = load_background(args.background_image, args.background) if args.background_image else None
+        for (path, (x, y)), name in zip(inputs, names):
+            with open(path, "rb") as f:
+                source_hash = _sha256(f.read())
+            with Image.open(path) as im:
+                rgba = img_conv.to_rgba(im)
+            h, w = rgba.shape[:2]
+            translucent = ((rgba[..., 3] > 0) & (rgba[..., 3] < 255)).sum()
+            if args.premultiply:
+                cf, mode, background = "TRUE_COLOR_ALPHA", "premultiplied", None
+                out_rgba = premultiply(rgba)
+            elif bg_image is not None:
+                cf, mode = "TRUE_COLOR", "baked"
+                bg = region(bg_image, x, y, w, h)
+                out_rgba = bake(rgba, bg)
+                background = {"image": os.path.relpath(os.path.abspath(args.background_image), base),
+                              "x": x, "y": y, "color": "%06x" % args.background, "sha256": _sha256(bg.tobytes())}
+            else:
+                cf, mode, background = "TRUE_COLOR", "baked", "%06x" % args.background
+                out_rgba = bake(rgba, args.background)
+            image = Image.fromarray(out_rgba, "RGBA")
+            target = os.path.join(args.output, name + (".c" if args.format == "c" else ".bin"))
+            if args.format == "c":
+                with img_conv.open_atomic(target, "w") as out:
+                    img_conv.write_c(out, name, image, cf, args.include)
+            else:
+                with img_conv.open_atomic(target) as out:
+                    out.write(img_conv.to_bin(image, cf, args.color_depth, bool(args.swap)))
+            with open(target, "rb") as f:
+                output_hash = _sha256(f.read())
+            entry = {"source": os.path.relpath(os.path.abspath(path), base), "source_sha256": source_hash,
+                     "output_sha256": output_hash, "mode": mode, "cf": cf, "format": args.format, "size": [w, h],
+                     "background": background}
+            if args.format == "bin":
+                entry.update(color_depth=args.color_depth, swap=bool(args.swap))
+            manifest["assets"][os.path.relpath(os.path.abspath(target), base)] = entry
+            print("%s -> %s: %s, %d of %d pixels translucent" % (path, target, mode, translucent, w * h))
+        save_manifest(manifest_path, manifest)
+    except (OSError, ValueError) as e:
+        print("error: %s" % e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
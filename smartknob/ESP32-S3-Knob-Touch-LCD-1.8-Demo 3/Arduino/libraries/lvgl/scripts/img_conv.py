@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+'''
+Offline image converter for LVGL v8 (lv_img_dsc_t C arrays and .bin files)
+
+The output is the one of LVGL's online image converter, byte for byte: the
+arrays of examples/assets and demos/music/assets are regenerated unchanged
+from their PNG files (checked with --check), but for the 93 pixels of
+img_cogwheel_indexed16 whose color, the 17th of the PNG palette, the online
+converter wrapped to index 0:
+
+    python3 img_conv.py -f TRUE_COLOR_ALPHA -o out/ icons/*.png
+    python3 img_conv.py -f ALPHA_4 --name img_cogwheel_alpha16 cogwheel.png
+    python3 img_conv.py -f TRUE_COLOR --format bin --color-depth 16 --swap 1 photo.jpg
+    python3 img_conv.py -f TRUE_COLOR_ALPHA --check ../demos/music/assets/img_lv_demo_music_btn_loop.c \\
+        ../demos/music/assets/272_png/btn_loop.png
+
+Color formats (-f, the LV_IMG_CF_ name without the prefix):
+    TRUE_COLOR                  color of the display; a C file has the 8,
+    TRUE_COLOR_ALPHA            16, 16 swapped and 32-bit variants under
+    TRUE_COLOR_CHROMA_KEYED     #if LV_COLOR_DEPTH, a .bin file the one of
+                                --color-depth and --swap
+    ALPHA_1 ALPHA_2 ALPHA_4 ALPHA_8
+                                the alpha channel only
+    INDEXED_1 INDEXED_2 INDEXED_4 INDEXED_8
+                                a palette of 2^bpp B, G, R, A colors then the
+                                indices; palette images keep their first
+                                2^bpp colors (the others become the nearest
+                                of them), others are quantized by img_quant.py
+    RAW RAW_ALPHA RAW_CHROMA_KEYED
+                                the bytes of the input file, for a decoder
+
+Conversion rules of the online converter, applied to the whole image at once
+with numpy:
+  - channels are rounded half down to 3/5/6/2 bits (capped at the maximum),
+    not truncated: 0x84 -> 0x10 in 5 bits, 0x82 -> 0x10 too
+  - alpha goes through 7 bits (the converter used GD): a & 0xFE with bit 0
+    copied from bit 1
+  - TRUE_COLOR and CHROMA_KEYED images are flattened onto --background
+    (white), rounding down; transparent pixels of CHROMA_KEYED become the
+    chroma key
+  - ALPHA_n keeps the top n bits of the alpha; 1, 2 and 4 bpp rows start on
+    a byte boundary, the first pixel in the most significant bits
+--dither replaces the rounding of RGB332, RGB565 and ALPHA_1/2/4 with the
+dithering of img_dither.py.
+
+Dependencies: (PYTHON-3) pillow, numpy
+'''
+
+import argparse
+import glob
+import os
+import re
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from asset_cache import open_atomic
+from c_array import write_bytes
+
+# lv_img_cf_t of LVGL v8
+CF = {
+    "RAW": 1, "RAW_ALPHA": 2, "RAW_CHROMA_KEYED": 3,
+    "TRUE_COLOR": 4, "TRUE_COLOR_ALPHA": 5, "TRUE_COLOR_CHROMA_KEYED": 6,
+    "INDEXED_1BIT": 7, "INDEXED_2BIT": 8, "INDEXED_4BIT": 9, "INDEXED_8BIT": 10,
+    "ALPHA_1BIT": 11, "ALPHA_2BIT": 12, "ALPHA_4BIT": 13, "ALPHA_8BIT": 14,
+}
+TRUE_COLOR_FORMATS = ("TRUE_COLOR", "TRUE_COLOR_ALPHA", "TRUE_COLOR_CHROMA_KEYED")
+RAW_FORMATS = ("RAW", "RAW_ALPHA", "RAW_CHROMA_KEYED")
+IMAGE_EXTENSIONS = (".png", ".bmp", ".gif", ".jpg", ".jpeg")
+
+DEFAULT_BACKGROUND = 0xFFFFFF
+DEFAULT_CHROMA_KEY = 0x00FF00    # LV_COLOR_CHROMA_KEY of lv_conf.h
+
+# (condition, color depth, swap, pixel format comment without / with alpha) of the C file variants
+VARIANTS = (
+    ("LV_COLOR_DEPTH == 1 || LV_COLOR_DEPTH == 8", 8, False,
+     "Red: 3 bit, Green: 3 bit, Blue: 2 bit", "Alpha 8 bit, Red: 3 bit, Green: 3 bit, Blue: 2 bit"),
+    ("LV_COLOR_DEPTH == 16 && LV_COLOR_16_SWAP == 0", 16, False,
+     "Red: 5 bit, Green: 6 bit, Blue: 5 bit", "Alpha 8 bit, Red: 5 bit, Green: 6 bit, Blue: 5 bit"),
+    ("LV_COLOR_DEPTH == 16 && LV_COLOR_16_SWAP != 0", 16, True,
+     "Red: 5 bit, Green: 6 bit, Blue: 5 bit BUT the 2 bytes are swapped",
+     "Alpha 8 bit, Red: 5 bit, Green: 6 bit, Blue: 5 bit  BUT the 2  color bytes are swapped"),
+    ("LV_COLOR_DEPTH == 32", 32, False,
+     "Fix 0xFF: 8 bit, Red: 8 bit, Green: 8 bit, Blue: 8 bit", "Blue: 8 bit, Green: 8 bit, Red: 8 bit, Alpha: 8 bit"),
+)
+
+
+def color_format(name):
+    '''Canonical name of a color format: "alpha_4", "ALPHA_4BIT" and "LV_IMG_CF_ALPHA_4BIT" give "ALPHA_4BIT".'''
+    key = name.upper()
+    if key.startswith("LV_IMG_CF_"):
+        key = key[len("LV_IMG_CF_"):]
+    if re.fullmatch(r"(ALPHA|INDEXED)_\d", key):
+        key += "BIT"
+    if key not in CF:
+        raise ValueError("unknown color format '%s'" % name)
+    return key
+
+
+def bits_of(cf):
+    '''Bits per pixel of an ALPHA_nBIT or INDEXED_nBIT format.'''
+    return int(re.search(r"_(\d)BIT$", cf).group(1))
+
+
+def lv_img_header(cf, width, height):
+    '''lv_img_header_t of a .bin file: cf:5, always_zero:3, reserved:2, w:11, h:11.'''
+    if not 0 < width < 2048 or not 0 < height < 2048:
+        raise ValueError("LVGL v8 images are at most 2047x2047 pixels")
+    return struct.pack("<I", CF[cf] | width << 10 | height << 21)
+
+
+def _quantize(channel, bits):
+    '''Channel rounded half down to `bits` bits, as the online converter does.'''
+    import numpy as np
+    step = 1 << (8 - bits)
+    return np.minimum((channel.astype(np.uint16) + (step // 2 - 1)) // step, (1 << bits) - 1).astype(np.uint16)
+
+
+def _alpha(a):
+    '''8-bit alpha after the 7-bit round trip of the online converter.'''
+    return (a & 0xFE) | ((a >> 1) & 1)
+
+
+def _pack(values, bits):
+    '''Pack rows of `bits`-bit values into bytes, first pixel in the most significant bits.'''
+    import numpy as np
+    if bits == 8:
+        return values.astype(np.uint8).tobytes()
+    per_byte = 8 // bits
+    h, w = values.shape
+    padded = np.zeros((h, -(-w // per_byte) * per_byte), np.uint8)
+    padded[:, :w] = values
+    groups = padded.reshape(h, -1, per_byte)
+    shifts = np.arange(8 - bits, -1, -bits, dtype=np.uint8)
+    return np.bitwise_or.reduce(groups << shifts, axis=2).astype(np.uint8).tobytes()
+
+
+def to_rgba(image):
+    '''H x W x 4 uint8 array of a PIL image.'''
+    import numpy as np
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    return np.asarray(image)
+
+
+def flatten(rgba, background=DEFAULT_BACKGROUND):
+    '''Image blended onto the 0xRRGGBB `background`, alpha set to 255.'''
+    import numpy as np
+    a = rgba[..., 3:4].astype(np.uint32)
+    if a.min() == 255:
+        return rgba
+    bg = np.array([(background >> 16) & 0xFF, (background >> 8) & 0xFF, background & 0xFF], np.uint32)
+    out = np.empty_like(rgba)
+    out[..., :3] = (rgba[..., :3] * a + bg * (255 - a)) // 255
+    out[..., 3] = 255
+    return out
+
+
+def _channels(rgba, bits, dither):
+    '''R, G, B levels of `bits` bits each, rounded like the online converter or dithered.'''
+    if dither is None:
+        return [_quantize(rgba[..., i], n) for i, n in enumerate(bits)]
+    import numpy as np
+    import img_dither
+    levels = img_dither.dither(rgba[..., :3], bits, dither).astype(np.uint16)
+    return [levels[..., i] for i in range(3)]
+
+
+def true_color(rgba, color_depth=16, swap=False, alpha=False, dither=None):
+    '''
+    Pixels of an RGBA array in LV_IMG_CF_TRUE_COLOR(_ALPHA) layout for one
+    color depth, 8 and 16-bit colors dithered with the img_dither.py method
+    `dither` if not None.
+    '''
+    import numpy as np
+    r, g, b, a = (rgba[..., i] for i in range(4))
+    if color_depth == 32:
+        planes = [b, g, r, _alpha(a) if alpha else np.full_like(a, 0xFF)]
+    elif color_depth == 16:
+        r5, g6, b5 = _channels(rgba, (5, 6, 5), dither)
+        c = r5 << 11 | g6 << 5 | b5
+        lo, hi = c & 0xFF, c >> 8
+        planes = [hi, lo] if swap else [lo, hi]
+    elif color_depth == 8:
+        r3, g3, b2 = _channels(rgba, (3, 3, 2), dither)
+        planes = [r3 << 5 | g3 << 2 | b2]
+    else:
+        raise ValueError("unsupported color depth %d" % color_depth)
+    if alpha and color_depth != 32:
+        planes.append(_alpha(a))
+    return np.stack(planes, axis=-1).astype(np.uint8).tobytes()
+
+
+def alpha_only(rgba, bits, dither=None):
+    '''LV_IMG_CF_ALPHA_nBIT data: the top `bits` bits of every alpha value, or the alpha dithered.'''
+    if dither is None or bits == 8:
+        return _pack(_alpha(rgba[..., 3]) >> (8 - bits), bits)
+    import img_dither
+    return _pack(img_dither.dither(_alpha(rgba[..., 3]), bits, dither), bits)
+
+
+def _palette_image(image, bits):
+    '''(index array, RGBA palette array) of an image with at most 2^bits colors.'''
+    import numpy as np
+    colors = 1 << bits
+    if image.mode == "P":
+        pal = np.array(image.getpalette("RGBA") or [], np.uint8).reshape(-1, 4)
+        trns = image.info.get("transparency")
+        if isinstance(trns, int) and trns < len(pal):
+            pal[trns, 3] = 0
+        elif isinstance(trns, bytes):
+            pal[:len(trns), 3] = np.frombuffer(trns[:len(pal)], np.uint8)
+        # Colors past the first 2^bits become the nearest of those
+        lut = np.arange(max(len(pal), 256)) % max(len(pal), 1)
+        if len(pal) > colors:
+            dist = ((pal[colors:, None].astype(np.int32) - pal[None, :colors]) ** 2).sum(axis=2)
+            lut[colors:len(pal)] = dist.argmin(axis=1)
+        return lut[np.asarray(image)], pal[:colors]
+    import img_quant
+    quant = img_quant.quantize(image, bits)
+    return np.asarray(quant), np.array(quant.getpalette("RGBA"), np.uint8).reshape(-1, 4)[:colors]
+
+
+def indexed(image, bits):
+    '''LV_IMG_CF_INDEXED_nBIT data: 2^bits palette entries (B, G, R, A) then the packed indices.'''
+    import numpy as np
+    indices, pal = _palette_image(image, bits)
+    palette = np.zeros((1 << bits, 4), np.uint8)
+    palette[:len(pal)] = pal[:, [2, 1, 0, 3]]
+    palette[:, 3] = _alpha(palette[:, 3])
+    palette[palette[:, 3] == 0] = 0
+    return palette.tobytes() + _pack(indices, bits)
+
+
+def convert(image, cf, color_depth=16, swap=False, background=DEFAULT_BACKGROUND, chroma_key=DEFAULT_CHROMA_KEY,
+            raw=None, dither=None):
+    '''
+    Pixel data of `image` (a PIL image) in the color format `cf`, for
+    `color_depth` and `swap` with the TRUE_COLOR formats. The RAW formats
+    return `raw`, the bytes of the input file. `dither` is a method of
+    img_dither.py for the 8 and 16-bit colors and ALPHA_1/2/4BIT.
+    '''
+    cf = color_format(cf)
+    if cf in RAW_FORMATS:
+        if raw is None:
+            raise ValueError("%s needs the bytes of the file" % cf)
+        return bytes(raw)
+    if cf.startswith("INDEXED_"):
+        return indexed(image, bits_of(cf))
+    rgba = to_rgba(image)
+    if cf.startswith("ALPHA_"):
+        return alpha_only(rgba, bits_of(cf), dither)
+    if cf == "TRUE_COLOR_ALPHA":
+        return true_color(rgba, color_depth, swap, alpha=True, dither=dither)
+    if cf == "TRUE_COLOR_CHROMA_KEYED":
+        rgba = rgba.copy()
+        rgba[rgba[..., 3] == 0] = ((chroma_key >> 16) & 0xFF, (chroma_key >> 8) & 0xFF, chroma_key & 0xFF, 255)
+    return true_color(flatten(rgba, background), color_depth, swap, dither=dither)
+
+
+def auto_format(image):
+    '''TRUE_COLOR_ALPHA if the image has transparent pixels, else TRUE_COLOR.'''
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        if image.convert("RGBA").getextrema()[3][0] < 255:
+            return "TRUE_COLOR_ALPHA"
+    return "TRUE_COLOR"
+
+
+def to_bin(image, cf=None, color_depth=16, swap=False, **options):
+    '''LVGL v8 image file (.bin): the 4 byte header then the data. `cf` None picks it with auto_format().'''
+    cf = color_format(cf) if cf else auto_format(image)
+    return lv_img_header(cf, *image.size) + convert(image, cf, color_depth, swap, **options)
+
+
+def _row_bytes(cf, width, color_depth):
+    '''Bytes of one image row, the line width of the C arrays.'''
+    if cf in TRUE_COLOR_FORMATS:
+        return width * (color_depth // 8 + (cf == "TRUE_COLOR_ALPHA")) if color_depth != 32 else width * 4
+    if cf in RAW_FORMATS:
+        return 16
+    return -(-width * bits_of(cf) // 8)
+
+
+def write_c(out, name, image, cf, include="lvgl.h", guard=None, **options):
+    '''Write the C file of `image`: the `<name>_map` array and the `<name>` lv_img_dsc_t.'''
+    cf = color_format(cf)
+    w, h = image.size
+    attr = "LV_ATTRIBUTE_IMG_" + name.upper()
+    out.write('#include "%s"\n\n' % include)
+    if guard:
+        out.write("#if %s\n\n" % guard)
+    out.write("#ifndef LV_ATTRIBUTE_MEM_ALIGN\n#define LV_ATTRIBUTE_MEM_ALIGN\n#endif\n\n"
+              "#ifndef %s\n#define %s\n#endif\n\n" % (attr, attr))
+    out.write("const LV_ATTRIBUTE_MEM_ALIGN LV_ATTRIBUTE_LARGE_CONST %s uint8_t %s_map[] = {\n" % (attr, name))
+
+    if cf in TRUE_COLOR_FORMATS:
+        for cond, depth, swap, plain, with_alpha in VARIANTS:
+            data = convert(image, cf, depth, swap, **options)
+            out.write("#if %s\n  /*Pixel format: %s*/\n" % (cond, with_alpha if cf == "TRUE_COLOR_ALPHA" else plain))
+            if write_bytes(out, data, _row_bytes(cf, w, depth), indent="  ") % _row_bytes(cf, w, depth):
+                out.write("\n")
+            out.write("#endif\n")
+        size = "%d * %s" % (w * h, "LV_IMG_PX_SIZE_ALPHA_BYTE" if cf == "TRUE_COLOR_ALPHA" else "LV_COLOR_SIZE / 8")
+    else:
+        data = convert(image, cf, **options)
+        if cf.startswith("INDEXED_"):
+            n = 4 << bits_of(cf)
+            for i in range(0, n, 4):
+                out.write("  0x%02x, 0x%02x, 0x%02x, 0x%02x,   /*Color of index %d*/\n" % (*data[i:i + 4], i // 4))
+            out.write("\n")
+            data = data[n:]
+        line = _row_bytes(cf, w, 8)
+        if write_bytes(out, data, line, indent="  ") % line:
+            out.write("\n")
+        size = "%d" % (len(data) + (4 << bits_of(cf) if cf.startswith("INDEXED_") else 0))
+    out.write("};\n\n")
+    out.write("const lv_img_dsc_t %s = {\n"
+              "  .header.always_zero = 0,\n"
+              "  .header.w = %d,\n"
+              "  .header.h = %d,\n"
+              "  .data_size = %s,\n"
+              "  .header.cf = LV_IMG_CF_%s,\n"
+              "  .data = %s_map,\n"
+              "};\n" % (name, w, h, size, cf, name))
+    if guard:
+        out.write("\n#endif /*%s*/\n" % guard)
+
+
+def c_name(path):
+    '''C identifier from a file name: "btn-play@2x.png" gives "btn_play_2x".'''
+    name = re.sub(r"\W", "_", os.path.splitext(os.path.basename(path))[0])
+    return "_" + name if name[:1].isdigit() else name
+
+
+def check(path, image, cf, name=None, **options):
+    '''
+    Compare the conversion of `image` with the `<name>_map` array of the C
+    file `path` in every #if LV_COLOR_DEPTH variant. Return a list of
+    (variant, message) for the ones that differ.
+    '''
+    from asset_dedup import scan_file
+    cf = color_format(cf)
+    arrays, _ = scan_file(path)
+    arrays = [a for a in arrays if name is None or a.name == name + "_map"] or arrays
+    if not arrays:
+        return [("-", "no array in %s" % path)]
+    arr = arrays[0]
+    problems = []
+    variants = VARIANTS if cf in TRUE_COLOR_FORMATS else ((None, 16, False, None, None),)
+    for cond, depth, swap, _, _ in variants:
+        defines = {"LV_COLOR_DEPTH": str(depth), "LV_COLOR_16_SWAP": str(int(swap))}
+        expected = arr.content(defines)
+        got = convert(image, cf, depth, swap, **options)
+        if got != expected:
+            diff = sum(a != b for a, b in zip(got, expected)) + abs(len(got) - len(expected))
+            problems.append((cond or cf, "%d of %d bytes differ" % (diff, max(len(got), len(expected)))))
+    return problems
+
+
+def _job(job):
+    '''Convert (or check) one input file, return (path, output or None, problems).'''
+    path, args = job
+    from PIL import Image
+    options = {"background": args.background, "chroma_key": args.chroma_key, "dither": args.dither}
+    with open(path, "rb") as f:
+        raw = f.read()
+    with Image.open(path) as im:
+        im.load()
+        cf = args.cf or auto_format(im)
+        if color_format(cf) in RAW_FORMATS:
+            options["raw"] = raw
+        name = args.name or c_name(path)
+        if args.check:
+            return path, None, check(args.check, im, cf, args.name, **options)
+        ext = ".c" if args.format == "c" else ".bin"
+        if args.output and (args.output.endswith(os.sep) or os.path.isdir(args.output)):
+            target = os.path.join(args.output, name + ext)
+        else:
+            target = args.output or os.path.splitext(path)[0] + ext
+        if args.format == "c":
+            with open_atomic(target, "w") as out:
+                write_c(out, name, im, cf, args.include, args.guard, **options)
+        else:
+            with open_atomic(target) as out:
+                out.write(to_bin(im, cf, args.color_depth, bool(args.swap), **options))
+    return path, target, []
+
+
+def expand_inputs(patterns):
+    '''Files of the arguments: glob patterns, and the images of directories.'''
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) or [pattern]
+        for path in matches:
+            if os.path.isdir(path):
+                files.extend(sorted(os.path.join(path, f) for f in os.listdir(path)
+                                    if f.lower().endswith(IMAGE_EXTENSIONS)))
+            else:
+                files.append(path)
+    return files
+
+
+def main(argv=None):
+    from asset_pack import default_color_format
+    depth, swap = default_color_format()
+    parser = argparse.ArgumentParser(description="Convert images to LVGL v8 C arrays or .bin image files")
+    parser.add_argument("input", nargs="+", help="image files, directories or glob patterns")
+    parser.add_argument("-f", "--cf", metavar="FORMAT", type=color_format,
+                        help="color format, e.g. TRUE_COLOR_ALPHA, ALPHA_4, INDEXED_2, RAW (default: "
+                             "TRUE_COLOR_ALPHA for images with transparency, else TRUE_COLOR)")
+    parser.add_argument("--format", choices=("c", "bin"), default="c", help="output (default: %(default)s)")
+    parser.add_argument("-o", "--output", help="output file, or directory (ending with '/') for several inputs "
+                                               "(default: next to the input)")
+    parser.add_argument("--name", help="C name of the image (default: from the file name)")
+    parser.add_argument("--include", default="lvgl.h", help="header included by the C file (default: %(default)s)")
+    parser.add_argument("--guard", help="condition around the C file, e.g. 'LV_USE_DEMO_MUSIC'")
+    parser.add_argument("--color-depth", type=int, choices=(8, 16, 32), default=depth,
+                        help="of a .bin file (default: %(default)s, from lv_conf.h)")
+    parser.add_argument("--swap", type=int, choices=(0, 1), default=int(swap),
+                        help="swap the bytes of 16-bit colors of a .bin file (default: %(default)s, from lv_conf.h)")
+    parser.add_argument("--background", type=lambda s: int(s, 16), default=DEFAULT_BACKGROUND,
+                        help="RRGGBB transparent pixels are blended onto without alpha (default: ffffff)")
+    parser.add_argument("--chroma-key", type=lambda s: int(s, 16), default=DEFAULT_CHROMA_KEY,
+                        help="RRGGBB of the transparent pixels of CHROMA_KEYED images (default: 00ff00)")
+    parser.add_argument("--dither", choices=("bayer", "blue-noise", "floyd-steinberg"),
+                        help="dither the 8 and 16-bit colors and ALPHA_1/2/4 (see img_dither.py)")
+    parser.add_argument("--check", metavar="FILE.c",
+                        help="compare with the array of an existing C file instead of writing")
+    parser.add_argument("-j", "--jobs", type=int, help="parallel conversions (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    files = expand_inputs(args.input)
+    if len(files) > 1 and (args.name or args.check or
+                           (args.output and not args.output.endswith(os.sep) and not os.path.isdir(args.output))):
+        parser.error("--name, --check and an output file take one input")
+    if args.output and (args.output.endswith(os.sep) or os.path.isdir(args.output)):
+        names = [c_name(f) for f in files]
+        dup = next((n for n in names if names.count(n) > 1), None)
+        if dup:
+            parser.error("several inputs named '%s' for the directory %s" % (dup, args.output))
+        os.makedirs(args.output, exist_ok=True)
+
+    failed = 0
+    try:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            for path, target, problems in pool.map(_job, [(f, args) for f in files]):
+                if args.check:
+                    for variant, msg in problems:
+                        print("%s: %s: %s" % (path, variant, msg))
+                    print("%s: %s" % (path, "differs from " + args.check if problems else "identical"))
+                    failed += bool(problems)
+                else:
+                    print("%s -> %s" % (path, target))
+    except (OSError, ValueError) as e:
+        print("error: %s" % e, file=sys.stderr)
+        return 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
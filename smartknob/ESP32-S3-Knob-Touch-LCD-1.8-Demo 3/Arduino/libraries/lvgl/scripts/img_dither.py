@@ -0,0 +1,166 @@
+'''
+Dithering of the image channels quantized by img_conv.py
+
+Bakes the dithering of gradients and photos into RGB565/RGB332 and
+ALPHA_1/2/4BIT assets, so LV_DITHER_GRADIENT of lv_conf.h can stay 0
+(it dithers every redraw, with extra line buffers):
+
+    python3 img_conv.py -f TRUE_COLOR --dither floyd-steinberg cover.png
+    python3 img_conv.py -f ALPHA_4 --dither blue-noise shadow.png
+
+Methods:
+    bayer            ordered dithering with the 8x8 Bayer matrix: a regular
+                     cross-hatch, stable when the image is redrawn in parts
+    blue-noise       ordered dithering with a 64x64 void-and-cluster blue
+                     noise texture: no pattern, only fine grain
+    floyd-steinberg  error diffusion (7/16 right, 3/16 down left, 5/16 down,
+                     1/16 down right): the lowest error, best for photos
+
+A channel of `bits` bits has the levels 0..L (L = 2^bits - 1) shown as
+round(level * 255 / L). The ordered methods add a threshold in [0, 1) to
+value * L / 255 and round down, for the whole image at once. Error
+diffusion can't be computed a row at once: a pixel needs the error of its
+left neighbour. It is computed by anti-diagonals instead, pixel (x, y) at
+step x + 2y, when its four neighbours above and on the left are done: the
+image is skewed so that the pixels of a step are one contiguous row,
+quantized together, W + 2H numpy steps in all.
+
+Dependencies: (PYTHON-3) numpy
+'''
+
+import functools
+
+METHODS = ("bayer", "blue-noise", "floyd-steinberg")
+
+BLUE_NOISE_SIZE = 64
+BLUE_NOISE_SIGMA = 1.5
+BLUE_NOISE_SEED = 1
+
+
+def _check(method):
+    if method not in METHODS:
+        raise ValueError("unknown dithering '%s'" % method)
+
+
+@functools.lru_cache(maxsize=None)
+def bayer(size=8):
+    '''Bayer threshold matrix, `size` x `size` values in (0, 1).'''
+    import numpy as np
+    m = np.zeros((1, 1), np.int64)
+    while len(m) < size:
+        m = np.block([[4 * m, 4 * m + 2], [4 * m + 3, 4 * m + 1]])
+    return (m + 0.5) / m.size
+
+
+@functools.lru_cache(maxsize=None)
+def blue_noise(size=BLUE_NOISE_SIZE, sigma=BLUE_NOISE_SIGMA, seed=BLUE_NOISE_SEED):
+    '''
+    Blue noise threshold matrix, `size` x `size` values in (0, 1), by
+    Ulichney's void-and-cluster method. The energy of the pattern (its
+    toroidal Gaussian blur) is updated when a pixel is set or cleared.
+    '''
+    import numpy as np
+    d = np.minimum(np.arange(size), size - np.arange(size))
+    kernel = np.exp(-(d[:, None] ** 2 + d[None, :] ** 2) / (2 * sigma ** 2))
+
+    def splat(energy, pos, sign):
+        y, x = divmod(int(pos), size)
+        energy += sign * np.roll(kernel, (y, x), axis=(0, 1))
+
+    rng = np.random.default_rng(seed)
+    n = size * size
+    pattern = np.zeros(n, bool)
+    pattern[rng.choice(n, n // 10, replace=False)] = True
+    energy = np.zeros((size, size))
+    for pos in np.flatnonzero(pattern):
+        splat(energy, pos, 1)
+    flat = energy.ravel()
+
+    # Initial pattern: move the tightest cluster into the largest void until it stays
+    while True:
+        cluster = int(np.argmax(np.where(pattern, flat, -np.inf)))
+        pattern[cluster] = False
+        splat(energy, cluster, -1)
+        void = int(np.argmin(np.where(pattern, np.inf, flat)))
+        pattern[void] = True
+        splat(energy, void, 1)
+        if void == cluster:
+            break
+
+    rank = np.zeros(n, np.int64)
+    ones = int(pattern.sum())
+    # Ranks below the initial pattern: remove its tightest clusters one by one
+    proto, proto_energy = pattern.copy(), energy.copy()
+    for r in range(ones - 1, -1, -1):
+        cluster = int(np.argmax(np.where(pattern, flat, -np.inf)))
+        pattern[cluster] = False
+        splat(energy, cluster, -1)
+        rank[cluster] = r
+    # Ranks above it: fill the largest voids
+    pattern, energy = proto, proto_energy
+    flat = energy.ravel()
+    for r in range(ones, n):
+        void = int(np.argmin(np.where(pattern, np.inf, flat)))
+        pattern[void] = True
+        splat(energy, void, 1)
+        rank[void] = r
+    return ((rank + 0.5) / n).reshape(size, size)
+
+
+def _tile(matrix, h, w):
+    import numpy as np
+    reps = (-(-h // matrix.shape[0]), -(-w // matrix.shape[1]))
+    return np.tile(matrix, reps)[:h, :w]
+
+
+def ordered(values, levels, matrix):
+    '''Levels (H x W x C ints) of `values` (H x W x C in 0..255) with the threshold `matrix`.'''
+    import numpy as np
+    t = _tile(matrix, *values.shape[:2])[..., None]
+    return np.clip(np.floor(values * (levels / 255.0) + t), 0, levels).astype(np.int32)
+
+
+def floyd_steinberg(values, levels):
+    '''Levels (H x W x C ints) of `values` (H x W x C in 0..255) by error diffusion, by anti-diagonals.'''
+    import numpy as np
+    h, w, c = values.shape
+    levels = np.broadcast_to(np.asarray(levels, np.float64), (c,))
+    scale, step = levels / 255.0, 255.0 / levels
+    # Skewed copy: pixel (x, y) at [x + 2y, y], so an anti-diagonal is one contiguous row
+    # (3 extra rows and a row of padding below the image for the neighbours)
+    cols = w + 2 * h + 2
+    buf = np.zeros((cols, h + 1, c))
+    valid = np.zeros((cols, h, 1))
+    ys = np.arange(h)
+    for y in ys:
+        buf[2 * y:2 * y + w, y] = values[y]
+        valid[2 * y:2 * y + w, y] = 1
+    out = np.zeros((cols, h, c))
+    for s in range(w + 2 * h - 2):
+        v = buf[s, :h]
+        q = np.clip(np.rint(v * scale), 0, levels)
+        out[s] = q
+        # Padding cells take errors too but never pass them on
+        err = (v - q * step) * valid[s]
+        buf[s + 1, :h] += err * (7 / 16)
+        buf[s + 1, 1:] += err * (3 / 16)
+        buf[s + 2, 1:] += err * (5 / 16)
+        buf[s + 3, 1:] += err * (1 / 16)
+    idx = np.arange(w)[None, :] + 2 * ys[:, None]
+    return out[idx, ys[:, None]].astype(np.int32)
+
+
+def dither(values, bits, method):
+    '''
+    Quantize `values` (H x W x C, 0..255) to `bits` bits per channel (an int
+    or one per channel) with `method`; return the H x W x C levels.
+    '''
+    import numpy as np
+    _check(method)
+    values = np.asarray(values, np.float64)
+    if values.ndim == 2:
+        return dither(values[..., None], bits, method)[..., 0]
+    levels = (1 << np.broadcast_to(np.asarray(bits), values.shape[-1:])) - 1
+    if method == "floyd-steinberg":
+        return floyd_steinberg(values, levels)
+    return ordered(values, levels, bayer() if method == "bayer" else blue_noise())
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+'''
+Palette quantizer for the INDEXED_1/2/4/8BIT image formats of LVGL v8
+
+A 4-bit indexed image is 1/4 of the RGB565 + alpha one and 1/6 of the
+32-bit one; the cost is the palette. This picks it, reports what was lost
+and writes the images with img_conv.py:
+
+    python3 img_quant.py -b 4 -o out/ icons/*.png
+    python3 img_quant.py -b 4 --shared --method kmeans --seed 1 -o out/ icons/
+    python3 img_quant.py -b 2 --format none --json report.json icons/
+
+Methods (--method):
+    median-cut  the box of colors with the largest weighted squared error is
+                split at the weighted median of its widest channel, until
+                there is one box per palette entry (deterministic)
+    kmeans      median cut, then mini-batch k-means: batches of pixels drawn
+                with --seed move every entry towards the mean of the pixels
+                nearest to it, and a last full pass sets every entry to the
+                exact mean of its pixels (reproducible for a given seed)
+
+Colors are compared premultiplied, (r*a, g*a, b*a, a), so the faint edge of
+an anti-aliased icon doesn't take palette entries from its body. Pixels
+with an alpha below --transparent are all mapped to index 0, kept as the
+fully transparent entry (0, 0, 0, 0) like img_cogwheel_indexed16.c.
+With --shared the images get one palette made from all their pixels, so
+the icons of a set (or the states of an lv_imgbtn) use the same colors and
+a canvas can draw any of them with the palette set once by
+lv_canvas_set_palette(). Each image still carries its copy of the palette.
+
+Reported per image: PSNR and the mean and max CIE76 color difference (dE,
+~2.3 is a just noticeable difference) of the image and of its quantized
+version blended onto --background, as on the display, and the size of the
+indexed data against TRUE_COLOR(_ALPHA) in the color depth of lv_conf.h.
+
+Dependencies: (PYTHON-3) pillow, numpy
+'''
+
+import argparse
+import json
+import os
+import sys
+
+import img_conv
+
+DEFAULT_TRANSPARENT = 8
+KMEANS_BATCH = 4096
+KMEANS_ITERATIONS = 32
+# Rows of colors compared with the palette at once, bounds the memory of the distance matrix
+_CHUNK = 1 << 15
+
+
+def _features(rgba):
+    '''N x 4 float32 premultiplied colors of N x 4 RGBA values.'''
+    import numpy as np
+    f = rgba.astype(np.float32)
+    f[:, :3] *= f[:, 3:4] / 255.0
+    return f
+
+
+def _colors(features):
+    '''RGBA uint8 colors of premultiplied features.'''
+    import numpy as np
+    a = np.clip(features[:, 3:4], 0, 255)
+    rgb = np.where(a > 0, features[:, :3] * 255.0 / np.maximum(a, 1e-6), 0)
+    return np.clip(np.rint(np.concatenate([rgb, a], axis=1)), 0, 255).astype(np.uint8)
+
+
+def unique_colors(rgba):
+    '''(unique N x 4 RGBA colors, their counts) of an ... x 4 array.'''
+    import numpy as np
+    packed = rgba.reshape(-1, 4).view(np.uint32).ravel()
+    values, counts = np.unique(packed, return_counts=True)
+    return values.view(np.uint8).reshape(-1, 4), counts
+
+
+def nearest(features, palette):
+    '''Index of the nearest palette entry of every row of `features`.'''
+    import numpy as np
+    out = np.empty(len(features), np.intp)
+    p2 = (palette * palette).sum(axis=1)
+    for start in range(0, len(features), _CHUNK):
+        chunk = features[start:start + _CHUNK]
+        out[start:start + _CHUNK] = (p2 - 2 * chunk @ palette.T).argmin(axis=1)
+    return out
+
+
+def median_cut(features, weights, colors):
+    '''Palette (K x 4 features, K <= colors) of weighted colors by variance-based median cut.'''
+    import numpy as np
+    w = weights.astype(np.float64)
+
+    def stats(idx):
+        fw = w[idx]
+        mean = (features[idx] * fw[:, None]).sum(axis=0) / fw.sum()
+        var = ((features[idx] - mean) ** 2 * fw[:, None]).sum(axis=0)
+        return mean, var
+
+    boxes = [np.arange(len(features))]
+    info = [stats(boxes[0])]
+    while len(boxes) < colors:
+        errors = [var.sum() if len(idx) > 1 else -1.0 for idx, (_, var) in zip(boxes, info)]
+        i = int(np.argmax(errors))
+        if errors[i] <= 0:
+            break
+        idx = boxes[i]
+        axis = int(np.argmax(info[i][1]))
+        order = idx[np.argsort(features[idx, axis], kind="stable")]
+        cum = np.cumsum(w[order])
+        cut = int(np.searchsorted(cum, cum[-1] / 2))
+        cut = min(max(cut, 1), len(order) - 1)
+        boxes[i:i + 1] = [order[:cut], order[cut:]]
+        info[i:i + 1] = [stats(order[:cut]), stats(order[cut:])]
+    return np.array([mean for mean, _ in info], np.float32)
+
+
+def kmeans(features, weights, palette, seed=0, iterations=KMEANS_ITERATIONS, batch=KMEANS_BATCH):
+    '''Refine `palette` by mini-batch k-means over the weighted colors, then one full Lloyd step.'''
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    palette = palette.astype(np.float64)
+    k = len(palette)
+    seen = np.zeros(k)
+    p = weights / weights.sum()
+    for _ in range(iterations):
+        sample = features[rng.choice(len(features), size=batch, p=p)]
+        labels = nearest(sample, palette.astype(np.float32))
+        n = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(palette)
+        np.add.at(sums, labels, sample)
+        hit = n > 0
+        # Each entry is the running mean of every sample it has been given (Sculley's update, by batch)
+        palette[hit] = (palette[hit] * seen[hit, None] + sums[hit]) / (seen[hit] + n[hit])[:, None]
+        seen += n
+    labels = nearest(features, palette.astype(np.float32))
+    w = weights.astype(np.float64)
+    n = np.bincount(labels, weights=w, minlength=k)
+    sums = np.zeros_like(palette)
+    np.add.at(sums, labels, features * w[:, None])
+    hit = n > 0
+    palette[hit] = sums[hit] / n[hit, None]
+    return palette.astype(np.float32)
+
+
+def make_palette(rgba_list, bits, method="median-cut", seed=0, transparent=DEFAULT_TRANSPARENT):
+    '''
+    RGBA palette (K x 4 uint8, K <= 2^bits) for all the H x W x 4 arrays of
+    `rgba_list`. Entry 0 is (0, 0, 0, 0) when a pixel has an alpha below
+    `transparent`.
+    '''
+    import numpy as np
+    colors, counts = unique_colors(np.concatenate([a.reshape(-1, 4) for a in rgba_list]))
+    clear = colors[:, 3] < transparent
+    reserved = [np.zeros((1, 4), np.uint8)] if clear.any() else []
+    colors, counts = colors[~clear], counts[~clear]
+    size = (1 << bits) - len(reserved)
+    if not len(colors):
+        return np.concatenate(reserved or [np.zeros((1, 4), np.uint8)])
+    features = _features(colors)
+    palette = median_cut(features, counts, size)
+    if method == "kmeans" and len(colors) > len(palette):
+        palette = kmeans(features, counts, palette, seed)
+    elif method not in ("median-cut", "kmeans"):
+        raise ValueError("unknown method '%s'" % method)
+    return np.concatenate(reserved + [_colors(palette)])
+
+
+def remap(rgba, palette, transparent=DEFAULT_TRANSPARENT):
+    '''H x W indices of the palette entries nearest to the pixels of `rgba`.'''
+    import numpy as np
+    colors, inverse = np.unique(rgba.reshape(-1, 4).view(np.uint32).ravel(), return_inverse=True)
+    colors = colors.view(np.uint8).reshape(-1, 4)
+    idx = nearest(_features(colors), _features(palette))
+    clear = colors[:, 3] < transparent
+    if clear.any() and palette[0, 3] == 0:
+        idx[clear] = 0
+    return idx[inverse].reshape(rgba.shape[:2]).astype(np.uint8)
+
+
+def to_image(indices, palette):
+    '''P mode PIL image of indices and an RGBA palette, as read by img_conv.py.'''
+    from PIL import Image
+    im = Image.fromarray(indices, "P")
+    im.putpalette(palette.tobytes(), "RGBA")
+    return im
+
+
+def quantize(image, bits, method="median-cut", seed=0, transparent=DEFAULT_TRANSPARENT, palette=None):
+    '''P mode image of a PIL image with at most 2^bits colors, with its own palette or `palette`.'''
+    rgba = img_conv.to_rgba(image)
+    if palette is None:
+        palette = make_palette([rgba], bits, method, seed, transparent)
+    return to_image(remap(rgba, palette, transparent), palette)
+
+
+def _lab(rgb):
+    '''CIE L*a*b* (D65) of ... x 3 sRGB values in 0..255.'''
+    import numpy as np
+    c = rgb / 255.0
+    lin = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    xyz = lin @ np.array([[0.4124, 0.3576, 0.1805], [0.2126, 0.7152, 0.0722], [0.0193, 0.1192, 0.9505]]).T
+    xyz /= np.array([0.95047, 1.0, 1.08883])
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack([116 * f[..., 1] - 16, 500 * (f[..., 0] - f[..., 1]), 200 * (f[..., 1] - f[..., 2])], axis=-1)
+
+
+def error(rgba, quantized, background=img_conv.DEFAULT_BACKGROUND):
+    '''(PSNR in dB, mean dE, max dE) between two RGBA arrays blended onto `background`.'''
+    import numpy as np
+    a = img_conv.flatten(rgba, background)[..., :3].astype(np.float64)
+    b = img_conv.flatten(quantized, background)[..., :3].astype(np.float64)
+    mse = ((a - b) ** 2).mean()
+    psnr = float("inf") if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+    de = np.sqrt(((_lab(a) - _lab(b)) ** 2).sum(axis=-1))
+    return psnr, float(de.mean()), float(de.max())
+
+
+def sizes(image, bits, color_depth=16):
+    '''(INDEXED_nBIT data size, TRUE_COLOR(_ALPHA) data size) of an image in bytes.'''
+    w, h = image.size
+    indexed = 4 * (1 << bits) + -(-w * bits // 8) * h
+    has_alpha = img_conv.auto_format(image) == "TRUE_COLOR_ALPHA"
+    px = 4 if color_depth == 32 else color_depth // 8 + has_alpha
+    return indexed, w * h * px
+
+
+def main(argv=None):
+    from asset_pack import default_color_format
+    depth, _ = default_color_format()
+    parser = argparse.ArgumentParser(description="Quantize images to the INDEXED formats of LVGL v8 and report "
+                                                 "the error and the size saved")
+    parser.add_argument("input", nargs="+", help="image files, directories or glob patterns")
+    parser.add_argument("-b", "--bits", type=int, choices=(1, 2, 4, 8), default=4,
+                        help="bits per pixel, 2^bits palette entries (default: %(default)s)")
+    parser.add_argument("--method", choices=("median-cut", "kmeans"), default="median-cut",
+                        help="(default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="of the k-means batches (default: %(default)s)")
+    parser.add_argument("--shared", action="store_true", help="one palette for all the inputs")
+    parser.add_argument("--transparent", type=int, default=DEFAULT_TRANSPARENT,
+                        help="alpha below which pixels use the transparent entry 0 (default: %(default)s)")
+    parser.add_argument("--background", type=lambda s: int(s, 16), default=img_conv.DEFAULT_BACKGROUND,
+                        help="RRGGBB the error is measured on (default: ffffff)")
+    parser.add_argument("--format", choices=("c", "bin", "png", "none"), default="c",
+                        help="output (default: %(default)s)")
+    parser.add_argument("-o", "--output", default=".", help="output directory (default: %(default)s)")
+    parser.add_argument("--color-depth", type=int, choices=(8, 16, 32), default=depth,
+                        help="of the true color size compared with (default: %(default)s, from lv_conf.h)")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    from PIL import Image
+    files = img_conv.expand_inputs(args.input)
+    if args.format != "none":
+        names = [img_conv.c_name(f) for f in files]
+        dup = next((n for n in names if names.count(n) > 1), None)
+        if dup:
+            parser.error("several inputs named '%s' for the directory %s" % (dup, args.output))
+    if args.format == "png":
+        for path in files:
+            target = os.path.join(args.output, img_conv.c_name(path) + ".png")
+            if os.path.exists(target) and os.path.samefile(path, target):
+                parser.error("%s would be overwritten by its quantized image, use another --output" % path)
+    try:
+        images = []
+        for path in files:
+            with Image.open(path) as im:
+                im.load()
+                images.append(im)
+        rgbas = [img_conv.to_rgba(im) for im in images]
+        shared = make_palette(rgbas, args.bits, args.method, args.seed, args.transparent) if args.shared else None
+        if args.format != "none":
+            os.makedirs(args.output, exist_ok=True)
+
+        report = []
+        cf = "INDEXED_%dBIT" % args.bits
+        for path, im, rgba in zip(files, images, rgbas):
+            palette = shared if shared is not None else make_palette([rgba], args.bits, args.method, args.seed,
+                                                                     args.transparent)
+            q = to_image(remap(rgba, palette, args.transparent), palette)
+            psnr, de_mean, de_max = error(rgba, img_conv.to_rgba(q), args.background)
+            indexed_size, true_size = sizes(im, args.bits, args.color_depth)
+            name = img_conv.c_name(path)
+            if args.format == "c":
+                with img_conv.open_atomic(os.path.join(args.output, name + ".c"), "w") as out:
+                    img_conv.write_c(out, name, q, cf)
+            elif args.format == "bin":
+                with img_conv.open_atomic(os.path.join(args.output, name + ".bin")) as out:
+                    out.write(img_conv.to_bin(q, cf))
+            elif args.format == "png":
+                with img_conv.open_atomic(os.path.join(args.output, name + ".png")) as out:
+                    q.save(out, "PNG")
+            report.append({"file": path, "colors": len(palette), "psnr": round(psnr, 2),
+                           "de_mean": round(de_mean, 2), "de_max": round(de_max, 2),
+                           "indexed_bytes": indexed_size, "true_color_bytes": true_size})
+    except (OSError, ValueError) as e:
+        print("error: %s" % e, file=sys.stderr)
+        return 1
+
+    print("%-32s %6s %8s %8s %8s %9s %9s %6s" % ("image", "colors", "PSNR", "dE mean", "dE max", "indexed",
+                                                "true col", "ratio"))
+    for r in report:
+        print("%-32s %6d %8.2f %8.2f %8.2f %9d %9d %5.1fx" % (
+            os.path.basename(r["file"])[:32], r["colors"], r["psnr"], r["de_mean"], r["de_max"],
+            r["indexed_bytes"], r["true_color_bytes"], r["true_color_bytes"] / r["indexed_bytes"]))
+    total_indexed = sum(r["indexed_bytes"] for r in report)
+    total_true = sum(r["true_color_bytes"] for r in report)
+    if report:
+        print("total: %d bytes indexed, %d bytes true color, %d bytes saved" % (
+            total_indexed, total_true, total_true - total_indexed))
+    if args.json:
+        with img_conv.open_atomic(args.json, "w") as out:
+            json.dump({"bits": args.bits, "method": args.method, "seed": args.seed, "shared": args.shared,
+                       "images": report}, out, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
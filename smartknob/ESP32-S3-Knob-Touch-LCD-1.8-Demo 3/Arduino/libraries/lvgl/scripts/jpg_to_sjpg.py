@@ -1,138 +1,312 @@
 ##################################################################
-# sjpeg converter script version 1.0
+# sjpeg converter script version 2.0
 # Dependencies: (PYTHON-3)
+# The encoder itself lives in sjpg.py, this is only the CLI.
 ##################################################################
-SJPG_FILE_FORMAT_VERSION = "V1.00"  #
-JPEG_SPLIT_HEIGHT   = 16
-##################################################################
-import math, os, sys, time
+import argparse, glob, os, sys, time
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
 
-
-OUTPUT_FILE_NAME = ""
-INPUT_FILE       = ""
-
-
-if len(sys.argv) == 2:
-    INPUT_FILE = sys.argv[1]
-    OUTPUT_FILE_NAME = INPUT_FILE.split("/")[-1].split("\\")[-1].split(".")[0]
-else:
-    print("usage:\n\t python " + sys.argv[0] + " input_file.jpg")
-    sys.exit(0)
-
-try:
-    im = Image.open(INPUT_FILE)
-except:
-    print("\nFile not found!")
-    sys.exit(0)
-
-
-print("\nConversion started...\n")
-start_time = time.time()
-width, height = im.size
-
-print("Input:")
-print("\t" + INPUT_FILE)
-print("\tRES = " + str(width) + " x " + str(height) + '\n')
-
-
-lenbuf = []
-block_size = JPEG_SPLIT_HEIGHT;
-spilts = math.ceil(height/block_size)
-
-c_code = '''//LVGL SJPG C ARRAY\n#include "lvgl/lvgl.h"\n\nconst uint8_t ''' + OUTPUT_FILE_NAME + '''_map[] = {\n'''
-
-sjpeg_data = bytearray()
-sjpeg = bytearray()
-
-
-row_remaining = height;
-for i in range(spilts):
-    if row_remaining < block_size:
-        crop = im.crop((0, i*block_size, width, row_remaining + i*block_size))
-    else:
-        crop = im.crop((0, i*block_size, width, block_size + i*block_size))
-
-    row_remaining = row_remaining - block_size;
-    crop.save(str(i)+".jpg", quality=90)
-
-
-
-
-for i in range(spilts):
-    f = open(str(i)+".jpg", "rb")
-    a = f.read()
-    f.close()
-    sjpeg_data = sjpeg_data + a
-    lenbuf.append(len(a))
-
-header = bytearray()
-
-#4 BYTES
-header = header + bytearray("_SJPG__".encode("UTF-8"));
-
-#6 BYTES VERSION
-header = header + bytearray(("\x00" + SJPG_FILE_FORMAT_VERSION + "\x00").encode("UTF-8"));
-
-#WIDTH 2 BYTES
-header = header + width.to_bytes(2, byteorder='little');
-
-#HEIGHT 2 BYTES
-header = header + height.to_bytes(2, byteorder='little');
-
-#NUMBER OF ITEMS 2 BYTES
-header = header + spilts.to_bytes(2, byteorder='little');
-
-#NUMBER OF ITEMS 2 BYTES
-header = header + int(JPEG_SPLIT_HEIGHT).to_bytes(2, byteorder='little');
-
-for item_len in lenbuf:
-    # WIDTH 2 BYTES
-    header = header + item_len.to_bytes(2, byteorder='little');
-
-
-data = bytearray()
-
-sjpeg = header + sjpeg_data;
-
-if 1:
-    for i in range(len(lenbuf)):
-        os.remove(str(i) + ".jpg")
-
-
-f = open(OUTPUT_FILE_NAME+".sjpg","wb");
-f.write(sjpeg)
-f.close()
-
-new_line_threshold = 0
-for i in range(len(sjpeg)):
-    c_code = c_code + "\t" + str(hex(sjpeg[i])) + ","
-    new_line_threshold = new_line_threshold + 1
-    if (new_line_threshold >= 16):
-        c_code = c_code + "\n"
-        new_line_threshold = 0
-
-
-c_code = c_code + "\n};\n\nlv_img_dsc_t "
-c_code = c_code + OUTPUT_FILE_NAME + " = {\n"
-c_code = c_code + "\t.header.always_zero = 0,\n"
-c_code = c_code + "\t.header.w = " + str(width) + ",\n"
-c_code = c_code + "\t.header.h = " + str(height) + ",\n"
-c_code = c_code + "\t.data_size = " + str(len(sjpeg)) + ",\n"
-c_code = c_code + "\t.header.cf = LV_IMG_CF_RAW,\n"
-c_code = c_code + "\t.data = " + OUTPUT_FILE_NAME+"_map" + ",\n};"
-
-
-f = open(OUTPUT_FILE_NAME + '.c', 'w')
-f.write(c_code)
-f.close()
-
-
-time_taken = (time.time() - start_time)
-
-print("Output:")
-print("\tTime taken = " + str(round(time_taken,2)) + " sec")
-print("\tbin size = " + str(round(len(sjpeg)/1024, 1)) + " KB" )
-print("\t" + OUTPUT_FILE_NAME + ".sjpg\t(bin file)" + "\n\t" + OUTPUT_FILE_NAME + ".c\t\t(c array)")
-
-print("\nAll good!")
+import c_array
+import sjpg
+import sjpg_optimize
+import sjpg_restripe
+import sjpg_stream
+from asset_cache import AssetCache, open_atomic, write_atomic
+from sjpg_reader import SJPGReader
+
+CONVERTER_VERSION = "jpg_to_sjpg 2.0"
+CACHE_FILE_NAME = ".sjpg_cache.json"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def output_name(path):
+    return path.split("/")[-1].split("\\")[-1].split(".")[0]
+
+
+def expand_inputs(patterns):
+    '''Expand files, directories (their images) and glob patterns to a sorted list of files.'''
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            files += [os.path.join(pattern, f) for f in os.listdir(pattern) if f.lower().endswith(IMAGE_EXTENSIONS)]
+        elif glob.has_magic(pattern):
+            files += [f for f in glob.glob(pattern, recursive=True) if os.path.isfile(f)]
+        else:
+            files.append(pattern)
+    return sorted(set(files))
+
+
+def write_c_file(out, name, width, height, sjpeg):
+    '''Write the C array and the lv_img_dsc_t of an SJPG image to the text stream `out`.'''
+    out.write('''//LVGL SJPG C ARRAY\n#include "lvgl/lvgl.h"\n\nconst uint8_t ''' + name + '''_map[] = {\n''')
+    c_array.write_bytes(out, sjpeg, line_width=16, item_format="\t0x%x,", indent="")
+
+    out.write("\n};\n\nlv_img_dsc_t ")
+    out.write(name + " = {\n")
+    out.write("\t.header.always_zero = 0,\n")
+    out.write("\t.header.w = " + str(width) + ",\n")
+    out.write("\t.header.h = " + str(height) + ",\n")
+    out.write("\t.data_size = " + str(len(sjpeg)) + ",\n")
+    out.write("\t.header.cf = LV_IMG_CF_RAW,\n")
+    out.write("\t.data = " + name+"_map" + ",\n};")
+
+
+def write_outputs(output_dir, name, width, height, sjpeg):
+    '''Check that tjpgd can decode every strip, then write <name>.sjpg and <name>.c.'''
+    problems = SJPGReader(sjpeg).verify()
+    if problems:
+        raise ValueError("%s.sjpg is not valid: %s" % (name, "; ".join(problems)))
+    write_atomic(os.path.join(output_dir, name + ".sjpg"), sjpeg)
+    with open_atomic(os.path.join(output_dir, name + ".c"), "w") as out:
+        write_c_file(out, name, width, height, sjpeg)
+
+
+def convert(input_file, output_dir, settings, workers=None, verbose=True):
+    '''
+    Convert one image to <name>.sjpg and <name>.c in `output_dir`.
+    Return the size of the SJPG data or raise ValueError.
+    '''
+    name = output_name(input_file)
+    split_height = settings["split_height"]
+    quality = settings["quality"]
+    profile = settings["profile"]
+
+    if settings["lossless"]:
+        with open(input_file, "rb") as f:
+            data = f.read()
+        try:
+            sjpeg, width, height = sjpg_restripe.encode_sjpg_lossless(data, split_height, settings["version"],
+                                                                      settings["crc"])
+        except sjpg_restripe.NotEligible as e:
+            if verbose:
+                print("Lossless re-striping not possible (%s), re-encoding instead\n" % e)
+        else:
+            write_outputs(output_dir, name, width, height, sjpeg)
+            return len(sjpeg)
+
+    if settings["stream"] or settings["reduce"] > 1:
+        if settings["optimize"] is not None:
+            raise ValueError("--optimize needs the whole image, it can't be used with --stream or --reduce")
+        sjpeg, width, height = sjpg_stream.encode_sjpg_file(input_file, split_height, quality, workers,
+                                                            settings["version"], settings["crc"],
+                                                            settings["reduce"], profile)
+        write_outputs(output_dir, name, width, height, sjpeg)
+        return len(sjpeg)
+
+    with Image.open(input_file) as im:
+        width, height = im.size
+        opt = settings["optimize"]
+        if opt is not None:
+            best, candidates, front = sjpg_optimize.optimize(im, opt["flash_budget"], opt["ram_budget"],
+                                                             opt["min_psnr"], opt["redraw_rows"],
+                                                             cost_model=sjpg_optimize.DecodeCostModel(*opt["cost_model"]),
+                                                             version=settings["version"], workers=workers,
+                                                             profile=profile)
+            if verbose:
+                print("Pareto front (%d of %d points):" % (len(front), len(candidates)))
+                print(sjpg_optimize.format_table(front, best) + "\n")
+            if best is None:
+                raise ValueError("no strip height / quality meets the budgets")
+            if verbose:
+                print("Chosen:")
+                print(sjpg_optimize.format_table([best]) + "\n")
+            split_height = best.split_height
+            quality = best.quality
+
+        sjpeg = sjpg.encode_sjpg(im, split_height, quality, workers=workers,
+                                 version=settings["version"], crc=settings["crc"], profile=profile)
+
+    write_outputs(output_dir, name, width, height, sjpeg)
+    return len(sjpeg)
+
+
+def _convert_job(job):
+    input_file, output_dir, settings = job
+    try:
+        return convert(input_file, output_dir, settings, workers=1, verbose=False), None
+    except (OSError, ValueError) as e:
+        return None, str(e)
+
+
+def convert_one(input_file, output_dir, settings):
+    '''The classic single image conversion with its verbose report.'''
+    name = output_name(input_file)
+    try:
+        im = Image.open(input_file)
+    except:
+        print("\nFile not found!")
+        sys.exit(0)
+
+    print("\nConversion started...\n")
+    start_time = time.time()
+    width, height = im.size
+    im.close()
+
+    print("Input:")
+    print("\t" + input_file)
+    print("\tRES = " + str(width) + " x " + str(height) + '\n')
+
+    try:
+        size = convert(input_file, output_dir, settings)
+    except ValueError as e:
+        print("\nError: " + str(e))
+        sys.exit(1)
+
+    time_taken = (time.time() - start_time)
+
+    print("Output:")
+    print("\tTime taken = " + str(round(time_taken,2)) + " sec")
+    print("\tbin size = " + str(round(size/1024, 1)) + " KB" )
+    print("\t" + name + ".sjpg\t(bin file)" + "\n\t" + name + ".c\t\t(c array)")
+
+    print("\nAll good!")
+
+
+def convert_batch(input_files, output_dir, settings, cache_path, jobs):
+    '''Convert many images in parallel, skipping the ones whose cache entry is valid.'''
+    start_time = time.time()
+    names = {}
+    for f in input_files:
+        name = output_name(f)
+        if name in names:
+            print("Error: %s and %s would both be written as %s.sjpg" % (names[name], f, name))
+            sys.exit(1)
+        names[name] = f
+
+    cache = AssetCache(cache_path, CONVERTER_VERSION) if cache_path else None
+    todo = []
+    failed = 0
+    for f in input_files:
+        name = output_name(f)
+        outputs = [os.path.join(output_dir, name + ext) for ext in (".sjpg", ".c")]
+        key = None
+        if cache is not None:
+            try:
+                with open(f, "rb") as fin:
+                    key = cache.key(fin.read(), settings)
+            except OSError as e:
+                print("%s: error: %s" % (f, e.strerror))
+                failed += 1
+                continue
+            if cache.hit(f, key, outputs):
+                continue
+        todo.append((f, key, outputs))
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = pool.map(_convert_job, [(f, output_dir, settings) for f, _, _ in todo])
+            for (f, key, outputs), (size, error) in zip(todo, results):
+                if error is not None:
+                    print("%s: error: %s" % (f, error))
+                    failed += 1
+                    continue
+                print("%s -> %s.sjpg (%.1f KB)" % (f, output_name(f), size / 1024))
+                if cache is not None:
+                    cache.store(f, key, outputs)
+
+    if cache is not None:
+        cache.save()
+        print("Cache: %d hits, %d misses" % (cache.hits, cache.misses))
+    up_to_date = cache.hits if cache is not None else 0
+    print("%d converted, %d failed, %d up to date in %.2f sec" %
+          (len(input_files) - failed - up_to_date, failed, up_to_date, time.time() - start_time))
+    if failed:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert JPG images to SJPG (.sjpg file and C array)")
+    parser.add_argument('input', nargs='+', metavar='input_file.jpg',
+                        help='Images to convert. Directories and glob patterns (e.g. "assets/**/*.jpg") '
+                             'convert many images at once')
+    parser.add_argument('-o', '--output-dir', default='.', metavar='dir',
+                        help='Where to write the .sjpg and .c files (default: current directory)')
+    parser.add_argument('--v2', action='store_true',
+                        help='Write the V2.00 container (32 bit strip offsets, strips may exceed 64 KB)')
+    parser.add_argument('--crc', action='store_true', help='Add a CRC-32 per strip (implies --v2)')
+    parser.add_argument('--split-height', type=int, default=sjpg.JPEG_SPLIT_HEIGHT, metavar='px',
+                        help='Height of a strip (default %(default)s)')
+    parser.add_argument('--quality', type=int, metavar='1-95',
+                        help='JPEG quality of the strips (default %s)' % sjpg.JPEG_QUALITY)
+    parser.add_argument('--profile', choices=list(sjpg.ENCODING_PROFILES),
+                        help='Encoding profile: "fast-decode" (4:2:0, optimized Huffman tables), "balanced" '
+                             '(4:2:2), "quality" (4:4:4) or "default" (4:2:0, standard tables). '
+                             'Default: %s' % sjpg.DEFAULT_PROFILE)
+    parser.add_argument('--lossless', action='store_true',
+                        help='Cut baseline JPEGs into strips without re-encoding (pixel exact); other images '
+                             'are re-encoded with the default quality and profile. Fast for JPEGs with restart '
+                             'markers on the strip boundaries (jpegtran -restart 1), else about 0.2 s per '
+                             'megapixel, slower than re-encoding')
+    parser.add_argument('--stream', action='store_true',
+                        help='Read and encode the image band by band to keep memory low (for huge images). '
+                             'Baseline JPEGs are cut into MCU rows first (about 0.2 s per megapixel without restart '
+                             'markers), progressive ones are refused')
+    parser.add_argument('--reduce', type=int, default=1, metavar='N',
+                        help='Downscale by N while reading (streaming, JPEG sources are decoded at 1/2, 1/4 or '
+                             '1/8 size if N is even)')
+
+    opt = parser.add_argument_group('optimizer', 'Search strip height and quality instead of using the values above')
+    opt.add_argument('--optimize', action='store_true', help='Enable the search')
+    opt.add_argument('--flash-budget', type=float, metavar='KB', help='Maximal size of the SJPG data')
+    opt.add_argument('--ram-budget', type=float, metavar='KB',
+                     help='Maximal decoder heap (strip cache + tjpgd work buffer)')
+    opt.add_argument('--min-psnr', type=float, metavar='dB',
+                     help='Quality floor (default: the PSNR of --quality 90, 0: none)')
+    opt.add_argument('--redraw-rows', type=int, metavar='px',
+                     help='Height of a typical invalidated area (default: 1/4 of the image)')
+    opt.add_argument('--cost-model', metavar='strip_us,byte_us,pixel_us',
+                     help='Decode time coefficients (default: %s)' %
+                     ",".join(str(v) for v in sjpg_optimize.DEFAULT_COST_MODEL))
+
+    batch = parser.add_argument_group('batch', 'Used when several images, a directory or a pattern is given')
+    batch.add_argument('-j', '--jobs', type=int, metavar='N', help='Parallel conversions (default: CPU count)')
+    batch.add_argument('--cache', metavar='file',
+                       help='Cache file (default: %s in the output directory)' % CACHE_FILE_NAME)
+    batch.add_argument('--no-cache', action='store_true', help='Convert every image')
+    args = parser.parse_args()
+    if args.lossless:
+        ignored = [name for name, used in (("--quality", args.quality is not None),
+                                           ("--profile", args.profile is not None),
+                                           ("--optimize", args.optimize), ("--stream", args.stream),
+                                           ("--reduce", args.reduce > 1)) if used]
+        if ignored:
+            parser.error("--lossless copies the JPEG data, it can't be used with %s" % ", ".join(ignored))
+
+    kb = lambda v: None if v is None else int(v * 1024)
+    optimize = None
+    if args.optimize:
+        cost_model = sjpg_optimize.DEFAULT_COST_MODEL
+        if args.cost_model:
+            cost_model = sjpg_optimize.DecodeCostModel(*(float(v) for v in args.cost_model.split(",")))
+        optimize = {"flash_budget": kb(args.flash_budget), "ram_budget": kb(args.ram_budget),
+                    "min_psnr": args.min_psnr, "redraw_rows": args.redraw_rows, "cost_model": list(cost_model)}
+
+    settings = {
+        "split_height": args.split_height,
+        "quality": sjpg.JPEG_QUALITY if args.quality is None else args.quality,
+        "profile": args.profile or sjpg.DEFAULT_PROFILE,
+        "version": 2 if (args.v2 or args.crc) else 1,
+        "crc": args.crc,
+        "optimize": optimize,
+        "lossless": args.lossless,
+        "stream": args.stream,
+        "reduce": args.reduce,
+    }
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    input_files = expand_inputs(args.input)
+    single = len(args.input) == 1 and not os.path.isdir(args.input[0]) and not glob.has_magic(args.input[0])
+    if single:
+        convert_one(input_files[0], args.output_dir, settings)
+        return
+
+    if not input_files:
+        print("No images found")
+        sys.exit(1)
+    cache_path = None if args.no_cache else (args.cache or os.path.join(args.output_dir, CACHE_FILE_NAME))
+    convert_batch(input_files, args.output_dir, settings, cache_path, args.jobs)
+
+
+if __name__ == "__main__":
+    main()
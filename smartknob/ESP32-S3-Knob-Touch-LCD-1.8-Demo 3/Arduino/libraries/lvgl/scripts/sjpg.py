@@ -0,0 +1,199 @@
+'''
+SJPG (split JPEG) encoder
+
+Importable counterpart of jpg_to_sjpg.py. The image is cut into horizontal
+strips, every strip is encoded to JPEG in memory and the strips are bundled
+behind the `_SJPG__` header understood by src/extra/libs/sjpg/lv_sjpg.c.
+
+Two container versions can be written:
+    V1.00   2 byte strip lengths, every strip must be smaller than 64 KB
+    V2.00   absolute 4 byte strip offsets (plus the end offset) so a decoder
+            can seek to any strip directly, and an optional CRC-32 per strip
+
+Example:
+    from PIL import Image
+    import sjpg
+
+    with Image.open("wallpaper.jpg") as im:
+        data = sjpg.encode_sjpg(im)
+        fast = sjpg.encode_sjpg(im, profile="fast-decode")
+
+Encoding profiles (ENCODING_PROFILES) select chroma subsampling and Huffman
+table optimization. They all write baseline Huffman JPEG with 1x1 chroma
+sampling, the only kind tjpgd decodes.
+
+Dependencies: (PYTHON-3) pillow
+'''
+
+import io
+import math
+import os
+import zlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+SJPG_MAGIC = b"_SJPG__"
+SJPG_FILE_FORMAT_VERSION = "V1.00"
+SJPG_FILE_FORMAT_VERSION_2 = "V2.00"
+JPEG_SPLIT_HEIGHT = 16
+JPEG_QUALITY = 90
+
+# V1: the 2 byte length table starts at 22
+SJPG_V1_HEADER_SIZE = 22
+# V2 only: uint16 flags at offset 22, the offset table starts at 24
+SJPG_V2_FLAGS_OFFSET = 22
+SJPG_V2_FRAME_INFO_ARRAY_OFFSET = 24
+SJPG_FLAG_CRC32 = 0x0001
+
+# `subsampling` and `optimize` are passed to Pillow (-1: libjpeg default, 4:2:0).
+# `decode_cost` is the tjpgd decode time per pixel relative to 4:2:0, measured
+# on colour images with lv_sjpg.c (JD_FASTDECODE 0), see docs/libs/sjpg.md.
+EncodingProfile = namedtuple("EncodingProfile", "subsampling optimize decode_cost")
+ENCODING_PROFILES = {
+    # What jpg_to_sjpg.py has always written: 4:2:0, standard Huffman tables
+    "default": EncodingProfile(subsampling=-1, optimize=False, decode_cost=1.0),
+    # 4:2:0 with optimized Huffman tables: same decode time, ~25 % smaller
+    "fast-decode": EncodingProfile(subsampling=2, optimize=True, decode_cost=1.0),
+    # 4:2:2, sharper horizontal color edges
+    "balanced": EncodingProfile(subsampling=1, optimize=True, decode_cost=1.3),
+    # 4:4:4, full color resolution, for text and thin colored lines
+    "quality": EncodingProfile(subsampling=0, optimize=True, decode_cost=1.6),
+}
+DEFAULT_PROFILE = "default"
+
+# Below this many strips the process pool costs more than it saves
+_PARALLEL_MIN_STRIPS = 8
+
+
+def split_rows(height, split_height=JPEG_SPLIT_HEIGHT):
+    '''Return the (top, bottom) row range of every strip.'''
+    return [(y, min(y + split_height, height)) for y in range(0, height, split_height)]
+
+
+def get_profile(name):
+    '''Return the EncodingProfile called `name` or raise ValueError.'''
+    try:
+        return ENCODING_PROFILES[name]
+    except KeyError:
+        raise ValueError("unknown encoding profile %r (known: %s)" % (name, ", ".join(ENCODING_PROFILES)))
+
+
+def mcu_height(image, profile=DEFAULT_PROFILE):
+    '''
+    Height of a JPEG MCU when `image` is encoded with `profile`: 8 rows for
+    grayscale, 4:4:4 and 4:2:2, 16 rows for 4:2:0.
+    '''
+    subsampling = get_profile(profile).subsampling
+    return 8 if image.mode == "L" or subsampling in (0, 1) else 16
+
+
+def encode_strip(strip, quality=JPEG_QUALITY, profile=DEFAULT_PROFILE):
+    '''Encode one strip (a PIL image) to JPEG bytes.'''
+    p = get_profile(profile)
+    buf = io.BytesIO()
+    strip.save(buf, format="JPEG", quality=quality, subsampling=p.subsampling, optimize=p.optimize,
+               progressive=False)
+    return buf.getvalue()
+
+
+def _encode_strip_job(job):
+    strip, quality, profile = job
+    return encode_strip(strip, quality, profile)
+
+
+def _common_header(version, width, height, split_height, strip_cnt):
+    header = bytearray(SJPG_MAGIC)
+    header += ("\x00" + version + "\x00").encode("UTF-8")
+    header += width.to_bytes(2, byteorder='little')
+    header += height.to_bytes(2, byteorder='little')
+    header += strip_cnt.to_bytes(2, byteorder='little')
+    header += split_height.to_bytes(2, byteorder='little')
+    return header
+
+
+def build_header(width, height, split_height, strip_lengths):
+    '''Build the V1.00 header followed by the 2 byte strip length table.'''
+    header = _common_header(SJPG_FILE_FORMAT_VERSION, width, height, split_height, len(strip_lengths))
+    for item_len in strip_lengths:
+        if item_len > 0xFFFF:
+            raise ValueError("strip of %d bytes does not fit the V1 length table, use version 2" % item_len)
+        header += item_len.to_bytes(2, byteorder='little')
+    return bytes(header)
+
+
+def v2_header_size(strip_cnt, crc=False):
+    '''Size of a V2 header (including the tables) for `strip_cnt` strips.'''
+    return SJPG_V2_FRAME_INFO_ARRAY_OFFSET + 4 * (strip_cnt + 1) + (4 * strip_cnt if crc else 0)
+
+
+def build_header_v2(width, height, split_height, strip_lengths, crcs=None):
+    '''
+    Build the V2.00 header:
+        0 - 21      same fields as V1.00 (magic, version, w, h, strip count, strip height)
+        22 - 23     flags, SJPG_FLAG_CRC32 if a CRC table follows the offset table
+        24 - ...    (strip count + 1) absolute uint32 offsets, the last one is the end of data
+        ...         optional uint32 CRC-32 of every strip
+    '''
+    header = _common_header(SJPG_FILE_FORMAT_VERSION_2, width, height, split_height, len(strip_lengths))
+    flags = SJPG_FLAG_CRC32 if crcs is not None else 0
+    header += flags.to_bytes(2, byteorder='little')
+
+    offset = v2_header_size(len(strip_lengths), crcs is not None)
+    for item_len in strip_lengths:
+        header += offset.to_bytes(4, byteorder='little')
+        offset += item_len
+    if offset > 0xFFFFFFFF:
+        raise ValueError("SJPG data does not fit 32 bit offsets")
+    header += offset.to_bytes(4, byteorder='little')
+
+    if crcs is not None:
+        for crc in crcs:
+            header += crc.to_bytes(4, byteorder='little')
+    return bytes(header)
+
+
+def encode_strips(image, split_height=JPEG_SPLIT_HEIGHT, quality=JPEG_QUALITY, workers=None,
+                  profile=DEFAULT_PROFILE):
+    '''
+    Encode every strip of `image` and return the list of JPEG blobs.
+    `workers` is the size of the process pool; None uses every CPU, 1 encodes
+    in the calling process.
+    '''
+    get_profile(profile)        # fail here rather than in every worker
+    width, height = image.size
+    jobs = [(image.crop((0, top, width, bottom)), quality, profile)
+            for top, bottom in split_rows(height, split_height)]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(jobs))
+
+    if workers <= 1 or len(jobs) < _PARALLEL_MIN_STRIPS:
+        return [_encode_strip_job(job) for job in jobs]
+
+    chunksize = max(1, math.ceil(len(jobs) / (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_encode_strip_job, jobs, chunksize=chunksize))
+
+
+def pack_sjpg(width, height, split_height, strips, version=1, crc=False):
+    '''Bundle already encoded JPEG strips into an SJPG blob.'''
+    lengths = [len(s) for s in strips]
+    if version == 1:
+        if crc:
+            raise ValueError("per strip CRC needs SJPG version 2")
+        header = build_header(width, height, split_height, lengths)
+    elif version == 2:
+        crcs = [zlib.crc32(s) for s in strips] if crc else None
+        header = build_header_v2(width, height, split_height, lengths, crcs)
+    else:
+        raise ValueError("unknown SJPG version %r" % version)
+    return header + b"".join(strips)
+
+
+def encode_sjpg(image, split_height=JPEG_SPLIT_HEIGHT, quality=JPEG_QUALITY, workers=None, version=1, crc=False,
+                profile=DEFAULT_PROFILE):
+    '''Encode a PIL image to an SJPG blob and return it as bytes.'''
+    width, height = image.size
+    strips = encode_strips(image, split_height, quality, workers, profile)
+    return pack_sjpg(width, height, split_height, strips, version, crc)
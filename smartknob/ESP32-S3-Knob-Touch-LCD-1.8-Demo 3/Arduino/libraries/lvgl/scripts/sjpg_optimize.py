@@ -0,0 +1,183 @@
+'''
+Strip height and quality optimizer for SJPG conversion
+
+Encodes an image over a grid of strip heights (multiples of the JPEG MCU
+height) and qualities and scores every point by
+    - file size (flash)
+    - peak RAM of the lv_sjpg decoder (strip cache + tjpgd work buffer)
+    - estimated decode time of one strip and of a typical partial redraw
+    - PSNR against the source image
+
+The fastest point that fits the flash budget, the RAM budget and the quality
+floor is chosen. Without a floor given, the floor is the PSNR of the default
+quality (sjpg.JPEG_QUALITY, the lowest at any strip height): the search
+then trades strip height and quality for speed but never goes below the
+quality of a plain conversion. The decode time is a linear cost model (per strip overhead,
+per compressed byte, per pixel); the default coefficients are rough ESP32-S3
+figures for 4:2:0 and can be replaced with measured ones. The per pixel cost
+is scaled by the `decode_cost` of the encoding profile.
+
+Used by `jpg_to_sjpg.py --optimize`.
+
+Dependencies: (PYTHON-3) pillow
+'''
+
+import io
+import math
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageChops, ImageStat
+
+import sjpg
+
+# Must match lv_sjpg.c
+TJPGD_WORKBUFF_SIZE = 4096
+# sizeof(JDEC) + sizeof(SJPEG) on a 32 bit target, rounded up
+SJPG_DECODER_CONTEXT_SIZE = 256
+# The strip cache holds RGB888 pixels
+SJPG_CACHE_PIXEL_SIZE = 3
+
+DEFAULT_QUALITIES = (50, 60, 70, 75, 80, 85, 90, 95)
+
+# Per strip overhead (header parsing in jd_prepare), per compressed byte (Huffman)
+# and per pixel (IDCT and color conversion), in microseconds
+DecodeCostModel = namedtuple("DecodeCostModel", "strip_us byte_us pixel_us")
+DEFAULT_COST_MODEL = DecodeCostModel(strip_us=150.0, byte_us=0.10, pixel_us=0.05)
+
+Candidate = namedtuple("Candidate", "split_height quality size ram strip_us redraw_us psnr")
+
+
+def decoder_ram(width, split_height, strip_cnt, version=1):
+    '''Peak heap used by lv_sjpg.c while an SJPG image is open.'''
+    ram = width * split_height * SJPG_CACHE_PIXEL_SIZE + TJPGD_WORKBUFF_SIZE + SJPG_DECODER_CONTEXT_SIZE
+    if version == 1:
+        # V1 keeps the start of every strip in RAM (one pointer or int per strip)
+        ram += 4 * strip_cnt
+    return ram
+
+
+def strips_per_redraw(split_height, redraw_rows):
+    '''Average number of strips an invalidated band of `redraw_rows` rows touches.'''
+    return (redraw_rows + split_height - 1) / split_height
+
+
+def psnr(reference, decoded):
+    '''PSNR in dB of `decoded` against `reference` (both RGB).'''
+    diff = ImageChops.difference(reference, decoded)
+    sum2 = sum(ImageStat.Stat(diff).sum2)
+    if sum2 == 0:
+        return float("inf")
+    mse = sum2 / (reference.size[0] * reference.size[1] * len(reference.getbands()))
+    return 10 * math.log10(255 * 255 / mse)
+
+
+def _decode_strips(width, height, strips):
+    out = Image.new("RGB", (width, height))
+    y = 0
+    for strip in strips:
+        with Image.open(io.BytesIO(strip)) as im:
+            out.paste(im.convert("RGB"), (0, y))
+            y += im.size[1]
+    return out
+
+
+def evaluate(image, split_height, quality, redraw_rows, cost_model=DEFAULT_COST_MODEL, version=1,
+             profile=sjpg.DEFAULT_PROFILE):
+    '''Encode `image` with one setting and return its Candidate.'''
+    width, height = image.size
+    strips = sjpg.encode_strips(image, split_height, quality, workers=1, profile=profile)
+    if version == 2:
+        size = sjpg.v2_header_size(len(strips)) + sum(len(s) for s in strips)
+    else:
+        size = sjpg.SJPG_V1_HEADER_SIZE + 2 * len(strips) + sum(len(s) for s in strips)
+
+    avg_bytes = sum(len(s) for s in strips) / len(strips)
+    pixel_us = cost_model.pixel_us * sjpg.get_profile(profile).decode_cost
+    strip_us = cost_model.strip_us + avg_bytes * cost_model.byte_us + width * split_height * pixel_us
+    redraw_us = strip_us * min(strips_per_redraw(split_height, redraw_rows), len(strips))
+
+    decoded = _decode_strips(width, height, strips)
+    reference = image if image.mode == "RGB" else image.convert("RGB")
+    return Candidate(split_height, quality, size, decoder_ram(width, split_height, len(strips), version),
+                     strip_us, redraw_us, psnr(reference, decoded))
+
+
+def _evaluate_job(job):
+    return evaluate(*job)
+
+
+def pareto_front(candidates):
+    '''Candidates not dominated in (size, ram, strip_us, PSNR): smaller, faster or better.'''
+    def dominates(a, b):
+        ka = (a.size, a.ram, a.strip_us, -a.psnr)
+        kb = (b.size, b.ram, b.strip_us, -b.psnr)
+        return all(x <= y for x, y in zip(ka, kb)) and ka != kb
+
+    return sorted((c for c in candidates if not any(dominates(o, c) for o in candidates)),
+                  key=lambda c: (c.size, c.ram, c.strip_us))
+
+
+def optimize(image, flash_budget=None, ram_budget=None, min_psnr=None, redraw_rows=None,
+             qualities=DEFAULT_QUALITIES, cost_model=DEFAULT_COST_MODEL,
+             version=1, workers=None, profile=sjpg.DEFAULT_PROFILE):
+    '''
+    Search strip height and quality for `image`.
+    `flash_budget` and `ram_budget` are in bytes, `min_psnr` in dB (None: the
+    PSNR of sjpg.JPEG_QUALITY, which is then added to `qualities`), `redraw_rows`
+    is the height of a typical invalidated area (defaults to 1/4 of the image).
+    Return (best, candidates, front). `front` is the Pareto front of the
+    candidates that fit the budgets (of all candidates if none does), `best` is
+    the one with the fastest redraw or None if nothing fits.
+    '''
+    width, height = image.size
+    if redraw_rows is None:
+        redraw_rows = max(1, height // 4)
+
+    mcu = sjpg.mcu_height(image, profile)
+    heights = []
+    split_height = mcu
+    while True:
+        heights.append(split_height)
+        if split_height >= height:
+            break
+        split_height += mcu
+
+    if ram_budget is not None:
+        heights = [h for h in heights
+                   if decoder_ram(width, h, math.ceil(height / h), version) <= ram_budget] or heights[:1]
+
+    if min_psnr is None and sjpg.JPEG_QUALITY not in qualities:
+        qualities = tuple(qualities) + (sjpg.JPEG_QUALITY,)
+    jobs = [(image, h, q, redraw_rows, cost_model, version, profile) for h in heights for q in qualities]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        candidates = [_evaluate_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            candidates = list(pool.map(_evaluate_job, jobs))
+
+    if min_psnr is None:
+        min_psnr = min(c.psnr for c in candidates if c.quality == sjpg.JPEG_QUALITY)
+
+    def fits(c):
+        return ((flash_budget is None or c.size <= flash_budget) and
+                (ram_budget is None or c.ram <= ram_budget) and
+                c.psnr >= min_psnr)
+
+    feasible = [c for c in candidates if fits(c)]
+    best = min(feasible, key=lambda c: (c.redraw_us, c.size, -c.psnr)) if feasible else None
+    return best, candidates, pareto_front(feasible or candidates)
+
+
+def format_table(candidates, best=None):
+    '''Format candidates as a text table, `best` is marked with `*`.'''
+    lines = ["    height  quality     size KB   RAM KB  strip us  redraw us   PSNR dB"]
+    for c in candidates:
+        mark = "*" if c == best else " "
+        lines.append("  %s %6d  %7d  %10.1f  %7.1f  %8.0f  %9.0f  %8.2f" %
+                     (mark, c.split_height, c.quality, c.size / 1024, c.ram / 1024,
+                      c.strip_us, c.redraw_us, c.psnr))
+    return "\n".join(lines)
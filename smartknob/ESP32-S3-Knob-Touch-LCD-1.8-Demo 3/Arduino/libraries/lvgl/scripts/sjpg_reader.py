@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+'''
+Reference SJPG reader
+
+Parses the `_SJPG__` header (V1.00 and V2.00), memory-maps .sjpg files and
+gives lazy access to the strips, so only the strips that are needed are read:
+
+    with SJPGReader("wallpaper.sjpg") as r:
+        r.get_strip(3)              # JPEG bytes of strip 3 (a memoryview)
+        r.decode_rows(100, 140)     # PIL image of rows 100..139
+
+The generated C arrays (`*_map[]` written by jpg_to_sjpg.py) can be opened
+the same way by passing the .c file.
+
+Command line:
+    python3 sjpg_reader.py info image.sjpg
+    python3 sjpg_reader.py verify image.sjpg [image.c ...] [--source image.jpg --min-psnr 30]
+    python3 sjpg_reader.py decode image.sjpg out.png [--rows y0 y1]
+
+Dependencies: (PYTHON-3) pillow for decoding, parsing and `verify` without
+--source work without it.
+'''
+
+import argparse
+import io
+import mmap
+import re
+import sys
+import zlib
+
+import sjpg
+
+# JPEG markers
+M_SOI = 0xD8
+M_EOI = 0xD9
+M_SOS = 0xDA
+M_SOF0 = 0xC0       # baseline, the only one tjpgd decodes
+SOF_MARKERS = (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF)
+
+# tjpgd limits (tjpgd.c, tjpgdcnf.h)
+TJPGD_SZBUF = 512                       # JD_SZBUF, the longest segment it can load
+TJPGD_LUMA_SAMPLING = (0x11, 0x21, 0x22)
+
+
+class SJPGError(ValueError):
+    pass
+
+
+def iter_segments(data):
+    '''
+    Yield (marker, offset, payload) for every marker segment of a JPEG up to
+    and including SOS. `offset` points at the 0xFF of the marker, `payload`
+    excludes the 2 byte length.
+    '''
+    if len(data) < 4 or data[0] != 0xFF or data[1] != M_SOI:
+        raise SJPGError("missing SOI marker")
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            raise SJPGError("expected a marker at offset %d" % pos)
+        marker = data[pos + 1]
+        if marker == 0xFF:          # fill byte
+            pos += 1
+            continue
+        length = (data[pos + 2] << 8) | data[pos + 3]
+        if length < 2 or pos + 2 + length > len(data):
+            raise SJPGError("truncated segment 0x%02X at offset %d" % (marker, pos))
+        yield marker, pos, data[pos + 4:pos + 2 + length]
+        if marker == M_SOS:
+            return
+        pos += 2 + length
+    raise SJPGError("no SOS marker")
+
+
+def parse_sof(data):
+    '''Return (sof_marker, width, height, components) of a JPEG.'''
+    for marker, _, payload in iter_segments(data):
+        if marker in SOF_MARKERS:
+            height = (payload[1] << 8) | payload[2]
+            width = (payload[3] << 8) | payload[4]
+            return marker, width, height, payload[5]
+    raise SJPGError("no SOF marker")
+
+
+def read_c_array(path):
+    '''Return the bytes of the `*_map[]` array of a generated C file.'''
+    with open(path, "r") as f:
+        text = f.read()
+    m = re.search(r"_map\s*\[\s*\]\s*=\s*\{(.*?)\}\s*;", text, re.S)
+    if not m:
+        raise SJPGError("no *_map[] array in " + path)
+    return bytes.fromhex("".join(h.zfill(2) for h in re.findall(r"0x([0-9a-fA-F]{1,2})", m.group(1))))
+
+
+def tjpgd_problems(data):
+    '''Return the reasons why tjpgd (jd_prepare) would refuse the JPEG `data`, empty if none.'''
+    problems = []
+    ncomp = 0
+    try:
+        for marker, _, payload in iter_segments(data):
+            if marker in SOF_MARKERS and marker != M_SOF0:
+                problems.append("SOF 0x%02X is not baseline" % marker)
+            elif marker == M_SOF0:
+                ncomp = payload[5]
+                if ncomp not in (1, 3):
+                    problems.append("%d color components" % ncomp)
+                for i in range(ncomp):
+                    sampling, qtid = payload[7 + 3 * i], payload[8 + 3 * i]
+                    if (i == 0 and sampling not in TJPGD_LUMA_SAMPLING) or (i > 0 and sampling != 0x11):
+                        problems.append("sampling factor 0x%02X of component %d" % (sampling, i))
+                    if qtid > 3:
+                        problems.append("quantization table %d" % qtid)
+            elif marker == M_SOS:
+                # tjpgd uses table 0 for Y and table 1 for Cb/Cr whatever the SOS says
+                for i in range(min(payload[0], ncomp)):
+                    if payload[2 + 2 * i] != (0x00 if i == 0 else 0x11):
+                        problems.append("component %d uses Huffman tables 0x%02X" % (i, payload[2 + 2 * i]))
+            if len(payload) > TJPGD_SZBUF and marker in (M_SOF0, M_SOS, 0xC4, 0xDB, 0xDD):
+                problems.append("segment 0x%02X is longer than JD_SZBUF" % marker)
+    except SJPGError as e:
+        problems.append(str(e))
+    return problems
+
+
+class SJPGReader:
+    '''Lazy reader of an SJPG file, C array or bytes object.'''
+
+    def __init__(self, source):
+        self._file = None
+        self._mmap = None
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self.data = memoryview(source)
+        elif str(source).endswith(".c"):
+            self.data = memoryview(read_c_array(source))
+        else:
+            self._file = open(source, "rb")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.data = memoryview(self._mmap)
+        try:
+            self._parse_header()
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        if self._mmap is not None:
+            self.data.release()
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _u16(self, pos):
+        return int.from_bytes(self.data[pos:pos + 2], "little")
+
+    def _u32(self, pos):
+        return int.from_bytes(self.data[pos:pos + 4], "little")
+
+    def _parse_header(self):
+        data = self.data
+        if len(data) < sjpg.SJPG_V1_HEADER_SIZE or bytes(data[0:7]) != sjpg.SJPG_MAGIC:
+            raise SJPGError("not an SJPG file (missing _SJPG__ magic)")
+        version = bytes(data[8:13]).decode("ascii", "replace")
+        self.width = self._u16(14)
+        self.height = self._u16(16)
+        self.strip_count = self._u16(18)
+        self.split_height = self._u16(20)
+        self.flags = 0
+        self.crcs = None
+
+        if version == sjpg.SJPG_FILE_FORMAT_VERSION:
+            self.version = 1
+            table = sjpg.SJPG_V1_HEADER_SIZE
+            self.header_size = table + 2 * self.strip_count
+            if self.header_size > len(data):
+                raise SJPGError("truncated strip length table")
+            self.offsets = [self.header_size]
+            for i in range(self.strip_count):
+                self.offsets.append(self.offsets[-1] + self._u16(table + 2 * i))
+        elif version == sjpg.SJPG_FILE_FORMAT_VERSION_2:
+            self.version = 2
+            self.flags = self._u16(sjpg.SJPG_V2_FLAGS_OFFSET)
+            has_crc = bool(self.flags & sjpg.SJPG_FLAG_CRC32)
+            table = sjpg.SJPG_V2_FRAME_INFO_ARRAY_OFFSET
+            self.header_size = sjpg.v2_header_size(self.strip_count, has_crc)
+            if self.header_size > len(data):
+                raise SJPGError("truncated strip offset table")
+            self.offsets = [self._u32(table + 4 * i) for i in range(self.strip_count + 1)]
+            if has_crc:
+                crc_table = table + 4 * (self.strip_count + 1)
+                self.crcs = [self._u32(crc_table + 4 * i) for i in range(self.strip_count)]
+        else:
+            raise SJPGError("unknown SJPG version %r" % version)
+
+    def strip_rows(self, index):
+        '''Return the (top, bottom) rows covered by a strip.'''
+        top = index * self.split_height
+        return top, min(top + self.split_height, self.height)
+
+    def get_strip(self, index):
+        '''Return the JPEG data of a strip without copying it.'''
+        if not 0 <= index < self.strip_count:
+            raise IndexError("strip %d out of range" % index)
+        return self.data[self.offsets[index]:self.offsets[index + 1]]
+
+    def decode_strip(self, index):
+        '''Decode a strip to an RGB PIL image.'''
+        from PIL import Image
+        with Image.open(io.BytesIO(self.get_strip(index))) as im:
+            return im.convert("RGB")
+
+    def decode_rows(self, y0, y1):
+        '''Decode rows y0 .. y1-1 reading only the strips covering them.'''
+        from PIL import Image
+        if not 0 <= y0 < y1 <= self.height:
+            raise IndexError("rows %d..%d out of range" % (y0, y1))
+        out = Image.new("RGB", (self.width, y1 - y0))
+        first = y0 // self.split_height
+        last = (y1 - 1) // self.split_height
+        for index in range(first, last + 1):
+            top, _ = self.strip_rows(index)
+            out.paste(self.decode_strip(index), (0, top - y0))
+        return out
+
+    def verify(self):
+        '''Check the header, the strip table and the JPEG markers. Return a list of problems.'''
+        problems = []
+        expected = (self.height + self.split_height - 1) // self.split_height if self.split_height else -1
+        if self.strip_count != expected:
+            problems.append("strip count %d, expected %d for height %d and strip height %d" %
+                            (self.strip_count, expected, self.height, self.split_height))
+        if self.offsets[0] != self.header_size:
+            problems.append("first strip at %d, header ends at %d" % (self.offsets[0], self.header_size))
+        if self.offsets[-1] != len(self.data):
+            problems.append("strips end at %d, data size is %d" % (self.offsets[-1], len(self.data)))
+
+        for i in range(self.strip_count):
+            if self.offsets[i + 1] < self.offsets[i] or self.offsets[i + 1] > len(self.data):
+                problems.append("strip %d: bad range %d..%d" % (i, self.offsets[i], self.offsets[i + 1]))
+                continue
+            strip = self.get_strip(i)
+            if bytes(strip[-2:]) != b"\xff\xd9":
+                problems.append("strip %d: missing EOI marker" % i)
+            try:
+                _, w, h, _ = parse_sof(strip)
+            except SJPGError as e:
+                problems.append("strip %d: %s" % (i, e))
+                continue
+            for p in tjpgd_problems(strip):
+                problems.append("strip %d: tjpgd can't decode it: %s" % (i, p))
+            top, bottom = self.strip_rows(i)
+            if (w, h) != (self.width, bottom - top):
+                problems.append("strip %d: %d x %d, expected %d x %d" % (i, w, h, self.width, bottom - top))
+            if self.crcs is not None and zlib.crc32(strip) != self.crcs[i]:
+                problems.append("strip %d: CRC mismatch" % i)
+        return problems
+
+
+def _cmd_info(args):
+    with SJPGReader(args.file) as r:
+        print("%s: SJPG V%d, %d x %d, %d strips of %d rows, flags 0x%04X, %d bytes" %
+              (args.file, r.version, r.width, r.height, r.strip_count, r.split_height, r.flags, len(r.data)))
+        for i in range(r.strip_count):
+            top, bottom = r.strip_rows(i)
+            crc = "  crc %08X" % r.crcs[i] if r.crcs is not None else ""
+            print("  strip %4d  rows %5d..%-5d  offset %8d  size %6d%s" %
+                  (i, top, bottom - 1, r.offsets[i], r.offsets[i + 1] - r.offsets[i], crc))
+    return 0
+
+
+def _cmd_verify(args):
+    failed = False
+    with SJPGReader(args.file) as r:
+        problems = r.verify()
+        for c_file in args.c_arrays:
+            if read_c_array(c_file) != bytes(r.data):
+                problems.append("%s does not match %s" % (c_file, args.file))
+        if args.source and not problems:
+            from PIL import Image
+            import sjpg_optimize
+            with Image.open(args.source) as src:
+                if src.size != (r.width, r.height):
+                    problems.append("source is %d x %d" % src.size)
+                else:
+                    value = sjpg_optimize.psnr(src.convert("RGB"), r.decode_rows(0, r.height))
+                    print("%s: PSNR %.2f dB against %s" % (args.file, value, args.source))
+                    if value < args.min_psnr:
+                        problems.append("PSNR %.2f dB is below %.2f dB" % (value, args.min_psnr))
+    for p in problems:
+        print("%s: %s" % (args.file, p))
+        failed = True
+    if not failed:
+        print("%s: OK" % args.file)
+    return 1 if failed else 0
+
+
+def _cmd_decode(args):
+    with SJPGReader(args.file) as r:
+        y0, y1 = args.rows if args.rows else (0, r.height)
+        r.decode_rows(y0, y1).save(args.output)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and verify SJPG files and C arrays")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("info", help="Print the header and the strip table")
+    p.add_argument("file", help=".sjpg or generated .c file")
+    p.set_defaults(func=_cmd_info)
+
+    p = sub.add_parser("verify", help="Check header, strip table and JPEG markers")
+    p.add_argument("file", help=".sjpg or generated .c file")
+    p.add_argument("c_arrays", nargs="*", metavar="file.c", help="C arrays that must hold the same bytes")
+    p.add_argument("--source", metavar="image", help="Compare the decoded image against the source image")
+    p.add_argument("--min-psnr", type=float, default=30.0, metavar="dB",
+                   help="Quality required with --source (default %(default)s)")
+    p.set_defaults(func=_cmd_verify)
+
+    p = sub.add_parser("decode", help="Decode the image (or some rows) to a PNG")
+    p.add_argument("file", help=".sjpg or generated .c file")
+    p.add_argument("output", help="Output image")
+    p.add_argument("--rows", type=int, nargs=2, metavar=("y0", "y1"), help="Decode only rows y0..y1-1")
+    p.set_defaults(func=_cmd_decode)
+
+    args = parser.parse_args()
+    try:
+        return args.func(args)
+    except (OSError, SJPGError) as e:
+        print("Error: %s" % e, file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+'''
+Streaming SJPG conversion of very large images
+
+sjpg.encode_sjpg() needs the whole decoded bitmap. Here the source is read in
+bands of strip height instead; every band is encoded and dropped, so at most
+a few bands are in memory at once:
+
+  - uncompressed sources stored as one raw tile (BMP, PPM, TGA, plain TIFF)
+    are read band by band straight from the file
+  - baseline JPEG sources are cut into one small JPEG per MCU row by
+    sjpg_restripe (no decoding, the compressed file is in memory) and the
+    rows are decoded one after the other. Without restart markers on the MCU
+    rows this walks the Huffman data in Python, about 0.2 s per megapixel
+  - JPEG sources use draft mode instead when the downscale (`reduce`) is
+    even, libjpeg then decodes the whole image at 1/2, 1/4 or 1/8 of the size
+  - progressive JPEGs and the JPEGs sjpg_restripe can't cut are refused
+  - anything else is decoded once and cut into bands
+
+`reduce` is an integer downscale factor (box filter, like Image.reduce()).
+
+Dependencies: (PYTHON-3) pillow
+'''
+
+import io
+import math
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+import sjpg
+import sjpg_restripe
+
+# A multiple of every MCU height (8 or 16 rows)
+JPEG_ROWS = 16
+
+
+def _raw_tile(im):
+    '''Return (offset, rawmode, stride, orientation) if `im` is stored as one raw tile, else None.'''
+    if len(im.tile) != 1:
+        return None
+    codec, extents, offset, args = im.tile[0][:4]
+    if codec != "raw" or tuple(extents) != (0, 0) + im.size:
+        return None
+    if isinstance(args, str):
+        args = (args,)
+    rawmode = args[0]
+    stride = args[1] if len(args) > 1 else 0
+    orientation = args[2] if len(args) > 2 else 1
+    if not stride:
+        try:
+            stride = len(Image.new(im.mode, (im.size[0], 1)).tobytes("raw", rawmode))
+        except ValueError:
+            return None
+    return offset, rawmode, stride, orientation
+
+
+def _iter_raw_bands(im, tile, band_height):
+    offset, rawmode, stride, orientation = tile
+    width, height = im.size
+    palette = im.getpalette() if im.mode == "P" else None
+    for top in range(0, height, band_height):
+        bottom = min(top + band_height, height)
+        first = top if orientation > 0 else height - bottom
+        im.fp.seek(offset + first * stride)
+        data = im.fp.read((bottom - top) * stride)
+        band = Image.frombytes(im.mode, (width, bottom - top), data, "raw", rawmode, stride, orientation)
+        if palette:
+            band.putpalette(palette)
+        yield band
+
+
+def _iter_decoded_bands(im, band_height):
+    im.load()
+    width, height = im.size
+    for top in range(0, height, band_height):
+        yield im.crop((0, top, width, min(top + band_height, height)))
+
+
+def _iter_jpeg_bands(im, band_height):
+    '''Decode a baseline JPEG in bands, from the pieces of JPEG_ROWS rows sjpg_restripe cuts it into.'''
+    im.fp.seek(0)
+    try:
+        width, height, pieces = sjpg_restripe.restripe(im.fp.read(), JPEG_ROWS)
+    except sjpg_restripe.NotEligible as e:
+        raise ValueError("can't decode this JPEG band by band (%s), convert it without --stream" % e)
+    band = None
+    top = 0
+    filled = 0
+    for blob in pieces:
+        with Image.open(io.BytesIO(blob)) as piece:
+            piece.load()
+            y = 0
+            while y < piece.size[1]:
+                if band is None:
+                    band = Image.new(piece.mode, (width, min(band_height, height - top)))
+                n = min(piece.size[1] - y, band.size[1] - filled)
+                band.paste(piece.crop((0, y, width, y + n)), (0, filled))
+                y += n
+                filled += n
+                if filled == band.size[1]:
+                    yield band
+                    top += filled
+                    band = None
+                    filled = 0
+
+
+def iter_bands(im, band_height, reduce=1):
+    '''
+    Return (width, height, bands) of the (reduced) image; `bands` yields images
+    of `band_height` rows (the last one may be shorter).
+    '''
+    width, height = im.size
+    out_size = (math.ceil(width / reduce), math.ceil(height / reduce))
+
+    tile = _raw_tile(im)
+    if tile is not None:
+        bands = _iter_raw_bands(im, tile, band_height * reduce)
+    elif im.format == "JPEG" and reduce % 2:
+        bands = _iter_jpeg_bands(im, band_height * reduce)
+    else:
+        if reduce > 1 and im.format == "JPEG":
+            # libjpeg scales by 1/2, 1/4 or 1/8 while decoding, the rest is done by reduce()
+            scale = 1
+            while scale < 8 and reduce % (scale * 2) == 0:
+                scale *= 2
+            if scale > 1:
+                # Pillow picks the scale from min(width // requested width, ...): request the sizes
+                # rounded down, and take the scale libjpeg really uses (maybe less) from the new size
+                im.draft(im.mode, (max(width // scale, 1), max(height // scale, 1)))
+                scale = next(s for s in (8, 4, 2, 1) if math.ceil(width / s) == im.size[0])
+                reduce //= scale
+        bands = _iter_decoded_bands(im, band_height * reduce)
+
+    def normalized(bands):
+        rows = 0
+        for band in bands:
+            if reduce > 1:
+                band = band.reduce(reduce)
+            if band.mode not in ("RGB", "L"):
+                band = band.convert("RGB")
+            rows += band.size[1]
+            if band.size[0] != out_size[0] or rows > out_size[1]:
+                raise ValueError("band of %dx%d at row %d of a %dx%d image" % (
+                    band.size + (rows - band.size[1],) + out_size))
+            yield band
+        if rows != out_size[1]:
+            raise ValueError("%d rows for a %dx%d image" % ((rows,) + out_size))
+
+    return out_size[0], out_size[1], normalized(bands)
+
+
+def _encode_band_job(job):
+    band, quality, profile = job
+    return sjpg.encode_strip(band, quality, profile)
+
+
+def encode_bands(bands, quality=sjpg.JPEG_QUALITY, workers=None, profile=sjpg.DEFAULT_PROFILE):
+    '''
+    Encode the bands in a process pool keeping only a few of them in flight,
+    so the source is consumed at the speed of the encoders.
+    '''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        return [sjpg.encode_strip(band, quality, profile) for band in bands]
+
+    strips = []
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for band in bands:
+            pending.append(pool.submit(_encode_band_job, (band, quality, profile)))
+            if len(pending) >= 2 * workers:
+                strips.append(pending.popleft().result())
+        while pending:
+            strips.append(pending.popleft().result())
+    return strips
+
+
+def encode_sjpg_file(path, split_height=sjpg.JPEG_SPLIT_HEIGHT, quality=sjpg.JPEG_QUALITY, workers=None,
+                     version=1, crc=False, reduce=1, profile=sjpg.DEFAULT_PROFILE):
+    '''Stream the image at `path` (or a file object) into an SJPG blob. Return (data, width, height).'''
+    with Image.open(path) as im:
+        width, height, bands = iter_bands(im, split_height, reduce)
+        strips = encode_bands(bands, quality, workers, profile)
+    return sjpg.pack_sjpg(width, height, split_height, strips, version, crc), width, height
+
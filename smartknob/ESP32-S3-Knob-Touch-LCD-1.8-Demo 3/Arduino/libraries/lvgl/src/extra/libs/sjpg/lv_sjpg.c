@@ -33,6 +33,19 @@
 /
 /   SJPEG data                   |   Each JPEG frame can be extracted from SJPEG data by parsing the FRAME_INFO_ARRAY one time.
 /
+/    --------------------------------------------------------------------------------------------------------------------------------
+/    SJPEG V2.00 FILE STRUCTURE (same as V1.00 up to byte 21)
+/    --------------------------------------------------------------------------------------------------------------------------------
+/
+/    8 - 13                      |   "V2.00" followed by '\0'
+/
+/    22 - 23                     |   FLAGS                           [bit 0: CRC-32 table present]
+/
+/    24 - [(TOTAL_FRAMES+1)*4]   |   ABSOLUTE OFFSET OF EACH FRAGMENT from the start of the file, plus the end offset
+/                                    [uint32, little endian]. Fragment N is located directly without summing the lengths.
+/
+/    [optional]                  |   CRC-32 OF EACH FRAGMENT [uint32, little endian], only used by the host side tools
+/
 /----------------------------------------------------------------------------------------------------------------------------------
 /                   JPEG DECODER
 /                   ------------
@@ -64,6 +77,8 @@
 #define SJPEG_TOTAL_FRAMES_OFFSET       18
 #define SJPEG_BLOCK_WIDTH_OFFSET        20
 #define SJPEG_FRAME_INFO_ARRAY_OFFSET   22
+#define SJPEG_V2_FLAGS_OFFSET           22
+#define SJPEG_V2_FRAME_INFO_ARRAY_OFFSET 24
 
 /**********************
  *      TYPEDEFS
@@ -95,6 +110,8 @@ typedef struct {
     int sjpeg_cache_frame_index;
     uint8_t ** frame_base_array;        //to save base address of each split frames upto sjpeg_total_frames.
     int * frame_base_offset;            //to save base offset for fseek
+    const uint8_t * frame_offset_table; //V2 C array: table of absolute frame offsets, read on demand
+    bool frame_offset_table_in_file;    //V2 file: the frame offsets are read from the file on demand
     uint8_t * frame_cache;
     uint8_t * workb;                    //JPG work buffer for jpeg library
     JDEC * tjpeg_jd;
@@ -111,6 +128,8 @@ static lv_res_t decoder_read_line(lv_img_decoder_t * decoder, lv_img_decoder_dsc
 static void decoder_close(lv_img_decoder_t * decoder, lv_img_decoder_dsc_t * dsc);
 static size_t input_func(JDEC * jd, uint8_t * buff, size_t ndata);
 static int is_jpg(const uint8_t * raw_data, size_t len);
+static bool is_sjpg_v2(const uint8_t * raw_data);
+static uint32_t read_u32_le(const uint8_t * data);
 static void lv_sjpg_cleanup(SJPEG * sjpeg);
 static void lv_sjpg_free(SJPEG * sjpeg);
 
@@ -377,22 +396,29 @@ static lv_res_t decoder_open(lv_img_decoder_t * decoder, lv_img_decoder_dsc_t *
             sjpeg->sjpeg_single_frame_height = *data++;
             sjpeg->sjpeg_single_frame_height |= *data++ << 8;
 
-            sjpeg->frame_base_array = lv_mem_alloc(sizeof(uint8_t *) * sjpeg->sjpeg_total_frames);
-            if(! sjpeg->frame_base_array) {
-                lv_sjpg_cleanup(sjpeg);
-                sjpeg = NULL;
-                return LV_RES_INV;
-            }
-
             sjpeg->frame_base_offset = NULL;
 
-            uint8_t * img_frame_base = data +  sjpeg->sjpeg_total_frames * 2;
-            sjpeg->frame_base_array[0] = img_frame_base;
+            if(is_sjpg_v2(sjpeg->sjpeg_data)) {
+                /*The absolute offsets are read straight from the array when a frame is needed*/
+                sjpeg->frame_base_array = NULL;
+                sjpeg->frame_offset_table = sjpeg->sjpeg_data + SJPEG_V2_FRAME_INFO_ARRAY_OFFSET;
+            }
+            else {
+                sjpeg->frame_base_array = lv_mem_alloc(sizeof(uint8_t *) * sjpeg->sjpeg_total_frames);
+                if(! sjpeg->frame_base_array) {
+                    lv_sjpg_cleanup(sjpeg);
+                    sjpeg = NULL;
+                    return LV_RES_INV;
+                }
+
+                uint8_t * img_frame_base = data +  sjpeg->sjpeg_total_frames * 2;
+                sjpeg->frame_base_array[0] = img_frame_base;
 
-            for(int i = 1; i <  sjpeg->sjpeg_total_frames; i++) {
-                int offset = *data++;
-                offset |= *data++ << 8;
-                sjpeg->frame_base_array[i] = sjpeg->frame_base_array[i - 1] + offset;
+                for(int i = 1; i <  sjpeg->sjpeg_total_frames; i++) {
+                    int offset = *data++;
+                    offset |= *data++ << 8;
+                    sjpeg->frame_base_array[i] = sjpeg->frame_base_array[i - 1] + offset;
+                }
             }
             sjpeg->sjpeg_cache_frame_index = -1;
             sjpeg->frame_cache = (void *)lv_mem_alloc(sjpeg->sjpeg_x_res * sjpeg->sjpeg_single_frame_height * 3/*2*/);
@@ -551,26 +577,34 @@ end:
                 sjpeg->sjpeg_single_frame_height |= *data++ << 8;
 
                 sjpeg->frame_base_array = NULL;//lv_mem_alloc( sizeof(uint8_t *) * sjpeg->sjpeg_total_frames );
-                sjpeg->frame_base_offset = lv_mem_alloc(sizeof(int) * sjpeg->sjpeg_total_frames);
-                if(! sjpeg->frame_base_offset) {
-                    lv_fs_close(&lv_file);
-                    lv_sjpg_cleanup(sjpeg);
-                    return LV_RES_INV;
-                }
-                int img_frame_start_offset = (SJPEG_FRAME_INFO_ARRAY_OFFSET + sjpeg->sjpeg_total_frames * 2);
-                sjpeg->frame_base_offset[0] = img_frame_start_offset; //pointer used to save integer for now...
 
-                for(int i = 1; i <  sjpeg->sjpeg_total_frames; i++) {
-                    res = lv_fs_read(&lv_file, buff, 2, &rn);
-                    if(res != LV_FS_RES_OK || rn != 2) {
+                if(is_sjpg_v2(buff)) {
+                    /*Nothing to preload, the offset of a frame is read from the file when it's needed*/
+                    sjpeg->frame_base_offset = NULL;
+                    sjpeg->frame_offset_table_in_file = true;
+                }
+                else {
+                    sjpeg->frame_base_offset = lv_mem_alloc(sizeof(int) * sjpeg->sjpeg_total_frames);
+                    if(! sjpeg->frame_base_offset) {
                         lv_fs_close(&lv_file);
+                        lv_sjpg_cleanup(sjpeg);
                         return LV_RES_INV;
                     }
-
-                    data = buff;
-                    int offset = *data++;
-                    offset |= *data++ << 8;
-                    sjpeg->frame_base_offset[i] = sjpeg->frame_base_offset[i - 1] + offset;
+                    int img_frame_start_offset = (SJPEG_FRAME_INFO_ARRAY_OFFSET + sjpeg->sjpeg_total_frames * 2);
+                    sjpeg->frame_base_offset[0] = img_frame_start_offset; //pointer used to save integer for now...
+
+                    for(int i = 1; i <  sjpeg->sjpeg_total_frames; i++) {
+                        res = lv_fs_read(&lv_file, buff, 2, &rn);
+                        if(res != LV_FS_RES_OK || rn != 2) {
+                            lv_fs_close(&lv_file);
+                            return LV_RES_INV;
+                        }
+
+                        data = buff;
+                        int offset = *data++;
+                        offset |= *data++ << 8;
+                        sjpeg->frame_base_offset[i] = sjpeg->frame_base_offset[i - 1] + offset;
+                    }
                 }
 
                 sjpeg->sjpeg_cache_frame_index = -1; //INVALID AT BEGINNING for a forced compare mismatch at first time.
@@ -725,15 +759,25 @@ static lv_res_t decoder_read_line(lv_img_decoder_t * decoder, lv_img_decoder_dsc
 
         /*If line not from cache, refresh cache */
         if(sjpeg_req_frame_index != sjpeg->sjpeg_cache_frame_index) {
-            sjpeg->io.raw_sjpg_data = sjpeg->frame_base_array[ sjpeg_req_frame_index ];
-            if(sjpeg_req_frame_index == (sjpeg->sjpeg_total_frames - 1)) {
-                /*This is the last frame. */
-                const uint32_t frame_offset = (uint32_t)(sjpeg->io.raw_sjpg_data - sjpeg->sjpeg_data);
-                sjpeg->io.raw_sjpg_data_size = sjpeg->sjpeg_data_size - frame_offset;
+            if(sjpeg->frame_offset_table) {
+                const uint8_t * entry = sjpeg->frame_offset_table + sjpeg_req_frame_index * 4;
+                const uint32_t frame_start = read_u32_le(entry);
+                const uint32_t frame_end = read_u32_le(entry + 4);
+                if(frame_end < frame_start || frame_end > sjpeg->sjpeg_data_size) return LV_RES_INV;
+                sjpeg->io.raw_sjpg_data = sjpeg->sjpeg_data + frame_start;
+                sjpeg->io.raw_sjpg_data_size = frame_end - frame_start;
             }
             else {
-                sjpeg->io.raw_sjpg_data_size =
-                    (uint32_t)(sjpeg->frame_base_array[sjpeg_req_frame_index + 1] - sjpeg->io.raw_sjpg_data);
+                sjpeg->io.raw_sjpg_data = sjpeg->frame_base_array[ sjpeg_req_frame_index ];
+                if(sjpeg_req_frame_index == (sjpeg->sjpeg_total_frames - 1)) {
+                    /*This is the last frame. */
+                    const uint32_t frame_offset = (uint32_t)(sjpeg->io.raw_sjpg_data - sjpeg->sjpeg_data);
+                    sjpeg->io.raw_sjpg_data_size = sjpeg->sjpeg_data_size - frame_offset;
+                }
+                else {
+                    sjpeg->io.raw_sjpg_data_size =
+                        (uint32_t)(sjpeg->frame_base_array[sjpeg_req_frame_index + 1] - sjpeg->io.raw_sjpg_data);
+                }
             }
             sjpeg->io.raw_sjpg_data_next_read_pos = 0;
             rc = jd_prepare(sjpeg->tjpeg_jd, input_func, sjpeg->workb, (size_t)TJPGD_WORKBUFF_SIZE, &(sjpeg->io));
@@ -795,7 +839,17 @@ static lv_res_t decoder_read_line(lv_img_decoder_t * decoder, lv_img_decoder_dsc
 
         /*If line not from cache, refresh cache */
         if(sjpeg_req_frame_index != sjpeg->sjpeg_cache_frame_index) {
-            sjpeg->io.raw_sjpg_data_next_read_pos = (int)(sjpeg->frame_base_offset [ sjpeg_req_frame_index ]);
+            if(sjpeg->frame_offset_table_in_file) {
+                uint8_t entry[4];
+                uint32_t rn;
+                lv_fs_seek(lv_file_p, SJPEG_V2_FRAME_INFO_ARRAY_OFFSET + sjpeg_req_frame_index * 4, LV_FS_SEEK_SET);
+                lv_fs_res_t res = lv_fs_read(lv_file_p, entry, 4, &rn);
+                if(res != LV_FS_RES_OK || rn != 4) return LV_RES_INV;
+                sjpeg->io.raw_sjpg_data_next_read_pos = read_u32_le(entry);
+            }
+            else {
+                sjpeg->io.raw_sjpg_data_next_read_pos = (int)(sjpeg->frame_base_offset [ sjpeg_req_frame_index ]);
+            }
             lv_fs_seek(&(sjpeg->io.lv_file), sjpeg->io.raw_sjpg_data_next_read_pos, LV_FS_SEEK_SET);
 
             rc = jd_prepare(sjpeg->tjpeg_jd, input_func, sjpeg->workb, (size_t)TJPGD_WORKBUFF_SIZE, &(sjpeg->io));
@@ -890,6 +944,16 @@ static int is_jpg(const uint8_t * raw_data, size_t len)
     return memcmp(jpg_signature, raw_data, sizeof(jpg_signature)) == 0;
 }
 
+static bool is_sjpg_v2(const uint8_t * raw_data)
+{
+    return memcmp(raw_data + SJPEG_VERSION_OFFSET, "V2.", 3) == 0;
+}
+
+static uint32_t read_u32_le(const uint8_t * data)
+{
+    return (uint32_t)data[0] | ((uint32_t)data[1] << 8) | ((uint32_t)data[2] << 16) | ((uint32_t)data[3] << 24);
+}
+
 static void lv_sjpg_free(SJPEG * sjpeg)
 {
     if(sjpeg->frame_cache) lv_mem_free(sjpeg->frame_cache);
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+'''
+Host benchmark of LVGL's bundled image decoders
+
+Builds LVGL with the SJPG (tjpgd), PNG (lodepng), BMP and GIF (gifdec)
+decoders into a shared library for every requested color depth, loads it with
+ctypes and decodes a corpus of images through the same calls LVGL uses:
+lv_img_decoder_open() / read_line() for SJPG, JPG, PNG and BMP,
+gd_get_frame() / gd_render_frame() for GIF.
+
+For every image it reports
+    - throughput in MB/s (compressed bytes) and pixels/s
+    - the latency of every strip (SJPG), row (BMP, JPG), or frame (PNG, GIF)
+    - the peak LVGL heap (lv_mem_monitor) while the image is open
+
+lv_mem_monitor() only keeps the high-water mark since lv_init(), so every
+image is measured in a fresh process: `heap_peak` is the high-water mark with
+the image open, `heap_baseline` the one right after lv_init(). The results are written as JSON and can be
+compared across commits and compiler flags:
+
+    ./decoder_bench.py generate corpus --sizes 120 360 720
+    ./decoder_bench.py run corpus --color-depth 16 32 -o before.json
+    CFLAGS="-O3" ./decoder_bench.py run corpus -o after.json
+    ./decoder_bench.py compare before.json after.json
+
+Dependencies: (PYTHON-3) a C compiler, pillow for `generate` only
+'''
+
+import argparse
+import ctypes
+import datetime
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import shlex
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+bench_dir = os.path.dirname(os.path.realpath(__file__))
+lvgl_dir = os.path.realpath(os.path.join(bench_dir, os.pardir, os.pardir))
+
+IMAGE_FORMATS = {
+    ".sjpg": "sjpg",
+    ".jpg": "jpg",
+    ".jpeg": "jpg",
+    ".png": "png",
+    ".bmp": "bmp",
+    ".gif": "gif",
+}
+# lv_bmp.c only opens BMPs whose bits per pixel match LV_COLOR_DEPTH
+BMP_BPP_FOR_DEPTH = {8: (8,), 16: (16,), 32: (24, 32)}
+DEFAULT_MEM_SIZE = 16 * 1024 * 1024
+DEFAULT_CFLAGS = "-O2"
+MAX_CHUNKS = 1 << 16
+
+
+class BenchResult(ctypes.Structure):
+    '''Must match lv_bench_result_t in lv_bench.c'''
+    _fields_ = [
+        ("w", ctypes.c_uint32),
+        ("h", ctypes.c_uint32),
+        ("frames", ctypes.c_uint32),
+        ("chunks", ctypes.c_uint32),
+        ("open_us", ctypes.c_double),
+        ("total_us", ctypes.c_double),
+        ("mem_max_before", ctypes.c_uint32),
+        ("mem_max_after", ctypes.c_uint32),
+        ("mem_leaked", ctypes.c_uint32),
+    ]
+
+
+def compiler():
+    return shlex.split(os.environ.get("CC", "cc"))
+
+
+def compiler_version(cc):
+    try:
+        out = subprocess.run(cc + ["--version"], capture_output=True, text=True, check=True).stdout
+        return out.splitlines()[0] if out else ""
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def lvgl_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=lvgl_dir, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_library(color_depth, cflags, mem_size, build_root, jobs=None, clean=False):
+    '''
+    Compile LVGL and lv_bench.c into a shared library and return its path.
+    Objects newer than their source are reused; every combination of compiler,
+    flags and configuration gets its own build directory.
+    '''
+    cc = compiler()
+    defines = ["-DLV_CONF_PATH=lv_bench_conf.h", "-DLV_COLOR_DEPTH=%d" % color_depth,
+               "-DLV_MEM_SIZE=%d" % mem_size]
+    flags = shlex.split(cflags) + ["-fPIC", "-I" + bench_dir] + defines
+    tag = hashlib.sha1(json.dumps([cc, flags]).encode("utf-8")).hexdigest()[:8]
+    build_dir = os.path.join(build_root, "build_bench_%dbit_%s" % (color_depth, tag))
+    if clean and os.path.isdir(build_dir):
+        for f in glob.glob(os.path.join(build_dir, "**", "*"), recursive=True):
+            if os.path.isfile(f):
+                os.unlink(f)
+
+    sources = sorted(glob.glob(os.path.join(lvgl_dir, "src", "**", "*.c"), recursive=True))
+    sources.append(os.path.join(bench_dir, "lv_bench.c"))
+    conf = os.path.join(bench_dir, "lv_bench_conf.h")
+
+    def compile_one(src):
+        obj = os.path.join(build_dir, os.path.relpath(src, lvgl_dir) + ".o")
+        if os.path.exists(obj) and os.path.getmtime(obj) >= max(os.path.getmtime(src), os.path.getmtime(conf)):
+            return obj
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        subprocess.check_call(cc + flags + ["-c", src, "-o", obj])
+        return obj
+
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        objects = list(pool.map(compile_one, sources))
+
+    lib = os.path.join(build_dir, "liblvbench.so")
+    if not os.path.exists(lib) or os.path.getmtime(lib) < max(os.path.getmtime(o) for o in objects):
+        subprocess.check_call(cc + ["-shared", "-o", lib] + objects + ["-lm"])
+    return lib
+
+
+def find_images(paths):
+    images = []
+    for path in paths:
+        if os.path.isdir(path):
+            for f in glob.glob(os.path.join(path, "**", "*"), recursive=True):
+                if os.path.splitext(f)[1].lower() in IMAGE_FORMATS:
+                    images.append(f)
+        else:
+            images.append(path)
+    return sorted(images)
+
+
+def latency_stats(values):
+    if not values:
+        return {"count": 0}
+    s = sorted(values)
+    pick = lambda q: s[min(len(s) - 1, int(q * len(s)))]
+    return {"count": len(s), "mean_us": sum(s) / len(s), "p50_us": pick(0.50), "p95_us": pick(0.95),
+            "max_us": s[-1]}
+
+
+def _sjpg_split_height(data):
+    if data[:7] == b"_SJPG__" and len(data) >= 22:
+        return int.from_bytes(data[20:22], "little")
+    return None
+
+
+def measure(job):
+    '''
+    Decode one image `reps` times in this (fresh) process and return its result
+    dict, or None if the decoder can't open it at this color depth.
+    '''
+    lib_path, path, reps, source = job
+    lib = ctypes.CDLL(lib_path)
+    lib.lv_bench_init()
+    color_depth = lib.lv_bench_color_depth()
+
+    fmt = IMAGE_FORMATS.get(os.path.splitext(path)[1].lower())
+    with open(path, "rb") as f:
+        data = f.read()
+    if fmt == "bmp":
+        source = "file"            # lv_bmp can't decode variables
+        if int.from_bytes(data[28:30], "little") not in BMP_BPP_FOR_DEPTH[color_depth]:
+            return None
+    if fmt == "gif":
+        source = "var"
+
+    buf = ctypes.create_string_buffer(data, len(data))
+    chunks = (ctypes.c_double * MAX_CHUNKS)()
+    res = BenchResult()
+    file_src = ("A:" + os.path.abspath(path)).encode("utf-8") if source == "file" else None
+
+    best = None
+    baseline = None
+    for _ in range(reps + 1):       # the first run warms the caches and is dropped
+        if fmt == "gif":
+            ret = lib.lv_bench_decode_gif(buf, chunks, MAX_CHUNKS, ctypes.byref(res))
+        else:
+            ret = lib.lv_bench_decode_img(file_src, buf, len(data), chunks, MAX_CHUNKS, ctypes.byref(res))
+        if ret != 0:
+            return {"file": path, "format": fmt, "color_depth": color_depth, "source": source,
+                    "error": "decoder returned %d" % ret}
+        if baseline is None:
+            baseline = res.mem_max_before
+        if best is None or res.total_us < best[0].total_us:
+            best = (BenchResult.from_buffer_copy(res), list(chunks[:res.chunks]))
+
+    res, times = best
+    unit = {"png": "frame", "gif": "frame"}.get(fmt, "row")
+    split_height = _sjpg_split_height(data)
+    if split_height:
+        # lv_sjpg decodes a whole strip when its first row is read, group the rows by strip
+        unit = "strip"
+        times = [sum(times[i:i + split_height]) for i in range(0, len(times), split_height)]
+
+    pixels = res.w * res.h * res.frames
+    return {
+        "file": path,
+        "format": fmt,
+        "color_depth": color_depth,
+        "source": source,
+        "width": res.w,
+        "height": res.h,
+        "frames": res.frames,
+        "bytes": len(data),
+        "open_us": res.open_us,
+        "time_us": res.total_us,
+        "mb_per_s": len(data) / res.total_us if res.total_us else None,
+        "pixels_per_s": pixels / res.total_us * 1e6 if res.total_us else None,
+        "latency": dict(unit=unit, **latency_stats(times)),
+        "heap_peak": res.mem_max_after,
+        "heap_baseline": baseline,
+        "heap_leaked": res.mem_leaked,
+    }
+
+
+def format_results(results):
+    lines = ["%-32s %5s %3s %9s %9s %8s %10s %-6s %9s %9s %9s" %
+             ("file", "fmt", "bpp", "size", "time us", "MB/s", "Mpx/s", "unit", "p50 us", "max us", "heap KB")]
+    for r in results:
+        name = os.path.basename(r["file"])
+        if "error" in r:
+            lines.append("%-32s %5s %3d  %s" % (name, r["format"], r["color_depth"], r["error"]))
+            continue
+        lat = r["latency"]
+        lines.append("%-32s %5s %3d %9d %9.0f %8.2f %10.2f %-6s %9.1f %9.1f %9.1f" %
+                     (name, r["format"], r["color_depth"], r["bytes"], r["time_us"], r["mb_per_s"],
+                      r["pixels_per_s"] / 1e6, lat["unit"], lat.get("p50_us", 0), lat.get("max_us", 0),
+                      r["heap_peak"] / 1024))
+    return "\n".join(lines)
+
+
+def cmd_run(args):
+    images = find_images(args.corpus)
+    if not images:
+        print("No images found", file=sys.stderr)
+        return 1
+
+    cflags = os.environ.get("CFLAGS", DEFAULT_CFLAGS)
+    build_root = args.build_dir or bench_dir
+    results = []
+    for depth in args.color_depth:
+        print("Building the %d bit library..." % depth, flush=True)
+        lib = build_library(depth, cflags, args.mem_size, build_root, clean=args.clean)
+        # maxtasksperchild=1: a new process (new LVGL heap) for every image
+        with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+            for r in pool.imap(measure, [(lib, path, args.reps, args.source) for path in images]):
+                if r is not None:
+                    results.append(r)
+
+    print(format_results(results))
+    report = {
+        "meta": {
+            "time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "lvgl_commit": lvgl_commit(),
+            "cc": " ".join(compiler()),
+            "cc_version": compiler_version(compiler()),
+            "cflags": cflags,
+            "mem_size": args.mem_size,
+            "reps": args.reps,
+            "host": platform.platform(),
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+        print("Results written to %s" % args.output)
+    return 1 if any("error" in r for r in results) else 0
+
+
+def cmd_compare(args):
+    def load(path):
+        with open(path) as f:
+            report = json.load(f)
+        return report["meta"], {(os.path.basename(r["file"]), r["color_depth"], r["source"]): r
+                                for r in report["results"] if "error" not in r}
+
+    meta_a, a = load(args.baseline)
+    meta_b, b = load(args.current)
+    print("baseline: %s %s %s" % (meta_a.get("lvgl_commit"), meta_a.get("cc_version"), meta_a.get("cflags")))
+    print("current:  %s %s %s" % (meta_b.get("lvgl_commit"), meta_b.get("cc_version"), meta_b.get("cflags")))
+    print("%-32s %3s %-4s %10s %10s %8s %10s" % ("file", "bpp", "src", "base us", "cur us", "speedup", "heap diff"))
+    for key in sorted(set(a) & set(b)):
+        ra, rb = a[key], b[key]
+        print("%-32s %3d %-4s %10.0f %10.0f %7.2fx %+10d" %
+              (key[0], key[1], key[2], ra["time_us"], rb["time_us"], ra["time_us"] / rb["time_us"],
+               rb["heap_peak"] - ra["heap_peak"]))
+    for key in sorted(set(a) ^ set(b)):
+        print("%-32s %3d %-4s only in %s" % (key[0], key[1], key[2], "baseline" if key in a else "current"))
+    return 0
+
+
+def write_bmp(path, im, bpp):
+    '''Write an RGB image as a 16 (RGB565), 24 or 32 bit BMP, the layouts lv_bmp.c reads.'''
+    width, height = im.size
+    if bpp == 16:
+        rgb = im.convert("RGB").tobytes()
+        pixels = bytearray()
+        for i in range(0, len(rgb), 3):
+            c = ((rgb[i] >> 3) << 11) | ((rgb[i + 1] >> 2) << 5) | (rgb[i + 2] >> 3)
+            pixels += c.to_bytes(2, "little")
+        masks = (0xF800).to_bytes(4, "little") + (0x07E0).to_bytes(4, "little") + (0x001F).to_bytes(4, "little")
+        compression = 3     # BI_BITFIELDS
+    else:
+        pixels = im.convert("RGBA" if bpp == 32 else "RGB").tobytes("raw", "BGRA" if bpp == 32 else "BGR")
+        masks = b""
+        compression = 0
+    row = width * bpp // 8
+    stride = (row + 3) & ~3
+    rows = [pixels[y * row:(y + 1) * row] + bytes(stride - row) for y in range(height)]
+    offset = 14 + 40 + len(masks)
+    size = offset + stride * height
+    header = b"BM" + size.to_bytes(4, "little") + bytes(4) + offset.to_bytes(4, "little")
+    info = (b"".join(v.to_bytes(4, "little") for v in (40, width, height)) + (1).to_bytes(2, "little") +
+            bpp.to_bytes(2, "little") + compression.to_bytes(4, "little") + (stride * height).to_bytes(4, "little") +
+            bytes(16))
+    with open(path, "wb") as f:
+        f.write(header + info + masks + b"".join(reversed(rows)))
+
+
+def cmd_generate(args):
+    '''Write the same synthetic picture in every format and size.'''
+    from PIL import Image, ImageDraw
+    sys.path.insert(0, os.path.join(lvgl_dir, "scripts"))
+    import sjpg
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for size in args.sizes:
+        im = Image.radial_gradient("L").resize((size, size)).convert("RGB")
+        draw = ImageDraw.Draw(im)
+        for i in range(8):
+            r = size * (i + 1) // 20
+            draw.ellipse((size // 2 - r, size // 2 - r, size // 2 + r, size // 2 + r),
+                         outline=((i * 40) % 256, 255 - i * 30, i * 25), width=max(1, size // 60))
+        draw.text((size // 10, size // 10), "LVGL %d" % size, fill=(255, 255, 0))
+
+        base = os.path.join(args.output_dir, "img_%d" % size)
+        with open(base + ".sjpg", "wb") as f:
+            f.write(sjpg.encode_sjpg(im, workers=1))
+        im.save(base + ".jpg", quality=sjpg.JPEG_QUALITY)
+        im.save(base + ".png")
+        write_bmp(base + "_16bpp.bmp", im, 16)
+        write_bmp(base + "_24bpp.bmp", im, 24)
+        frames = [im.rotate(a, fillcolor=(0, 0, 0)).convert("P", palette=Image.ADAPTIVE) for a in range(0, 90, 15)]
+        frames[0].save(base + ".gif", save_all=True, append_images=frames[1:], duration=50, loop=0)
+        print("%s.{sjpg,jpg,png,gif} %s_{16,24}bpp.bmp" % (base, base))
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LVGL's image decoders on the host")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("run", help="Build the library and decode a corpus")
+    p.add_argument("corpus", nargs="+", help="Images or directories (.sjpg .jpg .png .bmp .gif)")
+    p.add_argument("--color-depth", type=int, nargs="+", default=[16], choices=[8, 16, 32],
+                   help="LV_COLOR_DEPTH of the libraries to build (default 16)")
+    p.add_argument("--reps", type=int, default=10, help="Decodes per image, the fastest is reported")
+    p.add_argument("--source", choices=["var", "file"], default="var",
+                   help="Decode from memory (C array) or through lv_fs (BMP always uses files)")
+    p.add_argument("--mem-size", type=int, default=DEFAULT_MEM_SIZE, help="LV_MEM_SIZE in bytes")
+    p.add_argument("--build-dir", help="Where to build the libraries (default: next to this script)")
+    p.add_argument("--clean", action="store_true", help="Rebuild the libraries from scratch")
+    p.add_argument("-o", "--output", help="Write the results to this JSON file")
+    p.set_defaults(func=cmd_run)
+
+    p = sub.add_parser("compare", help="Compare two JSON result files")
+    p.add_argument("baseline")
+    p.add_argument("current")
+    p.set_defaults(func=cmd_compare)
+
+    p = sub.add_parser("generate", help="Write a synthetic corpus in every format")
+    p.add_argument("output_dir")
+    p.add_argument("--sizes", type=int, nargs="+", default=[120, 360, 720], help="Edge lengths in pixels")
+    p.set_defaults(func=cmd_generate)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+/**
+ * @file lv_bench.c
+ * Entry points of the decoder benchmark library, loaded with ctypes by decoder_bench.py
+ */
+
+/*********************
+ *      INCLUDES
+ *********************/
+#include "../../lvgl.h"
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+/*********************
+ *      DEFINES
+ *********************/
+
+/**********************
+ *      TYPEDEFS
+ **********************/
+typedef struct {
+    uint32_t w;
+    uint32_t h;
+    uint32_t frames;            /*Decoded GIF frames, 1 for still images*/
+    uint32_t chunks;            /*Number of entries written to the latency array*/
+    double open_us;
+    double total_us;            /*Open + all reads + close*/
+    uint32_t mem_max_before;    /*lv_mem_monitor() high-water mark before opening the image*/
+    uint32_t mem_max_after;     /*and after closing it*/
+    uint32_t mem_leaked;        /*Still allocated after closing*/
+} lv_bench_result_t;
+
+/**********************
+ *  STATIC PROTOTYPES
+ **********************/
+static double now_us(void);
+static uint32_t mem_used(void);
+static uint32_t mem_max_used(void);
+
+/**********************
+ *   GLOBAL FUNCTIONS
+ **********************/
+
+void lv_bench_init(void)
+{
+    lv_init();
+}
+
+uint32_t lv_bench_color_depth(void)
+{
+    return LV_COLOR_DEPTH;
+}
+
+/**
+ * Decode an image with the registered image decoders (SJPG, PNG, BMP), one row at a time.
+ * @param path      file source ("A:..."), or NULL to use `data`
+ * @param data      the image in memory (variable source)
+ * @param size      size of `data`
+ * @param row_us    receives the time of every lv_img_decoder_read_line() call.
+ *                  Decoders which decode the whole image when it is opened write only the open time.
+ * @param cap       size of `row_us`
+ * @param res       receives the results
+ * @return          0 on success, -1 if the image can't be opened, -2 if a row can't be read
+ */
+int lv_bench_decode_img(const char * path, const uint8_t * data, uint32_t size, double * row_us, uint32_t cap,
+                        lv_bench_result_t * res)
+{
+    lv_img_dsc_t dsc;
+    const void * src = path;
+    if(path == NULL) {
+        lv_memset_00(&dsc, sizeof(dsc));
+        dsc.header.cf = LV_IMG_CF_RAW;
+        dsc.data = data;
+        dsc.data_size = size;
+        src = &dsc;
+    }
+
+    lv_memset_00(res, sizeof(*res));
+    res->mem_max_before = mem_max_used();
+    uint32_t used = mem_used();
+
+    lv_img_decoder_dsc_t d;
+    double t0 = now_us();
+    if(lv_img_decoder_open(&d, src, lv_color_black(), 0) != LV_RES_OK) return -1;
+    double t1 = now_us();
+    res->open_us = t1 - t0;
+    res->w = d.header.w;
+    res->h = d.header.h;
+    res->frames = 1;
+
+    int ret = 0;
+    if(d.img_data == NULL) {
+        uint8_t * buf = malloc(d.header.w * sizeof(lv_color32_t));
+        for(uint32_t y = 0; y < res->h; y++) {
+            double r0 = now_us();
+            if(lv_img_decoder_read_line(&d, 0, y, d.header.w, buf) != LV_RES_OK) {
+                ret = -2;
+                break;
+            }
+            if(res->chunks < cap) row_us[res->chunks++] = now_us() - r0;
+        }
+        free(buf);
+    }
+    else if(cap > 0) {
+        row_us[res->chunks++] = res->open_us;
+    }
+
+    lv_img_decoder_close(&d);
+    res->total_us = now_us() - t0;
+
+    res->mem_max_after = mem_max_used();
+    res->mem_leaked = mem_used() - used;
+    return ret;
+}
+
+#if LV_USE_GIF
+/**
+ * Decode every frame of a GIF the way lv_gif renders them.
+ * @param data      the GIF in memory
+ * @param frame_us  receives the time of every frame (gd_get_frame() + gd_render_frame())
+ * @param cap       size of `frame_us`
+ * @param res       receives the results
+ * @return          0 on success, -1 if the GIF can't be opened
+ */
+int lv_bench_decode_gif(const uint8_t * data, double * frame_us, uint32_t cap, lv_bench_result_t * res)
+{
+    lv_memset_00(res, sizeof(*res));
+    res->mem_max_before = mem_max_used();
+    uint32_t used = mem_used();
+
+    double t0 = now_us();
+    gd_GIF * gif = gd_open_gif_data(data);
+    if(gif == NULL) return -1;
+    res->open_us = now_us() - t0;
+    res->w = gif->width;
+    res->h = gif->height;
+
+    /*Play the animation once, gd_get_frame() rewinds forever for endlessly looping GIFs*/
+    gif->loop_count = 1;
+
+    while(1) {
+        double f0 = now_us();
+        int has_next = gd_get_frame(gif);
+        if(has_next <= 0) break;
+        gd_render_frame(gif, gif->canvas);
+        if(res->chunks < cap) frame_us[res->chunks++] = now_us() - f0;
+        res->frames++;
+    }
+
+    gd_close_gif(gif);
+    res->total_us = now_us() - t0;
+
+    res->mem_max_after = mem_max_used();
+    res->mem_leaked = mem_used() - used;
+    return 0;
+}
+#endif /*LV_USE_GIF*/
+
+/**********************
+ *   STATIC FUNCTIONS
+ **********************/
+
+static double now_us(void)
+{
+    struct timespec t;
+    clock_gettime(CLOCK_MONOTONIC, &t);
+    return t.tv_sec * 1e6 + t.tv_nsec * 1e-3;
+}
+
+static uint32_t mem_used(void)
+{
+    lv_mem_monitor_t mon;
+    lv_mem_monitor(&mon);
+    return mon.total_size - mon.free_size;
+}
+
+static uint32_t mem_max_used(void)
+{
+    lv_mem_monitor_t mon;
+    lv_mem_monitor(&mon);
+    return mon.max_used;
+}
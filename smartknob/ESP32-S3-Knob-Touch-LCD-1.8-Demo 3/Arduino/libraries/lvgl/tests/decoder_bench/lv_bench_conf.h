@@ -0,0 +1,31 @@
+/**
+ * @file lv_bench_conf.h
+ * Configuration of the decoder benchmark library.
+ * LV_COLOR_DEPTH and LV_MEM_SIZE are passed on the command line by decoder_bench.py,
+ * everything not set here uses the defaults of lv_conf_internal.h.
+ */
+
+#ifndef LV_BENCH_CONF_H
+#define LV_BENCH_CONF_H
+
+#define LV_CONF_SUPPRESS_DEFINE_CHECK 1
+
+/*lv_mem_monitor() only works with the built-in heap*/
+#define LV_MEM_CUSTOM 0
+
+#define LV_USE_LOG 0
+#define LV_USE_ASSERT_MEM_INTEGRITY 0
+
+/*The decoders under test*/
+#define LV_USE_SJPG 1
+#define LV_USE_PNG 1
+#define LV_USE_BMP 1
+#define LV_USE_GIF 1
+
+/*BMP can only be opened from files*/
+#define LV_USE_FS_STDIO 1
+#define LV_FS_STDIO_LETTER 'A'
+#define LV_FS_STDIO_PATH ""
+#define LV_FS_STDIO_CACHE_SIZE 0
+
+#endif /*LV_BENCH_CONF_H*/
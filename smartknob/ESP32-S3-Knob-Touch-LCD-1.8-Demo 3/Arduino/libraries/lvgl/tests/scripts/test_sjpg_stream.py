@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+'''
+Tests of scripts/sjpg_stream.py, the streaming SJPG conversion
+
+    python3 -m pytest tests/scripts     (or python3 -m unittest discover tests/scripts)
+
+Dependencies: (PYTHON-3) pillow, numpy
+'''
+
+import io
+import math
+import os
+import sys
+import unittest
+
+import numpy as np
+from PIL import Image
+
+scripts_dir = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "scripts"))
+sys.path.insert(0, scripts_dir)
+
+import sjpg_stream  # noqa: E402
+from sjpg_reader import SJPGReader  # noqa: E402
+
+# Sizes that don't divide by the reduce factors, libjpeg then scales by less than asked
+ODD_SIZES = ((317, 203), (316, 202), (333, 201), (640, 480))
+REDUCES = (2, 3, 4, 6, 8)
+
+
+def _jpeg(size, **options):
+    rng = np.random.default_rng(size[0] * size[1])
+    gradient = np.linspace(0, 255, size[0] * size[1]).reshape(size[1], size[0], 1)
+    pixels = np.clip(gradient + rng.normal(0, 20, (size[1], size[0], 3)), 0, 255).astype(np.uint8)
+    out = io.BytesIO()
+    Image.fromarray(pixels).save(out, "JPEG", **options)
+    out.seek(0)
+    return out
+
+
+def _bands(jpeg, band_height, reduce=1):
+    with Image.open(jpeg) as im:
+        width, height, bands = sjpg_stream.iter_bands(im, band_height, reduce)
+        return width, height, [np.asarray(band) for band in bands]
+
+
+class TestReduce(unittest.TestCase):
+    def test_odd_sizes(self):
+        for size in ODD_SIZES:
+            for reduce in REDUCES:
+                with self.subTest(size=size, reduce=reduce):
+                    data, width, height = sjpg_stream.encode_sjpg_file(_jpeg(size), workers=1, reduce=reduce)
+                    self.assertEqual((width, height), (math.ceil(size[0] / reduce), math.ceil(size[1] / reduce)))
+                    self.assertEqual(SJPGReader(data).verify(), [])
+
+
+class TestJpegBands(unittest.TestCase):
+    def test_bands_match_the_full_decode(self):
+        # 4:4:4, no chroma upsampling across the MCU rows: the pixels are the same
+        jpeg = _jpeg((203, 117), subsampling=0)
+        for band_height in (1, 7, 16, 40, 200):
+            with self.subTest(band_height=band_height):
+                width, height, bands = _bands(jpeg, band_height)
+                self.assertEqual([len(b) for b in bands[:-1]], [band_height] * (len(bands) - 1))
+                full = np.asarray(Image.open(jpeg).convert("RGB"))
+                self.assertTrue(np.array_equal(np.concatenate(bands), full))
+
+    def test_subsampled_and_restart_markers(self):
+        for options in ({}, {"restart_marker_rows": 1}, {"subsampling": 1}):
+            with self.subTest(**options):
+                jpeg = _jpeg((150, 90), **options)
+                width, height, bands = _bands(jpeg, 16)
+                self.assertEqual((width, height), (150, 90))
+                full = np.asarray(Image.open(jpeg).convert("RGB")).astype(int)
+                # The chroma is upsampled per MCU row, only the rows next to a cut may differ a little
+                self.assertLess(np.abs(np.concatenate(bands) - full).max(), 16)
+
+    def test_grayscale(self):
+        jpeg = io.BytesIO()
+        Image.linear_gradient("L").resize((77, 45)).save(jpeg, "JPEG")
+        width, height, bands = _bands(jpeg, 10)
+        self.assertTrue(np.array_equal(np.concatenate(bands), np.asarray(Image.open(jpeg))))
+
+    def test_progressive_is_refused(self):
+        with self.assertRaisesRegex(ValueError, "band by band"):
+            _bands(_jpeg((64, 64), progressive=True), 16)
+
+
+if __name__ == "__main__":
+    unittest.main()
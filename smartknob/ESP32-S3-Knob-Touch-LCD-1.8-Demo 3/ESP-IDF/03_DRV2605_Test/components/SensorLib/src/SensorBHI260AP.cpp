@@ -29,6 +29,7 @@
  */
 #include "SensorBHI260AP.hpp"
 #include "bosch/BoschParseStatic.hpp"
+#include "bosch/bhy2_lz.h"
 
 #define BHY2_RLST_CHECK(ret, str, val) \
     do                                 \
@@ -40,6 +41,11 @@
         }                               \
     } while (0)
 
+static int8_t delta_stream_read(uint8_t *buffer, uint32_t buffer_len, uint32_t *actual_len, void *ctx)
+{
+    return bhy2_delta_read(buffer, buffer_len, actual_len, static_cast<struct bhy2_delta_dec *>(ctx));
+}
+
 static constexpr uint16_t max_process_buffer_size = 512;
 
 SensorBHI260AP::SensorBHI260AP(): comm(nullptr),
@@ -50,6 +56,8 @@ SensorBHI260AP::SensorBHI260AP(): comm(nullptr),
     _processBufferSize(max_process_buffer_size),
     _firmware_stream(nullptr),
     _firmware_size(0),
+    _firmware_base(nullptr),
+    _firmware_base_size(0),
     _write_flash(false),
     _boot_from_flash(false),
     _force_update(false),
@@ -347,12 +355,28 @@ void SensorBHI260AP::setProcessBufferSize(uint32_t size)
  * @param  *firmware: Firmware data address
  * @param  length: Firmware data length
  * @param  write2Flash: 1 is written to external flash, 0 is written to RAM
+ * @param  *base: Base firmware of a delta written by fw_dedup.py
+ * @param  base_len: Base firmware length
  * @retval true success or failed
  */
-bool SensorBHI260AP::uploadFirmware(const uint8_t *firmware, uint32_t length, bool write2Flash)
+bool SensorBHI260AP::uploadFirmware(const uint8_t *firmware, uint32_t length, bool write2Flash,
+                                    const uint8_t *base, uint32_t base_len)
 {
     uint8_t sensor_error;
     uint8_t boot_status;
+    struct bhy2_delta_dec delta_dec;
+    /* Images written by fw2h.py --compress are decompressed and deltas rebuilt while they are uploaded */
+    bool compressed = bhy2_lz_is_compressed(firmware, length);
+    bool delta = bhy2_delta_is_delta(firmware, length);
+    uint32_t firmware_size = length;
+
+    if (compressed) {
+        firmware_size = bhy2_lz_get_size(firmware, length);
+    } else if (delta) {
+        _error_code = bhy2_delta_init(firmware, length, base, base_len, &delta_dec);
+        BHY2_RLST_CHECK(_error_code != BHY2_OK, "The firmware delta doesn't match its base!", false);
+        firmware_size = bhy2_delta_get_size(firmware, length);
+    }
 
     log_d("Upload Firmware ...");
 
@@ -362,7 +386,7 @@ bool SensorBHI260AP::uploadFirmware(const uint8_t *firmware, uint32_t length, bo
     if (write2Flash) {
         if (boot_status & BHY2_BST_FLASH_DETECTED) {
             uint32_t start_addr = BHY2_FLASH_SECTOR_START_ADDR;
-            uint32_t end_addr = start_addr + length;
+            uint32_t end_addr = start_addr + firmware_size;
             log_d("Flash detected. Erasing flash to upload firmware");
             _error_code = bhy2_erase_flash(start_addr, end_addr, _bhy2.get());
             BHY2_RLST_CHECK(_error_code != BHY2_OK, "bhy2_erase_flash failed!", false);
@@ -371,15 +395,32 @@ bool SensorBHI260AP::uploadFirmware(const uint8_t *firmware, uint32_t length, bo
             return false;
         }
         log_d("Loading firmware into FLASH.");
-        _error_code = bhy2_upload_firmware_to_flash(firmware, length, _bhy2.get(),
-                      _process_callback,
-                      _process_callback_user_data);
+        if (compressed) {
+            _error_code = bhy2_upload_compressed_firmware_to_flash(firmware, length, _bhy2.get(),
+                          _process_callback,
+                          _process_callback_user_data);
+        } else if (delta) {
+            _error_code = bhy2_upload_firmware_stream_to_flash(firmware_size, delta_stream_read, &delta_dec,
+                          _bhy2.get(),
+                          _process_callback,
+                          _process_callback_user_data);
+        } else {
+            _error_code = bhy2_upload_firmware_to_flash(firmware, length, _bhy2.get(),
+                          _process_callback,
+                          _process_callback_user_data);
+        }
         BHY2_RLST_CHECK(_error_code != BHY2_OK, "bhy2_upload_firmware_to_flash failed!", false);
         log_d("Loading firmware into FLASH Done");
     } else {
         log_d("Loading firmware into RAM.");
-        log_d("upload size = %lu", length);
-        _error_code = bhy2_upload_firmware_to_ram(firmware, length, _bhy2.get());
+        log_d("upload size = %lu", firmware_size);
+        if (compressed) {
+            _error_code = bhy2_upload_compressed_firmware_to_ram(firmware, length, _bhy2.get());
+        } else if (delta) {
+            _error_code = bhy2_upload_firmware_stream_to_ram(firmware_size, delta_stream_read, &delta_dec, _bhy2.get());
+        } else {
+            _error_code = bhy2_upload_firmware_to_ram(firmware, length, _bhy2.get());
+        }
         BHY2_RLST_CHECK(_error_code != BHY2_OK, "bhy2_upload_firmware_to_ram failed!", false);
         log_d("Loading firmware into RAM Done");
     }
@@ -494,10 +535,30 @@ void SensorBHI260AP::setFirmware(const uint8_t *image, size_t image_len, bool wr
 {
     _firmware_stream = image;
     _firmware_size = image_len;
+    _firmware_base = nullptr;
+    _firmware_base_size = 0;
     _write_flash = write_flash;
     _force_update = force_update;
 }
 
+/**
+ * @brief  setFirmware
+ * @note   Set one of the firmware variants packed by tools/fw2h/fw_dedup.py
+ * @param  *variant: variant, e.g. bhy2_fw_variant_find(table, count, "Bosch_BHI260_GPIO.fw")
+ * @param  force_update: true, rewrite to flash or ram regardless of whether there is firmware, false, do not write if firmware is detected
+ * @retval None
+ */
+void SensorBHI260AP::setFirmware(const struct bhy2_fw_variant *variant, bool force_update)
+{
+    if (variant == nullptr) {
+        setFirmware(nullptr, 0, false, force_update);
+        return;
+    }
+    setFirmware(variant->image, variant->image_len, variant->type == 1, force_update);
+    _firmware_base = variant->base;
+    _firmware_base_size = variant->base_len;
+}
+
 /**
  * @brief  getSensorName
  * @note   Get sensor name
@@ -1120,7 +1181,7 @@ bool SensorBHI260AP::initImpl(bhy2_intf interface)
             _error_code = bhy2_soft_reset(_bhy2.get());
             BHY2_RLST_CHECK(_error_code != BHY2_OK, "reset _bhy2 failed!", false);
             log_i("Force update firmware.");
-            if (!uploadFirmware(_firmware_stream, _firmware_size, _write_flash)) {
+            if (!uploadFirmware(_firmware_stream, _firmware_size, _write_flash, _firmware_base, _firmware_base_size)) {
                 log_e("uploadFirmware failed!");
                 return false;
             }
@@ -1132,7 +1193,7 @@ bool SensorBHI260AP::initImpl(bhy2_intf interface)
         }
 
         // ** Upload firmware to RAM **//
-        if (!uploadFirmware(_firmware_stream, _firmware_size, false)) {
+        if (!uploadFirmware(_firmware_stream, _firmware_size, false, _firmware_base, _firmware_base_size)) {
             log_e("uploadFirmware failed!");
             return false;
         }
@@ -36,6 +36,7 @@
 #include "bosch/BoschSensorID.hpp"
 #include "bosch/BoschParseBase.hpp"
 #include "bosch/BoschParseCallbackManager.hpp"
+#include "bosch/bhy2_delta.h"
 
 
 #define BHI260AP_SLAVE_ADDRESS_L          0x28
@@ -413,13 +414,17 @@ public:
 
     /**
      * @brief  uploadFirmware
-     * @note   Update BHI sensor firmware
+     * @note   Update BHI sensor firmware, images compressed with fw2h.py --compress are decompressed
+     *         and deltas written by fw_dedup.py rebuilt from their base during the upload
      * @param  *firmware: Firmware data address
      * @param  length: Firmware data length
      * @param  write2Flash: 1 is written to external flash, 0 is written to RAM
+     * @param  *base: Base firmware, only used by deltas
+     * @param  base_len: Base firmware length
      * @retval bool true-> Success false-> failure
      */
-    bool uploadFirmware(const uint8_t *firmware, uint32_t length, bool write2Flash = false);
+    bool uploadFirmware(const uint8_t *firmware, uint32_t length, bool write2Flash = false,
+                        const uint8_t *base = nullptr, uint32_t base_len = 0);
 
     /**
      * @brief  getError
@@ -475,6 +480,15 @@ public:
      */
     void setFirmware(const uint8_t *image, size_t image_len, bool write_flash = false, bool force_update = false);
 
+    /**
+     * @brief  setFirmware
+     * @note   Set one of the firmware variants packed by tools/fw2h/fw_dedup.py, deltas are rebuilt during the upload
+     * @param  *variant: variant, e.g. bhy2_fw_variant_find(table, count, "Bosch_BHI260_GPIO.fw")
+     * @param  force_update: true, rewrite to flash or ram regardless of whether there is firmware, false, do not write if firmware is detected
+     * @retval None
+     */
+    void setFirmware(const struct bhy2_fw_variant *variant, bool force_update = false);
+
     /**
      * @brief  getSensorName
      * @note   Get sensor name
@@ -621,6 +635,8 @@ protected:
     size_t              _processBufferSize;
     const uint8_t      *_firmware_stream;
     size_t              _firmware_size;
+    const uint8_t      *_firmware_base;
+    uint32_t            _firmware_base_size;
     bool                _write_flash;
     bool                _boot_from_flash;
     bool                _force_update;
@@ -665,6 +665,39 @@ int8_t bhy2_upload_firmware_to_ram_partly(const uint8_t *firmware,
     return rslt;
 }
 
+int8_t bhy2_upload_compressed_firmware_to_ram(const uint8_t *image, uint32_t length, struct bhy2_dev *dev)
+{
+    int8_t rslt = BHY2_OK;
+
+    if ((dev == NULL) || (image == NULL))
+    {
+        rslt = BHY2_E_NULL_PTR;
+    }
+    else
+    {
+        rslt = bhy2_hif_upload_compressed_to_ram(image, length, &dev->hif);
+    }
+
+    return rslt;
+}
+
+int8_t bhy2_upload_firmware_stream_to_ram(uint32_t total_size, bhy2_fw_read_fptr_t read, void *ctx,
+                                          struct bhy2_dev *dev)
+{
+    int8_t rslt = BHY2_OK;
+
+    if ((dev == NULL) || (read == NULL))
+    {
+        rslt = BHY2_E_NULL_PTR;
+    }
+    else
+    {
+        rslt = bhy2_hif_upload_stream_to_ram(total_size, read, ctx, &dev->hif);
+    }
+
+    return rslt;
+}
+
 int8_t bhy2_boot_from_ram(struct bhy2_dev *dev)
 {
     int8_t rslt = BHY2_OK;
@@ -736,6 +769,41 @@ int8_t bhy2_upload_firmware_to_flash_partly(const uint8_t *firmware,
     return rslt;
 }
 
+int8_t bhy2_upload_compressed_firmware_to_flash(const uint8_t *image, uint32_t length, struct bhy2_dev *dev,
+    bhy2_progress_callback progress_cb, void *user_data)
+{
+    int8_t rslt = BHY2_OK;
+
+    if ((dev == NULL) || (image == NULL))
+    {
+        rslt = BHY2_E_NULL_PTR;
+    }
+    else
+    {
+        rslt = bhy2_hif_upload_compressed_to_flash(image, length, &dev->hif, progress_cb, user_data);
+    }
+
+    return rslt;
+}
+
+int8_t bhy2_upload_firmware_stream_to_flash(uint32_t total_size, bhy2_fw_read_fptr_t read, void *ctx,
+                                            struct bhy2_dev *dev, bhy2_progress_callback progress_cb,
+                                            void *user_data)
+{
+    int8_t rslt = BHY2_OK;
+
+    if ((dev == NULL) || (read == NULL))
+    {
+        rslt = BHY2_E_NULL_PTR;
+    }
+    else
+    {
+        rslt = bhy2_hif_upload_stream_to_flash(total_size, read, ctx, &dev->hif, progress_cb, user_data);
+    }
+
+    return rslt;
+}
+
 int8_t bhy2_boot_from_flash(struct bhy2_dev *dev)
 {
     int8_t rslt = BHY2_OK;
@@ -282,6 +282,26 @@ int8_t bhy2_upload_firmware_to_ram_partly(const uint8_t *firmware,
                                           uint32_t packet_len,
                                           struct bhy2_dev *dev);
 
+/**
+ * @brief Function to upload a compressed firmware image to RAM, decompressing it during the transfer
+ * @param[in] image     : Reference to the compressed image (tools/fw2h/fw2h.py --compress)
+ * @param[in] length    : Size of the compressed image
+ * @param[in] dev       : Device reference
+ * @return API error codes
+ */
+int8_t bhy2_upload_compressed_firmware_to_ram(const uint8_t *image, uint32_t length, struct bhy2_dev *dev);
+
+/**
+ * @brief Function to upload a firmware produced chunk by chunk to RAM, e.g. by bhy2_delta_read
+ * @param[in] total_size    : Size of the firmware
+ * @param[in] read          : Called for each chunk
+ * @param[in] ctx           : Passed to read
+ * @param[in] dev           : Device reference
+ * @return API error codes
+ */
+int8_t bhy2_upload_firmware_stream_to_ram(uint32_t total_size, bhy2_fw_read_fptr_t read, void *ctx,
+                                          struct bhy2_dev *dev);
+
 /**
  * @brief Function to boot firmware from RAM
  * @param[in] dev   : Device reference
@@ -321,6 +341,32 @@ int8_t bhy2_upload_firmware_to_flash_partly(const uint8_t *firmware,
                                             uint32_t packet_len,
                                             struct bhy2_dev *dev);
 
+/**
+ * @brief Function to upload a compressed firmware image to Flash, decompressing it during the transfer
+ * @param[in] image         : Reference to the compressed image (tools/fw2h/fw2h.py --compress)
+ * @param[in] length        : Size of the compressed image
+ * @param[in] dev           : Device reference
+ * @param[in] progress_cb   : Progress callback, can be NULL
+ * @param[in] user_data     : Passed to the progress callback
+ * @return API error codes
+ */
+int8_t bhy2_upload_compressed_firmware_to_flash(const uint8_t *image, uint32_t length, struct bhy2_dev *dev,
+                                                bhy2_progress_callback progress_cb, void *user_data);
+
+/**
+ * @brief Function to upload a firmware produced chunk by chunk to Flash, e.g. by bhy2_delta_read
+ * @param[in] total_size    : Size of the firmware
+ * @param[in] read          : Called for each chunk
+ * @param[in] ctx           : Passed to read
+ * @param[in] dev           : Device reference
+ * @param[in] progress_cb   : Progress callback, can be NULL
+ * @param[in] user_data     : Passed to the progress callback
+ * @return API error codes
+ */
+int8_t bhy2_upload_firmware_stream_to_flash(uint32_t total_size, bhy2_fw_read_fptr_t read, void *ctx,
+                                            struct bhy2_dev *dev, bhy2_progress_callback progress_cb,
+                                            void *user_data);
+
 /**
  * @brief Function to boot from Flash
  * @param[in] dev   : Device reference
@@ -602,6 +602,9 @@ typedef BHY2_INTF_RET_TYPE (*bhy2_write_fptr_t)(uint8_t reg_addr, const uint8_t
 typedef void (*bhy2_delay_us_fptr_t)(uint32_t period_us, void *intf_ptr);
 typedef void (*bhy2_progress_callback)(void *user_data, uint32_t total, uint32_t transferred);
 
+/* Produces the next bytes of a firmware streamed to the sensor, actual_len is less than buffer_len only at the end */
+typedef int8_t (*bhy2_fw_read_fptr_t)(uint8_t *buffer, uint32_t buffer_len, uint32_t *actual_len, void *ctx);
+
 enum bhy2_intf {
     BHY2_SPI_INTERFACE = 1,
     BHY2_I2C_INTERFACE
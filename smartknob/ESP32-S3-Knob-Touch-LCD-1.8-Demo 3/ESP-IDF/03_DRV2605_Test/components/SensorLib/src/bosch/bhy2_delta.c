@@ -0,0 +1,211 @@
+/**
+ * @file      bhy2_delta.c
+ * @brief     Streaming reconstruction of the delta firmware variants (see bhy2_delta.h)
+ *
+ * Not part of the upstream SensorLib: added with the fw2h tools of this
+ * repository, under the library's MIT license (see LICENSE).
+ */
+
+#include "bhy2_delta.h"
+#include "bhy2_lz.h"
+
+#define BHY2_DELTA_VERSION  UINT8_C(1)
+
+/* Reads a LEB128 varint of at most 32 bits, returns 0 if it's truncated or too long */
+static uint8_t get_varint(uint32_t *value, struct bhy2_delta_dec *dec)
+{
+    uint8_t shift = 0;
+    uint8_t byte;
+
+    *value = 0;
+    do
+    {
+        if ((dec->delta_pos >= dec->delta_len) || (shift > 28))
+        {
+            return 0;
+        }
+
+        byte = dec->delta[dec->delta_pos++];
+        if ((shift == 28) && (byte & 0x70))
+        {
+            return 0;
+        }
+
+        *value |= (uint32_t)(byte & 0x7F) << shift;
+        shift += 7;
+    } while (byte & 0x80);
+
+    return 1;
+}
+
+/* Decodes the next operation, returns 0 if it's invalid */
+static uint8_t next_op(struct bhy2_delta_dec *dec)
+{
+    uint32_t head, zigzag, offset;
+
+    if (!get_varint(&head, dec))
+    {
+        return 0;
+    }
+
+    dec->op_len = head >> 1;
+    if ((dec->op_len == 0) || (dec->op_len > dec->out_len - dec->out_pos))
+    {
+        return 0;
+    }
+
+    if (head & 1)
+    {
+        if (!get_varint(&zigzag, dec))
+        {
+            return 0;
+        }
+
+        /* Signed distance from the end of the previous copy */
+        offset = dec->copy_end + ((zigzag >> 1) ^ (0UL - (zigzag & 1)));
+        if ((offset > dec->base_len) || (dec->op_len > dec->base_len - offset))
+        {
+            return 0;
+        }
+
+        dec->op_src = &dec->base[offset];
+        dec->copy_end = offset + dec->op_len;
+    }
+    else
+    {
+        if (dec->op_len > dec->delta_len - dec->delta_pos)
+        {
+            return 0;
+        }
+
+        dec->op_src = &dec->delta[dec->delta_pos];
+        dec->delta_pos += dec->op_len;
+    }
+
+    return 1;
+}
+
+uint8_t bhy2_delta_is_delta(const uint8_t *image, uint32_t length)
+{
+    return (image != NULL) && (length >= BHY2_DELTA_HEADER_LEN) && (image[0] == 'B') && (image[1] == 'H') &&
+           (image[2] == 'D') && (image[3] == 'L');
+}
+
+int8_t bhy2_delta_init(const uint8_t *delta,
+                       uint32_t delta_len,
+                       const uint8_t *base,
+                       uint32_t base_len,
+                       struct bhy2_delta_dec *dec)
+{
+    int8_t rslt = BHY2_OK;
+
+    if ((delta == NULL) || (base == NULL) || (dec == NULL))
+    {
+        rslt = BHY2_E_NULL_PTR;
+    }
+    else if (!bhy2_delta_is_delta(delta, delta_len) || (delta[4] != BHY2_DELTA_VERSION))
+    {
+        rslt = BHY2_E_MAGIC;
+    }
+    else if ((BHY2_LE2U32(&delta[16]) != base_len) || (BHY2_LE2U32(&delta[20]) != bhy2_lz_crc32(0, base, base_len)))
+    {
+        rslt = BHY2_E_INVALID_PARAM;
+    }
+    else
+    {
+        memset(dec, 0, sizeof(*dec));
+        dec->delta = delta;
+        dec->delta_len = delta_len;
+        dec->delta_pos = BHY2_DELTA_HEADER_LEN;
+        dec->base = base;
+        dec->base_len = base_len;
+        dec->out_len = BHY2_LE2U32(&delta[8]);
+        dec->exp_crc = BHY2_LE2U32(&delta[12]);
+    }
+
+    return rslt;
+}
+
+uint32_t bhy2_delta_get_size(const uint8_t *delta, uint32_t length)
+{
+    return bhy2_delta_is_delta(delta, length) ? BHY2_LE2U32(&delta[8]) : 0;
+}
+
+int8_t bhy2_delta_read(uint8_t *buffer, uint32_t buffer_len, uint32_t *actual_len, struct bhy2_delta_dec *dec)
+{
+    int8_t rslt = BHY2_OK;
+    uint32_t len = 0;
+    uint32_t count;
+
+    if ((buffer == NULL) || (actual_len == NULL) || (dec == NULL))
+    {
+        return BHY2_E_NULL_PTR;
+    }
+
+    while ((len < buffer_len) && (dec->out_pos < dec->out_len))
+    {
+        if ((dec->op_len == 0) && !next_op(dec))
+        {
+            dec->op_len = 0;
+            rslt = BHY2_E_INVALID_PARAM;
+            break;
+        }
+
+        count = buffer_len - len;
+        if (count > dec->op_len)
+        {
+            count = dec->op_len;
+        }
+
+        memcpy(&buffer[len], dec->op_src, count);
+        dec->crc = bhy2_lz_crc32(dec->crc, dec->op_src, count);
+        dec->op_src += count;
+        dec->op_len -= count;
+        dec->out_pos += count;
+        len += count;
+    }
+
+    if ((rslt == BHY2_OK) && (dec->out_pos == dec->out_len) && (dec->crc != dec->exp_crc))
+    {
+        rslt = BHY2_E_INVALID_PARAM;
+    }
+
+    *actual_len = len;
+
+    return rslt;
+}
+
+uint32_t bhy2_fw_variant_get_size(const struct bhy2_fw_variant *variant)
+{
+    if ((variant == NULL) || (variant->image == NULL))
+    {
+        return 0;
+    }
+
+    if (variant->base == NULL)
+    {
+        return variant->image_len;
+    }
+
+    return bhy2_delta_get_size(variant->image, variant->image_len);
+}
+
+const struct bhy2_fw_variant *bhy2_fw_variant_find(const struct bhy2_fw_variant *variants,
+                                                   uint32_t count,
+                                                   const char *name)
+{
+    if ((variants == NULL) || (name == NULL))
+    {
+        return NULL;
+    }
+
+    for (uint32_t i = 0; i < count; i++)
+    {
+        if ((variants[i].name != NULL) && (strcmp(variants[i].name, name) == 0))
+        {
+            return &variants[i];
+        }
+    }
+
+    return NULL;
+}
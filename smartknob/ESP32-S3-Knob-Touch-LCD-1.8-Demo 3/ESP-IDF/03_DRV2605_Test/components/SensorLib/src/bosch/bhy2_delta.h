@@ -0,0 +1,130 @@
+/**
+ * @file      bhy2_delta.h
+ * @brief     Streaming reconstruction of the firmware variants stored as a delta
+ *            against a base firmware by tools/fw2h/fw_dedup.py (format described in fw_delta.py)
+ *
+ * Not part of the upstream SensorLib: added with the fw2h tools of this
+ * repository, under the library's MIT license (see LICENSE).
+ */
+
+#ifndef __BHY2_DELTA_H__
+#define __BHY2_DELTA_H__
+
+/* Start of CPP Guard */
+#ifdef __cplusplus
+extern "C" {
+#endif /*__cplusplus */
+
+#include "bhy2_defs.h"
+
+#define BHY2_DELTA_HEADER_LEN     24
+
+struct bhy2_delta_dec
+{
+    /*! Delta operations */
+    const uint8_t *delta;
+    uint32_t delta_len;
+    uint32_t delta_pos;
+
+    /*! Firmware the copies read from */
+    const uint8_t *base;
+    uint32_t base_len;
+
+    /*! Size of the firmware, bytes produced so far */
+    uint32_t out_len;
+    uint32_t out_pos;
+    uint32_t crc;
+    uint32_t exp_crc;
+
+    /*! End of the previous copy in the base */
+    uint32_t copy_end;
+
+    /*! Current operation: bytes left and where they're read from */
+    const uint8_t *op_src;
+    uint32_t op_len;
+};
+
+/*! One of the firmware variants packed by fw_dedup.py */
+struct bhy2_fw_variant
+{
+    /*! Name of the .fw file */
+    const char *name;
+
+    /*! The firmware itself, or a delta against base */
+    const uint8_t *image;
+    uint32_t image_len;
+
+    /*! NULL if image is the firmware */
+    const uint8_t *base;
+    uint32_t base_len;
+
+    /*! bosch_firmware_type: 0 RAM, 1 flash */
+    uint8_t type;
+};
+
+/**
+ * @brief Function to check if an image is a delta
+ * @param[in] image     : Reference to the image
+ * @param[in] length    : Size of the image
+ * @return 1 if it's a delta, 0 otherwise
+ */
+uint8_t bhy2_delta_is_delta(const uint8_t *image, uint32_t length);
+
+/**
+ * @brief Function to start rebuilding a firmware from its delta
+ * @param[in] delta         : Reference to the delta
+ * @param[in] delta_len     : Size of the delta
+ * @param[in] base          : Reference to the base firmware
+ * @param[in] base_len      : Size of the base firmware
+ * @param[out] dec          : Decoder state
+ * @return BHY2_OK, BHY2_E_MAGIC if it isn't a delta, BHY2_E_INVALID_PARAM if the delta
+ *         was made for another base
+ */
+int8_t bhy2_delta_init(const uint8_t *delta,
+                       uint32_t delta_len,
+                       const uint8_t *base,
+                       uint32_t base_len,
+                       struct bhy2_delta_dec *dec);
+
+/**
+ * @brief Function to get the size of the firmware rebuilt from a delta
+ * @param[in] delta     : Reference to the delta
+ * @param[in] length    : Size of the delta
+ * @return Size of the firmware, 0 if the image isn't a delta
+ */
+uint32_t bhy2_delta_get_size(const uint8_t *delta, uint32_t length);
+
+/**
+ * @brief Function to rebuild the next bytes of the firmware
+ * @param[out] buffer       : Reference to the output buffer
+ * @param[in] buffer_len    : Bytes requested
+ * @param[out] actual_len   : Bytes written, less than buffer_len only at the end of the firmware
+ * @param[in] dec           : Decoder state
+ * @return BHY2_OK, BHY2_E_INVALID_PARAM if the delta is damaged or the CRC doesn't match
+ */
+int8_t bhy2_delta_read(uint8_t *buffer, uint32_t buffer_len, uint32_t *actual_len, struct bhy2_delta_dec *dec);
+
+/**
+ * @brief Function to get the size of a packed firmware variant
+ * @param[in] variant   : Reference to the variant
+ * @return Size of the firmware, 0 if the variant is damaged
+ */
+uint32_t bhy2_fw_variant_get_size(const struct bhy2_fw_variant *variant);
+
+/**
+ * @brief Function to look up a packed firmware variant by the name of its .fw file
+ * @param[in] variants  : Table generated by fw_dedup.py
+ * @param[in] count     : Entries in the table
+ * @param[in] name      : Name of the .fw file, e.g. "Bosch_BHI260_GPIO.fw"
+ * @return Reference to the variant, NULL if there's none with that name
+ */
+const struct bhy2_fw_variant *bhy2_fw_variant_find(const struct bhy2_fw_variant *variants,
+                                                   uint32_t count,
+                                                   const char *name);
+
+/* End of CPP Guard */
+#ifdef __cplusplus
+}
+#endif /*__cplusplus */
+
+#endif /* __BHY2_DELTA_H__ */
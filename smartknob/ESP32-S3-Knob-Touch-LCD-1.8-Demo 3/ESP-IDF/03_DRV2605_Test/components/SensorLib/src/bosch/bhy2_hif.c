@@ -37,6 +37,7 @@
  */
 
 #include "bhy2_hif.h"
+#include "bhy2_lz.h"
 
 /*! Mask definitions for SPI read/write address */
 #define BHY2_SPI_RD_MASK UINT8_C(0x80)
@@ -685,6 +686,24 @@ int8_t bhy2_hif_reset(struct bhy2_hif_dev *hif)
     return rslt;
 }
 
+static int8_t bhy2_hif_lz_read(uint8_t *buffer, uint32_t buffer_len, uint32_t *actual_len, void *ctx)
+{
+    return bhy2_lz_read(buffer, buffer_len, actual_len, (struct bhy2_lz_dec *)ctx);
+}
+
+/* Transfer size of the streamed uploads: the read/write length, at most BHY2_LZ_CHUNK_LEN */
+static uint32_t bhy2_hif_stream_chunk_len(const struct bhy2_hif_dev *hif)
+{
+    uint32_t len = hif->read_write_len;
+
+    if ((len == 0) || (len > BHY2_LZ_CHUNK_LEN))
+    {
+        len = BHY2_LZ_CHUNK_LEN;
+    }
+
+    return BHY2_ROUND_WORD_LOWER(len);
+}
+
 int8_t bhy2_hif_upload_firmware_to_ram(const uint8_t *firmware, uint32_t length, struct bhy2_hif_dev *hif)
 {
     int8_t rslt = BHY2_OK;
@@ -759,6 +778,69 @@ int8_t bhy2_hif_upload_firmware_to_ram_partly(const uint8_t *firmware,
     return rslt;
 }
 
+int8_t bhy2_hif_upload_stream_to_ram(uint32_t total_size,
+                                     bhy2_fw_read_fptr_t read,
+                                     void *ctx,
+                                     struct bhy2_hif_dev *hif)
+{
+    int8_t rslt = BHY2_OK;
+    uint8_t chunk[BHY2_LZ_CHUNK_LEN];
+    uint32_t chunk_len, actual_len, pos = 0;
+
+    if ((hif != NULL) && (read != NULL))
+    {
+        chunk_len = bhy2_hif_stream_chunk_len(hif);
+
+        /* Each chunk is sent as it's produced, the first one with the upload command */
+        while ((rslt == BHY2_OK) && (pos < total_size))
+        {
+            rslt = read(chunk, chunk_len, &actual_len, ctx);
+            if ((rslt == BHY2_OK) && (actual_len == 0))
+            {
+                rslt = BHY2_E_INVALID_PARAM;
+            }
+
+            if (rslt == BHY2_OK)
+            {
+                rslt = bhy2_hif_upload_firmware_to_ram_partly(chunk, total_size, pos, actual_len, hif);
+                pos += actual_len;
+            }
+        }
+
+        if (rslt == BHY2_OK)
+        {
+            rslt = bhy2_hif_check_boot_status_ram(hif);
+        }
+    }
+    else
+    {
+        rslt = BHY2_E_NULL_PTR;
+    }
+
+    return rslt;
+}
+
+int8_t bhy2_hif_upload_compressed_to_ram(const uint8_t *image, uint32_t length, struct bhy2_hif_dev *hif)
+{
+    int8_t rslt = BHY2_OK;
+    struct bhy2_lz_dec dec;
+
+    if ((hif != NULL) && (image != NULL))
+    {
+        rslt = bhy2_lz_init(image, length, &dec);
+        if (rslt == BHY2_OK)
+        {
+            rslt = bhy2_hif_upload_stream_to_ram(bhy2_lz_get_size(image, length), bhy2_hif_lz_read, &dec, hif);
+        }
+    }
+    else
+    {
+        rslt = BHY2_E_NULL_PTR;
+    }
+
+    return rslt;
+}
+
 int8_t bhy2_hif_boot_program_ram(struct bhy2_hif_dev *hif)
 {
     int8_t rslt;
@@ -1497,6 +1579,79 @@ int8_t bhy2_hif_upload_to_flash_partly(const uint8_t *firmware,
     return rslt;
 }
 
+int8_t bhy2_hif_upload_stream_to_flash(uint32_t total_size,
+                                       bhy2_fw_read_fptr_t read,
+                                       void *ctx,
+                                       struct bhy2_hif_dev *hif,
+                                       bhy2_progress_callback progress_cb,
+                                       void *user_data)
+{
+    int8_t rslt = BHY2_OK;
+    uint8_t chunk[BHY2_LZ_CHUNK_LEN];
+    uint32_t chunk_len, actual_len, pos = 0;
+
+    if ((hif != NULL) && (read != NULL))
+    {
+        chunk_len = bhy2_hif_stream_chunk_len(hif);
+
+        while ((rslt == BHY2_OK) && (pos < total_size))
+        {
+            rslt = read(chunk, chunk_len, &actual_len, ctx);
+            if ((rslt == BHY2_OK) && (actual_len == 0))
+            {
+                rslt = BHY2_E_INVALID_PARAM;
+            }
+
+            if (rslt == BHY2_OK)
+            {
+                rslt = bhy2_hif_upload_to_flash_partly(chunk, pos, actual_len, hif);
+                pos += actual_len;
+            }
+
+            if ((rslt == BHY2_OK) && (progress_cb != NULL))
+            {
+                progress_cb(user_data, total_size, pos);
+            }
+        }
+    }
+    else
+    {
+        rslt = BHY2_E_NULL_PTR;
+    }
+
+    return rslt;
+}
+
+int8_t bhy2_hif_upload_compressed_to_flash(const uint8_t *image,
+                                           uint32_t length,
+                                           struct bhy2_hif_dev *hif,
+                                           bhy2_progress_callback progress_cb,
+                                           void *user_data)
+{
+    int8_t rslt = BHY2_OK;
+    struct bhy2_lz_dec dec;
+
+    if ((hif != NULL) && (image != NULL))
+    {
+        rslt = bhy2_lz_init(image, length, &dec);
+        if (rslt == BHY2_OK)
+        {
+            rslt = bhy2_hif_upload_stream_to_flash(bhy2_lz_get_size(image, length),
+                                                   bhy2_hif_lz_read,
+                                                   &dec,
+                                                   hif,
+                                                   progress_cb,
+                                                   user_data);
+        }
+    }
+    else
+    {
+        rslt = BHY2_E_NULL_PTR;
+    }
+
+    return rslt;
+}
+
 int8_t bhy2_hif_boot_from_flash(struct bhy2_hif_dev *hif)
 {
     int8_t rslt;
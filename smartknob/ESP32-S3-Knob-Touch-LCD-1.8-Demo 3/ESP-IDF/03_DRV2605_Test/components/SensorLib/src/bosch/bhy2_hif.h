@@ -169,6 +169,38 @@ int8_t bhy2_hif_upload_to_flash_partly(const uint8_t *firmware,
                                        uint32_t packet_len,
                                        struct bhy2_hif_dev *hif);
 
+/**
+ * @brief Function to upload a firmware produced chunk by chunk to flash
+ * @param[in] total_size    : Size of the firmware
+ * @param[in] read          : Called for each chunk, at most read_write_len bytes
+ * @param[in] ctx           : Passed to read
+ * @param[in] hif           : HIF device reference
+ * @param[in] progress_cb   : Progress callback, can be NULL
+ * @param[in] user_data     : Passed to the progress callback
+ * @return API error codes
+ */
+int8_t bhy2_hif_upload_stream_to_flash(uint32_t total_size,
+                                       bhy2_fw_read_fptr_t read,
+                                       void *ctx,
+                                       struct bhy2_hif_dev *hif,
+                                       bhy2_progress_callback progress_cb,
+                                       void *user_data);
+
+/**
+ * @brief Function to upload a compressed firmware image to flash, decompressing it chunk by chunk
+ * @param[in] image         : Reference to the compressed image (tools/fw2h/fw2h.py --compress)
+ * @param[in] length        : Size of the compressed image
+ * @param[in] hif           : HIF device reference
+ * @param[in] progress_cb   : Progress callback, can be NULL
+ * @param[in] user_data     : Passed to the progress callback
+ * @return API error codes
+ */
+int8_t bhy2_hif_upload_compressed_to_flash(const uint8_t *image,
+                                           uint32_t length,
+                                           struct bhy2_hif_dev *hif,
+                                           bhy2_progress_callback progress_cb,
+                                           void *user_data);
+
 /**
  * @brief Function to boot from flash
  * @param[in] hif   : HIF device reference
@@ -287,6 +319,28 @@ int8_t bhy2_hif_upload_firmware_to_ram_partly(const uint8_t *firmware,
                                               uint32_t packet_len,
                                               struct bhy2_hif_dev *hif);
 
+/**
+ * @brief Function to upload a firmware produced chunk by chunk to program RAM
+ * @param[in] total_size    : Size of the firmware
+ * @param[in] read          : Called for each chunk, at most read_write_len bytes
+ * @param[in] ctx           : Passed to read
+ * @param[in] hif           : HIF device reference
+ * @return API error codes
+ */
+int8_t bhy2_hif_upload_stream_to_ram(uint32_t total_size,
+                                     bhy2_fw_read_fptr_t read,
+                                     void *ctx,
+                                     struct bhy2_hif_dev *hif);
+
+/**
+ * @brief Function to upload a compressed firmware image to program RAM, decompressing it chunk by chunk
+ * @param[in] image     : Reference to the compressed image (tools/fw2h/fw2h.py --compress)
+ * @param[in] length    : Size of the compressed image
+ * @param[in] hif       : HIF device reference
+ * @return API error codes
+ */
+int8_t bhy2_hif_upload_compressed_to_ram(const uint8_t *image, uint32_t length, struct bhy2_hif_dev *hif);
+
 /**
  * @brief Function to boot from RAM
  * @param[in] hif   : HIF device reference
@@ -0,0 +1,174 @@
+/**
+ * @file      bhy2_lz.c
+ * @brief     Streaming decoder of the compressed firmware images (see bhy2_lz.h)
+ *
+ * Not part of the upstream SensorLib: added with the fw2h tools of this
+ * repository, under the library's MIT license (see LICENSE).
+ */
+
+#include "bhy2_lz.h"
+
+#define BHY2_LZ_VERSION     UINT8_C(1)
+
+static uint32_t crc32_update(uint32_t crc, uint8_t byte)
+{
+    crc ^= byte;
+    for (uint8_t i = 0; i < 8; i++)
+    {
+        crc = (crc >> 1) ^ (0xEDB88320UL & (0UL - (crc & 1)));
+    }
+
+    return crc;
+}
+
+uint32_t bhy2_lz_crc32(uint32_t crc, const uint8_t *data, uint32_t length)
+{
+    crc = ~crc;
+    while (length--)
+    {
+        crc = crc32_update(crc, *data++);
+    }
+
+    return ~crc;
+}
+
+/* Returns the next `count` bits (at most 16), or -1 at the end of the stream */
+static int32_t get_bits(uint8_t count, struct bhy2_lz_dec *dec)
+{
+    int32_t value = 0;
+
+    while (count--)
+    {
+        if (dec->bit_count == 0)
+        {
+            if (dec->src_pos >= dec->src_len)
+            {
+                return -1;
+            }
+
+            dec->bit_buf = dec->src[dec->src_pos++];
+            dec->bit_count = 8;
+        }
+
+        dec->bit_count--;
+        value = (value << 1) | ((dec->bit_buf >> dec->bit_count) & 1);
+    }
+
+    return value;
+}
+
+static void put_byte(uint8_t byte, uint8_t *buffer, struct bhy2_lz_dec *dec)
+{
+    uint16_t mask = (uint16_t)((1U << dec->window_bits) - 1);
+
+    dec->window[dec->out_pos & mask] = byte;
+    dec->crc = crc32_update(dec->crc, byte);
+    *buffer = byte;
+    dec->out_pos++;
+}
+
+uint8_t bhy2_lz_is_compressed(const uint8_t *image, uint32_t length)
+{
+    return (image != NULL) && (length >= BHY2_LZ_HEADER_LEN) && (image[0] == 'B') && (image[1] == 'H') &&
+           (image[2] == 'L') && (image[3] == 'Z');
+}
+
+int8_t bhy2_lz_init(const uint8_t *image, uint32_t length, struct bhy2_lz_dec *dec)
+{
+    int8_t rslt = BHY2_OK;
+
+    if ((image == NULL) || (dec == NULL))
+    {
+        rslt = BHY2_E_NULL_PTR;
+    }
+    else if (!bhy2_lz_is_compressed(image, length) || (image[4] != BHY2_LZ_VERSION))
+    {
+        rslt = BHY2_E_MAGIC;
+    }
+    else if ((image[5] > BHY2_LZ_MAX_WINDOW_BITS) || (image[6] >= image[5]) || (image[6] < 3))
+    {
+        rslt = BHY2_E_BUFFER;
+    }
+    else
+    {
+        memset(dec, 0, sizeof(*dec));
+        dec->src = &image[BHY2_LZ_HEADER_LEN];
+        dec->src_len = length - BHY2_LZ_HEADER_LEN;
+        dec->window_bits = image[5];
+        dec->lookahead_bits = image[6];
+        dec->out_len = BHY2_LE2U32(&image[8]);
+        dec->exp_crc = BHY2_LE2U32(&image[12]);
+        dec->crc = 0xFFFFFFFFUL;
+    }
+
+    return rslt;
+}
+
+uint32_t bhy2_lz_get_size(const uint8_t *image, uint32_t length)
+{
+    return bhy2_lz_is_compressed(image, length) ? BHY2_LE2U32(&image[8]) : 0;
+}
+
+int8_t bhy2_lz_read(uint8_t *buffer, uint32_t buffer_len, uint32_t *actual_len, struct bhy2_lz_dec *dec)
+{
+    int8_t rslt = BHY2_OK;
+    uint32_t len = 0;
+    int32_t bits;
+    uint16_t mask;
+
+    if ((buffer == NULL) || (actual_len == NULL) || (dec == NULL))
+    {
+        return BHY2_E_NULL_PTR;
+    }
+
+    mask = (uint16_t)((1U << dec->window_bits) - 1);
+    while ((len < buffer_len) && (dec->out_pos < dec->out_len))
+    {
+        if (dec->copy_count > 0)
+        {
+            put_byte(dec->window[(dec->out_pos - dec->copy_dist) & mask], &buffer[len++], dec);
+            dec->copy_count--;
+            continue;
+        }
+
+        bits = get_bits(1, dec);
+        if (bits == 1)
+        {
+            bits = get_bits(8, dec);
+            if (bits < 0)
+            {
+                rslt = BHY2_E_INVALID_PARAM;
+                break;
+            }
+
+            put_byte((uint8_t)bits, &buffer[len++], dec);
+        }
+        else if (bits == 0)
+        {
+            bits = get_bits(dec->window_bits, dec);
+            dec->copy_dist = (uint16_t)(bits + 1);
+            bits = get_bits(dec->lookahead_bits, dec);
+            dec->copy_count = (uint16_t)(bits + 1);
+            if ((bits < 0) || (dec->copy_dist > dec->out_pos) || (dec->copy_count > dec->out_len - dec->out_pos))
+            {
+                dec->copy_count = 0;
+                rslt = BHY2_E_INVALID_PARAM;
+                break;
+            }
+        }
+        else
+        {
+            rslt = BHY2_E_INVALID_PARAM;
+            break;
+        }
+    }
+
+    if ((rslt == BHY2_OK) && (dec->out_pos == dec->out_len) && ((uint32_t)~dec->crc != dec->exp_crc))
+    {
+        rslt = BHY2_E_INVALID_PARAM;
+    }
+
+    *actual_len = len;
+
+    return rslt;
+}
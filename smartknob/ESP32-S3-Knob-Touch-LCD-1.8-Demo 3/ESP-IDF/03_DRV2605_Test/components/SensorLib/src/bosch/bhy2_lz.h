@@ -0,0 +1,106 @@
+/**
+ * @file      bhy2_lz.h
+ * @brief     Streaming decoder of the compressed firmware images written by
+ *            tools/fw2h/fw2h.py --compress (format described in fw_lz.py)
+ *
+ * Not part of the upstream SensorLib: added with the fw2h tools of this
+ * repository, under the library's MIT license (see LICENSE).
+ */
+
+#ifndef __BHY2_LZ_H__
+#define __BHY2_LZ_H__
+
+/* Start of CPP Guard */
+#ifdef __cplusplus
+extern "C" {
+#endif /*__cplusplus */
+
+#include "bhy2_defs.h"
+
+/*! Largest window the decoder accepts, the decoder holds (1 << BHY2_LZ_MAX_WINDOW_BITS) bytes */
+#ifndef BHY2_LZ_MAX_WINDOW_BITS
+#define BHY2_LZ_MAX_WINDOW_BITS   8
+#endif
+
+/*! Size of the chunk buffer used by the compressed uploads (on the stack), at most read_write_len is used */
+#ifndef BHY2_LZ_CHUNK_LEN
+#define BHY2_LZ_CHUNK_LEN         256
+#endif
+
+#define BHY2_LZ_HEADER_LEN        16
+
+struct bhy2_lz_dec
+{
+    /*! Compressed stream */
+    const uint8_t *src;
+    uint32_t src_len;
+    uint32_t src_pos;
+
+    /*! Size of the firmware, bytes produced so far */
+    uint32_t out_len;
+    uint32_t out_pos;
+    uint32_t crc;
+    uint32_t exp_crc;
+
+    /*! Pending copy */
+    uint16_t copy_dist;
+    uint16_t copy_count;
+
+    uint8_t window_bits;
+    uint8_t lookahead_bits;
+    uint8_t bit_buf;
+    uint8_t bit_count;
+    uint8_t window[1 << BHY2_LZ_MAX_WINDOW_BITS];
+};
+
+/**
+ * @brief Function to check if a firmware image is compressed
+ * @param[in] image     : Reference to the image
+ * @param[in] length    : Size of the image
+ * @return 1 if compressed, 0 otherwise
+ */
+uint8_t bhy2_lz_is_compressed(const uint8_t *image, uint32_t length);
+
+/**
+ * @brief Function to start decoding a compressed image
+ * @param[in] image     : Reference to the compressed image
+ * @param[in] length    : Size of the compressed image
+ * @param[out] dec      : Decoder state
+ * @return BHY2_OK, BHY2_E_MAGIC if not compressed, BHY2_E_BUFFER if the window is larger
+ *         than BHY2_LZ_MAX_WINDOW_BITS
+ */
+int8_t bhy2_lz_init(const uint8_t *image, uint32_t length, struct bhy2_lz_dec *dec);
+
+/**
+ * @brief Function to get the size of the firmware stored in a compressed image
+ * @param[in] image     : Reference to the compressed image
+ * @param[in] length    : Size of the compressed image
+ * @return Size of the decompressed firmware, 0 if the image isn't compressed
+ */
+uint32_t bhy2_lz_get_size(const uint8_t *image, uint32_t length);
+
+/**
+ * @brief Function to decode the next bytes of the firmware
+ * @param[out] buffer       : Reference to the output buffer
+ * @param[in] buffer_len    : Bytes requested
+ * @param[out] actual_len   : Bytes written, less than buffer_len only at the end of the firmware
+ * @param[in] dec           : Decoder state
+ * @return BHY2_OK, BHY2_E_INVALID_PARAM if the stream is damaged or the CRC doesn't match
+ */
+int8_t bhy2_lz_read(uint8_t *buffer, uint32_t buffer_len, uint32_t *actual_len, struct bhy2_lz_dec *dec);
+
+/**
+ * @brief Function to update a CRC-32 (zlib polynomial), as stored in the compressed and delta images
+ * @param[in] crc       : CRC of the previous data, 0 to start
+ * @param[in] data      : Reference to the data
+ * @param[in] length    : Size of the data
+ * @return CRC including the data
+ */
+uint32_t bhy2_lz_crc32(uint32_t crc, const uint8_t *data, uint32_t length);
+
+/* End of CPP Guard */
+#ifdef __cplusplus
+}
+#endif /*__cplusplus */
+
+#endif /* __BHY2_LZ_H__ */
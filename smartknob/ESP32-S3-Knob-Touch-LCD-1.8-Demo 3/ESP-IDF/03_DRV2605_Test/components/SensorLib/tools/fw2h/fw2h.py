@@ -2,37 +2,173 @@
  * @file      fw2h.py
  * @author    Lewis He (lewishe@outlook.com)
  * @date      2024-07-24
+
+Usage:
+    python3 fw2h.py Bosch_BHI260_GPIO.fw                 # py_Bosch_BHI260_GPIO.fw.h, a C array
+    python3 fw2h.py -f asm -s bosch_bhi260_gpio Bosch_BHI260_GPIO.fw
+    python3 fw2h.py -f elf -m xtensa -o build/bhi260.h Bosch_BHI260_GPIO.fw
+
+The headers in src/bosch/firmware are kept up to date with fw_regen.py.
+
+`-c` compresses the firmware (fw_lz.py); SensorBHI260AP::uploadFirmware()
+recognizes such images and decompresses them while uploading, with
+(1 << --window-bits) bytes of window RAM (BHY2_LZ_MAX_WINDOW_BITS in bhy2_lz.h).
+Projects keeping several variants selectable at runtime can store most of them
+as deltas against a few bases instead, see fw_dedup.py.
+
+`-f asm` writes a `.S` stub which `.incbin`s the firmware and `-f elf` a
+relocatable object holding it, each with a small header declaring the
+`<symbol>`, `<symbol>_start` and `<symbol>_end` symbols (see fw_object.py).
+Add the `.S` or `.o` file to the build instead of compiling a C array, e.g. in
+an ESP-IDF component: `idf_component_register(SRCS "bhi260.S" ...)`.
 '''
 
+import argparse
+import io
+import os
 import sys
-import struct
 
-def convert_binary_to_header(input_file_path):
-    output_file_name = 'py_' + input_file_path + ".h"
+import fw_io
+import fw_lz
+import fw_object
+
+DEFAULT_SYMBOL = "bhy2_firmware_image"
+
+
+# bosch_firmware_type of the headers in src/bosch/firmware
+FIRMWARE_TYPES = {"ram": 0, "flash": 1}
+
+
+def write_firmware_header(output_file, symbol, input_file, firmware_type=None):
+    '''
+    Write the C array of the firmware. With a `firmware_type` ("ram" or "flash")
+    the bosch_firmware_image/size/type definitions used by BoschFirmware.h follow.
+    '''
+    # 12 bytes per row as in the C program
+    fw_io.write_c_array(output_file, symbol, input_file, ctype="const unsigned char",
+                        line_width=12, item_format="0x%02x, ", indent="  ")
+    if firmware_type is not None:
+        output_file.write("const unsigned char *bosch_firmware_image = %s;\n" % symbol)
+        output_file.write("const unsigned int  bosch_firmware_size = sizeof(%s)/sizeof(%s[0]);\n" % (symbol, symbol))
+        output_file.write("const unsigned char bosch_firmware_type = %d;\n" % FIRMWARE_TYPES[firmware_type])
+
+
+def open_firmware(input_file_path, compress=None):
+    '''
+    Open the firmware for reading, or compress it when `compress` is a
+    (window bits, lookahead bits) pair. Return the file object and its size.
+    '''
+    if compress is None:
+        return open(input_file_path, "rb"), os.path.getsize(input_file_path)
+    with open(input_file_path, "rb") as f:
+        data = f.read()
+    image = fw_lz.compress(data, *compress)
+    print(f"Compressed {len(data)} bytes to {len(image)} ({100.0 * len(image) / max(len(data), 1):.1f} %)")
+    return io.BytesIO(image), len(image)
+
+
+def convert_binary_to_header(input_file_path, output_file_name=None, symbol=DEFAULT_SYMBOL, firmware_type=None,
+                             compress=None):
+    output_file_name = output_file_name or 'py_' + input_file_path + ".h"
     print(f"Utility to convert binary files to .h")
     print(f"Copying firmware to {output_file_name}")
 
-    with open(input_file_path, "rb") as input_file, open(output_file_name, "w") as output_file:
-        output_file.write("const unsigned char bhy2_firmware_image[] = {\n")
-        fw = bytearray(12)  # Assuming 12 rows as in the C program
-        bytes_read = 0
+    input_file, _ = open_firmware(input_file_path, compress)
+    with input_file, open(output_file_name, "w", newline="\n") as output_file:
+        write_firmware_header(output_file, symbol, input_file, firmware_type)
 
-        while True:
-            bytes_read = input_file.readinto(fw)
-            if not bytes_read:
-                break
 
-            output_file.write("  ")
-            for j in range(bytes_read):
-                output_file.write(f"0x{fw[j]:02x}, ")
-            output_file.write("\n")
+def convert_binary_to_asm(input_file_path, output_file_name=None, symbol=DEFAULT_SYMBOL,
+                          section=None, align=fw_object.DEFAULT_ALIGN, incbin_path=None, compress=None):
+    output_file_name = output_file_name or 'py_' + input_file_path + ".h"
+    stub_name = os.path.splitext(output_file_name)[0] + ".S"
+    input_file, size = open_firmware(input_file_path, compress)
+    if compress is not None:
+        # .incbin needs a file, the compressed image is put next to the stub
+        blob_name = os.path.splitext(output_file_name)[0] + ".lz"
+        with input_file, open(blob_name, "wb") as blob:
+            blob.write(input_file.getvalue())
+        input_file_path = blob_name
+    else:
+        input_file.close()
+    print(f"Writing {stub_name} and {output_file_name} ({size} bytes)")
 
-        output_file.write("};\n")
+    with open(stub_name, "w") as stub:
+        fw_object.write_asm_stub(stub, symbol, incbin_path or os.path.abspath(input_file_path), size,
+                                 section, align)
+    with open(output_file_name, "w") as header:
+        fw_object.write_extern_header(header, symbol, size, input_file_path, stub_name)
 
-if __name__ == "__main__":
-    if len(sys.argv) == 1:
+
+def convert_binary_to_object(input_file_path, output_file_name=None, symbol=DEFAULT_SYMBOL,
+                             section=None, align=fw_object.DEFAULT_ALIGN,
+                             machine=fw_object.DEFAULT_MACHINE, flags=None, compress=None):
+    output_file_name = output_file_name or 'py_' + input_file_path + ".h"
+    object_name = os.path.splitext(output_file_name)[0] + ".o"
+    input_file, size = open_firmware(input_file_path, compress)
+    print(f"Writing {object_name} ({machine}) and {output_file_name} ({size} bytes)")
+
+    with input_file, open(object_name, "wb") as obj:
+        fw_object.write_elf_object(obj, symbol, input_file, size, machine, section, align, flags)
+    with open(output_file_name, "w") as header:
+        fw_object.write_extern_header(header, symbol, size, input_file_path, object_name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert Bosch sensor firmware files for linking.")
+    parser.add_argument("files", nargs="*", help="firmware files (.fw)")
+    parser.add_argument("-f", "--format", choices=("header", "asm", "elf"), default="header",
+                        help="C array header (default), .incbin assembler stub or ELF object")
+    parser.add_argument("-s", "--symbol", default=DEFAULT_SYMBOL,
+                        help="name of the firmware array (default: %(default)s)")
+    parser.add_argument("-o", "--output",
+                        help="header to write, the .S/.o file is put next to it (one input only)")
+    parser.add_argument("--section", help="section of the firmware (default: .rodata.<symbol>)")
+    parser.add_argument("--align", type=int, default=fw_object.DEFAULT_ALIGN,
+                        help="alignment of the firmware in bytes (default: %(default)s)")
+    parser.add_argument("-m", "--machine", choices=sorted(fw_object.ELF_MACHINES),
+                        default=fw_object.DEFAULT_MACHINE, help="target of the ELF object (default: %(default)s)")
+    parser.add_argument("--elf-flags", type=lambda v: int(v, 0),
+                        help="e_flags of the ELF object, e.g. 0x2 for RISC-V ilp32f")
+    parser.add_argument("-t", "--type", choices=sorted(FIRMWARE_TYPES),
+                        help="header format: also define bosch_firmware_image/size/type for BoschFirmware.h")
+    parser.add_argument("-c", "--compress", action="store_true",
+                        help="compress the firmware, it's decompressed during the upload")
+    parser.add_argument("--window-bits", type=int, default=fw_lz.DEFAULT_WINDOW_BITS,
+                        help="compression window, 1 << bits bytes of decoder RAM (default: %(default)s)")
+    parser.add_argument("--lookahead-bits", type=int, default=fw_lz.DEFAULT_LOOKAHEAD_BITS,
+                        help="longest copy, 1 << bits bytes (default: %(default)s)")
+    parser.add_argument("--incbin-path", help="firmware path written into the .S file (default: absolute path)")
+    args = parser.parse_args(argv)
+
+    if not args.files:
         print("Pass a firmware file as an argument. Exiting")
         sys.exit(-1)
+    if args.output and len(args.files) > 1:
+        parser.error("--output needs a single input file")
+    if not args.symbol.isidentifier():
+        parser.error("invalid symbol name '%s'" % args.symbol)
+    if args.align < 1 or args.align & (args.align - 1):
+        parser.error("--align must be a power of two")
+
+    compress = None
+    if args.compress:
+        try:
+            fw_lz.check_parameters(args.window_bits, args.lookahead_bits)
+        except ValueError as e:
+            parser.error(str(e))
+        compress = (args.window_bits, args.lookahead_bits)
+
+    for path in args.files:
+        if args.format == "asm":
+            convert_binary_to_asm(path, args.output, args.symbol, args.section, args.align, args.incbin_path,
+                                  compress)
+        elif args.format == "elf":
+            convert_binary_to_object(path, args.output, args.symbol, args.section, args.align, args.machine,
+                                     args.elf_flags, compress)
+        else:
+            convert_binary_to_header(path, args.output, args.symbol, args.type, compress)
 
-    for i in range(1, len(sys.argv)):
-        convert_binary_to_header(sys.argv[i])
\ No newline at end of file
+
+if __name__ == "__main__":
+    main()
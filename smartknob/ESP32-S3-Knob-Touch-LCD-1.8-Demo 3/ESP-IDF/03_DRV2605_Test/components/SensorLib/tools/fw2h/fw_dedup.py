@@ -0,0 +1,226 @@
+'''
+ * @file      fw_dedup.py
+ * @brief     Store several Bosch firmware variants as bases plus deltas
+
+Most variants are builds of the same code (turbo, extra sensors, GPIO...), so
+a project keeping several of them selectable at runtime can store a few of
+them in full and the others as deltas (fw_delta.py), rebuilt by
+src/bosch/bhy2_delta.c while they're uploaded:
+
+    python3 fw_dedup.py analyze                   # every firmware of firmware.json
+    python3 fw_dedup.py analyze --matrix a.fw b.fw c.fw
+    python3 fw_dedup.py pack -o bosch_variants Bosch_BHI260_GPIO.fw Bosch_BHI260_aux_BMM150_GPIO.fw
+
+`pack` writes bosch_variants.c and bosch_variants.h, which declare a table of
+`struct bhy2_fw_variant` for SensorBHI260AP::setFirmware(). The bases are
+picked greedily to minimize the total size; every delta refers to a base
+stored in full, never to another delta.
+'''
+
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+
+import fw_delta
+import fw_io
+from fw_regen import MANIFEST_FILE_NAME, Manifest
+
+
+class Variant:
+    def __init__(self, path, firmware_type=None):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(path, "rb") as f:
+            self.data = f.read()
+        self.type = firmware_type or ("flash" if self.name.endswith("-flash.fw") else "ram")
+
+    @property
+    def identifier(self):
+        return re.sub(r"\W", "_", os.path.splitext(self.name)[0].lower())
+
+
+def load_variants(paths, manifest_path):
+    '''Load the given firmware files, or every firmware listed in the manifest.'''
+    if paths:
+        return [Variant(p) for p in paths]
+    manifest = Manifest(manifest_path)
+    return [Variant(manifest.source_path(e), e["type"]) for e in manifest.entries]
+
+
+def _delta_row(job):
+    b, datas = job
+    index = fw_delta.BaseIndex(datas[b])
+    return [None if v == b else len(fw_delta.encode(datas[b], t, index)) for v, t in enumerate(datas)]
+
+
+def delta_sizes(variants, processes=None):
+    '''Return sizes[b][v], the size of the delta of variant v against base b (None on the diagonal).'''
+    datas = [v.data for v in variants]
+    jobs = [(b, datas) for b in range(len(datas))]
+    if processes == 1 or len(jobs) < 2:
+        return [_delta_row(j) for j in jobs]
+    with multiprocessing.Pool(min(processes or os.cpu_count() or 1, len(jobs))) as pool:
+        return pool.map(_delta_row, jobs)
+
+
+def choose_bases(variants, sizes):
+    '''
+    Pick the variants stored in full and the base of every other one.
+    Return {variant index: base index or None}.
+    '''
+    n = len(variants)
+
+    def plan(bases):
+        assignment = {}
+        for v in range(n):
+            if v in bases:
+                assignment[v] = None
+            else:
+                assignment[v] = min(bases, key=lambda b: sizes[b][v])
+        return assignment
+
+    def cost(assignment):
+        return sum(len(variants[v].data) if b is None else sizes[b][v] for v, b in assignment.items())
+
+    # Start with the best single base and add bases while the total shrinks
+    bases = set()
+    best = None
+    while len(bases) < n:
+        candidates = [(cost(plan(bases | {c})), c) for c in range(n) if c not in bases]
+        total, c = min(candidates)
+        if best is not None and total >= best:
+            break
+        bases.add(c)
+        best = total
+    return plan(bases)
+
+
+def analyze(variants, sizes, assignment):
+    '''Return the report of the packed variants as a dict.'''
+    rows = []
+    for v, b in sorted(assignment.items()):
+        variant = variants[v]
+        row = {"firmware": variant.name, "size": len(variant.data), "type": variant.type}
+        if b is None:
+            row.update(base=None, stored=len(variant.data), shared=0)
+        else:
+            delta = fw_delta.encode(variants[b].data, variant.data)
+            copied, _ = fw_delta.stats(delta)
+            row.update(base=variants[b].name, stored=len(delta), shared=copied)
+        rows.append(row)
+    raw = sum(r["size"] for r in rows)
+    stored = sum(r["stored"] for r in rows)
+    return {
+        "variants": rows,
+        "raw_size": raw,
+        "packed_size": stored,
+        "bases": sum(1 for r in rows if r["base"] is None),
+        # Share of the raw bytes that duplicate bytes of a base
+        "redundancy": 1.0 - stored / raw if raw else 0.0,
+    }
+
+
+def print_report(report, variants=None, sizes=None):
+    print("%-48s %8s %8s %6s  %s" % ("firmware", "size", "stored", "shared", "base"))
+    for r in report["variants"]:
+        shared = 100.0 * r["shared"] / r["size"] if r["size"] else 0.0
+        print("%-48s %8d %8d %5.1f%%  %s" % (r["firmware"], r["size"], r["stored"], shared, r["base"] or "-"))
+    print("%d variants, %d bases: %d bytes raw, %d packed, %.1f %% redundant" %
+          (len(report["variants"]), report["bases"], report["raw_size"], report["packed_size"],
+           100.0 * report["redundancy"]))
+
+    if sizes is not None:
+        # Delta size in % of the target, base in rows
+        print()
+        print("delta size (%% of the column variant), row = base\n%4s" % "" +
+              "".join("%5d" % i for i in range(len(variants))))
+        for b, row in enumerate(sizes):
+            cells = "".join("    -" if s is None else "%5.0f" % (100.0 * s / max(len(variants[v].data), 1))
+                            for v, s in enumerate(row))
+            print("%4d%s  %s" % (b, cells, variants[b].name))
+
+
+def write_pack(prefix, variants, assignment):
+    '''Write <prefix>.c with the bases and deltas and <prefix>.h declaring the variant table.'''
+    name = os.path.basename(prefix)
+    table = re.sub(r"\W", "_", name.lower())
+    images = {}
+    with open(prefix + ".c", "w", newline="\n") as out:
+        out.write("/* Generated by fw_dedup.py from %d firmware files, do not edit */\n" % len(variants))
+        out.write('#include "%s.h"\n\n' % name)
+        for v, b in sorted(assignment.items(), key=lambda item: item[1] is not None):
+            variant = variants[v]
+            if b is None:
+                symbol, data = "%s_base_%s" % (table, variant.identifier), variant.data
+            else:
+                symbol = "%s_delta_%s" % (table, variant.identifier)
+                data = fw_delta.encode(variants[b].data, variant.data)
+                if fw_delta.decode(variants[b].data, data) != variant.data:
+                    raise RuntimeError("the delta of %s doesn't rebuild it" % variant.name)
+            images[v] = symbol
+            out.write("/* %s%s */\n" % (variant.name, "" if b is None else ", delta against " + variants[b].name))
+            fw_io.write_c_array(out, symbol, data, ctype="static const unsigned char",
+                                line_width=12, item_format="0x%02x, ", indent="  ")
+            out.write("\n")
+
+        out.write("const struct bhy2_fw_variant %s[%s_COUNT] = {\n" % (table, table.upper()))
+        for v, b in sorted(assignment.items()):
+            base = "NULL, 0" if b is None else "%s, sizeof(%s)" % (images[b], images[b])
+            out.write('    {"%s", %s, sizeof(%s), %s, %d},\n' %
+                      (variants[v].name, images[v], images[v], base, 1 if variants[v].type == "flash" else 0))
+        out.write("};\n")
+
+    with open(prefix + ".h", "w", newline="\n") as out:
+        guard = "__%s_H__" % table.upper()
+        out.write("/* Generated by fw_dedup.py, do not edit */\n")
+        out.write("#ifndef %s\n#define %s\n\n" % (guard, guard))
+        out.write('#include "bhy2_delta.h"\n\n')
+        out.write("#ifdef __cplusplus\nextern \"C\" {\n#endif\n\n")
+        for v in sorted(assignment):
+            out.write("#define %s_%s %d\n" % (table.upper(), variants[v].identifier.upper(), v))
+        out.write("#define %s_COUNT %d\n\n" % (table.upper(), len(variants)))
+        out.write("extern const struct bhy2_fw_variant %s[%s_COUNT];\n\n" % (table, table.upper()))
+        out.write("#ifdef __cplusplus\n}\n#endif\n\n#endif /* %s */\n" % guard)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find the redundancy between Bosch firmware variants "
+                                                 "and pack them as bases plus deltas.")
+    parser.add_argument("command", choices=("analyze", "pack"))
+    parser.add_argument("files", nargs="*", help="firmware files (default: all of the manifest)")
+    parser.add_argument("--manifest", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                           MANIFEST_FILE_NAME),
+                        help="manifest listing the firmware (default: %s next to this script)" % MANIFEST_FILE_NAME)
+    parser.add_argument("-o", "--output", help="pack: output path without extension")
+    parser.add_argument("--matrix", action="store_true", help="analyze: print the delta size of every pair")
+    parser.add_argument("--json", help="analyze: also write the report to this file")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of processes (default: number of CPUs)")
+    args = parser.parse_intermixed_args(argv)
+
+    if args.command == "pack" and not args.output:
+        parser.error("pack needs --output")
+    variants = load_variants(args.files, args.manifest)
+    names = [v.name for v in variants]
+    if len(set(names)) != len(names):
+        parser.error("the firmware file names must be unique")
+
+    sizes = delta_sizes(variants, args.jobs)
+    assignment = choose_bases(variants, sizes)
+    report = analyze(variants, sizes, assignment)
+    print_report(report, variants, sizes if args.matrix else None)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    if args.command == "pack":
+        write_pack(args.output, variants, assignment)
+        print("Wrote %s.c and %s.h" % (args.output, args.output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
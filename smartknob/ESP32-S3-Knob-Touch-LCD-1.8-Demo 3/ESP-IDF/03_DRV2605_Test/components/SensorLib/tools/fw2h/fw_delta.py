@@ -0,0 +1,219 @@
+'''
+ * @file      fw_delta.py
+ * @brief     Firmware variants as copy/literal deltas against a base firmware
+
+The target is rebuilt by src/bosch/bhy2_delta.c while it's uploaded, reading
+the base from flash, so no RAM besides the decoder state is needed.
+Layout (little endian):
+
+    0   4  magic "BHDL"
+    4   1  version (1)
+    5   3  reserved, 0
+    8   4  size of the target
+    12  4  CRC-32 of the target (zlib)
+    16  4  size of the base
+    20  4  CRC-32 of the base
+    24     operations, each starting with varint((length << 1) | copy):
+           copy:    zigzag varint(offset in the base - end of the previous copy)
+           literal: `length` bytes
+
+Varints are LEB128 (7 bits per byte, low bits first), of 32 bits at most.
+
+tests/test_bhy2_delta.py rebuilds the output with bhy2_delta.c on the host.
+'''
+
+import struct
+import zlib
+
+MAGIC = b"BHDL"
+VERSION = 1
+HEADER = struct.Struct("<4sB3xIIII")
+
+# Shortest copy worth an operation, and the length of the indexed base substrings
+MIN_COPY = 8
+# Base positions compared per lookup at most
+_MAX_CANDIDATES = 16
+
+
+def is_delta(data):
+    return data[:4] == MAGIC
+
+
+def crc32(data):
+    return zlib.crc32(data) & 0xFFFFFFFF
+
+
+def _varint(value, out):
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+class BaseIndex:
+    '''Positions of every MIN_COPY byte substring of a base, reused for all targets.'''
+
+    def __init__(self, base):
+        self.base = bytes(base)
+        self.positions = {}
+        for i in range(len(self.base) - MIN_COPY + 1):
+            key = self.base[i:i + MIN_COPY]
+            pos = self.positions.get(key)
+            if pos is None:
+                self.positions[key] = i
+            elif isinstance(pos, list):
+                if len(pos) < _MAX_CANDIDATES:
+                    pos.append(i)
+            else:
+                self.positions[key] = [pos, i]
+
+    def candidates(self, key):
+        pos = self.positions.get(key)
+        if pos is None:
+            return ()
+        return pos if isinstance(pos, list) else (pos,)
+
+
+def _match_length(a, ai, b, bi):
+    limit = min(len(a) - ai, len(b) - bi)
+    n = 0
+    # Compare in blocks first, then byte by byte
+    while n + 32 <= limit and a[ai + n:ai + n + 32] == b[bi + n:bi + n + 32]:
+        n += 32
+    while n < limit and a[ai + n] == b[bi + n]:
+        n += 1
+    return n
+
+
+def encode(base, target, index=None):
+    '''Return the delta rebuilding `target` from `base`.'''
+    index = index or BaseIndex(base)
+    base = index.base
+    target = bytes(target)
+    ops = bytearray()
+    literal_start = 0
+    copy_end = 0        # end of the previous copy in the base
+    disp = 0            # base offset - target offset of the previous copy
+    i = 0
+    n = len(target)
+
+    def flush_literal(end):
+        if end > literal_start:
+            _varint((end - literal_start) << 1, ops)
+            ops.extend(target[literal_start:end])
+
+    while i + MIN_COPY <= n:
+        # The continuation of the previous copy is cheap to encode, try it first
+        best_len, best_pos = 0, 0
+        expected = i + disp
+        if 0 <= expected <= len(base) - MIN_COPY:
+            best_len = _match_length(base, expected, target, i)
+            best_pos = expected
+        if best_len < 64:
+            for pos in index.candidates(target[i:i + MIN_COPY]):
+                length = _match_length(base, pos, target, i)
+                if length > best_len:
+                    best_len, best_pos = length, pos
+        if best_len < MIN_COPY:
+            i += 1
+            continue
+
+        # Extend backwards into the pending literal
+        while i > literal_start and best_pos > 0 and base[best_pos - 1] == target[i - 1]:
+            i -= 1
+            best_pos -= 1
+            best_len += 1
+
+        flush_literal(i)
+        _varint((best_len << 1) | 1, ops)
+        _varint(_zigzag(best_pos - copy_end), ops)
+        copy_end = best_pos + best_len
+        disp = best_pos - i
+        i += best_len
+        literal_start = i
+
+    flush_literal(n)
+    header = HEADER.pack(MAGIC, VERSION, n, crc32(target), len(base), crc32(base))
+    return header + bytes(ops)
+
+
+def _operations(delta):
+    '''Yield (copy, length, base offset or literal position) for each operation.'''
+    if len(delta) < HEADER.size:
+        raise ValueError("delta too short")
+    magic, version, size = HEADER.unpack_from(delta)[:3]
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a firmware delta")
+
+    pos = HEADER.size
+
+    def varint():
+        nonlocal pos
+        value = shift = 0
+        while True:
+            if pos >= len(delta):
+                raise ValueError("truncated delta")
+            byte = delta[pos]
+            pos += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                return value
+
+    done = 0
+    copy_end = 0
+    while done < size:
+        head = varint()
+        length = head >> 1
+        if not length or done + length > size:
+            raise ValueError("invalid operation at byte %d" % done)
+        if head & 1:
+            z = varint()
+            offset = copy_end + ((z >> 1) ^ -(z & 1))
+            copy_end = offset + length
+            yield True, length, offset
+        else:
+            if pos + length > len(delta):
+                raise ValueError("truncated delta")
+            yield False, length, pos
+            pos += length
+        done += length
+
+
+def stats(delta):
+    '''Return the bytes of the target copied from the base and those stored as literals.'''
+    copied = literal = 0
+    for copy, length, _ in _operations(delta):
+        if copy:
+            copied += length
+        else:
+            literal += length
+    return copied, literal
+
+
+def decode(base, delta):
+    '''Rebuild the target, raise ValueError if the delta is damaged or made for another base.'''
+    if len(delta) >= HEADER.size:
+        _, _, _, crc, base_size, base_crc = HEADER.unpack_from(delta)
+        if base_size != len(base) or base_crc != crc32(base):
+            raise ValueError("the delta was made for another base")
+
+    out = bytearray()
+    for copy, length, pos in _operations(delta):
+        if not copy:
+            out += delta[pos:pos + length]
+        elif pos < 0 or pos + length > len(base):
+            raise ValueError("copy outside of the base")
+        else:
+            out += base[pos:pos + length]
+    if crc32(out) != crc:
+        raise ValueError("CRC mismatch")
+    return bytes(out)
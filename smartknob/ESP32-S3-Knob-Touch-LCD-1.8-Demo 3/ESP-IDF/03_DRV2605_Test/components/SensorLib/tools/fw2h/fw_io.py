@@ -0,0 +1,25 @@
+'''
+ * @file      fw_io.py
+ * @brief     C array writer and atomic file writes of the fw2h tools
+
+They are the ones of the LVGL asset scripts, c_array.py and asset_cache.py in
+Arduino/libraries/lvgl/scripts of this repository: one copy, so the output
+format and its fixes are shared. This module is the only place that knows
+where they are; a copy of SensorLib outside the repository needs the
+environment variable LVGL_SCRIPTS set to an lvgl/scripts directory.
+'''
+
+import os
+import sys
+
+LVGL_SCRIPTS = os.environ.get("LVGL_SCRIPTS") or os.path.normpath(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), *[os.pardir] * 6, "Arduino", "libraries", "lvgl", "scripts"))
+
+if not os.path.isfile(os.path.join(LVGL_SCRIPTS, "c_array.py")):
+    raise ImportError("fw2h needs c_array.py and asset_cache.py of the LVGL scripts, not found in %s: "
+                      "set LVGL_SCRIPTS to the lvgl/scripts directory" % LVGL_SCRIPTS)
+if LVGL_SCRIPTS not in sys.path:
+    sys.path.append(LVGL_SCRIPTS)
+
+from asset_cache import open_atomic, write_atomic  # noqa: E402,F401
+from c_array import write_c_array  # noqa: E402,F401
@@ -0,0 +1,185 @@
+'''
+ * @file      fw_lz.py
+ * @brief     Small window LZSS compression of the Bosch firmware images
+
+The stream is decoded during the upload by src/bosch/bhy2_lz.c with
+(1 << window_bits) bytes of window RAM. Layout (little endian):
+
+    0   4  magic "BHLZ"
+    4   1  version (1)
+    5   1  window bits (4..14)
+    6   1  lookahead bits (3..window bits - 1)
+    7   1  reserved, 0
+    8   4  size of the firmware
+    12  4  CRC-32 of the firmware (zlib)
+    16     bit stream, most significant bit first:
+           1 + 8 bits:                          literal byte
+           0 + window bits + lookahead bits:    copy (count - 1) + 1 bytes from
+                                                (distance - 1) + 1 bytes back
+           padded with 0 bits to a byte
+
+Every copy is at least as short as the literals it replaces, and a longer
+match starting at the next byte is preferred (lazy matching).
+
+tests/test_bhy2_lz.py decodes the output with bhy2_lz.c on the host.
+'''
+
+import struct
+import zlib
+
+MAGIC = b"BHLZ"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBBII")
+
+DEFAULT_WINDOW_BITS = 8
+DEFAULT_LOOKAHEAD_BITS = 4
+MIN_WINDOW_BITS = 4
+MAX_WINDOW_BITS = 14
+
+# Candidates compared per position at most, keeps large windows fast
+_MAX_CHAIN = 256
+
+
+def is_compressed(data):
+    return data[:4] == MAGIC
+
+
+def check_parameters(window_bits, lookahead_bits):
+    if not MIN_WINDOW_BITS <= window_bits <= MAX_WINDOW_BITS:
+        raise ValueError("window bits must be %d..%d" % (MIN_WINDOW_BITS, MAX_WINDOW_BITS))
+    if not 3 <= lookahead_bits < window_bits:
+        raise ValueError("lookahead bits must be 3..%d" % (window_bits - 1))
+
+
+class _BitWriter:
+    def __init__(self):
+        self.out = bytearray()
+        self.acc = 0
+        self.bits = 0
+
+    def put(self, value, count):
+        self.acc = (self.acc << count) | value
+        self.bits += count
+        while self.bits >= 8:
+            self.bits -= 8
+            self.out.append((self.acc >> self.bits) & 0xFF)
+        self.acc &= (1 << self.bits) - 1
+
+    def flush(self):
+        if self.bits:
+            self.out.append((self.acc << (8 - self.bits)) & 0xFF)
+            self.acc = self.bits = 0
+        return bytes(self.out)
+
+
+def compress(data, window_bits=DEFAULT_WINDOW_BITS, lookahead_bits=DEFAULT_LOOKAHEAD_BITS):
+    '''Return the compressed image of `data` (bytes-like), header included.'''
+    check_parameters(window_bits, lookahead_bits)
+    data = bytes(data)
+    n = len(data)
+    window = 1 << window_bits
+    max_len = 1 << lookahead_bits
+    copy_bits = 1 + window_bits + lookahead_bits
+    # Shortest copy cheaper than the literals
+    min_len = copy_bits // 9 + 1
+
+    # Hash chains on the next 2 bytes: head[key] is the last position, prev[pos] the one before
+    head = {}
+    prev = [-1] * n
+
+    def insert(pos):
+        if pos + 1 < n:
+            key = data[pos:pos + 2]
+            prev[pos] = head.get(key, -1)
+            head[key] = pos
+
+    def longest(pos):
+        limit = min(max_len, n - pos)
+        best_len = 0
+        best_dist = 0
+        if limit < min_len:
+            return 0, 0
+        cand = head.get(data[pos:pos + 2], -1)
+        chain = _MAX_CHAIN
+        while cand >= 0 and pos - cand <= window and chain:
+            # A longer match must also agree on the byte after the best one
+            if best_len < limit and data[cand + best_len] == data[pos + best_len]:
+                length = 2
+                while length < limit and data[cand + length] == data[pos + length]:
+                    length += 1
+                if length > best_len:
+                    best_len, best_dist = length, pos - cand
+                    if length == limit:
+                        break
+            cand = prev[cand]
+            chain -= 1
+        if best_len < min_len:
+            return 0, 0
+        return best_len, best_dist
+
+    bits = _BitWriter()
+    pos = 0
+    pending = None
+    while pos < n:
+        length, dist = pending if pending is not None else longest(pos)
+        pending = None
+        if length:
+            insert(pos)
+            nxt = longest(pos + 1) if pos + 1 < n else (0, 0)
+            if nxt[0] > length:
+                # Lazy matching: a literal now and the longer copy from the next byte
+                bits.put(0x100 | data[pos], 9)
+                pos += 1
+                pending = nxt
+                continue
+            bits.put(((dist - 1) << lookahead_bits) | (length - 1), copy_bits)
+            for p in range(pos + 1, pos + length):
+                insert(p)
+            pos += length
+        else:
+            bits.put(0x100 | data[pos], 9)
+            insert(pos)
+            pos += 1
+
+    header = HEADER.pack(MAGIC, VERSION, window_bits, lookahead_bits, 0, n, zlib.crc32(data) & 0xFFFFFFFF)
+    return header + bits.flush()
+
+
+def decompress(image):
+    '''Decode a compressed image, raise ValueError if it's damaged.'''
+    if len(image) < HEADER.size:
+        raise ValueError("image too short")
+    magic, version, window_bits, lookahead_bits, _, size, crc = HEADER.unpack_from(image)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a compressed firmware image")
+    check_parameters(window_bits, lookahead_bits)
+
+    stream = bytes(image[HEADER.size:])
+    total_bits = len(stream) * 8
+    bitpos = 0
+
+    def get(count):
+        nonlocal bitpos
+        if bitpos + count > total_bits:
+            raise ValueError("truncated stream")
+        # count <= 14 bits at a bit offset <= 7, always within 3 bytes
+        start = bitpos >> 3
+        chunk = int.from_bytes(stream[start:start + 3].ljust(3, b"\0"), "big")
+        shift = 24 - (bitpos & 7) - count
+        bitpos += count
+        return (chunk >> shift) & ((1 << count) - 1)
+
+    out = bytearray()
+    while len(out) < size:
+        if get(1):
+            out.append(get(8))
+        else:
+            dist = get(window_bits) + 1
+            count = get(lookahead_bits) + 1
+            if dist > len(out) or len(out) + count > size:
+                raise ValueError("invalid copy at byte %d" % len(out))
+            for _ in range(count):
+                out.append(out[-dist])
+    if zlib.crc32(out) & 0xFFFFFFFF != crc:
+        raise ValueError("CRC mismatch")
+    return bytes(out)
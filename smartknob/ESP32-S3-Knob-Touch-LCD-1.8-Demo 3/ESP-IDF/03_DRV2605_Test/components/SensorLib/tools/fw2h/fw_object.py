@@ -0,0 +1,175 @@
+'''
+ * @file      fw_object.py
+ * @brief     Linkable firmware blobs for fw2h.py
+
+Instead of a C array the firmware is put into the link as binary data, the
+way ESP-IDF's EMBED_FILES does it, so the compiler never tokenizes it:
+
+  - write_asm_stub():   a `.S` file which `.incbin`s the firmware file
+  - write_elf_object(): a relocatable ELF object holding the firmware
+  - write_extern_header(): the header declaring the symbols
+
+Both define `<symbol>` (sized, so sizeof() works through the header),
+`<symbol>_start` and `<symbol>_end` in the section `.rodata.<symbol>`.
+'''
+
+import os
+import shutil
+import struct
+
+DEFAULT_ALIGN = 4
+
+# name: (e_machine, e_flags, ELF class bits)
+ELF_MACHINES = {
+    "xtensa": (94, 0, 32),          # ESP32, ESP32-S2, ESP32-S3
+    "riscv32": (243, 0, 32),        # ESP32-C3/C6/H2 (ilp32, soft float)
+    "arm": (40, 0x05000000, 32),    # EABI version 5
+    "x86_64": (62, 0, 64),          # host builds
+    "aarch64": (183, 0, 64),
+}
+DEFAULT_MACHINE = "xtensa"
+
+_SHT_PROGBITS = 1
+_SHT_SYMTAB = 2
+_SHT_STRTAB = 3
+_SHF_ALLOC = 2
+_STB_LOCAL = 0
+_STB_GLOBAL = 1
+_STT_NOTYPE = 0
+_STT_OBJECT = 1
+_STT_SECTION = 3
+
+
+def default_section(symbol):
+    return ".rodata." + symbol
+
+
+def _align(value, align):
+    return (value + align - 1) // align * align
+
+
+def write_asm_stub(out, symbol, incbin_path, size, section=None, align=DEFAULT_ALIGN):
+    '''
+    Write a GNU assembler file to the text stream `out` including the `size`
+    byte firmware at `incbin_path`. The assembler looks the path up relative to
+    its working directory and the -I directories, so an absolute path is safest.
+    '''
+    section = section or default_section(symbol)
+    path = incbin_path.replace("\\", "/").replace('"', '\\"')
+    out.write("/* Generated by fw2h.py, do not edit */\n")
+    out.write('    .section %s, "a"\n' % section)
+    out.write("    .balign %d\n" % align)
+    for name in (symbol, symbol + "_start", symbol + "_end"):
+        out.write("    .global %s\n" % name)
+    out.write("    .type %s, STT_OBJECT\n" % symbol)
+    out.write("    .size %s, %d\n" % (symbol, size))
+    out.write("%s:\n" % symbol)
+    out.write("%s_start:\n" % symbol)
+    out.write('    .incbin "%s"\n' % path)
+    out.write("%s_end:\n" % symbol)
+    # Host builds (the file is preprocessed): the blob doesn't need an executable stack
+    out.write("#if defined(__linux__) && defined(__ELF__)\n")
+    out.write('    .section .note.GNU-stack, "", %progbits\n')
+    out.write("#endif\n")
+
+
+def _strtab(names):
+    '''Return the string table holding `names` and the offset of every name.'''
+    table = b"\0"
+    offsets = {}
+    for name in names:
+        offsets[name] = len(table)
+        table += name.encode("ascii") + b"\0"
+    return table, offsets
+
+
+def write_elf_object(out, symbol, source, size, machine=DEFAULT_MACHINE, section=None,
+                     align=DEFAULT_ALIGN, flags=None):
+    '''
+    Write a little-endian relocatable ELF object to the binary stream `out`,
+    copying the `size` bytes of the binary file object `source` into it.
+    '''
+    if machine not in ELF_MACHINES:
+        raise ValueError("unknown machine '%s', use one of: %s" % (machine, ", ".join(ELF_MACHINES)))
+    e_machine, e_flags, bits = ELF_MACHINES[machine]
+    if flags is not None:
+        e_flags = flags
+    section = section or default_section(symbol)
+    elf64 = bits == 64
+    ehdr_size, shdr_size, sym_size = (64, 64, 24) if elf64 else (52, 40, 16)
+    word = 8 if elf64 else 4
+
+    # Sections: null, data, .symtab, .strtab, .shstrtab, .note.GNU-stack (not an executable stack)
+    shstrtab, sh_names = _strtab([section, ".symtab", ".strtab", ".shstrtab", ".note.GNU-stack"])
+    strtab, st_names = _strtab([symbol, symbol + "_start", symbol + "_end"])
+
+    def sym(name, value, sym_size_, bind, typ, shndx):
+        info = (bind << 4) | typ
+        if elf64:
+            return struct.pack("<IBBHQQ", name, info, 0, shndx, value, sym_size_)
+        return struct.pack("<IIIBBH", name, value, sym_size_, info, 0, shndx)
+
+    symbols = [
+        sym(0, 0, 0, _STB_LOCAL, _STT_NOTYPE, 0),
+        sym(0, 0, 0, _STB_LOCAL, _STT_SECTION, 1),
+        sym(st_names[symbol], 0, size, _STB_GLOBAL, _STT_OBJECT, 1),
+        sym(st_names[symbol + "_start"], 0, 0, _STB_GLOBAL, _STT_NOTYPE, 1),
+        sym(st_names[symbol + "_end"], size, 0, _STB_GLOBAL, _STT_NOTYPE, 1),
+    ]
+    symtab = b"".join(symbols)
+    first_global = 2
+
+    data_off = _align(ehdr_size, align)
+    symtab_off = _align(data_off + size, word)
+    strtab_off = symtab_off + len(symtab)
+    shstrtab_off = strtab_off + len(strtab)
+    shoff = _align(shstrtab_off + len(shstrtab), word)
+
+    def shdr(name, typ, flags_, offset, sh_size, link=0, info=0, addralign=1, entsize=0):
+        fmt = "<IIQQQQIIQQ" if elf64 else "<IIIIIIIIII"
+        return struct.pack(fmt, name, typ, flags_, 0, offset, sh_size, link, info, addralign, entsize)
+
+    headers = [
+        b"\0" * shdr_size,
+        shdr(sh_names[section], _SHT_PROGBITS, _SHF_ALLOC, data_off, size, addralign=align),
+        shdr(sh_names[".symtab"], _SHT_SYMTAB, 0, symtab_off, len(symtab), link=3, info=first_global,
+             addralign=word, entsize=sym_size),
+        shdr(sh_names[".strtab"], _SHT_STRTAB, 0, strtab_off, len(strtab)),
+        shdr(sh_names[".shstrtab"], _SHT_STRTAB, 0, shstrtab_off, len(shstrtab)),
+        shdr(sh_names[".note.GNU-stack"], _SHT_PROGBITS, 0, shoff, 0),
+    ]
+
+    ident = b"\x7fELF" + bytes([2 if elf64 else 1, 1, 1, 0]) + b"\0" * 8
+    if elf64:
+        ehdr = ident + struct.pack("<HHIQQQIHHHHHH", 1, e_machine, 1, 0, 0, shoff, e_flags,
+                                   ehdr_size, 0, 0, shdr_size, len(headers), 4)
+    else:
+        ehdr = ident + struct.pack("<HHIIIIIHHHHHH", 1, e_machine, 1, 0, 0, shoff, e_flags,
+                                   ehdr_size, 0, 0, shdr_size, len(headers), 4)
+
+    out.write(ehdr)
+    out.write(b"\0" * (data_off - ehdr_size))
+    start = out.tell() if out.seekable() else None
+    shutil.copyfileobj(source, out)
+    if start is not None and out.tell() - start != size:
+        raise ValueError("firmware size changed while it was copied")
+    out.write(b"\0" * (symtab_off - data_off - size))
+    out.write(symtab)
+    out.write(strtab)
+    out.write(shstrtab)
+    out.write(b"\0" * (shoff - shstrtab_off - len(shstrtab)))
+    out.write(b"".join(headers))
+
+
+def write_extern_header(out, symbol, size, source_name, object_name):
+    '''Write the header declaring the symbols defined by the stub or the object.'''
+    size_macro = symbol.upper() + "_SIZE"
+    out.write("/* Generated by fw2h.py from %s, link %s */\n" % (os.path.basename(source_name),
+                                                                 os.path.basename(object_name)))
+    out.write("#pragma once\n\n")
+    out.write("#ifdef __cplusplus\nextern \"C\" {\n#endif\n\n")
+    out.write("#define %s %du\n\n" % (size_macro, size))
+    out.write("extern const unsigned char %s[%s];\n" % (symbol, size_macro))
+    out.write("extern const unsigned char %s_start[];\n" % symbol)
+    out.write("extern const unsigned char %s_end[];\n" % symbol)
+    out.write("\n#ifdef __cplusplus\n}\n#endif\n")
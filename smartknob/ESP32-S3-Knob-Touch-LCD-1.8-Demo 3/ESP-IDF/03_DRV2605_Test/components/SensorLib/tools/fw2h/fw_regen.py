@@ -0,0 +1,221 @@
+'''
+ * @file      fw_regen.py
+ * @brief     Regenerate the firmware headers of src/bosch/firmware
+
+firmware.json lists every `.fw` file with the header BoschFirmware.h includes
+for it, the array name and the firmware type, together with the SHA-256 of the
+firmware and of the header generated from it:
+
+    python3 fw_regen.py sync          # update the list from BoschFirmware.h and the .fw files
+    python3 fw_regen.py regenerate    # rewrite the outdated headers, -j N processes, --force all
+    python3 fw_regen.py check         # CI: exit 1 if a header doesn't match its firmware
+
+A header is outdated when the hash of its firmware, the hash of the header on
+disk or the generator version differ from the manifest. Headers are written
+atomically (temporary file + rename). `check` doesn't trust the hashes, it
+generates every header in memory and compares it with the file.
+'''
+
+import argparse
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import sys
+
+import fw2h
+from fw_io import write_atomic
+
+MANIFEST_FILE_NAME = "firmware.json"
+# Stored in the manifest, bump it when the header format changes
+GENERATOR_VERSION = "fw2h 2"
+
+_INCLUDE_RE = re.compile(r'#\s*(?:el)?if\s+defined\s*\(\s*(\w+)\s*\)\s*\n\s*#\s*include\s+"([^"]+)"')
+
+
+def sha256_file(path):
+    '''Return the SHA-256 of a file, or None if it doesn't exist.'''
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                h.update(block)
+    except FileNotFoundError:
+        return None
+    return h.hexdigest()
+
+
+def header_name(source):
+    '''`Bosch_BHI260_GPIO-flash.fw` -> `bosch_bhi260_gpio_flash.h`'''
+    return os.path.splitext(source)[0].lower().replace("-", "_") + ".h"
+
+
+class Manifest:
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        base = os.path.dirname(self.path)
+        with open(self.path, "r") as f:
+            content = json.load(f)
+        self.generator = content.get("generator")
+        self.firmware_dir = os.path.normpath(os.path.join(base, content["firmware_dir"]))
+        self.index = os.path.normpath(os.path.join(base, content["index"]))
+        self.content = content
+        self.entries = content["firmware"]
+
+    def source_path(self, entry):
+        return os.path.join(self.firmware_dir, entry["source"])
+
+    def header_path(self, entry):
+        return os.path.join(self.firmware_dir, entry["header"])
+
+    def included_headers(self):
+        '''Return {header file name: macro} of the firmware headers included by BoschFirmware.h.'''
+        with open(self.index, "r") as f:
+            text = f.read()
+        return {os.path.basename(header): macro for macro, header in _INCLUDE_RE.findall(text)}
+
+    def save(self):
+        self.content["generator"] = self.generator
+        self.content["firmware"] = sorted(self.entries, key=lambda e: e["header"])
+        write_atomic(self.path, json.dumps(self.content, indent=2) + "\n", "w")
+
+
+def render(source_path, symbol, firmware_type):
+    '''Return the bytes of the header generated from a firmware file.'''
+    out = io.StringIO()
+    with open(source_path, "rb") as f:
+        fw2h.write_firmware_header(out, symbol, f, firmware_type)
+    return out.getvalue().encode("ascii")
+
+
+def _regenerate_one(job):
+    source_path, header_path, symbol, firmware_type, write = job
+    data = render(source_path, symbol, firmware_type)
+    if write:
+        write_atomic(header_path, data)
+    return hashlib.sha256(data).hexdigest()
+
+
+def _run(jobs, processes):
+    if processes == 1 or len(jobs) < 2:
+        return [_regenerate_one(j) for j in jobs]
+    with multiprocessing.Pool(min(processes or os.cpu_count() or 1, len(jobs))) as pool:
+        return pool.map(_regenerate_one, jobs)
+
+
+def is_outdated(manifest, entry):
+    return manifest.generator != GENERATOR_VERSION or \
+        entry.get("source_sha256") != sha256_file(manifest.source_path(entry)) or \
+        entry.get("header_sha256") != sha256_file(manifest.header_path(entry))
+
+
+def index_problems(manifest):
+    '''Return the differences between the manifest and the includes of BoschFirmware.h.'''
+    problems = []
+    included = manifest.included_headers()
+    listed = {e["header"]: e for e in manifest.entries}
+    for header, macro in sorted(included.items()):
+        if header not in listed:
+            problems.append("%s (%s) is included by %s but not in the manifest" %
+                            (header, macro, os.path.basename(manifest.index)))
+    for header, entry in sorted(listed.items()):
+        if header not in included:
+            problems.append("%s is not included by %s" % (header, os.path.basename(manifest.index)))
+        elif entry.get("macro") != included[header]:
+            problems.append("%s: macro %s, %s uses %s" %
+                            (header, entry.get("macro"), os.path.basename(manifest.index), included[header]))
+        if not os.path.exists(manifest.source_path(entry)):
+            problems.append("%s: firmware %s is missing" % (header, entry["source"]))
+    return problems
+
+
+def sync(manifest):
+    '''Add the firmware files included by BoschFirmware.h to the manifest and drop the removed ones.'''
+    included = manifest.included_headers()
+    old = {e["header"]: e for e in manifest.entries}
+    entries = []
+    for source in sorted(os.listdir(manifest.firmware_dir)):
+        if not source.endswith(".fw"):
+            continue
+        header = header_name(source)
+        if header not in included:
+            print("Skipped %s: %s is not included by %s" % (source, header, os.path.basename(manifest.index)))
+            continue
+        entry = old.get(header, {})
+        entry.update({
+            "source": source,
+            "header": header,
+            "symbol": os.path.splitext(header)[0] + "_firmware_image",
+            "macro": included[header],
+            "type": "flash" if source.endswith("-flash.fw") else "ram",
+        })
+        entries.append(entry)
+    added = sorted(set(e["header"] for e in entries) - set(old))
+    removed = sorted(set(old) - set(e["header"] for e in entries))
+    manifest.entries = entries
+    manifest.save()
+    print("%d firmware files, %d added, %d removed" % (len(entries), len(added), len(removed)))
+
+
+def regenerate(manifest, processes=None, force=False):
+    problems = index_problems(manifest)
+    if problems:
+        print("\n".join(problems))
+        return 1
+
+    outdated = [e for e in manifest.entries if force or is_outdated(manifest, e)]
+    jobs = [(manifest.source_path(e), manifest.header_path(e), e["symbol"], e["type"], True) for e in outdated]
+    for entry, digest in zip(outdated, _run(jobs, processes)):
+        entry["source_sha256"] = sha256_file(manifest.source_path(entry))
+        entry["header_sha256"] = digest
+        print("Generated %s" % entry["header"])
+    if outdated or manifest.generator != GENERATOR_VERSION:
+        manifest.generator = GENERATOR_VERSION
+        manifest.save()
+    print("%d regenerated, %d up to date" % (len(outdated), len(manifest.entries) - len(outdated)))
+    return 0
+
+
+def check(manifest, processes=None):
+    problems = index_problems(manifest)
+    if not problems:
+        jobs = [(manifest.source_path(e), manifest.header_path(e), e["symbol"], e["type"], False)
+                for e in manifest.entries]
+        for entry, digest in zip(manifest.entries, _run(jobs, processes)):
+            if digest != sha256_file(manifest.header_path(entry)):
+                problems.append("%s is stale, it doesn't match %s" % (entry["header"], entry["source"]))
+            elif is_outdated(manifest, entry):
+                problems.append("%s: the hashes in %s are outdated" %
+                                (entry["header"], os.path.basename(manifest.path)))
+    if problems:
+        print("\n".join(problems))
+        print("Run `python3 fw_regen.py regenerate` and commit the result.")
+        return 1
+    print("%d firmware headers are up to date" % len(manifest.entries))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Regenerate the Bosch firmware headers from firmware.json.")
+    parser.add_argument("command", choices=("sync", "regenerate", "check"))
+    parser.add_argument("--manifest", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                           MANIFEST_FILE_NAME),
+                        help="manifest file (default: %s next to this script)" % MANIFEST_FILE_NAME)
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of processes (default: number of CPUs)")
+    parser.add_argument("--force", action="store_true", help="regenerate every header")
+    args = parser.parse_args(argv)
+
+    manifest = Manifest(args.manifest)
+    if args.command == "sync":
+        sync(manifest)
+        return 0
+    if args.command == "regenerate":
+        return regenerate(manifest, args.jobs, args.force)
+    return check(manifest, args.jobs)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
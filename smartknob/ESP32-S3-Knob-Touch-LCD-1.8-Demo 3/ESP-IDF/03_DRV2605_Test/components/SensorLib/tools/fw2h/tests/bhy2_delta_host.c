@@ -0,0 +1,90 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include "bhy2_delta.h"
+
+/*
+ * Host driver of bhy2_delta.c for test_bhy2_delta.py:
+ *
+ *   bhy2_delta_host BASE DELTA OUT CHUNK...
+ *
+ * rebuilds the firmware from BASE and DELTA with bhy2_delta_read() calls of
+ * the CHUNK sizes (used in turn), writes the firmware rebuilt so far to OUT
+ * and prints the result code. A read shorter than asked before the end of
+ * the firmware aborts: the upload relies on full chunks. BASE and DELTA are
+ * in buffers of their exact size, for AddressSanitizer.
+ */
+
+static uint8_t *read_file(const char *path, uint32_t *size)
+{
+    FILE *f = fopen(path, "rb");
+    uint8_t *data;
+    long len;
+
+    if (f == NULL || fseek(f, 0, SEEK_END) != 0 || (len = ftell(f)) < 0 || fseek(f, 0, SEEK_SET) != 0)
+    {
+        perror(path);
+        exit(2);
+    }
+    data = malloc(len ? (size_t)len : 1);
+    if (data == NULL || fread(data, 1, (size_t)len, f) != (size_t)len)
+    {
+        perror(path);
+        exit(2);
+    }
+    fclose(f);
+    *size = (uint32_t)len;
+    return data;
+}
+
+int main(int argc, char **argv)
+{
+    struct bhy2_delta_dec dec;
+    uint8_t *base, *delta, *out_data = NULL;
+    uint32_t base_size, size, out_size, pos = 0, actual;
+    int chunk = 0;
+    int8_t rslt;
+    FILE *out;
+
+    if (argc < 5)
+    {
+        fprintf(stderr, "usage: %s BASE DELTA OUT CHUNK...\n", argv[0]);
+        return 2;
+    }
+    base = read_file(argv[1], &base_size);
+    delta = read_file(argv[2], &size);
+
+    rslt = bhy2_delta_init(delta, size, base, base_size, &dec);
+    if (rslt == BHY2_OK)
+    {
+        out_size = bhy2_delta_get_size(delta, size);
+        out_data = malloc(out_size ? out_size : 1);
+        while (rslt == BHY2_OK && pos < out_size)
+        {
+            uint32_t n = (uint32_t)atoi(argv[4 + chunk]);
+            chunk = (chunk + 1) % (argc - 4);
+            if (n > out_size - pos)
+            {
+                n = out_size - pos;
+            }
+            rslt = bhy2_delta_read(out_data + pos, n, &actual, &dec);
+            if (actual > n || (rslt == BHY2_OK && actual != n))
+            {
+                fprintf(stderr, "read of %u bytes at %u returned %u\n", (unsigned)n, (unsigned)pos, (unsigned)actual);
+                abort();
+            }
+            pos += actual;
+        }
+    }
+
+    out = fopen(argv[3], "wb");
+    if (out == NULL || (pos && fwrite(out_data, 1, pos, out) != pos) || fclose(out) != 0)
+    {
+        perror(argv[3]);
+        return 2;
+    }
+    printf("%d\n", rslt);
+    free(base);
+    free(delta);
+    free(out_data);
+    return 0;
+}
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+'''
+Host round trip of the firmware deltas: fw_delta.py makes them,
+src/bosch/bhy2_delta.c (built here with bhy2_delta_host.c) rebuilds the
+firmware from them
+
+    python3 -m pytest tools/fw2h/tests    (or python3 test_bhy2_delta.py)
+
+The decoder is built with AddressSanitizer and UBSan when the compiler has
+them, the base and the delta sitting in buffers of their exact size. The
+firmware is read in pieces of 1, 7 and 4096 bytes and mixed sizes, damaged
+and truncated deltas and copies outside of the base must be refused.
+
+Dependencies: (PYTHON-3) a C compiler (CC, default cc)
+'''
+
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+fw2h_dir = os.path.dirname(test_dir)
+bosch_dir = os.path.join(fw2h_dir, os.pardir, os.pardir, "src", "bosch")
+sys.path.insert(0, fw2h_dir)
+
+import fw_delta  # noqa: E402
+
+CC = os.environ.get("CC", "cc")
+SANITIZE = ["-fsanitize=address,undefined", "-fno-omit-frame-pointer"]
+CHUNKS = ((1,), (7,), (4096,), (1, 7, 4096, 3, 65536))
+BASE = os.path.join(bosch_dir, "firmware", "Bosch_APP30_SHUTTLE_BHI260.fw")
+TARGET = os.path.join(bosch_dir, "firmware", "Bosch_APP30_SHUTTLE_BHI260_BMP390.fw")
+
+OK = 0
+E_INVALID_PARAM = -2
+E_MAGIC = -4
+
+
+def _build(out_dir, name):
+    '''Build bhy2_delta_host, with the sanitizers if the compiler has them. Return its path.'''
+    exe = os.path.join(out_dir, name)
+    cmd = [CC, "-std=c99", "-O1", "-g", "-Wall", "-Wextra", "-I" + bosch_dir, os.path.join(bosch_dir, "bhy2_delta.c"),
+           os.path.join(bosch_dir, "bhy2_lz.c"), os.path.join(test_dir, "bhy2_delta_host.c"), "-o", exe]
+    if subprocess.run(cmd[:1] + SANITIZE + cmd[1:], capture_output=True).returncode != 0:
+        subprocess.run(cmd, check=True, capture_output=True)
+    return exe
+
+
+def _ops(*ops):
+    '''Operations of a hand made delta: (length, base offset relative to the previous copy) or literal bytes.'''
+    out = bytearray()
+    for op in ops:
+        if isinstance(op, tuple):
+            fw_delta._varint(op[0] << 1 | 1, out)
+            fw_delta._varint(fw_delta._zigzag(op[1]), out)
+        else:
+            fw_delta._varint(len(op) << 1, out)
+            out += op
+    return bytes(out)
+
+
+def _delta(base, target, ops):
+    return fw_delta.HEADER.pack(fw_delta.MAGIC, fw_delta.VERSION, len(target), fw_delta.crc32(target), len(base),
+                                fw_delta.crc32(base)) + ops
+
+
+@unittest.skipUnless(shutil.which(CC), "no C compiler (%s)" % CC)
+class TestBhy2Delta(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.exe = _build(cls.tmp, "bhy2_delta_host")
+        with open(BASE, "rb") as f:
+            cls.base = f.read()
+        with open(TARGET, "rb") as f:
+            cls.target = f.read()
+        cls.delta = fw_delta.encode(cls.base, cls.target)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def rebuild(self, base, delta, chunks=(4096,)):
+        '''Return (result code, firmware rebuilt).'''
+        paths = [os.path.join(self.tmp, n) for n in ("base.fw", "delta.bhdl", "out.fw")]
+        for path, data in zip(paths, (base, delta)):
+            with open(path, "wb") as f:
+                f.write(data)
+        run = subprocess.run([self.exe] + paths + [str(c) for c in chunks], capture_output=True, text=True,
+                             timeout=60)
+        self.assertEqual(run.returncode, 0, run.stderr)
+        self.assertEqual(run.stderr, "")
+        with open(paths[2], "rb") as f:
+            return int(run.stdout), f.read()
+
+    def test_firmware(self):
+        self.assertGreater(fw_delta.stats(self.delta)[0], 0)
+        for chunks in CHUNKS:
+            with self.subTest(chunks=chunks):
+                self.assertEqual(self.rebuild(self.base, self.delta, chunks), (OK, self.target))
+
+    def test_edge_images(self):
+        rng = random.Random(1)
+        other = bytes(rng.getrandbits(8) for _ in range(3000))
+        for base, target in ((self.base, b""), (b"", other), (self.base, self.base), (self.base, other),
+                             (self.base, self.base[5000:5007]), (self.base, self.base[-100:] + self.base[:100])):
+            delta = fw_delta.encode(base, target)
+            with self.subTest(base=len(base), target=len(target)):
+                self.assertEqual(self.rebuild(base, delta, (7,)), (OK, target))
+
+    def test_other_base(self):
+        base = bytearray(self.base)
+        base[1234] ^= 1
+        for other in (bytes(base), self.base[:-1]):
+            with self.subTest(size=len(other)):
+                self.assertEqual(self.rebuild(other, self.delta)[0], E_INVALID_PARAM)
+
+    def test_not_a_delta(self):
+        for delta in (self.delta[:fw_delta.HEADER.size - 1], b"BHLZ" + self.delta[4:], b"BHDL\x02" + self.delta[5:]):
+            with self.subTest(delta=delta[:8]):
+                self.assertEqual(self.rebuild(self.base, delta)[0], E_MAGIC)
+
+    def test_copy_outside_of_base(self):
+        base = self.base[:1000]
+        for ops in (_ops((8, 993)), _ops((8, -1)), _ops((1001, 0)), _ops((500, 400), (8, 93)), _ops((8, 0), (8, -9))):
+            with self.subTest(ops=ops):
+                self.assertEqual(self.rebuild(base, _delta(base, bytes(16), ops), (7,))[0], E_INVALID_PARAM)
+        # The same copies inside the base are fine
+        target = base[992:1000] + base[0:8]
+        self.assertEqual(self.rebuild(base, _delta(base, target, _ops((8, 992), (8, -1000)))), (OK, target))
+
+    def test_invalid_length(self):
+        # Longer than the firmware left, or empty
+        for ops in (_ops(bytes(17)), _ops((17, 0)), _ops(bytes(8), (9, 0)), _ops(b"", bytes(16)),
+                    _ops((0, 0), bytes(16))):
+            with self.subTest(ops=ops):
+                self.assertEqual(self.rebuild(self.base, _delta(self.base, bytes(16), ops), (7,))[0],
+                                 E_INVALID_PARAM)
+
+    def test_overlong_varint(self):
+        # The last one is a copy 1 << 31 bytes away, read as a copy of the start if the bits above 32 are dropped
+        for ops in (b"\xff" * 5 + b"\x01", b"\x90\x80\x80\x80\x80\x00", _ops((8, 0))[:1] + b"\xff" * 5 + b"\x01",
+                    _ops((8, 1 << 31))):
+            with self.subTest(ops=ops):
+                self.assertEqual(self.rebuild(self.base, _delta(self.base, self.base[:8], ops))[0], E_INVALID_PARAM)
+
+    def test_truncated(self):
+        for size in (fw_delta.HEADER.size, fw_delta.HEADER.size + 1, len(self.delta) // 2, len(self.delta) - 1):
+            for chunks in ((1,), (4096,)):
+                with self.subTest(size=size, chunks=chunks):
+                    self.assertEqual(self.rebuild(self.base, self.delta[:size], chunks)[0], E_INVALID_PARAM)
+
+    def test_damaged(self):
+        rng = random.Random(2)
+        for _ in range(24):
+            delta = bytearray(self.delta)
+            pos = rng.randrange(8, len(delta))
+            delta[pos] ^= 1 << rng.randrange(8)
+            chunks = rng.choice(CHUNKS)
+            with self.subTest(pos=pos, chunks=chunks):
+                self.assertEqual(self.rebuild(self.base, bytes(delta), chunks)[0], E_INVALID_PARAM)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+'''
+Host round trip of the compressed firmware images: fw_lz.py compresses them,
+src/bosch/bhy2_lz.c (built here with bhy2_lz_host.c) decodes them
+
+    python3 -m pytest tools/fw2h/tests    (or python3 test_bhy2_lz.py)
+
+The decoder is built with the default BHY2_LZ_MAX_WINDOW_BITS and with the
+largest window fw_lz.py writes, with AddressSanitizer and UBSan when the
+compiler has them. The images are read in pieces of 1, 7 and 4096 bytes and
+mixed sizes, damaged and truncated images must be refused.
+
+Dependencies: (PYTHON-3) a C compiler (CC, default cc)
+'''
+
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+import zlib
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+fw2h_dir = os.path.dirname(test_dir)
+bosch_dir = os.path.join(fw2h_dir, os.pardir, os.pardir, "src", "bosch")
+sys.path.insert(0, fw2h_dir)
+
+import fw_lz  # noqa: E402
+
+CC = os.environ.get("CC", "cc")
+SANITIZE = ["-fsanitize=address,undefined", "-fno-omit-frame-pointer"]
+CHUNKS = ((1,), (7,), (4096,), (1, 7, 4096, 3, 65536))
+FIRMWARE = os.path.join(bosch_dir, "firmware", "Bosch_BHI260_GPIO.fw")
+
+OK = 0
+E_INVALID_PARAM = -2
+E_MAGIC = -4
+E_BUFFER = -6
+
+
+def _build(out_dir, name, flags):
+    '''Build bhy2_lz_host with `flags`, with the sanitizers if the compiler has them. Return its path.'''
+    exe = os.path.join(out_dir, name)
+    cmd = [CC, "-std=c99", "-O1", "-g", "-Wall", "-Wextra", "-I" + bosch_dir, os.path.join(bosch_dir, "bhy2_lz.c"),
+           os.path.join(test_dir, "bhy2_lz_host.c")] + flags + ["-o", exe]
+    if subprocess.run(cmd[:1] + SANITIZE + cmd[1:], capture_output=True).returncode != 0:
+        subprocess.run(cmd, check=True, capture_output=True)
+    return exe
+
+
+@unittest.skipUnless(shutil.which(CC), "no C compiler (%s)" % CC)
+class TestBhy2Lz(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.builds = {
+            "default": _build(cls.tmp, "default", []),
+            "max": _build(cls.tmp, "max", ["-DBHY2_LZ_MAX_WINDOW_BITS=%d" % fw_lz.MAX_WINDOW_BITS]),
+        }
+        with open(FIRMWARE, "rb") as f:
+            cls.firmware = f.read()
+        cls.image = fw_lz.compress(cls.firmware)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def decode(self, image, chunks=(4096,), build="default"):
+        '''Return (result code, firmware decoded).'''
+        paths = [os.path.join(self.tmp, n) for n in ("image.lz", "out.fw")]
+        with open(paths[0], "wb") as f:
+            f.write(image)
+        run = subprocess.run([self.builds[build]] + paths + [str(c) for c in chunks],
+                             capture_output=True, text=True, timeout=60)
+        self.assertEqual(run.returncode, 0, run.stderr)
+        self.assertEqual(run.stderr, "")
+        with open(paths[1], "rb") as f:
+            return int(run.stdout), f.read()
+
+    def test_firmware(self):
+        for chunks in CHUNKS:
+            with self.subTest(chunks=chunks):
+                self.assertEqual(self.decode(self.image, chunks), (OK, self.firmware))
+
+    def test_parameters(self):
+        data = self.firmware[:20000]
+        for window_bits, lookahead_bits in ((4, 3), (6, 5), (10, 4), (12, 6), (14, 13)):
+            image = fw_lz.compress(data, window_bits, lookahead_bits)
+            build = "default" if window_bits <= fw_lz.DEFAULT_WINDOW_BITS else "max"
+            for chunks in ((7,), (1, 7, 4096, 3, 65536)):
+                with self.subTest(window_bits=window_bits, lookahead_bits=lookahead_bits, chunks=chunks):
+                    self.assertEqual(self.decode(image, chunks, build), (OK, data))
+
+    def test_edge_data(self):
+        rng = random.Random(1)
+        for data in (b"", b"\x42", bytes(5000), b"ab" * 3000, bytes(rng.getrandbits(8) for _ in range(3000))):
+            image = fw_lz.compress(data)
+            with self.subTest(size=len(data), head=data[:4]):
+                self.assertEqual(self.decode(image, (7,)), (OK, data))
+
+    def test_window_too_large(self):
+        image = fw_lz.compress(self.firmware[:5000], fw_lz.DEFAULT_WINDOW_BITS + 1)
+        self.assertEqual(self.decode(image)[0], E_BUFFER)
+        self.assertEqual(self.decode(image, build="max"), (OK, self.firmware[:5000]))
+
+    def test_bad_header(self):
+        for pos, value, rc in ((0, ord("X"), E_MAGIC), (4, 2, E_MAGIC), (5, fw_lz.MAX_WINDOW_BITS + 1, E_BUFFER),
+                               (6, 2, E_BUFFER), (6, fw_lz.DEFAULT_WINDOW_BITS, E_BUFFER)):
+            image = bytearray(self.image)
+            image[pos] = value
+            with self.subTest(pos=pos, value=value):
+                self.assertEqual(self.decode(bytes(image), build="max")[0], rc)
+        self.assertEqual(self.decode(self.image[:fw_lz.HEADER.size - 1])[0], E_MAGIC)
+
+    def test_truncated(self):
+        for size in (fw_lz.HEADER.size, fw_lz.HEADER.size + 1, len(self.image) // 2, len(self.image) - 2):
+            for chunks in ((1,), (4096,)):
+                with self.subTest(size=size, chunks=chunks):
+                    self.assertEqual(self.decode(self.image[:size], chunks)[0], E_INVALID_PARAM)
+
+    def test_longer_size(self):
+        image = bytearray(self.image)
+        image[8:12] = (len(self.firmware) + 1).to_bytes(4, "little")
+        self.assertEqual(self.decode(bytes(image), (7,))[0], E_INVALID_PARAM)
+
+    def test_copy_before_start(self):
+        # A copy of 4 bytes 1 byte back as the first code: the window is empty, the CRC is the one of zeros
+        data = bytes(4)
+        image = fw_lz.HEADER.pack(fw_lz.MAGIC, fw_lz.VERSION, 8, 4, 0, len(data), zlib.crc32(data)) + bytes([0, 0x18])
+        self.assertEqual(self.decode(image)[0], E_INVALID_PARAM)
+
+    def test_damaged(self):
+        rng = random.Random(2)
+        for _ in range(24):
+            image = bytearray(self.image)
+            pos = rng.randrange(12, len(image))
+            image[pos] ^= 1 << rng.randrange(8)
+            chunks = rng.choice(CHUNKS)
+            with self.subTest(pos=pos, chunks=chunks):
+                rc, data = self.decode(bytes(image), chunks)
+                if rc == OK:
+                    # Only the padding of the last byte can change without an error
+                    self.assertEqual(data, self.firmware)
+                else:
+                    self.assertEqual(rc, E_INVALID_PARAM)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,14 +6,25 @@
 #include "driver/gpio.h"
 #include "esp_log.h"
 #include "driver/i2s_pdm.h"
+#include "esp_heap_caps.h"
+#include "ima_adpcm.h"
 
 static const char *TAG = "user_audio";
 
+#ifdef AUDIO_MUSIC_ADPCM
+extern const uint8_t music_adpcm_start[] asm("_binary_canon_adpcm_start");
+extern const uint8_t music_adpcm_end[]   asm("_binary_canon_adpcm_end");
+#else
 extern const uint8_t music_pcm_start[] asm("_binary_canon_pcm_start");
 extern const uint8_t music_pcm_end[]   asm("_binary_canon_pcm_end");
+#endif
 
 #define volumeMax  50                             //int16_t (100/2) uint16_t 100
 static uint8_t volume = 10;
+#define VOLUME_GAIN_Q15(vol)  (((int32_t)(vol) << 15) / 100)   //0-100 -> 0.0-1.0 in Q15
+
+#define SCALE_BUF_SAMPLES  512
+static int16_t scale_buf[SCALE_BUF_SAMPLES];                  //bsp_i2s_write, used by a single task (loopback or PCM playback)
 
 
 static i2s_chan_handle_t                tx_chan;        // I2S tx channel handler
@@ -115,19 +126,67 @@ int volume_adjustment(uint8_t vol)
 static esp_err_t bsp_i2s_write(void *audio_buffer, size_t len, size_t *bytes_written)
 {
   esp_err_t err = ESP_OK;
-  int16_t *audio_per = (int16_t *)audio_buffer;
+  const int16_t *audio_per = (const int16_t *)audio_buffer;
   size_t sample_count = len / sizeof(int16_t);
-  int16_t *samples = (int16_t *)heap_caps_malloc(len, MALLOC_CAP_SPIRAM); 
-  float volume_factor = volume / 100.0f;// Calculate the volume scaling factor to convert the volume level from 0-100 to the 0.0-1.0 range
-  for(uint32_t i = 0; i<sample_count; i++)
+  int32_t gain = VOLUME_GAIN_Q15(volume);
+  *bytes_written = 0;
+  while(sample_count > 0 && err == ESP_OK)
   {
-    samples[i] = (int16_t)(audio_per[i] * volume_factor); //加入声音调节(int16_t)(audio_per[i] * volume_factor); 源声是audio_per[i]
+    size_t n = sample_count < SCALE_BUF_SAMPLES ? sample_count : SCALE_BUF_SAMPLES;
+    size_t written = 0;
+    for(size_t i = 0; i < n; i++)
+    {
+      scale_buf[i] = (int16_t)((audio_per[i] * gain) >> 15); //加入声音调节 源声是audio_per[i]
+    }
+    err = i2s_channel_write(tx_chan, scale_buf, n * sizeof(int16_t), &written, 1000);
+    *bytes_written += written;
+    audio_per += n;
+    sample_count -= n;
   }
-  err = i2s_channel_write(tx_chan, (int8_t *)samples, len, bytes_written, 1000);
-  heap_caps_free(samples);
-  samples = NULL;
   return err;
 }
+#ifdef AUDIO_MUSIC_ADPCM
+static void i2s_dac_loop_task(void *arg)
+{
+  ima_adpcm_t dec;
+  ESP_ERROR_CHECK(ima_adpcm_open(&dec, music_adpcm_start, music_adpcm_end - music_adpcm_start));
+  if(dec.sample_rate != I2S_SAMPLE_RATE)
+  {
+    i2s_std_clk_config_t clk_cfg = I2S_STD_CLK_DEFAULT_CONFIG(dec.sample_rate);
+    ESP_ERROR_CHECK(i2s_channel_disable(tx_chan));
+    ESP_ERROR_CHECK(i2s_channel_reconfig_std_clock(tx_chan, &clk_cfg));
+    ESP_ERROR_CHECK(i2s_channel_enable(tx_chan));
+  }
+  ESP_LOGI(TAG, "adpcm: %lu Hz, %d ch, %lu frames", (unsigned long)dec.sample_rate, dec.channels,
+           (unsigned long)dec.frames);
+
+  //Ping-pong buffer allocated once, always stereo like the I2S slots
+  size_t half = (size_t)dec.frames_per_block * 2;
+  int16_t *pcm = (int16_t *)heap_caps_malloc(2 * half * sizeof(int16_t), MALLOC_CAP_INTERNAL | MALLOC_CAP_8BIT);
+  assert(pcm);
+  uint8_t ping = 0;
+  for(;;)
+  {
+    int16_t *out = pcm + ping * half;
+    size_t frames = ima_adpcm_decode_block(&dec, out, VOLUME_GAIN_Q15(volume));
+    if(frames == 0)
+    {
+      ima_adpcm_seek(&dec, 0); //循环播放
+      continue;
+    }
+    if(dec.channels == 1)
+    {
+      for(size_t i = frames; i-- > 0;) //mono -> stereo, from the end
+      {
+        out[2 * i] = out[2 * i + 1] = out[i];
+      }
+    }
+    size_t w_bytes = 0;
+    i2s_channel_write(tx_chan, out, frames * 2 * sizeof(int16_t), &w_bytes, portMAX_DELAY);
+    ping ^= 1;
+  }
+}
+#else
 static void i2s_dac_loop_task(void *arg)
 {
   for(;;)
@@ -138,7 +197,8 @@ static void i2s_dac_loop_task(void *arg)
     int8_t *data_ptr = (int8_t *)music_pcm_start;
     while (bytes_write < bytes_sizt) 
     {
-      if (bsp_i2s_write(data_ptr, 256, &w_bytes) == ESP_OK)
+      size_t chunk = bytes_sizt - bytes_write < 256 ? bytes_sizt - bytes_write : 256;
+      if (bsp_i2s_write(data_ptr, chunk, &w_bytes) == ESP_OK)
       {
         //printf("Write Task: i2s write %d bytes dma %d \n", w_bytes,wDma_bytes);
       }
@@ -151,6 +211,7 @@ static void i2s_dac_loop_task(void *arg)
     }
   }
 }
+#endif
 static void i2s_adc_loop_task(void *arg)
 {
   int16_t *r_buf = (int16_t *)calloc(1, 2048);
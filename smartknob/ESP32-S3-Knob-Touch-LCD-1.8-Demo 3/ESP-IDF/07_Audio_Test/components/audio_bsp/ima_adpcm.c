@@ -0,0 +1,122 @@
+#include <string.h>
+#include "ima_adpcm.h"
+
+static const int8_t index_table[8] = {-1, -1, -1, -1, 2, 4, 6, 8};
+
+static const int16_t step_table[89] =
+{
+  7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45, 50, 55, 60, 66, 73, 80, 88, 97,
+  107, 118, 130, 143, 157, 173, 190, 209, 230, 253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796,
+  876, 963, 1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327, 3660, 4026, 4428, 4871,
+  5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442, 11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623,
+  27086, 29794, 32767,
+};
+
+static inline uint32_t le32(const uint8_t *p)
+{
+  return (uint32_t)p[0] | ((uint32_t)p[1] << 8) | ((uint32_t)p[2] << 16) | ((uint32_t)p[3] << 24);
+}
+
+static inline int16_t scale(int32_t sample, int32_t gain_q15)
+{
+  return (int16_t)((sample * gain_q15) >> 15);
+}
+
+esp_err_t ima_adpcm_open(ima_adpcm_t *dec, const uint8_t *data, size_t len)
+{
+  if(dec == NULL || data == NULL)
+  {
+    return ESP_ERR_INVALID_ARG;
+  }
+  if(len < IMA_ADPCM_HEADER_LEN || memcmp(data, "IMAD", 4) != 0 || data[4] != 1 || data[5] < 1 || data[5] > 2)
+  {
+    return ESP_ERR_INVALID_VERSION;
+  }
+
+  memset(dec, 0, sizeof(*dec));
+  dec->channels = data[5];
+  dec->block_size = (uint16_t)(data[6] | (data[7] << 8));
+  dec->sample_rate = le32(&data[8]);
+  dec->frames = le32(&data[12]);
+  if(dec->block_size <= 4 * dec->channels || (dec->block_size - 4 * dec->channels) % (4 * dec->channels))
+  {
+    return ESP_ERR_INVALID_SIZE;
+  }
+  dec->frames_per_block = (uint32_t)(dec->block_size - 4 * dec->channels) * 2 / dec->channels + 1;
+  dec->block_count = dec->frames / dec->frames_per_block + (dec->frames % dec->frames_per_block != 0);
+  if((uint64_t)dec->block_count * dec->block_size > len - IMA_ADPCM_HEADER_LEN)
+  {
+    return ESP_ERR_INVALID_SIZE;
+  }
+  dec->blocks = &data[IMA_ADPCM_HEADER_LEN];
+  return ESP_OK;
+}
+
+esp_err_t ima_adpcm_seek(ima_adpcm_t *dec, uint32_t frame)
+{
+  if(dec == NULL || frame > dec->frames)
+  {
+    return ESP_ERR_INVALID_ARG;
+  }
+  dec->block = frame / dec->frames_per_block;
+  return ESP_OK;
+}
+
+size_t ima_adpcm_decode_block(ima_adpcm_t *dec, int16_t *out, int32_t gain_q15)
+{
+  if(dec == NULL || out == NULL || dec->block >= dec->block_count)
+  {
+    return 0;
+  }
+  if(gain_q15 < 0)
+  {
+    gain_q15 = 0;
+  }
+  else if(gain_q15 > IMA_ADPCM_GAIN_ONE)
+  {
+    gain_q15 = IMA_ADPCM_GAIN_ONE;
+  }
+
+  const uint8_t *block = dec->blocks + (size_t)dec->block * dec->block_size;
+  const uint8_t channels = dec->channels;
+  size_t frames = dec->frames_per_block;
+  if((uint64_t)(dec->block + 1) * frames > dec->frames)
+  {
+    frames = dec->frames - dec->block * (uint32_t)frames;
+  }
+
+  for(uint8_t c = 0; c < channels; c++)
+  {
+    const uint8_t *header = &block[4 * c];
+    int32_t predictor = (int16_t)(header[0] | (header[1] << 8));
+    int32_t index = header[2] > 88 ? 88 : header[2];
+    int16_t *dst = &out[c];
+    size_t n = 1;
+
+    *dst = scale(predictor, gain_q15);
+    dst += channels;
+    // 4 bytes (8 samples) of this channel every 4 * channels bytes
+    for(const uint8_t *src = &block[4 * channels + 4 * c]; n < frames; src += 4 * channels)
+    {
+      for(uint8_t i = 0; i < 8 && n < frames; i++, n++)
+      {
+        uint8_t code = (src[i >> 1] >> ((i & 1) * 4)) & 0x0F;
+        int32_t step = step_table[index];
+        int32_t delta = step >> 3;
+        if(code & 4) delta += step;
+        if(code & 2) delta += step >> 1;
+        if(code & 1) delta += step >> 2;
+        predictor += (code & 8) ? -delta : delta;
+        if(predictor > 32767) predictor = 32767;
+        else if(predictor < -32768) predictor = -32768;
+        index += index_table[code & 7];
+        if(index < 0) index = 0;
+        else if(index > 88) index = 88;
+        *dst = scale(predictor, gain_q15);
+        dst += channels;
+      }
+    }
+  }
+  dec->block++;
+  return frames;
+}
@@ -0,0 +1,47 @@
+#ifndef IMA_ADPCM_H
+#define IMA_ADPCM_H
+
+/*
+ * Decoder of the .adpcm files of tools/pcm_to_adpcm.py: IMA-ADPCM in
+ * blocks that each start with the exact first sample, decoded one block at
+ * a time into a buffer of the caller, with the volume applied.
+ */
+
+#include <stddef.h>
+#include <stdint.h>
+#include "esp_err.h"
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+#define IMA_ADPCM_HEADER_LEN   16
+#define IMA_ADPCM_GAIN_ONE     32768    // gain of 1.0 in Q15
+
+typedef struct
+{
+  const uint8_t *blocks;
+  uint32_t block_count;
+  uint32_t frames;             // samples per channel
+  uint32_t sample_rate;
+  uint32_t frames_per_block;   // up to 131057 (mono blocks of 65532 bytes)
+  uint16_t block_size;         // bytes
+  uint8_t channels;
+  uint32_t block;              // next block decoded
+} ima_adpcm_t;
+
+esp_err_t ima_adpcm_open(ima_adpcm_t *dec, const uint8_t *data, size_t len);
+/* Continue from the start of the block holding `frame` */
+esp_err_t ima_adpcm_seek(ima_adpcm_t *dec, uint32_t frame);
+/*
+ * Decode the next block to `out` (frames_per_block * channels interleaved
+ * samples) scaled by gain_q15 (0..IMA_ADPCM_GAIN_ONE), return the number of
+ * frames, 0 at the end.
+ */
+size_t ima_adpcm_decode_block(ima_adpcm_t *dec, int16_t *out, int32_t gain_q15);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif
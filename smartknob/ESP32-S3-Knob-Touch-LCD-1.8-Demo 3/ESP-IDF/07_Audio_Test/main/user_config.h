@@ -4,6 +4,7 @@
 /*
 LoopbackMode: A loopback mode that can play back the sound received by the microphone.
 PlaybackMusicMode: A music playback mode that can directly play PCM-format audio.
+  (canon.adpcm made by tools/pcm_to_adpcm.py replaces canon.pcm with 4x less flash)
 The rotary encoder adjusts the audio playback volume.
 */
 #define LoopbackMode         0
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+'''
+IMA-ADPCM encoder for the music of 07_Audio_Test
+
+Stores 16-bit audio in 4 bits per sample, decoded while playing by
+components/audio_bsp/ima_adpcm.c:
+
+    python3 pcm_to_adpcm.py music.wav -o ../components/audio_bsp/canon.adpcm
+    python3 pcm_to_adpcm.py canon.pcm --rate 44100 --channels 2 -o canon.adpcm
+    python3 pcm_to_adpcm.py decode canon.adpcm -o check.wav
+
+The audio_bsp component embeds canon.adpcm instead of canon.pcm when the file
+exists. Raw .pcm input is little endian 16-bit, interleaved. The blocks are
+the ones of IMA-ADPCM WAV files (format 0x11): every block starts with the
+exact first sample and the step index of each channel, so playback can start
+at any block. Layout (little endian):
+
+    0   4  magic "IMAD"
+    4   1  version (1)
+    5   1  channels (1 or 2)
+    6   2  bytes per block
+    8   4  sample rate
+    12  4  frames (samples per channel)
+    16     blocks, the last one padded with its last sample:
+           per channel: int16 first sample, uint8 step index, uint8 0
+           then 4 bytes per channel in turn, 8 samples each, low nibble first
+
+tests/test_ima_adpcm.py decodes the output with ima_adpcm.c on the host.
+
+Dependencies: (PYTHON-3)
+'''
+
+import argparse
+import array
+import math
+import os
+import struct
+import sys
+import wave
+from concurrent.futures import ProcessPoolExecutor
+
+MAGIC = b"IMAD"
+VERSION = 1
+HEADER = struct.Struct("<4sBBHII")
+DEFAULT_BLOCK_SIZE = 1024
+# Consecutive blocks encoded by one process, only the first one guesses its step index
+_BLOCKS_PER_JOB = 64
+
+INDEX_TABLE = (-1, -1, -1, -1, 2, 4, 6, 8)
+STEP_TABLE = (
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45, 50, 55, 60, 66, 73, 80, 88, 97,
+    107, 118, 130, 143, 157, 173, 190, 209, 230, 253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796,
+    876, 963, 1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327, 3660, 4026, 4428, 4871,
+    5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442, 11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623,
+    27086, 29794, 32767)
+
+
+def samples_per_block(block_size, channels):
+    return (block_size - 4 * channels) * 2 // channels + 1
+
+
+def check_block_size(block_size, channels):
+    if block_size <= 4 * channels or (block_size - 4 * channels) % (4 * channels) or block_size > 0xFFFF:
+        raise ValueError("the block size must be 4 * channels plus a multiple of %d" % (4 * channels))
+
+
+def _initial_index(samples):
+    '''Step index matching the first differences of a channel.'''
+    deltas = [abs(b - a) for a, b in zip(samples[:16], samples[1:17])]
+    mean = sum(deltas) / len(deltas) if deltas else 0
+    return min(range(len(STEP_TABLE)), key=lambda i: abs(STEP_TABLE[i] - mean))
+
+
+def _encode_channel(samples, index):
+    '''Return the codes of samples[1:] and the final step index, the first sample is stored as is.'''
+    predictor = samples[0]
+    codes = []
+    for sample in samples[1:]:
+        step = STEP_TABLE[index]
+        diff = sample - predictor
+        code = 0
+        if diff < 0:
+            code = 8
+            diff = -diff
+        delta = step >> 3
+        if diff >= step:
+            code |= 4
+            diff -= step
+            delta += step
+        step >>= 1
+        if diff >= step:
+            code |= 2
+            diff -= step
+            delta += step
+        step >>= 1
+        if diff >= step:
+            code |= 1
+            delta += step
+        predictor = max(-32768, min(32767, predictor - delta if code & 8 else predictor + delta))
+        index = max(0, min(88, index + INDEX_TABLE[code & 7]))
+        codes.append(code)
+    return codes, index
+
+
+def encode_blocks(job):
+    '''Encode consecutive blocks of interleaved samples, each list holding samples_per_block frames.'''
+    blocks, channels, indexes = job
+    out = bytearray()
+    for block in blocks:
+        header = bytearray()
+        channel_codes = []
+        for c in range(channels):
+            samples = block[c::channels]
+            if indexes[c] is None:
+                indexes[c] = _initial_index(samples)
+            header += struct.pack("<hBx", samples[0], indexes[c])
+            codes, indexes[c] = _encode_channel(samples, indexes[c])
+            channel_codes.append(codes)
+        out += header
+        for group in range(0, len(channel_codes[0]), 8):
+            for codes in channel_codes:
+                chunk = codes[group:group + 8]
+                out += bytes(chunk[i] | (chunk[i + 1] << 4) for i in range(0, 8, 2))
+    return bytes(out)
+
+
+def encode(samples, channels, rate, block_size=DEFAULT_BLOCK_SIZE, jobs=None):
+    '''Return the .adpcm file of interleaved 16-bit `samples`.'''
+    if channels not in (1, 2):
+        raise ValueError("1 or 2 channels only")
+    check_block_size(block_size, channels)
+    frames = len(samples) // channels
+    per_block = samples_per_block(block_size, channels)
+    samples = list(samples[:frames * channels])
+    if frames % per_block:
+        # Repeat the last frame, the decoder stops at `frames`
+        last = samples[-channels:] if samples else [0] * channels
+        samples += last * (per_block - frames % per_block)
+    step = per_block * channels
+    blocks = [samples[i:i + step] for i in range(0, len(samples), step)]
+    job_list = [(blocks[i:i + _BLOCKS_PER_JOB], channels, [None] * channels)
+                for i in range(0, len(blocks), _BLOCKS_PER_JOB)]
+    if jobs == 1 or len(job_list) < 2:
+        data = [encode_blocks(j) for j in job_list]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            data = list(pool.map(encode_blocks, job_list))
+    return HEADER.pack(MAGIC, VERSION, channels, block_size, rate, frames) + b"".join(data)
+
+
+def read_header(data):
+    if len(data) < HEADER.size:
+        raise ValueError("file too short")
+    magic, version, channels, block_size, rate, frames = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or channels not in (1, 2):
+        raise ValueError("not an IMA-ADPCM file of pcm_to_adpcm.py")
+    check_block_size(block_size, channels)
+    return channels, block_size, rate, frames
+
+
+def decode(data):
+    '''Return (interleaved samples, channels, rate) of an .adpcm file.'''
+    channels, block_size, rate, frames = read_header(data)
+    per_block = samples_per_block(block_size, channels)
+    out = array.array("h")
+    pos = HEADER.size
+    while len(out) < frames * channels:
+        block = data[pos:pos + block_size]
+        if len(block) < block_size:
+            raise ValueError("truncated file")
+        pos += block_size
+        decoded = [[] for _ in range(channels)]
+        state = []
+        for c in range(channels):
+            predictor, index = struct.unpack_from("<hB", block, 4 * c)
+            if index > 88:
+                raise ValueError("invalid step index")
+            decoded[c].append(predictor)
+            state.append([predictor, index])
+        for offset in range(4 * channels, block_size, 4 * channels):
+            for c in range(channels):
+                predictor, index = state[c]
+                for byte in block[offset + 4 * c:offset + 4 * c + 4]:
+                    for code in (byte & 0x0F, byte >> 4):
+                        step = STEP_TABLE[index]
+                        delta = step >> 3
+                        if code & 4:
+                            delta += step
+                        if code & 2:
+                            delta += step >> 1
+                        if code & 1:
+                            delta += step >> 2
+                        predictor = max(-32768, min(32767, predictor - delta if code & 8 else predictor + delta))
+                        index = max(0, min(88, index + INDEX_TABLE[code & 7]))
+                        decoded[c].append(predictor)
+                state[c] = [predictor, index]
+        for i in range(per_block):
+            for c in range(channels):
+                out.append(decoded[c][i])
+    del out[frames * channels:]
+    return out, channels, rate
+
+
+def snr(reference, decoded):
+    '''Signal to noise ratio of the decoded samples in dB.'''
+    signal = sum(s * s for s in reference)
+    noise = sum((a - b) * (a - b) for a, b in zip(reference, decoded))
+    if noise == 0:
+        return float("inf")
+    return 10 * math.log10(signal / noise) if signal else float("-inf")
+
+
+def read_input(path, rate, channels):
+    '''Return (interleaved samples, channels, rate) of a WAV file or of raw 16-bit PCM.'''
+    if path.lower().endswith(".wav"):
+        with wave.open(path, "rb") as w:
+            if w.getsampwidth() != 2 or w.getcomptype() != "NONE":
+                raise ValueError("%s: only 16-bit PCM WAV files are supported" % path)
+            channels, rate = w.getnchannels(), w.getframerate()
+            raw = w.readframes(w.getnframes())
+    else:
+        with open(path, "rb") as f:
+            raw = f.read()
+        raw = raw[:len(raw) // 2 * 2]
+    samples = array.array("h")
+    samples.frombytes(raw)
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples, channels, rate
+
+
+def write_wav(path, samples, channels, rate):
+    samples = array.array("h", samples)
+    if sys.byteorder == "big":
+        samples.byteswap()
+    with wave.open(path, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(samples.tobytes())
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "decode":
+        parser = argparse.ArgumentParser(prog="pcm_to_adpcm.py decode",
+                                         description="Decode an .adpcm file to a WAV file")
+        parser.add_argument("input")
+        parser.add_argument("-o", "--output", required=True, help="WAV file")
+        args = parser.parse_args(argv[1:])
+        try:
+            with open(args.input, "rb") as f:
+                samples, channels, rate = decode(f.read())
+        except (OSError, ValueError) as e:
+            print("error: %s" % e, file=sys.stderr)
+            return 1
+        write_wav(args.output, samples, channels, rate)
+        print("Wrote %s: %d frames, %d Hz, %d channels" % (args.output, len(samples) // channels, rate, channels))
+        return 0
+
+    parser = argparse.ArgumentParser(description="Encode a WAV or raw 16-bit PCM file to IMA-ADPCM "
+                                                 "(use `decode` to convert back)")
+    parser.add_argument("input", help="WAV file, or raw little endian 16-bit PCM")
+    parser.add_argument("-o", "--output", help="output file (default: the input with the .adpcm extension)")
+    parser.add_argument("--rate", type=int, default=44100, help="raw input: sample rate (default: %(default)s)")
+    parser.add_argument("--channels", type=int, default=2, choices=(1, 2),
+                        help="raw input: channels (default: %(default)s)")
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE,
+                        help="bytes per block, the seek granularity (default: %(default)s)")
+    parser.add_argument("--no-check", action="store_true", help="don't decode the result to report its SNR")
+    parser.add_argument("-j", "--jobs", type=int, help="parallel processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    output = args.output or os.path.splitext(args.input)[0] + ".adpcm"
+    try:
+        samples, channels, rate = read_input(args.input, args.rate, args.channels)
+        data = encode(samples, channels, rate, args.block_size, args.jobs)
+    except (OSError, ValueError) as e:
+        print("error: %s" % e, file=sys.stderr)
+        return 1
+    with open(output, "wb") as f:
+        f.write(data)
+    frames = len(samples) // channels
+    print("Wrote %s: %d bytes for %d bytes of PCM (%.1f s, %.1fx smaller)" %
+          (output, len(data), frames * channels * 2, frames / rate if rate else 0.0,
+           frames * channels * 2 / len(data)))
+    if not args.no_check:
+        decoded, _, _ = decode(data)
+        print("SNR %.1f dB" % snr(samples[:frames * channels], decoded))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,16 @@
+#ifndef ESP_ERR_H
+#define ESP_ERR_H
+
+/*
+ * The esp_err.h codes used by ima_adpcm.c, with the values of ESP-IDF
+ * (components/esp_common/include/esp_err.h), to build it on the host.
+ */
+
+typedef int esp_err_t;
+
+#define ESP_OK                   0
+#define ESP_ERR_INVALID_ARG      0x102
+#define ESP_ERR_INVALID_SIZE     0x104
+#define ESP_ERR_INVALID_VERSION  0x10A
+
+#endif
@@ -0,0 +1,93 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include "ima_adpcm.h"
+
+/*
+ * Host driver of ima_adpcm.c for test_ima_adpcm.py:
+ *
+ *   ima_adpcm_host FILE OUT GAIN SEEK
+ *
+ * opens FILE, seeks to frame SEEK, decodes the blocks up to the end with
+ * gain GAIN (Q15) into OUT (16-bit little endian samples) and prints the
+ * result of ima_adpcm_open() and ima_adpcm_seek() and the frames decoded.
+ * FILE and the block buffer have their exact size, for AddressSanitizer.
+ */
+
+static uint8_t *read_file(const char *path, size_t *size)
+{
+  FILE *f = fopen(path, "rb");
+  uint8_t *data;
+  long len;
+
+  if(f == NULL || fseek(f, 0, SEEK_END) != 0 || (len = ftell(f)) < 0 || fseek(f, 0, SEEK_SET) != 0)
+  {
+    perror(path);
+    exit(2);
+  }
+  data = malloc(len ? (size_t)len : 1);
+  if(data == NULL || fread(data, 1, (size_t)len, f) != (size_t)len)
+  {
+    perror(path);
+    exit(2);
+  }
+  fclose(f);
+  *size = (size_t)len;
+  return data;
+}
+
+int main(int argc, char **argv)
+{
+  ima_adpcm_t dec;
+  uint8_t *data;
+  size_t size;
+  unsigned long total = 0;
+  esp_err_t open_err, seek_err = ESP_OK;
+  FILE *out;
+
+  if(argc != 5)
+  {
+    fprintf(stderr, "usage: %s FILE OUT GAIN SEEK\n", argv[0]);
+    return 2;
+  }
+  data = read_file(argv[1], &size);
+  out = fopen(argv[2], "wb");
+  if(out == NULL)
+  {
+    perror(argv[2]);
+    return 2;
+  }
+
+  open_err = ima_adpcm_open(&dec, data, size);
+  if(open_err == ESP_OK)
+  {
+    size_t block_len = (size_t)dec.frames_per_block * dec.channels;
+    int16_t *block = malloc(block_len * sizeof(int16_t));
+    size_t frames;
+
+    seek_err = ima_adpcm_seek(&dec, (uint32_t)strtoul(argv[4], NULL, 0));
+    while(block != NULL && (frames = ima_adpcm_decode_block(&dec, block, atoi(argv[3]))) > 0)
+    {
+      if(frames > dec.frames_per_block)
+      {
+        fprintf(stderr, "block of %lu frames\n", (unsigned long)frames);
+        abort();
+      }
+      for(size_t i = 0; i < frames * dec.channels; i++)
+      {
+        fputc(block[i] & 0xFF, out);
+        fputc((block[i] >> 8) & 0xFF, out);
+      }
+      total += frames;
+    }
+    free(block);
+  }
+
+  if(fclose(out) != 0)
+  {
+    perror(argv[2]);
+    return 2;
+  }
+  printf("%d %d %lu\n", open_err, seek_err, total);
+  free(data);
+  return 0;
+}
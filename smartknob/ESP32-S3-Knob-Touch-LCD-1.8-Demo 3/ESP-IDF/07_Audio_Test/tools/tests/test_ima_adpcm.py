@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+'''
+Host round trip of the music: pcm_to_adpcm.py encodes it,
+components/audio_bsp/ima_adpcm.c (built here with ima_adpcm_host.c and the
+esp_err.h codes of host/) decodes it
+
+    python3 -m pytest tools/tests     (or python3 test_ima_adpcm.py)
+
+The decoder is built with AddressSanitizer and UBSan when the compiler has
+them and must give the samples of pcm_to_adpcm.py decode, for mono and
+stereo, small, default and large blocks, frame counts around the block
+size, the gains and seeks. Truncated and damaged files must be refused or
+decoded without reading or writing out of bounds.
+
+Dependencies: (PYTHON-3) a C compiler (CC, default cc)
+'''
+
+import array
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+tools_dir = os.path.dirname(test_dir)
+bsp_dir = os.path.join(tools_dir, os.pardir, "components", "audio_bsp")
+sys.path.insert(0, tools_dir)
+
+import pcm_to_adpcm  # noqa: E402
+
+CC = os.environ.get("CC", "cc")
+SANITIZE = ["-fsanitize=address,undefined", "-fno-omit-frame-pointer"]
+GAIN_ONE = 32768
+
+ESP_OK = 0
+ESP_ERR_INVALID_ARG = 0x102
+ESP_ERR_INVALID_SIZE = 0x104
+ESP_ERR_INVALID_VERSION = 0x10A
+
+
+def _build(out_dir, name):
+    '''Build ima_adpcm_host, with the sanitizers if the compiler has them. Return its path.'''
+    exe = os.path.join(out_dir, name)
+    cmd = [CC, "-std=c99", "-O1", "-g", "-Wall", "-Wextra", "-I" + bsp_dir, "-I" + os.path.join(test_dir, "host"),
+           os.path.join(bsp_dir, "ima_adpcm.c"), os.path.join(test_dir, "ima_adpcm_host.c"), "-o", exe]
+    if subprocess.run(cmd[:1] + SANITIZE + cmd[1:], capture_output=True).returncode != 0:
+        subprocess.run(cmd, check=True, capture_output=True)
+    return exe
+
+
+def _music(frames, channels, seed=1):
+    '''Interleaved samples: two tones a channel, some noise, a few loud clicks.'''
+    rng = random.Random(seed)
+    samples = array.array("h")
+    for i in range(frames):
+        for c in range(channels):
+            s = 9000 * math.sin(i * (0.03 + 0.02 * c)) + 4000 * math.sin(i * 0.31) + rng.gauss(0, 300)
+            if rng.random() < 0.001:
+                s = rng.choice((-32768, 32767))
+            samples.append(max(-32768, min(32767, int(s))))
+    return samples
+
+
+def _encode(samples, channels, block_size=pcm_to_adpcm.DEFAULT_BLOCK_SIZE):
+    return pcm_to_adpcm.encode(samples, channels, 22050, block_size, jobs=1)
+
+
+@unittest.skipUnless(shutil.which(CC), "no C compiler (%s)" % CC)
+class TestImaAdpcm(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.exe = _build(cls.tmp, "ima_adpcm_host")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def decode(self, data, gain=GAIN_ONE, seek=0):
+        '''Return (ima_adpcm_open() result, ima_adpcm_seek() result, frames, samples).'''
+        paths = [os.path.join(self.tmp, n) for n in ("music.adpcm", "out.pcm")]
+        with open(paths[0], "wb") as f:
+            f.write(data)
+        run = subprocess.run([self.exe] + paths + [str(gain), str(seek)], capture_output=True, text=True, timeout=60)
+        self.assertEqual(run.returncode, 0, run.stderr)
+        self.assertEqual(run.stderr, "")
+        samples = array.array("h")
+        with open(paths[1], "rb") as f:
+            samples.frombytes(f.read())
+        if sys.byteorder == "big":
+            samples.byteswap()
+        open_err, seek_err, frames = (int(v) for v in run.stdout.split())
+        return open_err, seek_err, frames, samples
+
+    def test_round_trip(self):
+        for channels in (1, 2):
+            for block_size in (8 * channels, 36 * channels, pcm_to_adpcm.DEFAULT_BLOCK_SIZE):
+                per_block = pcm_to_adpcm.samples_per_block(block_size, channels)
+                for frames in (0, 1, 7, per_block - 1, per_block, per_block + 1, 3 * per_block + 7):
+                    samples = _music(frames, channels)
+                    data = _encode(samples, channels, block_size)
+                    expected = pcm_to_adpcm.decode(data)[0]
+                    with self.subTest(channels=channels, block_size=block_size, frames=frames):
+                        self.assertEqual(self.decode(data), (ESP_OK, ESP_OK, frames, expected))
+                        if frames > 100:
+                            self.assertGreater(pcm_to_adpcm.snr(samples, expected), 12)
+
+    def test_large_blocks(self):
+        # More than 65535 frames a block in mono
+        samples = _music(100000, 1)
+        data = _encode(samples, 1, 40004)
+        self.assertEqual(self.decode(data), (ESP_OK, ESP_OK, 100000, pcm_to_adpcm.decode(data)[0]))
+
+    def test_gain(self):
+        data = _encode(_music(3000, 2), 2)
+        decoded = pcm_to_adpcm.decode(data)[0]
+        for gain, applied in ((0, 0), (1, 1), (16384, 16384), (32767, 32767), (40000, GAIN_ONE), (-5, 0)):
+            with self.subTest(gain=gain):
+                self.assertEqual(self.decode(data, gain)[3], array.array("h", (s * applied >> 15 for s in decoded)))
+
+    def test_seek(self):
+        channels = 2
+        data = _encode(_music(5000, channels), channels)
+        decoded = pcm_to_adpcm.decode(data)[0]
+        per_block = pcm_to_adpcm.samples_per_block(pcm_to_adpcm.DEFAULT_BLOCK_SIZE, channels)
+        for frame in (1, per_block - 1, per_block, 2 * per_block + 5, 4999, 5000):
+            start = frame // per_block * per_block
+            with self.subTest(frame=frame):
+                self.assertEqual(self.decode(data, seek=frame),
+                                 (ESP_OK, ESP_OK, 5000 - start, decoded[start * channels:]))
+        self.assertEqual(self.decode(data, seek=5001)[1], ESP_ERR_INVALID_ARG)
+
+    def test_bad_header(self):
+        data = _encode(_music(3000, 2), 2)
+        for pos, value, err in ((0, b"X", ESP_ERR_INVALID_VERSION), (4, b"\x02", ESP_ERR_INVALID_VERSION),
+                                (5, b"\x00", ESP_ERR_INVALID_VERSION), (5, b"\x03", ESP_ERR_INVALID_VERSION),
+                                (6, b"\x08\x00", ESP_ERR_INVALID_SIZE), (6, b"\x0c\x04", ESP_ERR_INVALID_SIZE),
+                                (6, b"\x00\x00", ESP_ERR_INVALID_SIZE), (12, b"\xff\xff\xff\xff", ESP_ERR_INVALID_SIZE),
+                                (12, (3000 + 1020).to_bytes(4, "little"), ESP_ERR_INVALID_SIZE)):
+            damaged = data[:pos] + value + data[pos + len(value):]
+            with self.subTest(pos=pos, value=value):
+                self.assertEqual(self.decode(damaged)[:3], (err, ESP_OK, 0))
+
+    def test_truncated(self):
+        data = _encode(_music(3000, 2), 2)
+        for size in (0, 15, 16, 17, len(data) // 2, len(data) - 1):
+            with self.subTest(size=size):
+                self.assertEqual(self.decode(data[:size])[:3],
+                                 (ESP_ERR_INVALID_VERSION if size < 16 else ESP_ERR_INVALID_SIZE, ESP_OK, 0))
+
+    def test_damaged(self):
+        rng = random.Random(2)
+        for channels in (1, 2):
+            data = _encode(_music(3000, channels), channels, 36 * channels)
+            for _ in range(8):
+                damaged = bytearray(data)
+                for _ in range(20):
+                    damaged[rng.randrange(pcm_to_adpcm.HEADER.size, len(data))] = rng.getrandbits(8)
+                with self.subTest(channels=channels, damaged=bytes(damaged[16:24])):
+                    open_err, _, frames, samples = self.decode(bytes(damaged))
+                    self.assertEqual((open_err, frames, len(samples)), (ESP_OK, 3000, 3000 * channels))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,407 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include "asset_pack.h"
+
+#ifdef ESP_PLATFORM
+#include "esp_log.h"
+#include "esp_partition.h"
+#endif
+
+#define ASSET_PACK_VERSION          1
+#define ASSET_PACK_ENTRY_LEN        24
+#define ASSET_PACK_CRC_CHUNK        256
+
+struct asset_pack
+{
+  const uint8_t *map;                       // the whole archive, NULL when it is read from `file`
+  FILE *file;
+  uint32_t size;
+  uint32_t data_offset;
+  uint32_t count;
+  const asset_pack_entry_t *index;
+  const char *names;
+  uint32_t names_size;
+  void *index_buf;                          // index and names read from `file`
+#ifdef ESP_PLATFORM
+  esp_partition_mmap_handle_t mmap;
+  uint8_t mapped;
+#endif
+};
+
+static uint32_t pack_crc32(uint32_t crc, const uint8_t *data, size_t len)
+{
+  static const uint32_t table[16] =
+  {
+    0x00000000, 0x1DB71064, 0x3B6E20C8, 0x26D930AC, 0x76DC4190, 0x6B6B51F4, 0x4DB26158, 0x5005713C,
+    0xEDB88320, 0xF00F9344, 0xD6D6A3E8, 0xCB61B38C, 0x9B64C2B0, 0x86D3D2D4, 0xA00AE278, 0xBDBDF21C,
+  };
+
+  crc = ~crc;
+  while (len--)
+  {
+    crc ^= *data++;
+    crc = (crc >> 4) ^ table[crc & 0x0F];
+    crc = (crc >> 4) ^ table[crc & 0x0F];
+  }
+  return ~crc;
+}
+
+static uint32_t le32(const uint8_t *p)
+{
+  return (uint32_t)p[0] | ((uint32_t)p[1] << 8) | ((uint32_t)p[2] << 16) | ((uint32_t)p[3] << 24);
+}
+
+static uint32_t name_hash(const char *name)
+{
+  uint32_t h = 0x811C9DC5;
+  while (*name)
+  {
+    h = (h ^ (uint8_t)*name++) * 0x01000193;
+  }
+  return h;
+}
+
+/* Check the header against the `available` bytes, set the layout fields of `p` */
+static int parse_header(asset_pack_t *p, const uint8_t *h, uint32_t available, uint32_t *crc)
+{
+  uint16_t version = (uint16_t)(h[4] | (h[5] << 8));
+  uint16_t align = (uint16_t)(h[6] | (h[7] << 8));
+  uint32_t names_offset;
+
+  if (memcmp(h, "LVPK", 4) != 0 || version != ASSET_PACK_VERSION || align == 0 || (align & (align - 1)))
+  {
+    return ASSET_PACK_ERR_FORMAT;
+  }
+  p->count = le32(&h[8]);
+  names_offset = le32(&h[12]);
+  p->names_size = le32(&h[16]);
+  p->data_offset = le32(&h[20]);
+  p->size = le32(&h[24]);
+  *crc = le32(&h[28]);
+  if (p->size > available || p->count > (p->size - ASSET_PACK_HEADER_LEN) / ASSET_PACK_ENTRY_LEN ||
+      names_offset != ASSET_PACK_HEADER_LEN + p->count * ASSET_PACK_ENTRY_LEN ||
+      p->names_size > p->size - names_offset || p->data_offset < names_offset + p->names_size ||
+      p->data_offset > p->size)
+  {
+    return ASSET_PACK_ERR_CORRUPT;
+  }
+  return ASSET_PACK_OK;
+}
+
+/* Check the CRC of the index and names and that every entry is in bounds */
+static int check_index(const asset_pack_t *p, uint32_t crc)
+{
+  uint32_t i;
+
+  if (pack_crc32(0, (const uint8_t *)p->index, p->count * ASSET_PACK_ENTRY_LEN + p->names_size) != crc)
+  {
+    return ASSET_PACK_ERR_CORRUPT;
+  }
+  for (i = 0; i < p->count; i++)
+  {
+    const asset_pack_entry_t *e = &p->index[i];
+    if (e->name_offset >= p->names_size || e->name_len >= p->names_size - e->name_offset ||
+        p->names[e->name_offset + e->name_len] != '\0' || e->offset < p->data_offset || e->offset > p->size ||
+        e->size > p->size - e->offset || (i > 0 && e->hash < p->index[i - 1].hash))
+    {
+      return ASSET_PACK_ERR_CORRUPT;
+    }
+  }
+  return ASSET_PACK_OK;
+}
+
+int asset_pack_open_mem(asset_pack_t **pack, const void *data, size_t size)
+{
+  asset_pack_t *p;
+  uint32_t crc;
+  int rc;
+
+  // The index is used in place, its 32-bit fields must be aligned
+  if (pack == NULL || data == NULL || ((uintptr_t)data & 3) != 0)
+  {
+    return ASSET_PACK_ERR_ARG;
+  }
+  if (size < ASSET_PACK_HEADER_LEN)
+  {
+    return ASSET_PACK_ERR_FORMAT;
+  }
+  p = calloc(1, sizeof(*p));
+  if (p == NULL)
+  {
+    return ASSET_PACK_ERR_NO_MEM;
+  }
+  p->map = data;
+  rc = parse_header(p, p->map, size > UINT32_MAX ? UINT32_MAX : (uint32_t)size, &crc);
+  if (rc == ASSET_PACK_OK)
+  {
+    p->index = (const asset_pack_entry_t *)(p->map + ASSET_PACK_HEADER_LEN);
+    p->names = (const char *)(p->map + ASSET_PACK_HEADER_LEN + p->count * ASSET_PACK_ENTRY_LEN);
+    rc = check_index(p, crc);
+  }
+  if (rc != ASSET_PACK_OK)
+  {
+    free(p);
+    return rc;
+  }
+  *pack = p;
+  return ASSET_PACK_OK;
+}
+
+int asset_pack_open_file(asset_pack_t **pack, const char *path)
+{
+  asset_pack_t *p;
+  uint8_t header[ASSET_PACK_HEADER_LEN];
+  uint32_t crc, index_len;
+  long file_size;
+  int rc;
+
+  if (pack == NULL || path == NULL)
+  {
+    return ASSET_PACK_ERR_ARG;
+  }
+  p = calloc(1, sizeof(*p));
+  if (p == NULL)
+  {
+    return ASSET_PACK_ERR_NO_MEM;
+  }
+  p->file = fopen(path, "rb");
+  if (p->file == NULL)
+  {
+    free(p);
+    return ASSET_PACK_ERR_IO;
+  }
+
+  rc = ASSET_PACK_ERR_IO;
+  if (fseek(p->file, 0, SEEK_END) == 0 && (file_size = ftell(p->file)) >= 0 && fseek(p->file, 0, SEEK_SET) == 0)
+  {
+    rc = fread(header, 1, sizeof(header), p->file) == sizeof(header) ?
+         parse_header(p, header, file_size > UINT32_MAX ? UINT32_MAX : (uint32_t)file_size, &crc) :
+         ASSET_PACK_ERR_FORMAT;
+  }
+  if (rc == ASSET_PACK_OK)
+  {
+    index_len = p->count * ASSET_PACK_ENTRY_LEN;
+    p->index_buf = malloc(index_len + p->names_size + 1);
+    if (p->index_buf == NULL)
+    {
+      rc = ASSET_PACK_ERR_NO_MEM;
+    }
+    else if (fread(p->index_buf, 1, index_len + p->names_size, p->file) != index_len + p->names_size)
+    {
+      rc = ASSET_PACK_ERR_IO;
+    }
+    else
+    {
+      p->index = p->index_buf;
+      p->names = (const char *)p->index_buf + index_len;
+      rc = check_index(p, crc);
+    }
+  }
+  if (rc != ASSET_PACK_OK)
+  {
+    asset_pack_close(p);
+    return rc;
+  }
+  *pack = p;
+  return ASSET_PACK_OK;
+}
+
+void asset_pack_close(asset_pack_t *pack)
+{
+  if (pack == NULL)
+  {
+    return;
+  }
+  if (pack->file != NULL)
+  {
+    fclose(pack->file);
+  }
+#ifdef ESP_PLATFORM
+  if (pack->mapped)
+  {
+    esp_partition_munmap(pack->mmap);
+  }
+#endif
+  free(pack->index_buf);
+  free(pack);
+}
+
+const asset_pack_entry_t *asset_pack_find(const asset_pack_t *pack, const char *name)
+{
+  uint32_t lo = 0, hi, h;
+
+  if (pack == NULL || name == NULL)
+  {
+    return NULL;
+  }
+  while (*name == '/')
+  {
+    name++;
+  }
+  h = name_hash(name);
+  hi = pack->count;
+  // First entry not before (h, name): the index is sorted by hash, then by name
+  while (lo < hi)
+  {
+    uint32_t mid = lo + (hi - lo) / 2;
+    const asset_pack_entry_t *e = &pack->index[mid];
+    if (e->hash < h || (e->hash == h && strcmp(pack->names + e->name_offset, name) < 0))
+    {
+      lo = mid + 1;
+    }
+    else
+    {
+      hi = mid;
+    }
+  }
+  if (lo < pack->count && pack->index[lo].hash == h && strcmp(pack->names + pack->index[lo].name_offset, name) == 0)
+  {
+    return &pack->index[lo];
+  }
+  return NULL;
+}
+
+uint32_t asset_pack_count(const asset_pack_t *pack)
+{
+  return pack != NULL ? pack->count : 0;
+}
+
+const asset_pack_entry_t *asset_pack_entry(const asset_pack_t *pack, uint32_t i)
+{
+  return pack != NULL && i < pack->count ? &pack->index[i] : NULL;
+}
+
+const char *asset_pack_name(const asset_pack_t *pack, const asset_pack_entry_t *entry)
+{
+  return pack != NULL && entry != NULL ? pack->names + entry->name_offset : NULL;
+}
+
+const void *asset_pack_data(const asset_pack_t *pack, const asset_pack_entry_t *entry)
+{
+  return pack != NULL && entry != NULL && pack->map != NULL ? pack->map + entry->offset : NULL;
+}
+
+int asset_pack_read(const asset_pack_t *pack, const asset_pack_entry_t *entry, uint32_t offset, void *buf,
+                    uint32_t len)
+{
+  if (pack == NULL || entry == NULL || (buf == NULL && len > 0) || offset > entry->size ||
+      len > entry->size - offset)
+  {
+    return ASSET_PACK_ERR_ARG;
+  }
+  if (pack->map != NULL)
+  {
+    memcpy(buf, pack->map + entry->offset + offset, len);
+    return ASSET_PACK_OK;
+  }
+  if (len > 0 && (fseek(pack->file, (long)entry->offset + offset, SEEK_SET) != 0 ||
+                  fread(buf, 1, len, pack->file) != len))
+  {
+    return ASSET_PACK_ERR_IO;
+  }
+  return ASSET_PACK_OK;
+}
+
+int asset_pack_verify(const asset_pack_t *pack, const asset_pack_entry_t *entry)
+{
+  uint8_t buf[ASSET_PACK_CRC_CHUNK];
+  uint32_t crc = 0, pos, n;
+  int rc;
+
+  if (pack == NULL || entry == NULL)
+  {
+    return ASSET_PACK_ERR_ARG;
+  }
+  if (pack->map != NULL)
+  {
+    crc = pack_crc32(0, pack->map + entry->offset, entry->size);
+  }
+  else
+  {
+    for (pos = 0; pos < entry->size; pos += n)
+    {
+      n = entry->size - pos < sizeof(buf) ? entry->size - pos : sizeof(buf);
+      rc = asset_pack_read(pack, entry, pos, buf, n);
+      if (rc != ASSET_PACK_OK)
+      {
+        return rc;
+      }
+      crc = pack_crc32(crc, buf, n);
+    }
+  }
+  return crc == entry->crc ? ASSET_PACK_OK : ASSET_PACK_ERR_CORRUPT;
+}
+
+const char *asset_pack_err_to_name(int err)
+{
+  switch (err)
+  {
+    case ASSET_PACK_OK:             return "ok";
+    case ASSET_PACK_ERR_ARG:        return "invalid argument";
+    case ASSET_PACK_ERR_FORMAT:     return "not a supported asset archive";
+    case ASSET_PACK_ERR_CORRUPT:    return "damaged asset archive";
+    case ASSET_PACK_ERR_NOT_FOUND:  return "no such asset";
+    case ASSET_PACK_ERR_NO_MEM:     return "out of memory";
+    case ASSET_PACK_ERR_IO:         return "read error";
+    default:                        return "unknown error";
+  }
+}
+
+#ifdef ESP_PLATFORM
+
+static const char *TAG = "asset_pack";
+
+esp_err_t asset_pack_open_partition(asset_pack_t **pack, const char *label)
+{
+  const esp_partition_t *part;
+  uint8_t header[ASSET_PACK_HEADER_LEN];
+  esp_partition_mmap_handle_t handle;
+  const void *map;
+  uint32_t size;
+  esp_err_t err;
+  int rc;
+
+  if (pack == NULL || label == NULL)
+  {
+    return ESP_ERR_INVALID_ARG;
+  }
+  part = esp_partition_find_first(ESP_PARTITION_TYPE_DATA, ESP_PARTITION_SUBTYPE_ANY, label);
+  if (part == NULL)
+  {
+    ESP_LOGE(TAG, "no data partition '%s'", label);
+    return ESP_ERR_NOT_FOUND;
+  }
+  err = esp_partition_read(part, 0, header, sizeof(header));
+  if (err != ESP_OK)
+  {
+    return err;
+  }
+  // Map the archive only, not the rest of the partition
+  size = le32(&header[24]);
+  if (memcmp(header, "LVPK", 4) != 0 || size < ASSET_PACK_HEADER_LEN || size > part->size)
+  {
+    ESP_LOGE(TAG, "no asset archive in partition '%s'", label);
+    return ESP_ERR_INVALID_VERSION;
+  }
+  err = esp_partition_mmap(part, 0, size, ESP_PARTITION_MMAP_DATA, &map, &handle);
+  if (err != ESP_OK)
+  {
+    ESP_LOGE(TAG, "mapping %lu bytes of '%s' failed: %s", (unsigned long)size, label, esp_err_to_name(err));
+    return err;
+  }
+  rc = asset_pack_open_mem(pack, map, size);
+  if (rc != ASSET_PACK_OK)
+  {
+    ESP_LOGE(TAG, "partition '%s': %s", label, asset_pack_err_to_name(rc));
+    esp_partition_munmap(handle);
+    return rc == ASSET_PACK_ERR_NO_MEM ? ESP_ERR_NO_MEM :
+           rc == ASSET_PACK_ERR_CORRUPT ? ESP_ERR_INVALID_CRC : ESP_ERR_INVALID_VERSION;
+  }
+  (*pack)->mmap = handle;
+  (*pack)->mapped = 1;
+  ESP_LOGI(TAG, "%lu assets in partition '%s'", (unsigned long)(*pack)->count, label);
+  return ESP_OK;
+}
+
+#endif
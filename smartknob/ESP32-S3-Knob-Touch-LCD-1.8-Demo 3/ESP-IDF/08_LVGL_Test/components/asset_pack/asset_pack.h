@@ -0,0 +1,96 @@
+#ifndef ASSET_PACK_H
+#define ASSET_PACK_H
+
+/*
+ * Reader of the asset archives made by lvgl/scripts/asset_pack.py: images,
+ * fonts, SJPG and audio files in one file with a sorted index, looked up by
+ * name with a binary search. The archive is either memory mapped (a flash
+ * partition, or any buffer) and its members are used in place, or read from
+ * a file, e.g. on the SD card, with only the index loaded in RAM.
+ *
+ *   asset_pack_t *pack;
+ *   asset_pack_open_partition(&pack, "assets");     // or asset_pack_open_file(&pack, "/sdcard/assets.lvpk")
+ *   asset_pack_register_fs(pack, 'A');              // asset_pack_lvgl.h
+ *   lv_img_set_src(img, "A:icons/play.bin");
+ *   lv_font_t *font = lv_font_load("A:fonts/title.fnt");
+ *
+ * Members of a mapped archive are views into it, asset_pack_data() gives
+ * their address. A file backed archive seeks and reads its single FILE for
+ * every read, like lv_fs it must be used from one task at a time.
+ */
+
+#include <stddef.h>
+#include <stdint.h>
+
+#ifdef ESP_PLATFORM
+#include "esp_err.h"
+#endif
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+#define ASSET_PACK_HEADER_LEN       32
+
+#define ASSET_PACK_OK               0
+#define ASSET_PACK_ERR_ARG          -1      // NULL pointer, or a read past the end of a member
+#define ASSET_PACK_ERR_FORMAT       -2      // not an asset archive, or an unsupported version
+#define ASSET_PACK_ERR_CORRUPT      -3      // damaged or truncated archive, or a CRC mismatch
+#define ASSET_PACK_ERR_NOT_FOUND    -4
+#define ASSET_PACK_ERR_NO_MEM       -5
+#define ASSET_PACK_ERR_IO           -6
+
+/* Type of a member, set by asset_pack.py from its extension */
+#define ASSET_PACK_TYPE_RAW         0
+#define ASSET_PACK_TYPE_IMAGE       1       // LVGL image file (.bin)
+#define ASSET_PACK_TYPE_FONT        2       // lv_font_load() font (.fnt)
+#define ASSET_PACK_TYPE_SJPG        3
+#define ASSET_PACK_TYPE_PCM         4
+#define ASSET_PACK_TYPE_ADPCM       5       // 07_Audio_Test/tools/pcm_to_adpcm.py
+
+/* Index entry, as stored in the archive (little endian) */
+typedef struct
+{
+  uint32_t hash;               // FNV-1a of the name
+  uint32_t name_offset;
+  uint32_t offset;             // of the data, from the start of the archive
+  uint32_t size;
+  uint32_t crc;                // CRC-32 of the data
+  uint8_t type;                // ASSET_PACK_TYPE_*
+  uint8_t reserved;
+  uint16_t name_len;
+} asset_pack_entry_t;
+
+typedef struct asset_pack asset_pack_t;
+
+/* Use an archive in memory (mapped flash, embedded file...), which must stay valid until asset_pack_close() */
+int asset_pack_open_mem(asset_pack_t **pack, const void *data, size_t size);
+/* Open an archive file and load its index, the data is read when needed */
+int asset_pack_open_file(asset_pack_t **pack, const char *path);
+void asset_pack_close(asset_pack_t *pack);
+
+/* Member named `name` ("icons/play.bin", a leading '/' is ignored), NULL if there is none */
+const asset_pack_entry_t *asset_pack_find(const asset_pack_t *pack, const char *name);
+uint32_t asset_pack_count(const asset_pack_t *pack);
+/* Members in index order, for listing */
+const asset_pack_entry_t *asset_pack_entry(const asset_pack_t *pack, uint32_t i);
+const char *asset_pack_name(const asset_pack_t *pack, const asset_pack_entry_t *entry);
+/* Address of the data of a member of a mapped archive, NULL for a file backed one */
+const void *asset_pack_data(const asset_pack_t *pack, const asset_pack_entry_t *entry);
+/* Copy `len` bytes of a member from `offset` */
+int asset_pack_read(const asset_pack_t *pack, const asset_pack_entry_t *entry, uint32_t offset, void *buf,
+                    uint32_t len);
+/* Check the CRC-32 of a member (reads all of it) */
+int asset_pack_verify(const asset_pack_t *pack, const asset_pack_entry_t *entry);
+const char *asset_pack_err_to_name(int err);
+
+#ifdef ESP_PLATFORM
+/* Map the data partition `label` (e.g. "assets", written with parttool.py) and use the archive in it */
+esp_err_t asset_pack_open_partition(asset_pack_t **pack, const char *label);
+#endif
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif
@@ -0,0 +1,141 @@
+#include <stdlib.h>
+#include <string.h>
+#include "asset_pack_lvgl.h"
+
+#define LV_IMG_HEADER_LEN           4
+
+typedef struct
+{
+  lv_fs_drv_t drv;                          // first, the callbacks get its address
+  const asset_pack_t *pack;
+} pack_drv_t;
+
+typedef struct
+{
+  const asset_pack_entry_t *entry;
+  uint32_t pos;
+} member_file_t;
+
+static void *fs_open(lv_fs_drv_t *drv, const char *path, lv_fs_mode_t mode)
+{
+  const asset_pack_entry_t *entry;
+  member_file_t *f;
+
+  if (mode != LV_FS_MODE_RD)
+  {
+    return NULL;
+  }
+  entry = asset_pack_find(((pack_drv_t *)drv)->pack, path);
+  if (entry == NULL)
+  {
+    return NULL;
+  }
+  f = lv_mem_alloc(sizeof(*f));
+  if (f != NULL)
+  {
+    f->entry = entry;
+    f->pos = 0;
+  }
+  return f;
+}
+
+static lv_fs_res_t fs_close(lv_fs_drv_t *drv, void *file_p)
+{
+  LV_UNUSED(drv);
+  lv_mem_free(file_p);
+  return LV_FS_RES_OK;
+}
+
+static lv_fs_res_t fs_read(lv_fs_drv_t *drv, void *file_p, void *buf, uint32_t btr, uint32_t *br)
+{
+  member_file_t *f = file_p;
+  uint32_t n = f->entry->size - f->pos < btr ? f->entry->size - f->pos : btr;
+
+  *br = 0;
+  if (asset_pack_read(((pack_drv_t *)drv)->pack, f->entry, f->pos, buf, n) != ASSET_PACK_OK)
+  {
+    return LV_FS_RES_HW_ERR;
+  }
+  f->pos += n;
+  *br = n;
+  return LV_FS_RES_OK;
+}
+
+static lv_fs_res_t fs_seek(lv_fs_drv_t *drv, void *file_p, uint32_t pos, lv_fs_whence_t whence)
+{
+  member_file_t *f = file_p;
+  uint32_t base = whence == LV_FS_SEEK_CUR ? f->pos : whence == LV_FS_SEEK_END ? f->entry->size : 0;
+
+  LV_UNUSED(drv);
+  if (pos > f->entry->size - base)
+  {
+    return LV_FS_RES_INV_PARAM;
+  }
+  f->pos = base + pos;
+  return LV_FS_RES_OK;
+}
+
+static lv_fs_res_t fs_tell(lv_fs_drv_t *drv, void *file_p, uint32_t *pos_p)
+{
+  LV_UNUSED(drv);
+  *pos_p = ((member_file_t *)file_p)->pos;
+  return LV_FS_RES_OK;
+}
+
+int asset_pack_register_fs(asset_pack_t *pack, char letter)
+{
+  pack_drv_t *d;
+  const asset_pack_entry_t *first = asset_pack_entry(pack, 0);
+
+  if (pack == NULL || letter < 'A' || letter > 'Z')
+  {
+    return ASSET_PACK_ERR_ARG;
+  }
+  d = calloc(1, sizeof(*d));
+  if (d == NULL)
+  {
+    return ASSET_PACK_ERR_NO_MEM;
+  }
+  d->pack = pack;
+  lv_fs_drv_init(&d->drv);
+  d->drv.letter = letter;
+  // Reads of a mapped archive are memcpy() from flash, the cache would only add a copy
+  d->drv.cache_size = first != NULL && asset_pack_data(pack, first) == NULL ? ASSET_PACK_FS_CACHE_SIZE : 0;
+  d->drv.open_cb = fs_open;
+  d->drv.close_cb = fs_close;
+  d->drv.read_cb = fs_read;
+  d->drv.seek_cb = fs_seek;
+  d->drv.tell_cb = fs_tell;
+  lv_fs_drv_register(&d->drv);
+  return ASSET_PACK_OK;
+}
+
+int asset_pack_img_dsc(const asset_pack_t *pack, const char *name, lv_img_dsc_t *dsc)
+{
+  const asset_pack_entry_t *entry;
+  const uint8_t *data;
+
+  if (pack == NULL || name == NULL || dsc == NULL)
+  {
+    return ASSET_PACK_ERR_ARG;
+  }
+  entry = asset_pack_find(pack, name);
+  if (entry == NULL)
+  {
+    return ASSET_PACK_ERR_NOT_FOUND;
+  }
+  data = asset_pack_data(pack, entry);
+  if (data == NULL)
+  {
+    return ASSET_PACK_ERR_ARG;              // file backed: use the lv_fs path instead
+  }
+  if (entry->size < LV_IMG_HEADER_LEN || (data[0] & 0xE0) != 0)
+  {
+    return ASSET_PACK_ERR_FORMAT;           // always_zero is set, not an image file
+  }
+  // The file header is lv_img_header_t as stored in memory (little endian)
+  memcpy(&dsc->header, data, LV_IMG_HEADER_LEN);
+  dsc->data_size = entry->size - LV_IMG_HEADER_LEN;
+  dsc->data = data + LV_IMG_HEADER_LEN;
+  return ASSET_PACK_OK;
+}
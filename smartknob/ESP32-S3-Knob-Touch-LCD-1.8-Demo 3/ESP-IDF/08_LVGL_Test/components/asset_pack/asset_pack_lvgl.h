@@ -0,0 +1,30 @@
+#ifndef ASSET_PACK_LVGL_H
+#define ASSET_PACK_LVGL_H
+
+/*
+ * LVGL access to an asset archive: an lv_fs drive serving its members
+ * (images, fonts and SJPG files open with their usual functions), and image
+ * descriptors pointing into a mapped archive, drawn from flash with no copy.
+ */
+
+#include "lvgl.h"
+#include "asset_pack.h"
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+#ifndef ASSET_PACK_FS_CACHE_SIZE
+#define ASSET_PACK_FS_CACHE_SIZE    512     // lv_fs read cache of a file backed archive, 0: none
+#endif
+
+/* Serve the members of `pack` as "<letter>:name". LVGL v8 can't unregister a drive, keep `pack` open. */
+int asset_pack_register_fs(asset_pack_t *pack, char letter);
+/* Point `dsc` to the LVGL image file `name` of a mapped archive */
+int asset_pack_img_dsc(const asset_pack_t *pack, const char *name, lv_img_dsc_t *dsc);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif
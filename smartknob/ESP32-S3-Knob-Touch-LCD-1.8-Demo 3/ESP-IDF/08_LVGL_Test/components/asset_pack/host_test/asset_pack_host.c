@@ -0,0 +1,136 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include "asset_pack.h"
+
+/*
+ * Host driver of asset_pack.c for test_asset_pack.py:
+ *
+ *   asset_pack_host mem|unaligned|file ARCHIVE OUT CHUNK... < NAMES
+ *
+ * opens ARCHIVE in memory (in a buffer of its exact size, at an odd address
+ * for `unaligned`) or as a file and prints the result code. Then for every
+ * member in index order: its index, type and size and the results of
+ * reading all of it with asset_pack_read() calls of the CHUNK sizes (used in
+ * turn), of asset_pack_verify() and of two reads past its end; the data
+ * read goes to OUT. Last, the index of each name of NAMES (one a line) found by
+ * asset_pack_find(), -1 if none.
+ */
+
+static uint8_t *read_file(const char *path, size_t *size)
+{
+  FILE *f = fopen(path, "rb");
+  uint8_t *data;
+  long len;
+
+  if (f == NULL || fseek(f, 0, SEEK_END) != 0 || (len = ftell(f)) < 0 || fseek(f, 0, SEEK_SET) != 0)
+  {
+    perror(path);
+    exit(2);
+  }
+  data = malloc(len ? (size_t)len : 1);
+  if (data == NULL || fread(data, 1, (size_t)len, f) != (size_t)len)
+  {
+    perror(path);
+    exit(2);
+  }
+  fclose(f);
+  *size = (size_t)len;
+  return data;
+}
+
+int main(int argc, char **argv)
+{
+  asset_pack_t *pack = NULL;
+  uint8_t *data = NULL, *buf = NULL;
+  size_t size = 0;
+  char name[1024];
+  int chunk = 0;
+  int rc;
+  uint32_t i;
+  FILE *out;
+
+  if (argc < 5)
+  {
+    fprintf(stderr, "usage: %s mem|unaligned|file ARCHIVE OUT CHUNK... < NAMES\n", argv[0]);
+    return 2;
+  }
+  if (strcmp(argv[1], "file") == 0)
+  {
+    rc = asset_pack_open_file(&pack, argv[2]);
+  }
+  else
+  {
+    data = read_file(argv[2], &size);
+    if (strcmp(argv[1], "unaligned") == 0)
+    {
+      buf = malloc(size + 1);
+      memcpy(buf + 1, data, size);
+      rc = asset_pack_open_mem(&pack, buf + 1, size);
+    }
+    else
+    {
+      rc = asset_pack_open_mem(&pack, data, size);
+    }
+  }
+  printf("%d\n", rc);
+  out = fopen(argv[3], "wb");
+  if (out == NULL)
+  {
+    perror(argv[3]);
+    return 2;
+  }
+
+  for (i = 0; rc == ASSET_PACK_OK && i < asset_pack_count(pack); i++)
+  {
+    const asset_pack_entry_t *entry = asset_pack_entry(pack, i);
+    uint8_t *member = malloc(entry->size ? entry->size : 1);
+    uint32_t pos = 0;
+    int read_rc = ASSET_PACK_OK;
+    uint8_t byte;
+
+    while (read_rc == ASSET_PACK_OK && pos < entry->size)
+    {
+      uint32_t n = (uint32_t)atoi(argv[4 + chunk]);
+      chunk = (chunk + 1) % (argc - 4);
+      if (n > entry->size - pos)
+      {
+        n = entry->size - pos;
+      }
+      read_rc = asset_pack_read(pack, entry, pos, member + pos, n);
+      pos += n;
+    }
+    if (asset_pack_data(pack, entry) != NULL && memcmp(asset_pack_data(pack, entry), member, entry->size) != 0)
+    {
+      fprintf(stderr, "%s: asset_pack_data() differs from asset_pack_read()\n", asset_pack_name(pack, entry));
+      abort();
+    }
+    if (entry->size && fwrite(member, 1, entry->size, out) != entry->size)
+    {
+      perror(argv[3]);
+      return 2;
+    }
+    printf("%u %u %u %d %d %d %d\n", (unsigned)i, entry->type, (unsigned)entry->size, read_rc,
+           asset_pack_verify(pack, entry), asset_pack_read(pack, entry, entry->size, &byte, 1),
+           asset_pack_read(pack, entry, entry->size + 1, &byte, 0));
+    free(member);
+  }
+  if (fclose(out) != 0)
+  {
+    perror(argv[3]);
+    return 2;
+  }
+
+  while (rc == ASSET_PACK_OK && fgets(name, sizeof(name), stdin) != NULL)
+  {
+    const asset_pack_entry_t *entry;
+    name[strcspn(name, "\n")] = '\0';
+    entry = asset_pack_find(pack, name);
+    printf("%ld\n", entry != NULL ? (long)(entry - asset_pack_entry(pack, 0)) : -1L);
+  }
+
+  asset_pack_close(pack);
+  free(data);
+  free(buf);
+  return 0;
+}
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+'''
+Host round trip of the asset archives: lvgl/scripts/asset_pack.py builds
+them, asset_pack.c (built here with asset_pack_host.c) reads them
+
+    python3 -m pytest components/asset_pack/host_test     (or python3 test_asset_pack.py)
+
+The reader is built with AddressSanitizer and UBSan when the compiler has
+them. Archives are opened in memory, in buffers of their exact size, and as
+files, members are read in pieces of 1, 7 and 4096 bytes and mixed sizes and
+looked up by name. Truncated and damaged archives must be refused, damaged
+members must fail asset_pack_verify().
+
+Dependencies: (PYTHON-3) a C compiler (CC, default cc)
+'''
+
+import os
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import unittest
+import zlib
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+component_dir = os.path.dirname(test_dir)
+LVGL_SCRIPTS = os.environ.get("LVGL_SCRIPTS") or os.path.normpath(os.path.join(
+    test_dir, *[os.pardir] * 5, "Arduino", "libraries", "lvgl", "scripts"))
+sys.path.insert(0, LVGL_SCRIPTS)
+
+import asset_pack  # noqa: E402
+
+CC = os.environ.get("CC", "cc")
+SANITIZE = ["-fsanitize=address,undefined", "-fno-omit-frame-pointer"]
+CHUNKS = ((1,), (7,), (4096,), (1, 7, 4096, 3, 65536))
+MODES = ("mem", "file")
+
+OK = 0
+ERR_ARG = -1
+ERR_FORMAT = -2
+ERR_CORRUPT = -3
+
+
+def _build(out_dir, name):
+    '''Build asset_pack_host, with the sanitizers if the compiler has them. Return its path.'''
+    exe = os.path.join(out_dir, name)
+    cmd = [CC, "-std=c99", "-O1", "-g", "-Wall", "-Wextra", "-I" + component_dir,
+           os.path.join(component_dir, "asset_pack.c"), os.path.join(test_dir, "asset_pack_host.c"), "-o", exe]
+    if subprocess.run(cmd[:1] + SANITIZE + cmd[1:], capture_output=True).returncode != 0:
+        subprocess.run(cmd, check=True, capture_output=True)
+    return exe
+
+
+def _members(seed=1):
+    '''(name, type, data) of a set of assets: empty, tiny, large, shared and many small members.'''
+    rng = random.Random(seed)
+    large = bytes(rng.getrandbits(8) for _ in range(100000))
+    members = [("icons/play.bin", asset_pack.TYPE_IMAGE, bytes(range(256)) * 3),
+               ("icons/pause.bin", asset_pack.TYPE_IMAGE, bytes(range(256)) * 3),
+               ("fonts/title.fnt", asset_pack.TYPE_FONT, b"\x01" * 777),
+               ("wallpaper.sjpg", asset_pack.TYPE_SJPG, large),
+               ("music.adpcm", asset_pack.TYPE_ADPCM, large[:4097]),
+               ("empty", asset_pack.TYPE_RAW, b""),
+               ("a", asset_pack.TYPE_RAW, b"x"),
+               ("dir/sous-dossier/été.bin", asset_pack.TYPE_IMAGE, b"\xff" * 5)]
+    members += [("many/%d.txt" % i, asset_pack.TYPE_RAW, b"%d" % i * (i % 13)) for i in range(300)]
+    return members
+
+
+def _resign(archive):
+    '''Recompute the index CRC of a modified archive.'''
+    header = asset_pack.HEADER.unpack_from(archive)
+    names_end = header[4] + header[5]
+    crc = zlib.crc32(bytes(archive[asset_pack.HEADER.size:names_end]))
+    return asset_pack.HEADER.pack(*header[:-1], crc) + bytes(archive[asset_pack.HEADER.size:])
+
+
+def _set_entry(archive, i, **fields):
+    '''Archive with fields of entry `i` changed and the index CRC updated.'''
+    archive = bytearray(archive)
+    pos = asset_pack.HEADER.size + i * asset_pack.ENTRY.size
+    entry = list(asset_pack.ENTRY.unpack_from(archive, pos))
+    for field, value in fields.items():
+        entry[("hash", "name_offset", "offset", "size", "crc", "type", "name_len").index(field)] = value
+    archive[pos:pos + asset_pack.ENTRY.size] = asset_pack.ENTRY.pack(*entry)
+    return _resign(archive)
+
+
+def _set_header(archive, **fields):
+    '''Archive with header fields changed, the CRC too unless it's given.'''
+    header = list(asset_pack.HEADER.unpack_from(archive))
+    names = ("magic", "version", "align", "count", "names_offset", "names_size", "data_offset", "size", "crc")
+    for field, value in fields.items():
+        header[names.index(field)] = value
+    return asset_pack.HEADER.pack(*header) + archive[asset_pack.HEADER.size:]
+
+
+@unittest.skipUnless(shutil.which(CC), "no C compiler (%s)" % CC)
+class TestAssetPack(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.exe = _build(cls.tmp, "asset_pack_host")
+        cls.members = _members()
+        cls.archive = asset_pack.build(cls.members)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def read(self, archive, mode="mem", chunks=(4096,), names=()):
+        '''
+        Return (open result, [(type, size, read, verify, reads past the end)], data read, [index of the names]).
+        '''
+        paths = [os.path.join(self.tmp, n) for n in ("assets.lvpk", "out.bin")]
+        with open(paths[0], "wb") as f:
+            f.write(archive)
+        run = subprocess.run([self.exe, mode] + paths + [str(c) for c in chunks], input="".join(
+            n + "\n" for n in names).encode(), capture_output=True, timeout=60)
+        self.assertEqual(run.returncode, 0, run.stderr.decode(errors="replace"))
+        self.assertEqual(run.stderr, b"")
+        lines = run.stdout.decode().splitlines()
+        rc = int(lines[0])
+        count = len(lines) - 1 - (len(names) if rc == OK else 0)
+        members = []
+        for i, line in enumerate(lines[1:1 + count]):
+            values = [int(v) for v in line.split()]
+            self.assertEqual(values[0], i)
+            members.append(tuple(values[1:]))
+        with open(paths[1], "rb") as f:
+            return rc, members, f.read(), [int(v) for v in lines[1 + count:]]
+
+    def expected(self, archive):
+        '''Members and data as asset_pack.py reads them.'''
+        entries = asset_pack.read_index(archive)
+        members = [(e["type"], e["size"], OK, OK, ERR_ARG, ERR_ARG) for e in entries]
+        return members, b"".join(archive[e["offset"]:e["offset"] + e["size"]] for e in entries)
+
+    def test_round_trip(self):
+        for align in (1, 4, 64):
+            archive = asset_pack.build(self.members, align)
+            members, data = self.expected(archive)
+            for mode in MODES:
+                for chunks in CHUNKS:
+                    with self.subTest(align=align, mode=mode, chunks=chunks):
+                        self.assertEqual(self.read(archive, mode, chunks)[:3], (OK, members, data))
+
+    def test_find(self):
+        entries = asset_pack.read_index(self.archive)
+        names = [name for name, _, _ in self.members]
+        lookups = names + ["/icons/play.bin", "//a", "icons/play", "icons/play.bin ", "", "b", "many/300.txt"]
+        expected = [[e["name"] for e in entries].index(n.lstrip("/")) if n.lstrip("/") in names else -1
+                    for n in lookups]
+        for mode in MODES:
+            with self.subTest(mode=mode):
+                self.assertEqual(self.read(self.archive, mode, names=lookups)[3], expected)
+
+    def test_empty_archive(self):
+        for mode in MODES:
+            with self.subTest(mode=mode):
+                self.assertEqual(self.read(asset_pack.build([]), mode, names=["a"]), (OK, [], b"", [-1]))
+
+    def test_unaligned_memory(self):
+        self.assertEqual(self.read(self.archive, "unaligned")[0], ERR_ARG)
+
+    def test_not_an_archive(self):
+        for archive in (b"", self.archive[:asset_pack.HEADER.size - 1], b"LVPX" + self.archive[4:],
+                        _set_header(self.archive, version=2), _set_header(self.archive, align=0),
+                        _set_header(self.archive, align=3)):
+            for mode in MODES:
+                with self.subTest(header=archive[:8], mode=mode):
+                    self.assertEqual(self.read(archive, mode)[0], ERR_FORMAT)
+
+    def test_truncated(self):
+        for size in (asset_pack.HEADER.size, asset_pack.HEADER.size + 1, len(self.archive) // 2,
+                     len(self.archive) - 1):
+            for mode in MODES:
+                with self.subTest(size=size, mode=mode):
+                    self.assertEqual(self.read(self.archive[:size], mode)[0], ERR_CORRUPT)
+
+    def test_damaged_header(self):
+        # Not covered by the CRC, the layout must be checked
+        count, names_offset, names_size, data_offset, size = asset_pack.HEADER.unpack_from(self.archive)[3:8]
+        # count + (1 << 29) has the same names offset, count * 24 wrapping around
+        for fields in ({"count": count + 1}, {"count": 0xFFFFFFFF}, {"count": count + (1 << 29)},
+                       {"names_offset": names_offset + 4},
+                       {"names_size": names_size + 1}, {"names_size": 0xFFFFFFFF}, {"data_offset": size + 1},
+                       {"data_offset": names_offset}, {"size": size + 1}, {"crc": 0}):
+            archive = _set_header(self.archive, **fields)
+            for mode in MODES:
+                with self.subTest(fields=fields, mode=mode):
+                    self.assertEqual(self.read(archive, mode)[0], ERR_CORRUPT)
+
+    def test_damaged_index(self):
+        entries = asset_pack.read_index(self.archive)
+        names_size, _, size = asset_pack.HEADER.unpack_from(self.archive)[5:8]
+        last = len(entries) - 1
+        # A name shorter by one isn't followed by its NUL
+        shorter = len(entries[0]["name"].encode()) - 1
+        for i, fields in ((0, {"offset": size + 1}), (0, {"offset": 0}), (0, {"size": size}),
+                          (last, {"size": entries[last]["size"] + size}), (0, {"name_offset": names_size}),
+                          (0, {"name_len": 0xFFFF}), (0, {"name_len": shorter}), (0, {"hash": 0xFFFFFFFF}),
+                          (last, {"hash": 0})):
+            archive = _set_entry(self.archive, i, **fields)
+            for mode in MODES:
+                with self.subTest(i=i, fields=fields, mode=mode):
+                    self.assertEqual(self.read(archive, mode)[0], ERR_CORRUPT)
+        # Any flipped bit of the index or names fails the CRC
+        rng = random.Random(2)
+        for _ in range(8):
+            archive = bytearray(self.archive)
+            index_end = asset_pack.HEADER.size + len(entries) * asset_pack.ENTRY.size + names_size
+            pos = rng.randrange(asset_pack.HEADER.size, index_end)
+            archive[pos] ^= 1 << rng.randrange(8)
+            with self.subTest(pos=pos):
+                self.assertEqual(self.read(bytes(archive))[0], ERR_CORRUPT)
+
+    def test_damaged_member(self):
+        entries = asset_pack.read_index(self.archive)
+        members, data = self.expected(self.archive)
+        large = max(range(len(entries)), key=lambda i: entries[i]["size"])
+        archive = bytearray(self.archive)
+        archive[entries[large]["offset"] + 12345] ^= 0x10
+        members[large] = members[large][:3] + (ERR_CORRUPT, ERR_ARG, ERR_ARG)
+        for mode in MODES:
+            with self.subTest(mode=mode):
+                rc, read_members, _, _ = self.read(bytes(archive), mode, (7,))
+                self.assertEqual((rc, read_members), (OK, members))
+
+
+if __name__ == "__main__":
+    unittest.main()
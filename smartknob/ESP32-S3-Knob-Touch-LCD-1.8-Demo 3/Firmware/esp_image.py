@@ -0,0 +1,687 @@
+#!/usr/bin/env python3
+'''
+ESP32 firmware image analyzer
+
+Shows where the flash of a firmware goes without its build tree. Both the
+merged flash images shipped here (bootloader, partition table and app) and
+plain app images (build/<project>.bin) are accepted:
+
+    python3 esp_image.py info ESP32-KNOB_ESP32_0.bin
+    python3 esp_image.py info --json WX-ESP32S3-KNOB_V1.2.bin > s3.json
+    python3 esp_image.py compare old.bin new.bin
+
+For every app image the header, the segments with their load address and
+memory region (IROM/DROM/IRAM/DRAM/RTC), the checksum and the appended
+SHA-256 are checked, and large embedded blobs are located by signature:
+LVGL images (lv_img_dsc_t) and fonts (lv_font_t with the fmt_txt format),
+PNG/JPEG/GIF/SJPG files, Bosch sensor firmware (compared against the .fw
+files of SensorLib, --known adds more directories), compressed firmware
+images and long runs of 0x00/0xFF. The file is memory-mapped, only the
+parts that are parsed are read.
+
+Dependencies: (PYTHON-3)
+'''
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+IMAGE_MAGIC = 0xE9
+CHECKSUM_SEED = 0xEF
+# Offsets of the bootloader (ESP32/S2 and the newer chips) and the partition table in a merged image
+BOOTLOADER_OFFSETS = (0x1000, 0x0)
+PARTITION_TABLE_OFFSET = 0x8000
+PARTITION_MAGIC = 0x50AA
+PARTITION_MD5_MAGIC = 0xEBEB
+
+APP_DESC_MAGIC = 0xABCD5432
+
+CHIPS = {0: "esp32", 2: "esp32s2", 5: "esp32c3", 9: "esp32s3", 12: "esp32c2", 13: "esp32c6", 16: "esp32h2"}
+
+# (region, start, end) of the address spaces an app segment is loaded to
+REGIONS = {
+    "esp32": (("DROM", 0x3F400000, 0x3F800000), ("IROM", 0x400C2000, 0x40C00000),
+              ("DRAM", 0x3FFAE000, 0x40000000), ("IRAM", 0x40070000, 0x400A0000),
+              ("RTC_IRAM", 0x400C0000, 0x400C2000), ("RTC_DRAM", 0x3FF80000, 0x3FF82000),
+              ("RTC_DATA", 0x50000000, 0x50002000)),
+    "esp32s2": (("DROM", 0x3F000000, 0x3FF80000), ("IROM", 0x40080000, 0x40800000),
+                ("DRAM", 0x3FFB0000, 0x40000000), ("IRAM", 0x40020000, 0x40070000),
+                ("RTC_IRAM", 0x40070000, 0x40072000), ("RTC_DRAM", 0x3FF9E000, 0x3FFA0000),
+                ("RTC_DATA", 0x50000000, 0x50002000)),
+    "esp32s3": (("DROM", 0x3C000000, 0x3E000000), ("IROM", 0x42000000, 0x44000000),
+                ("DRAM", 0x3FC88000, 0x3FD00000), ("IRAM", 0x40370000, 0x403E0000),
+                ("RTC_IRAM", 0x600FE000, 0x60100000), ("RTC_DATA", 0x50000000, 0x50002000)),
+    "esp32c3": (("DROM", 0x3C000000, 0x3C800000), ("IROM", 0x42000000, 0x42800000),
+                ("DRAM", 0x3FC80000, 0x3FCE0000), ("IRAM", 0x4037C000, 0x403E0000),
+                ("RTC_IRAM", 0x50000000, 0x50002000)),
+}
+REGION_ORDER = ("IROM", "DROM", "IRAM", "DRAM", "RTC_IRAM", "RTC_DRAM", "RTC_DATA", "?")
+
+PARTITION_TYPES = {0: "app", 1: "data"}
+APP_SUBTYPES = {0x00: "factory", 0x20: "test"}
+APP_SUBTYPES.update({0x10 + i: "ota_%d" % i for i in range(16)})
+DATA_SUBTYPES = {0x00: "ota", 0x01: "phy", 0x02: "nvs", 0x03: "coredump", 0x04: "nvs_keys",
+                 0x05: "efuse", 0x80: "esphttpd", 0x81: "fat", 0x82: "spiffs", 0x83: "littlefs"}
+
+# Blobs smaller than this aren't reported
+DEFAULT_MIN_BLOB = 4096
+
+# LVGL v8 color formats: bits per pixel of the pixel data and bytes of the palette
+# (LV_COLOR_DEPTH 16: TRUE_COLOR is 2 bytes a pixel, + 1 alpha byte with _ALPHA)
+_LV_IMG_CF = {
+    4: ("TRUE_COLOR", 16, 0), 5: ("TRUE_COLOR_ALPHA", 24, 0), 6: ("TRUE_COLOR_CHROMA_KEYED", 16, 0),
+    7: ("INDEXED_1BIT", 1, 8), 8: ("INDEXED_2BIT", 2, 16), 9: ("INDEXED_4BIT", 4, 64),
+    10: ("INDEXED_8BIT", 8, 1024), 11: ("ALPHA_1BIT", 1, 0), 12: ("ALPHA_2BIT", 2, 0),
+    13: ("ALPHA_4BIT", 4, 0), 14: ("ALPHA_8BIT", 8, 0),
+}
+_LV_IMG_CF_RAW = (1, 2, 3)
+
+
+def region_of(chip, address):
+    for name, start, end in REGIONS.get(chip, ()):
+        if start <= address < end:
+            return name
+    return "?"
+
+
+class Segment:
+    def __init__(self, index, load_addr, offset, size, region):
+        self.index = index
+        self.load_addr = load_addr
+        self.offset = offset        # of the data, in the file
+        self.size = size
+        self.region = region
+
+    def to_dict(self):
+        return {"index": self.index, "load_addr": self.load_addr, "offset": self.offset,
+                "size": self.size, "region": self.region}
+
+
+class AppImage:
+    '''An app (or bootloader) image at `offset` of `buf`, see esp_app_format.h.'''
+
+    HEADER = struct.Struct("<BBBBIBBBBHBHH4sB")
+
+    def __init__(self, buf, offset, name="app"):
+        self.buf = buf
+        self.offset = offset
+        self.name = name
+        (magic, count, self.spi_mode, speed_size, self.entry, _, _, _, _, chip_id, _, min_rev, max_rev,
+         _, hash_appended) = self.HEADER.unpack_from(buf, offset)
+        if magic != IMAGE_MAGIC:
+            raise ValueError("no image at 0x%x" % offset)
+        self.chip = CHIPS.get(chip_id, "chip %d" % chip_id)
+        self.flash_size = ("1MB", "2MB", "4MB", "8MB", "16MB", "32MB", "64MB", "128MB")[speed_size >> 4] \
+            if speed_size >> 4 < 8 else "?"
+        self.min_rev = min_rev
+        self.max_rev = max_rev
+        self.hash_appended = bool(hash_appended)
+
+        self.segments = []
+        pos = offset + self.HEADER.size
+        checksum = CHECKSUM_SEED
+        for i in range(count):
+            load_addr, size = struct.unpack_from("<II", buf, pos)
+            pos += 8
+            if pos + size > len(buf):
+                raise ValueError("segment %d of the image at 0x%x is truncated" % (i, offset))
+            self.segments.append(Segment(i, load_addr, pos, size, region_of(self.chip, load_addr)))
+            checksum ^= _xor_bytes(buf[pos:pos + size])
+            pos += size
+
+        # The checksum is the last byte of a 16 byte block, the SHA-256 of everything before follows
+        pos += 15 - (pos - offset) % 16
+        self.checksum = buf[pos]
+        self.checksum_ok = self.checksum == checksum
+        pos += 1
+        self.sha256 = self.sha256_ok = None
+        if self.hash_appended:
+            self.sha256 = bytes(buf[pos:pos + 32]).hex()
+            self.sha256_ok = hashlib.sha256(buf[offset:pos]).hexdigest() == self.sha256
+            pos += 32
+        self.size = pos - offset
+        self.app_desc = self._app_desc()
+
+    def _app_desc(self):
+        '''esp_app_desc_t at the start of the first DROM segment, None in a bootloader.'''
+        for seg in self.segments:
+            if seg.region == "DROM" and seg.size >= 256:
+                magic, secure_version = struct.unpack_from("<II", self.buf, seg.offset)
+                if magic != APP_DESC_MAGIC:
+                    return None
+
+                def text(pos, size):
+                    raw = bytes(self.buf[seg.offset + pos:seg.offset + pos + size])
+                    return raw.split(b"\0")[0].decode("ascii", "replace")
+                return {"version": text(16, 32), "project": text(48, 32), "time": text(80, 16),
+                        "date": text(96, 16), "idf_ver": text(112, 32),
+                        "elf_sha256": bytes(self.buf[seg.offset + 144:seg.offset + 176]).hex(),
+                        "secure_version": secure_version}
+        return None
+
+    def address_to_offset(self, address, size=1):
+        '''Return the file offset of `size` bytes loaded at `address`, or None.'''
+        for seg in self.segments:
+            if seg.load_addr <= address and address + size <= seg.load_addr + seg.size:
+                return seg.offset + address - seg.load_addr
+        return None
+
+    def region_sizes(self):
+        sizes = {}
+        for seg in self.segments:
+            sizes[seg.region] = sizes.get(seg.region, 0) + seg.size
+        return sizes
+
+    def to_dict(self):
+        return {
+            "name": self.name, "offset": self.offset, "size": self.size, "chip": self.chip,
+            "entry": self.entry, "flash_size": self.flash_size, "app_desc": self.app_desc,
+            "segments": [s.to_dict() for s in self.segments], "regions": self.region_sizes(),
+            "checksum_ok": self.checksum_ok, "sha256": self.sha256, "sha256_ok": self.sha256_ok,
+        }
+
+
+def _xor_bytes(data):
+    '''XOR of all the bytes: the data as one integer, folded in halves down to a byte.'''
+    acc = int.from_bytes(data, "little")
+    width = len(data) * 8
+    while width > 8:
+        half = (width // 2 + 7) // 8 * 8
+        acc = (acc >> half) ^ (acc & ((1 << half) - 1))
+        width = half
+    return acc
+
+
+def parse_partition_table(buf, offset=PARTITION_TABLE_OFFSET):
+    '''Return the partitions as dicts, [] if there's no table at `offset`.'''
+    partitions = []
+    for pos in range(offset, min(offset + 0xC00, len(buf) - 31), 32):
+        magic, ptype, subtype, p_offset, size, label, flags = struct.unpack_from("<HBBII16sI", buf, pos)
+        if magic != PARTITION_MAGIC:
+            break
+        if ptype == 0:
+            sub = APP_SUBTYPES.get(subtype, "0x%02x" % subtype)
+        else:
+            sub = DATA_SUBTYPES.get(subtype, "0x%02x" % subtype)
+        partitions.append({"label": label.split(b"\0")[0].decode("ascii", "replace"),
+                           "type": PARTITION_TYPES.get(ptype, "0x%02x" % ptype), "subtype": sub,
+                           "offset": p_offset, "size": size, "encrypted": bool(flags & 1)})
+    return partitions
+
+
+class FlashImage:
+    '''A merged flash image or a single app image, memory-mapped.'''
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self.buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b""
+        self.partitions = parse_partition_table(self.buf) if len(self.buf) > PARTITION_TABLE_OFFSET else []
+        self.images = []
+        if self.partitions:
+            for boot in BOOTLOADER_OFFSETS:
+                if len(self.buf) > boot and self.buf[boot] == IMAGE_MAGIC:
+                    self.images.append(AppImage(self.buf, boot, "bootloader"))
+                    break
+            for part in self.partitions:
+                if part["type"] == "app" and part["offset"] < len(self.buf) and \
+                        self.buf[part["offset"]] == IMAGE_MAGIC:
+                    self.images.append(AppImage(self.buf, part["offset"], part["label"]))
+        elif self.buf and self.buf[0] == IMAGE_MAGIC:
+            self.images.append(AppImage(self.buf, 0, "app"))
+        else:
+            raise ValueError("%s is neither an app image nor a merged flash image" % path)
+
+    def close(self):
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def apps(self):
+        return [img for img in self.images if img.name != "bootloader"]
+
+
+class Blob:
+    def __init__(self, kind, offset, size, image, detail="", address=None):
+        self.kind = kind
+        self.offset = offset
+        self.size = size
+        self.image = image
+        self.detail = detail
+        self.address = address
+
+    def digest(self, buf):
+        return hashlib.sha256(buf[self.offset:self.offset + self.size]).hexdigest()
+
+    def to_dict(self, buf=None):
+        d = {"kind": self.kind, "offset": self.offset, "size": self.size, "detail": self.detail,
+             "address": self.address, "image": self.image.name}
+        if buf is not None:
+            d["sha256"] = self.digest(buf)
+        return d
+
+
+def _find_all(buf, needle, start, end):
+    pos = buf.find(needle, start, end)
+    while pos >= 0:
+        yield pos
+        pos = buf.find(needle, pos + 1, end)
+
+
+def _png_size(buf, pos, end):
+    p = pos + 8
+    while p + 12 <= end:
+        length, ctype = struct.unpack_from(">I4s", buf, p)
+        p += 12 + length
+        if ctype == b"IEND":
+            return p - pos if p <= end else None
+    return None
+
+
+def _jpeg_size(buf, pos, end):
+    # The marker segments up to SOS must be valid, font bitmaps often contain FF D8 FF
+    p = pos + 2
+    seen_frame = False
+    while p + 4 <= end:
+        if buf[p] != 0xFF:
+            return None
+        marker = buf[p + 1]
+        if marker == 0xFF:
+            p += 1
+            continue
+        if marker < 0xC0 or 0xD0 <= marker <= 0xD9:
+            return None
+        length = struct.unpack_from(">H", buf, p + 2)[0]
+        if length < 2:
+            return None
+        seen_frame |= marker in (0xC0, 0xC1, 0xC2)
+        if marker == 0xDA:
+            if not seen_frame:
+                return None
+            q = buf.find(b"\xff\xd9", p + 2 + length, end)
+            return q + 2 - pos if q >= 0 else None
+        p += 2 + length
+    return None
+
+
+def _sjpg_size(buf, pos, end):
+    if pos + 24 > end:
+        return None
+    version = bytes(buf[pos + 8:pos + 13])
+    strips = struct.unpack_from("<H", buf, pos + 18)[0]
+    if version == b"V1.00":
+        table = pos + 22
+        if table + 2 * strips > end:
+            return None
+        return 22 + 2 * strips + sum(struct.unpack_from("<%dH" % strips, buf, table))
+    if version == b"V2.00" and pos + 24 + 4 * (strips + 1) <= end:
+        return struct.unpack_from("<I", buf, pos + 24 + 4 * strips)[0]
+    return None
+
+
+def _gif_size(buf, pos, end):
+    p = buf.find(b"\x00\x3b", pos + 13, end)
+    return p + 2 - pos if p >= 0 else None
+
+
+def _firmware_image_size(buf, pos, end):
+    # BHLZ and BHDL (SensorLib fw_lz.py / fw_delta.py) aren't self-delimiting, the size isn't stored
+    return None
+
+
+_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "png", _png_size),
+    (b"\xff\xd8\xff", "jpeg", _jpeg_size),
+    (b"_SJPG__\x00", "sjpg", _sjpg_size),
+    (b"GIF89a", "gif", _gif_size),
+    (b"GIF87a", "gif", _gif_size),
+)
+
+
+def known_blobs(directories):
+    '''Return [(name, data)] of the files in `directories`.'''
+    known = []
+    for directory in directories:
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path) and os.path.getsize(path) >= 64:
+                with open(path, "rb") as f:
+                    known.append((name, f.read()))
+    return known
+
+
+def _scan_known(buf, image, seg, known):
+    '''Known files (the Bosch firmware by default) stored verbatim.'''
+    blobs = []
+    end = seg.offset + seg.size
+    for name, data in known:
+        for pos in _find_all(buf, data[:64], seg.offset, end):
+            if buf[pos:pos + len(data)] == data:
+                kind = "bosch-fw" if data[:2] == b"\x2b\x66" else "known"
+                blobs.append(Blob(kind, pos, len(data), image, name))
+    return blobs
+
+
+def _scan_lv_img(buf, image, seg, min_size):
+    '''lv_img_dsc_t: header bit field, data_size and a data pointer into the image.'''
+    blobs = []
+    end = seg.offset + seg.size
+    for pos in range(seg.offset, end - 11, 4):
+        header, data_size, data = struct.unpack_from("<III", buf, pos)
+        cf = header & 0x1F
+        if header & 0xE0 or data_size < min_size or (cf not in _LV_IMG_CF and cf not in _LV_IMG_CF_RAW):
+            continue
+        w = (header >> 10) & 0x7FF
+        h = (header >> 21) & 0x7FF
+        if cf in _LV_IMG_CF:
+            name, bpp, palette = _LV_IMG_CF[cf]
+            if not w or not h or data_size != palette + (w * bpp + 7) // 8 * h:
+                continue
+        else:
+            name = "RAW"
+        data_offset = image.address_to_offset(data, data_size)
+        if data_offset is None:
+            continue
+        blobs.append(Blob("lv_img", data_offset, data_size, image, "%dx%d %s" % (w, h, name), data))
+    return blobs
+
+
+def _font_glyph_count(buf, image, cmaps_offset, cmap_num):
+    '''Number of glyph descriptors (glyph 0 included) of a fmt_txt font, 0 if a cmap is invalid.'''
+    glyphs = 0
+    for i in range(cmap_num):
+        _, range_length, glyph_start, _, ofs_list, list_length, cmap_type = \
+            struct.unpack_from("<IHHIIHB", buf, cmaps_offset + 20 * i)
+        if cmap_type == 0:      # FORMAT0_FULL: uint8_t glyph id offsets of every code point
+            ofs = image.address_to_offset(ofs_list, range_length)
+            last = max(buf[ofs:ofs + range_length]) if ofs is not None and range_length else None
+        elif cmap_type == 1:    # SPARSE_FULL: uint16_t glyph id offsets of the listed code points
+            ofs = image.address_to_offset(ofs_list, 2 * list_length)
+            last = max(struct.unpack_from("<%dH" % list_length, buf, ofs)) \
+                if ofs is not None and list_length else None
+        elif cmap_type == 2:    # FORMAT0_TINY
+            last = range_length - 1
+        elif cmap_type == 3:    # SPARSE_TINY
+            last = list_length - 1
+        else:
+            return 0
+        if last is None or last < 0:
+            return 0
+        glyphs = max(glyphs, glyph_start + last + 1)
+    return glyphs
+
+
+def _scan_lv_font(buf, image, seg, min_size):
+    '''lv_font_t using lv_font_fmt_txt_dsc_t, the size is computed from the glyph table.'''
+    blobs = []
+    end = seg.offset + seg.size
+    code = ("IROM", "IRAM")
+    for pos in range(seg.offset, end - 23, 4):
+        get_dsc, get_bitmap, line_height, base_line, _, _, _, _, dsc = struct.unpack_from("<IIhhBbbBI", buf, pos)
+        if not 0 < line_height < 512 or not 0 <= base_line <= line_height:
+            continue
+        if region_of(image.chip, get_dsc) not in code or region_of(image.chip, get_bitmap) not in code:
+            continue
+        dsc_offset = image.address_to_offset(dsc, 24)
+        if dsc_offset is None:
+            continue
+        bitmap, glyph_dsc, cmaps, _, _, bits = struct.unpack_from("<IIIIHH", buf, dsc_offset)
+        cmap_num = bits & 0x1FF
+        bpp = (bits >> 9) & 0xF
+        if bpp not in (1, 2, 3, 4, 8) or not 0 < cmap_num < 512:
+            continue
+        cmaps_offset = image.address_to_offset(cmaps, 20 * cmap_num)
+        bitmap_offset = image.address_to_offset(bitmap)
+        glyph_offset = image.address_to_offset(glyph_dsc)
+        if cmaps_offset is None or bitmap_offset is None or glyph_offset is None:
+            continue
+        glyphs = _font_glyph_count(buf, image, cmaps_offset, cmap_num)
+        if not glyphs or glyph_offset + 8 * glyphs > len(buf):
+            continue
+        # Glyph 0 is reserved, the last bitmap ends the bitmap array
+        bitmap_size = 0
+        for g in range(glyphs):
+            index_adv, box_w, box_h = struct.unpack_from("<IBB", buf, glyph_offset + 8 * g)
+            bitmap_size = max(bitmap_size, (index_adv & 0xFFFFF) + (box_w * box_h * bpp + 7) // 8)
+        size = bitmap_size + 8 * glyphs
+        if size < min_size:
+            continue
+        font_addr = seg.load_addr + pos - seg.offset
+        blobs.append(Blob("lv_font", bitmap_offset, bitmap_size, image,
+                          "%d px, %d bpp, %d glyphs (+%d bytes of glyph table)" % (line_height, bpp, glyphs,
+                                                                                    8 * glyphs), font_addr))
+    return blobs
+
+
+def _scan_fill(buf, image, seg, min_size):
+    '''Runs of 0x00 or 0xFF, e.g. zero-initialized arrays placed in flash.'''
+    blobs = []
+    end = seg.offset + seg.size
+    for value in (0x00, 0xFF):
+        run = bytes([value]) * min_size
+        pos = buf.find(run, seg.offset, end)
+        while pos >= 0:
+            stop = pos + min_size
+            while stop < end and buf[stop] == value:
+                stop += 1
+            blobs.append(Blob("fill", pos, stop - pos, image, "0x%02x" % value))
+            pos = buf.find(run, stop, end)
+    return blobs
+
+
+def find_blobs(flash, known=None, min_size=DEFAULT_MIN_BLOB):
+    '''Return the embedded blobs of every app image of `flash`, largest first.'''
+    buf = flash.buf
+    blobs = []
+    for image in flash.apps:
+        for seg in image.segments:
+            if seg.region not in ("DROM", "?"):
+                continue
+            end = seg.offset + seg.size
+            for magic, kind, sizer in _SIGNATURES:
+                for pos in _find_all(buf, magic, seg.offset, end):
+                    size = sizer(buf, pos, end)
+                    if size and size >= min_size:
+                        blobs.append(Blob(kind, pos, size, image))
+            if known:
+                blobs += _scan_known(buf, image, seg, known)
+            for magic in (b"BHLZ", b"BHDL"):
+                for pos in _find_all(buf, magic, seg.offset, end):
+                    if pos + 16 <= end and buf[pos + 4] == 1:
+                        size = struct.unpack_from("<I", buf, pos + 8)[0]
+                        blobs.append(Blob("bosch-fw-" + magic.decode().lower(), pos, 0, image,
+                                          "%d bytes uncompressed" % size))
+            blobs += _scan_lv_img(buf, image, seg, min_size)
+            blobs += _scan_lv_font(buf, image, seg, min_size)
+            blobs += _scan_fill(buf, image, seg, min_size)
+
+    # The same data can be referenced twice (two descriptors of one image), keep one
+    unique = {}
+    for b in blobs:
+        unique.setdefault((b.offset, b.kind), b)
+    return sorted(unique.values(), key=lambda b: (-b.size, b.offset))
+
+
+def analyze(path, known_dirs=(), min_size=DEFAULT_MIN_BLOB):
+    '''Return the report of a firmware file as a dict.'''
+    with FlashImage(path) as flash:
+        known = known_blobs(known_dirs)
+        blobs = find_blobs(flash, known, min_size)
+        file_size = len(flash.buf)
+        report = {
+            "file": os.path.basename(path),
+            "file_size": file_size,
+            "partitions": flash.partitions,
+            "images": [img.to_dict() for img in flash.images],
+            "blobs": [b.to_dict(flash.buf) for b in blobs],
+        }
+        used = sum(img.size for img in flash.images)
+        report["unused_size"] = file_size - used
+    return report
+
+
+def _kb(n):
+    return "%.1f KB" % (n / 1024.0)
+
+
+def print_report(report, top=20, out=sys.stdout):
+    w = out.write
+    w("%s: %d bytes\n" % (report["file"], report["file_size"]))
+    if report["partitions"]:
+        w("\n%-16s %-5s %-9s %10s %10s\n" % ("partition", "type", "subtype", "offset", "size"))
+        for p in report["partitions"]:
+            w("%-16s %-5s %-9s %#10x %10s\n" % (p["label"], p["type"], p["subtype"], p["offset"], _kb(p["size"])))
+
+    for img in report["images"]:
+        desc = img["app_desc"] or {}
+        w("\n%s at %#x: %s, %d bytes, entry %#x, flash %s, checksum %s, SHA-256 %s\n" % (
+            img["name"], img["offset"], img["chip"], img["size"], img["entry"], img["flash_size"],
+            "ok" if img["checksum_ok"] else "BAD",
+            "-" if img["sha256"] is None else ("ok" if img["sha256_ok"] else "BAD")))
+        if desc:
+            w("  %s %s, IDF %s, built %s %s\n" % (desc["project"], desc["version"], desc["idf_ver"],
+                                                  desc["date"], desc["time"]))
+        w("  %-4s %-10s %-8s %10s %10s\n" % ("seg", "address", "region", "offset", "size"))
+        for s in img["segments"]:
+            w("  %-4d %#010x %-8s %#10x %10d\n" % (s["index"], s["load_addr"], s["region"], s["offset"], s["size"]))
+        total = sum(img["regions"].values()) or 1
+        for region in REGION_ORDER:
+            if region in img["regions"]:
+                size = img["regions"][region]
+                w("  %-8s %10s %5.1f %%\n" % (region, _kb(size), 100.0 * size / total))
+
+    blobs = report["blobs"]
+    if blobs:
+        total = sum(img["size"] for img in report["images"] if img["name"] != "bootloader") or 1
+        w("\n%-12s %10s %10s %6s  %s\n" % ("blob", "offset", "size", "app %", "detail"))
+        for b in blobs[:top]:
+            w("%-12s %#10x %10d %5.1f%%  %s\n" % (b["kind"], b["offset"], b["size"], 100.0 * b["size"] / total,
+                                                  b["detail"]))
+        if len(blobs) > top:
+            w("... %d more (--top)\n" % (len(blobs) - top))
+        kinds = {}
+        for b in blobs:
+            if b["kind"] != "fill":
+                kinds[b["kind"]] = kinds.get(b["kind"], 0) + b["size"]
+        w("blobs: %s\n" % ", ".join("%s %s" % (k, _kb(v)) for k, v in sorted(kinds.items(), key=lambda kv: -kv[1])))
+
+
+def compare(old, new):
+    '''Return the differences between two reports as a dict.'''
+    def split(report):
+        boot = [img for img in report["images"] if img["name"] == "bootloader"]
+        return boot[:1] or [None], [img for img in report["images"] if img["name"] != "bootloader"]
+
+    # The bootloaders, then the apps in partition order (the labels differ between layouts)
+    (old_boot, old_apps), (new_boot, new_apps) = split(old), split(new)
+    pairs = list(zip(old_boot, new_boot))
+    pairs += [(old_apps[i] if i < len(old_apps) else None, new_apps[i] if i < len(new_apps) else None)
+              for i in range(max(len(old_apps), len(new_apps)))]
+    images = []
+    for a, b in pairs:
+        if a is None and b is None:
+            continue
+        if a is None or b is None or a["name"] == b["name"]:
+            name = (a or b)["name"]
+        else:
+            name = "%s/%s" % (a["name"], b["name"])
+        regions = sorted(set((a or {}).get("regions", {})) | set((b or {}).get("regions", {})),
+                         key=REGION_ORDER.index)
+        images.append({
+            "name": name,
+            "old_size": a and a["size"], "new_size": b and b["size"],
+            "regions": {r: ((a or {}).get("regions", {}).get(r, 0), (b or {}).get("regions", {}).get(r, 0))
+                        for r in regions},
+        })
+
+    # Blobs are matched by content first, then by kind and detail
+    old_blobs = {b["sha256"]: b for b in old["blobs"] if b["kind"] != "fill"}
+    new_blobs = {b["sha256"]: b for b in new["blobs"] if b["kind"] != "fill"}
+    removed = [b for h, b in old_blobs.items() if h not in new_blobs]
+    added = [b for h, b in new_blobs.items() if h not in old_blobs]
+    return {
+        "old": old["file"], "new": new["file"], "images": images,
+        "unchanged_blobs": sum(1 for h in old_blobs if h in new_blobs),
+        "removed_blobs": sorted(removed, key=lambda b: -b["size"]),
+        "added_blobs": sorted(added, key=lambda b: -b["size"]),
+    }
+
+
+def print_compare(diff, top=20, out=sys.stdout):
+    w = out.write
+    w("%s -> %s\n" % (diff["old"], diff["new"]))
+    for img in diff["images"]:
+        w("\n%s: %s -> %s bytes\n" % (img["name"], img["old_size"] or "-", img["new_size"] or "-"))
+        for region, (a, b) in img["regions"].items():
+            w("  %-8s %10d %10d %+10d\n" % (region, a, b, b - a))
+    w("\n%d blobs unchanged\n" % diff["unchanged_blobs"])
+    for title, blobs in (("removed", diff["removed_blobs"]), ("added", diff["added_blobs"])):
+        if blobs:
+            w("%s:\n" % title)
+            for b in blobs[:top]:
+                w("  %-12s %10d  %s\n" % (b["kind"], b["size"], b["detail"]))
+
+
+def default_known_dirs():
+    '''The Bosch firmware shipped with SensorLib.'''
+    here = os.path.dirname(os.path.abspath(__file__))
+    return [os.path.join(here, os.pardir, "ESP-IDF", "03_DRV2605_Test", "components", "SensorLib", "src",
+                         "bosch", "firmware")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze ESP32 firmware images: segments, regions and blobs")
+    parser.add_argument("command", choices=("info", "compare"))
+    parser.add_argument("files", nargs="+", help="app or merged flash images (compare: old new)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--known", action="append", default=[], metavar="dir",
+                        help="directory of files to locate in the images (default: the SensorLib Bosch firmware)")
+    parser.add_argument("--min-blob", type=int, default=DEFAULT_MIN_BLOB, metavar="bytes",
+                        help="smallest blob reported (default: %(default)s)")
+    parser.add_argument("--top", type=int, default=20, help="blobs listed in the table (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.command == "compare" and len(args.files) != 2:
+        parser.error("compare needs two files")
+    known_dirs = args.known or default_known_dirs()
+    try:
+        reports = [analyze(path, known_dirs, args.min_blob) for path in args.files]
+    except (OSError, ValueError, struct.error) as e:
+        print("error: %s" % e, file=sys.stderr)
+        return 1
+
+    if args.command == "compare":
+        diff = compare(*reports)
+        if args.json:
+            json.dump(diff, sys.stdout, indent=2)
+            sys.stdout.write("\n")
+        else:
+            print_compare(diff, args.top)
+        return 0
+
+    if args.json:
+        json.dump(reports if len(reports) > 1 else reports[0], sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        for i, report in enumerate(reports):
+            if i:
+                print()
+            print_report(report, args.top)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
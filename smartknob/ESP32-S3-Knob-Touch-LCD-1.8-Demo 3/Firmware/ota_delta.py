@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+'''
+OTA patches between two firmware builds
+
+A release usually changes a small part of the app, so instead of the full
+image the knob can download a patch and rebuild the new app from the one it
+runs (ota_patch/ota_patch.c, while the patch is downloaded):
+
+    python3 ota_delta.py diff old.bin new.bin -o new.otad
+    python3 ota_delta.py diff --app ESP32-KNOB_ESP32_0.bin ESP32-KNOB_ESP32_1.bin -o update.otad
+    python3 ota_delta.py patch old.bin new.otad -o new.bin
+    python3 ota_delta.py bench ESP32-KNOB_ESP32_0.bin WX-ESP32S3-KNOB_V1.2.bin
+
+--app diffs the first app partition of merged flash images (see
+esp_image.py), which is what an OTA update writes. The matching is the
+bsdiff one: a suffix array of the old image gives the longest match of every
+position of the new image, the matches are extended forwards and backwards
+while at least half of the bytes agree, and the approximate parts are stored
+as bytewise differences, which are mostly zeros when code moved and its
+addresses shifted. The patch is deflate compressed as it's produced.
+Layout (little endian):
+
+    0   4  magic "OTAD"
+    4   1  version (1)
+    5   1  compression: 0 none, 1 raw deflate
+    6   1  deflate window bits (9..15), the applier needs 1 << bits bytes of RAM
+    7   1  reserved, 0
+    8   4  size of the old image
+    12  4  CRC-32 of the old image (zlib)
+    16  4  size of the new image
+    20  4  CRC-32 of the new image
+    24     compressed stream of entries:
+           varint(diff length) varint(extra length) zigzag varint(seek)
+           `diff length` bytes, new - old (mod 256) at the old position
+           `extra length` bytes copied to the new image
+           then the old position moves by diff length + seek
+
+Varints are LEB128 (7 bits per byte, low bits first), one entry is written
+even for an empty new image. ota_patch/test/test_ota_patch.py applies the
+patches of this script with ota_patch.c on the host.
+
+Dependencies: (PYTHON-3) numpy
+'''
+
+import argparse
+import array
+import glob
+import io
+import json
+import multiprocessing
+import os
+import struct
+import sys
+import time
+import zlib
+
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+
+try:
+    import numpy as np
+except ImportError:
+    sys.exit("ota_delta.py needs numpy: pip install numpy")
+
+MAGIC = b"OTAD"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBxIIII")
+COMPRESS_NONE = 0
+COMPRESS_DEFLATE = 1
+DEFAULT_WINDOW_BITS = 12
+
+# Bytes of every position looked up at once in the suffix array
+KEY_BYTES = 8
+# Bytes compared per step of the suffix array search
+_SEARCH_PREFIX = 256
+# A new match replaces the current alignment when it's this much longer
+_MATCH_SLACK = 8
+
+
+def crc32(data):
+    return zlib.crc32(data) & 0xFFFFFFFF
+
+
+def _varint(value, out):
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def suffix_array(data):
+    '''Return the start positions of the suffixes of `data` in lexicographic order (prefix doubling).'''
+    n = len(data)
+    if n == 0:
+        return np.zeros(0, np.int64)
+    # Dense ranks keep rank * (n + 1) + next rank unique
+    rank = np.unique(np.frombuffer(data, np.uint8), return_inverse=True)[1].astype(np.int64)
+    step = 1
+    while True:
+        # Sort by (rank of the first `step` bytes, rank of the next `step` bytes), -1 past the end
+        second = np.full(n, -1, np.int64)
+        second[:n - step] = rank[step:]
+        key = rank * (n + 1) + (second + 1)
+        sa = np.argsort(key, kind="stable")
+        sorted_key = key[sa]
+        new_rank = np.empty(n, np.int64)
+        new_rank[sa] = np.concatenate(([0], np.cumsum(sorted_key[1:] != sorted_key[:-1])))
+        rank = new_rank
+        if rank[sa[-1]] == n - 1 or step >= n:
+            return sa
+        step *= 2
+
+
+def _match_length(a, ai, b, bi):
+    limit = min(len(a) - ai, len(b) - bi)
+    n = 0
+    block = 32
+    # Compare in growing blocks first, then byte by byte
+    while n + block <= limit and a[ai + n:ai + n + block] == b[bi + n:bi + n + block]:
+        n += block
+        block = min(block * 2, 1 << 16)
+    while block > 1:
+        block //= 2
+        if n + block <= limit and a[ai + n:ai + n + block] == b[bi + n:bi + n + block]:
+            n += block
+    return n
+
+
+def _int_array(values):
+    '''A compact list of Python ints (8 bytes per item instead of a list's 36).'''
+    result = array.array("q")
+    result.frombytes(np.asarray(values, np.int64).tobytes())
+    return result
+
+
+def _prefix_keys(array, positions):
+    '''The KEY_BYTES bytes at every position as big endian integers, zero padded past the end.'''
+    padded = np.concatenate((array, np.zeros(KEY_BYTES, np.uint8)))
+    keys = np.zeros(len(positions), np.uint64)
+    for k in range(KEY_BYTES):
+        keys = (keys << np.uint64(8)) | padded[positions + k].astype(np.uint64)
+    return keys
+
+
+def _common_prefix(a, a_pos, b, b_pos):
+    '''Length of the common prefix of a[a_pos:] and b[b_pos:] for every pair, KEY_BYTES at most.'''
+    length = np.zeros(len(a_pos), np.int64)
+    same = np.ones(len(a_pos), bool)
+    for k in range(KEY_BYTES):
+        ai, bi = a_pos + k, b_pos + k
+        inside = (ai < len(a)) & (bi < len(b))
+        same &= inside
+        same[inside] &= a[ai[inside]] == b[bi[inside]]
+        length += same
+    return length
+
+
+class Differ:
+    '''The old image and its suffix array, reused for every new image diffed against it.'''
+
+    def __init__(self, old):
+        self.old = bytes(old)
+        self.old_array = np.frombuffer(self.old, np.uint8)
+        sa = suffix_array(self.old)
+        self.sa = _int_array(sa)
+        self.sa_keys = _prefix_keys(self.old_array, sa)
+
+    def _candidates(self, new_array):
+        '''
+        Look up the first KEY_BYTES bytes of every position of the new image at
+        once. Return the best (old position, length) per position, exact when
+        the length is below KEY_BYTES, and the range of the suffix array
+        sharing the key, where search() looks for the longer matches.
+        '''
+        n = len(new_array)
+        keys = _prefix_keys(new_array, np.arange(n))
+        left = np.searchsorted(self.sa_keys, keys, "left")
+        right = np.searchsorted(self.sa_keys, keys, "right")
+        sa = np.frombuffer(self.sa, np.int64)
+        positions = np.arange(n)
+        # Without an equal key the longest match is next to the insertion point
+        below = sa[np.clip(left - 1, 0, len(sa) - 1)]
+        above = sa[np.clip(left, 0, len(sa) - 1)]
+        below_len = _common_prefix(self.old_array, below, new_array, positions)
+        above_len = _common_prefix(self.old_array, above, new_array, positions)
+        best_pos = np.where(below_len > above_len, below, above)
+        best_len = np.maximum(below_len, above_len)
+        return _int_array(best_pos), _int_array(best_len), _int_array(left), _int_array(right)
+
+    def search(self, new, pos, candidates):
+        '''Return (old position, length) of the longest match of new[pos:].'''
+        best_pos, best_len, left, right = candidates
+        if best_len[pos] < KEY_BYTES:
+            return best_pos[pos], best_len[pos]
+        old, sa = self.old, self.sa
+        key = new[pos:pos + _SEARCH_PREFIX]
+        lo, hi = left[pos], right[pos] - 1
+        while hi - lo >= 2:
+            mid = (lo + hi) // 2
+            if old[sa[mid]:sa[mid] + len(key)] < key:
+                lo = mid
+            else:
+                hi = mid
+        lo_len = _match_length(old, sa[lo], new, pos)
+        hi_len = _match_length(old, sa[hi], new, pos)
+        return (sa[lo], lo_len) if lo_len > hi_len else (sa[hi], hi_len)
+
+    def _same(self, new, start, end, offset):
+        '''Number of positions i in [start, end) with old[i + offset] == new[i].'''
+        start = max(start, -offset)
+        end = min(end, len(self.old) - offset)
+        if end - start <= KEY_BYTES:
+            old = self.old
+            return sum(1 for i in range(start, end) if old[i + offset] == new[i])
+        return int(np.count_nonzero(np.frombuffer(new, np.uint8, end - start, start) ==
+                                    self.old_array[start + offset:end + offset]))
+
+    def entries(self, new):
+        '''Yield (diff start in new, old position, diff length, extra length, seek) as bsdiff matches them.'''
+        old = self.old
+        new = bytes(new)
+        old_size, new_size = len(old), len(new)
+        if not old_size or not new_size:
+            if new_size:
+                yield 0, 0, 0, new_size, 0
+            return
+        candidates = self._candidates(np.frombuffer(new, np.uint8))
+        scan = length = 0
+        last_scan = last_pos = last_offset = 0
+        pos = 0
+
+        while scan < new_size:
+            old_score = 0
+            scan += length
+            scored = scan
+            while scan < new_size:
+                pos, length = self.search(new, scan, candidates)
+                # Bytes of the match that the current alignment (last_offset) also gets right
+                if scored < scan + length:
+                    old_score += self._same(new, scored, scan + length, last_offset)
+                    scored = scan + length
+                if (length == old_score and length != 0) or length > old_score + _MATCH_SLACK:
+                    break
+                if 0 <= scan + last_offset < old_size and old[scan + last_offset] == new[scan]:
+                    old_score -= 1
+                scan += 1
+
+            if length == old_score and scan != new_size:
+                continue
+
+            # Extend the previous match forwards while at least half of the bytes agree
+            forward = 0
+            score = best = 0
+            i = 0
+            while last_scan + i < scan and last_pos + i < old_size:
+                if old[last_pos + i] == new[last_scan + i]:
+                    score += 1
+                i += 1
+                if score * 2 - i > best * 2 - forward:
+                    best, forward = score, i
+
+            # And the new match backwards
+            backward = 0
+            if scan < new_size:
+                score = best = 0
+                i = 1
+                while scan >= last_scan + i and pos >= i:
+                    if old[pos - i] == new[scan - i]:
+                        score += 1
+                    if score * 2 - i > best * 2 - backward:
+                        best, backward = score, i
+                    i += 1
+
+            if last_scan + forward > scan - backward:
+                # They overlap, split where the fewest bytes are lost
+                overlap = (last_scan + forward) - (scan - backward)
+                score = best = 0
+                split = 0
+                for i in range(overlap):
+                    if new[last_scan + forward - overlap + i] == old[last_pos + forward - overlap + i]:
+                        score += 1
+                    if new[scan - backward + i] == old[pos - backward + i]:
+                        score -= 1
+                    if score > best:
+                        best, split = score, i + 1
+                forward += split - overlap
+                backward -= split
+
+            yield (last_scan, last_pos, forward, (scan - backward) - (last_scan + forward),
+                   (pos - backward) - (last_pos + forward))
+            last_scan = scan - backward
+            last_pos = pos - backward
+            last_offset = pos - scan
+
+
+def _compressor(compression, window_bits):
+    if compression == COMPRESS_DEFLATE:
+        return zlib.compressobj(9, zlib.DEFLATED, -window_bits, 9)
+    return None
+
+
+def diff(old, new, out, compression=COMPRESS_DEFLATE, window_bits=DEFAULT_WINDOW_BITS, differ=None):
+    '''Write the patch from `old` to `new` to the binary stream `out`, return its size.'''
+    differ = differ or Differ(old)
+    old = differ.old
+    new = bytes(new)
+    old_array = differ.old_array
+    new_array = np.frombuffer(new, np.uint8)
+    out.write(HEADER.pack(MAGIC, VERSION, compression, window_bits, len(old), crc32(old), len(new), crc32(new)))
+    size = HEADER.size
+    compressor = _compressor(compression, window_bits)
+
+    def emit(data):
+        nonlocal size
+        if compressor is not None:
+            data = compressor.compress(data)
+        out.write(data)
+        size += len(data)
+
+    entries = 0
+    for start, old_pos, diff_len, extra_len, seek in differ.entries(new):
+        head = bytearray()
+        _varint(diff_len, head)
+        _varint(extra_len, head)
+        _varint(_zigzag(seek), head)
+        delta = new_array[start:start + diff_len] - old_array[old_pos:old_pos + diff_len]
+        emit(bytes(head) + delta.tobytes() + new[start + diff_len:start + diff_len + extra_len])
+        entries += 1
+    if entries == 0:
+        emit(b"\0\0\0")
+    if compressor is not None:
+        tail = compressor.flush()
+        out.write(tail)
+        size += len(tail)
+    return size
+
+
+def read_header(patch):
+    if len(patch) < HEADER.size:
+        raise ValueError("patch too short")
+    magic, version, compression, window_bits, old_size, old_crc, new_size, new_crc = HEADER.unpack_from(patch)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not an OTA patch")
+    if compression not in (COMPRESS_NONE, COMPRESS_DEFLATE) or not 9 <= window_bits <= 15:
+        raise ValueError("unsupported compression")
+    return {"compression": compression, "window_bits": window_bits, "old_size": old_size, "old_crc": old_crc,
+            "new_size": new_size, "new_crc": new_crc}
+
+
+def patch(old, patch_data, out=None):
+    '''Rebuild the new image, streaming like the device does; raise ValueError if the patch doesn't apply.'''
+    header = read_header(patch_data)
+    if len(old) != header["old_size"] or crc32(old) != header["old_crc"]:
+        raise ValueError("the patch was made for another image")
+    old_array = np.frombuffer(old, np.uint8)
+    result = bytearray()
+    stream = memoryview(patch_data)[HEADER.size:]
+    if header["compression"] == COMPRESS_DEFLATE:
+        decompressor = zlib.decompressobj(-header["window_bits"])
+        stream = decompressor.decompress(stream)
+        if not decompressor.eof:
+            raise ValueError("truncated patch")
+    pos = 0
+    old_pos = 0
+
+    def varint():
+        nonlocal pos
+        value = shift = 0
+        while True:
+            if pos >= len(stream):
+                raise ValueError("truncated patch")
+            byte = stream[pos]
+            pos += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                return value
+
+    while len(result) < header["new_size"] or pos < len(stream):
+        diff_len, extra_len, z = varint(), varint(), varint()
+        seek = (z >> 1) ^ -(z & 1)
+        if len(result) + diff_len + extra_len > header["new_size"] or pos + diff_len + extra_len > len(stream):
+            raise ValueError("invalid entry at byte %d" % len(result))
+        if old_pos < 0 or old_pos + diff_len > len(old):
+            raise ValueError("diff outside of the old image")
+        delta = np.frombuffer(stream[pos:pos + diff_len], np.uint8)
+        result += (delta + old_array[old_pos:old_pos + diff_len]).tobytes()
+        pos += diff_len
+        result += stream[pos:pos + extra_len]
+        pos += extra_len
+        old_pos += diff_len + seek
+    if crc32(result) != header["new_crc"]:
+        raise ValueError("CRC mismatch")
+    if out is not None:
+        out.write(result)
+    return bytes(result)
+
+
+def load_image(path, app=False):
+    '''Return the bytes of `path`, or of its first app partition with `app`.'''
+    if not app:
+        with open(path, "rb") as f:
+            return f.read()
+    import esp_image
+    with esp_image.FlashImage(path) as image:
+        if not image.apps:
+            raise ValueError("%s has no app image" % path)
+        first = image.apps[0]
+        return bytes(image.buf[first.offset:first.offset + first.size])
+
+
+def benchmark(old, new, compression, window_bits):
+    '''
+    Return the patch size, the time of one diff and of its application, and
+    the peak memory (RSS) of the process. Run it in a fresh process for the
+    memory to be the one of this diff.
+    '''
+    start = time.perf_counter()
+    differ = Differ(old)
+    index_time = time.perf_counter() - start
+    out = io.BytesIO()
+    diff(old, new, out, compression, window_bits, differ)
+    diff_time = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 if resource else None
+
+    patch_data = out.getvalue()
+    start = time.perf_counter()
+    if patch(old, patch_data) != bytes(new):
+        raise RuntimeError("the patch doesn't rebuild the new image")
+    apply_time = time.perf_counter() - start
+    full = len(zlib.compress(bytes(new), 9))
+    return {"old_size": len(old), "new_size": len(new), "patch_size": len(patch_data), "full_deflate": full,
+            "index_seconds": round(index_time, 3), "diff_seconds": round(diff_time, 3),
+            "apply_seconds": round(apply_time, 3), "peak_memory": peak}
+
+
+def _bench_pairs(files):
+    '''Every ordered pair of the files, the Firmware/*.bin images by default.'''
+    if not files:
+        files = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.bin")))
+    return [(a, b) for a in files for b in files if a != b]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Make, apply and benchmark OTA patches between firmware images")
+    parser.add_argument("command", choices=("diff", "patch", "bench"))
+    parser.add_argument("files", nargs="*", help="diff: old new, patch: old patch, bench: images (default: *.bin)")
+    parser.add_argument("-o", "--output", help="diff/patch: output file")
+    parser.add_argument("--app", action="store_true", help="use the first app partition of merged flash images")
+    parser.add_argument("--no-compress", action="store_true", help="diff: store the entries uncompressed")
+    parser.add_argument("--window-bits", type=int, default=DEFAULT_WINDOW_BITS, choices=range(9, 16),
+                        metavar="9..15", help="deflate window, RAM needed by the applier (default: %(default)s)")
+    parser.add_argument("--json", action="store_true", help="bench: print the results as JSON")
+    args = parser.parse_intermixed_args(argv)
+
+    compression = COMPRESS_NONE if args.no_compress else COMPRESS_DEFLATE
+    try:
+        if args.command == "bench":
+            pairs = _bench_pairs(args.files)
+            if not pairs:
+                parser.error("bench needs at least two images")
+            results = []
+            for old_path, new_path in pairs:
+                with multiprocessing.Pool(1) as pool:
+                    result = pool.apply(benchmark, (load_image(old_path, args.app), load_image(new_path, args.app),
+                                                    compression, args.window_bits))
+                result.update(old=os.path.basename(old_path), new=os.path.basename(new_path))
+                results.append(result)
+                if not args.json:
+                    print("%s -> %s" % (result["old"], result["new"]))
+                    print("  patch %d bytes, %.1f %% of the new image (%d), %.1f %% of it deflated (%d)" %
+                          (result["patch_size"], 100.0 * result["patch_size"] / max(result["new_size"], 1),
+                           result["new_size"], 100.0 * result["patch_size"] / max(result["full_deflate"], 1),
+                           result["full_deflate"]))
+                    print("  suffix array %.2f s, diff %.2f s total, apply %.2f s, peak memory %s" %
+                          (result["index_seconds"], result["diff_seconds"], result["apply_seconds"],
+                           "%.1f MB" % (result["peak_memory"] / 1e6) if result["peak_memory"] else "-"))
+            if args.json:
+                json.dump(results, sys.stdout, indent=2)
+                sys.stdout.write("\n")
+            return 0
+
+        if len(args.files) != 2 or not args.output:
+            parser.error("%s needs two files and --output" % args.command)
+        old = load_image(args.files[0], args.app)
+        if args.command == "diff":
+            new = load_image(args.files[1], args.app)
+            with open(args.output, "wb") as out:
+                size = diff(old, new, out, compression, args.window_bits)
+            print("Wrote %s: %d bytes for a %d byte image" % (args.output, size, len(new)))
+            if size >= len(zlib.compress(new, 9)):
+                print("note: the patch isn't smaller than the compressed image, the builds share little")
+        else:
+            with open(args.files[1], "rb") as f:
+                patch_data = f.read()
+            with open(args.output, "wb") as out:
+                new = patch(old, patch_data, out)
+            print("Wrote %s: %d bytes" % (args.output, len(new)))
+    except (OSError, ValueError) as e:
+        print("error: %s" % e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
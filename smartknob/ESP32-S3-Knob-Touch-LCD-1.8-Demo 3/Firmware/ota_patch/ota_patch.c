@@ -0,0 +1,654 @@
+#include <stdlib.h>
+#include <string.h>
+#include "ota_patch.h"
+
+/*
+ * The deflate stream is inflated with the tinfl decoder of the ROM on the
+ * ESP32 chips (miniz.h elsewhere with OTA_PATCH_USE_MINIZ), or with zlib on
+ * a host with OTA_PATCH_USE_ZLIB. Without any of them only the patches made
+ * with `ota_delta.py diff --no-compress` are accepted.
+ */
+#if defined(ESP_PLATFORM)
+#include "rom/miniz.h"
+#include "esp_log.h"
+#include "esp_ota_ops.h"
+#include "esp_partition.h"
+#define OTA_PATCH_TINFL
+#elif defined(OTA_PATCH_USE_MINIZ)
+#include "miniz.h"
+#define OTA_PATCH_TINFL
+#elif defined(OTA_PATCH_USE_ZLIB)
+#include <zlib.h>
+#endif
+
+#define PATCH_VERSION           1
+#define COMPRESS_NONE           0
+#define COMPRESS_DEFLATE        1
+
+enum
+{
+  STATE_CONTROL,    // reading the 3 varints of an entry
+  STATE_DIFF,       // diff bytes, added to the old image
+  STATE_EXTRA,      // bytes copied to the new image
+};
+
+struct ota_patch
+{
+  ota_patch_read_old_t read_old;
+  ota_patch_write_new_t write_new;
+  void *user;
+  int err;                                  // first error, every later call returns it
+
+  uint8_t header[OTA_PATCH_HEADER_LEN];
+  uint32_t header_len;
+  uint8_t compression;
+  uint32_t old_size;
+  uint32_t new_size;
+  uint32_t new_crc;
+
+  uint8_t state;
+  uint8_t field;                            // varint of the entry being read
+  uint8_t shift;
+  uint32_t value;
+  uint32_t fields[3];
+  uint32_t remaining;                       // bytes left in the diff or extra part
+  int64_t old_pos;
+  int32_t seek;
+
+  uint32_t new_pos;
+  uint32_t crc;
+  uint8_t stream_done;
+  uint8_t *dict;                            // inflate output, 1 << window bits
+  uint32_t dict_size;
+  uint32_t dict_pos;
+#if defined(OTA_PATCH_TINFL)
+  tinfl_decompressor inflator;
+#elif defined(OTA_PATCH_USE_ZLIB)
+  z_stream zs;
+  uint8_t zs_init;
+#endif
+
+  uint32_t out_len;
+  uint8_t out_buf[OTA_PATCH_OUT_BUF_SIZE];
+  uint8_t old_buf[OTA_PATCH_OLD_CHUNK_SIZE];
+
+#ifdef ESP_PLATFORM
+  const esp_partition_t *running;
+  const esp_partition_t *update;
+  esp_ota_handle_t ota_handle;
+  uint8_t ota_active;
+  esp_err_t ota_err;                        // error of the last failed partition call
+#endif
+};
+
+static uint32_t patch_crc32(uint32_t crc, const uint8_t *data, size_t len)
+{
+  static const uint32_t table[16] =
+  {
+    0x00000000, 0x1DB71064, 0x3B6E20C8, 0x26D930AC, 0x76DC4190, 0x6B6B51F4, 0x4DB26158, 0x5005713C,
+    0xEDB88320, 0xF00F9344, 0xD6D6A3E8, 0xCB61B38C, 0x9B64C2B0, 0x86D3D2D4, 0xA00AE278, 0xBDBDF21C,
+  };
+
+  crc = ~crc;
+  while (len--)
+  {
+    crc ^= *data++;
+    crc = (crc >> 4) ^ table[crc & 0x0F];
+    crc = (crc >> 4) ^ table[crc & 0x0F];
+  }
+  return ~crc;
+}
+
+static uint32_t le32(const uint8_t *p)
+{
+  return (uint32_t)p[0] | ((uint32_t)p[1] << 8) | ((uint32_t)p[2] << 16) | ((uint32_t)p[3] << 24);
+}
+
+static int flush_output(ota_patch_t *p)
+{
+  if (p->out_len > 0)
+  {
+    if (p->write_new(p->user, p->out_buf, p->out_len) != 0)
+    {
+      return OTA_PATCH_ERR_IO;
+    }
+    p->out_len = 0;
+  }
+  return OTA_PATCH_OK;
+}
+
+static int put_output(ota_patch_t *p, const uint8_t *data, uint32_t len)
+{
+  p->crc = patch_crc32(p->crc, data, len);
+  p->new_pos += len;
+  while (len > 0)
+  {
+    uint32_t n = OTA_PATCH_OUT_BUF_SIZE - p->out_len;
+    if (n > len)
+    {
+      n = len;
+    }
+    memcpy(&p->out_buf[p->out_len], data, n);
+    p->out_len += n;
+    data += n;
+    len -= n;
+    if (p->out_len == OTA_PATCH_OUT_BUF_SIZE)
+    {
+      int rc = flush_output(p);
+      if (rc != OTA_PATCH_OK)
+      {
+        return rc;
+      }
+    }
+  }
+  return OTA_PATCH_OK;
+}
+
+static void end_entry(ota_patch_t *p)
+{
+  p->old_pos += p->seek;
+  p->state = STATE_CONTROL;
+}
+
+static int start_entry(ota_patch_t *p)
+{
+  uint32_t diff_len = p->fields[0];
+  uint32_t extra_len = p->fields[1];
+  uint32_t z = p->fields[2];
+
+  if ((uint64_t)p->new_pos + diff_len + extra_len > p->new_size ||
+      p->old_pos < 0 || p->old_pos + diff_len > p->old_size)
+  {
+    return OTA_PATCH_ERR_CORRUPT;
+  }
+  p->seek = (int32_t)(z >> 1) ^ -(int32_t)(z & 1);
+  if (diff_len > 0)
+  {
+    p->state = STATE_DIFF;
+    p->remaining = diff_len;
+  }
+  else if (extra_len > 0)
+  {
+    p->state = STATE_EXTRA;
+    p->remaining = extra_len;
+  }
+  else
+  {
+    end_entry(p);
+  }
+  return OTA_PATCH_OK;
+}
+
+/* Consume the decompressed entries */
+static int process(ota_patch_t *p, const uint8_t *data, size_t len)
+{
+  int rc = OTA_PATCH_OK;
+
+  while (len > 0 && rc == OTA_PATCH_OK)
+  {
+    if (p->state == STATE_CONTROL)
+    {
+      uint8_t byte = *data++;
+      len--;
+      // 5 bytes at most, the last one with 4 bits
+      if (p->shift > 28 || (p->shift == 28 && (byte & 0x70)))
+      {
+        return OTA_PATCH_ERR_CORRUPT;
+      }
+      p->value |= (uint32_t)(byte & 0x7F) << p->shift;
+      p->shift += 7;
+      if (byte & 0x80)
+      {
+        continue;
+      }
+      p->fields[p->field++] = p->value;
+      p->value = 0;
+      p->shift = 0;
+      if (p->field == 3)
+      {
+        p->field = 0;
+        rc = start_entry(p);
+      }
+    }
+    else
+    {
+      uint32_t n = p->remaining < len ? p->remaining : (uint32_t)len;
+
+      if (p->state == STATE_DIFF)
+      {
+        if (n > OTA_PATCH_OLD_CHUNK_SIZE)
+        {
+          n = OTA_PATCH_OLD_CHUNK_SIZE;
+        }
+        if (p->read_old(p->user, (uint32_t)p->old_pos, p->old_buf, n) != 0)
+        {
+          return OTA_PATCH_ERR_IO;
+        }
+        for (uint32_t i = 0; i < n; i++)
+        {
+          p->old_buf[i] += data[i];
+        }
+        rc = put_output(p, p->old_buf, n);
+        p->old_pos += n;
+      }
+      else
+      {
+        rc = put_output(p, data, n);
+      }
+      data += n;
+      len -= n;
+      p->remaining -= n;
+      if (p->remaining == 0)
+      {
+        if (p->state == STATE_DIFF && p->fields[1] > 0)
+        {
+          p->state = STATE_EXTRA;
+          p->remaining = p->fields[1];
+        }
+        else
+        {
+          end_entry(p);
+        }
+      }
+    }
+  }
+  return rc;
+}
+
+static int inflate_input(ota_patch_t *p, const uint8_t *data, size_t len)
+{
+  if (p->stream_done)
+  {
+    return len ? OTA_PATCH_ERR_CORRUPT : OTA_PATCH_OK;
+  }
+#if defined(OTA_PATCH_TINFL)
+  for (;;)
+  {
+    size_t in_bytes = len;
+    size_t out_bytes = p->dict_size - p->dict_pos;
+    tinfl_status status = tinfl_decompress(&p->inflator, data, &in_bytes, p->dict, p->dict + p->dict_pos,
+                                           &out_bytes, TINFL_FLAG_HAS_MORE_INPUT);
+    data += in_bytes;
+    len -= in_bytes;
+    if (out_bytes > 0)
+    {
+      int rc = process(p, p->dict + p->dict_pos, out_bytes);
+      if (rc != OTA_PATCH_OK)
+      {
+        return rc;
+      }
+      p->dict_pos = (uint32_t)((p->dict_pos + out_bytes) & (p->dict_size - 1));
+    }
+    if (status == TINFL_STATUS_DONE)
+    {
+      p->stream_done = 1;
+      return len ? OTA_PATCH_ERR_CORRUPT : OTA_PATCH_OK;
+    }
+    if (status < TINFL_STATUS_DONE)
+    {
+      return OTA_PATCH_ERR_CORRUPT;
+    }
+    if (status == TINFL_STATUS_NEEDS_MORE_INPUT && len == 0)
+    {
+      return OTA_PATCH_OK;
+    }
+  }
+#elif defined(OTA_PATCH_USE_ZLIB)
+  p->zs.next_in = (Bytef *)data;
+  p->zs.avail_in = (uInt)len;
+  do
+  {
+    p->zs.next_out = p->dict;
+    p->zs.avail_out = p->dict_size;
+    int ret = inflate(&p->zs, Z_NO_FLUSH);
+    if (ret == Z_STREAM_END)
+    {
+      p->stream_done = 1;
+    }
+    else if (ret != Z_OK && ret != Z_BUF_ERROR)
+    {
+      return OTA_PATCH_ERR_CORRUPT;
+    }
+    int rc = process(p, p->dict, p->dict_size - p->zs.avail_out);
+    if (rc != OTA_PATCH_OK)
+    {
+      return rc;
+    }
+  } while (!p->stream_done && (p->zs.avail_in > 0 || p->zs.avail_out == 0));
+  return p->zs.avail_in ? OTA_PATCH_ERR_CORRUPT : OTA_PATCH_OK;
+#else
+  (void)data;
+  return OTA_PATCH_ERR_FORMAT;
+#endif
+}
+
+static int start_patch(ota_patch_t *p)
+{
+  const uint8_t *h = p->header;
+  uint8_t window_bits = h[6];
+  uint32_t old_crc = le32(&h[12]);
+  uint32_t crc = 0;
+
+  if (memcmp(h, "OTAD", 4) != 0 || h[4] != PATCH_VERSION || h[5] > COMPRESS_DEFLATE ||
+      window_bits < 9 || window_bits > 15)
+  {
+    return OTA_PATCH_ERR_FORMAT;
+  }
+#if !defined(OTA_PATCH_TINFL) && !defined(OTA_PATCH_USE_ZLIB)
+  if (h[5] == COMPRESS_DEFLATE)
+  {
+    return OTA_PATCH_ERR_FORMAT;
+  }
+#endif
+  p->compression = h[5];
+  p->old_size = le32(&h[8]);
+  p->new_size = le32(&h[16]);
+  p->new_crc = le32(&h[20]);
+
+  // The output buffer isn't used yet, check the old image through it
+  for (uint32_t pos = 0; pos < p->old_size; pos += OTA_PATCH_OUT_BUF_SIZE)
+  {
+    uint32_t n = p->old_size - pos < OTA_PATCH_OUT_BUF_SIZE ? p->old_size - pos : OTA_PATCH_OUT_BUF_SIZE;
+    if (p->read_old(p->user, pos, p->out_buf, n) != 0)
+    {
+      return OTA_PATCH_ERR_IO;
+    }
+    crc = patch_crc32(crc, p->out_buf, n);
+  }
+  if (crc != old_crc)
+  {
+    return OTA_PATCH_ERR_BASE;
+  }
+
+  if (p->compression == COMPRESS_DEFLATE)
+  {
+    p->dict_size = 1UL << window_bits;
+    p->dict = malloc(p->dict_size);
+    if (p->dict == NULL)
+    {
+      return OTA_PATCH_ERR_NO_MEM;
+    }
+#if defined(OTA_PATCH_TINFL)
+    tinfl_init(&p->inflator);
+#elif defined(OTA_PATCH_USE_ZLIB)
+    if (inflateInit2(&p->zs, -window_bits) != Z_OK)
+    {
+      return OTA_PATCH_ERR_NO_MEM;
+    }
+    p->zs_init = 1;
+#endif
+  }
+  return OTA_PATCH_OK;
+}
+
+int ota_patch_begin(ota_patch_t **patch, ota_patch_read_old_t read_old, ota_patch_write_new_t write_new,
+                    void *user)
+{
+  ota_patch_t *p;
+
+  if (patch == NULL || read_old == NULL || write_new == NULL)
+  {
+    return OTA_PATCH_ERR_ARG;
+  }
+  p = calloc(1, sizeof(*p));
+  if (p == NULL)
+  {
+    return OTA_PATCH_ERR_NO_MEM;
+  }
+  p->read_old = read_old;
+  p->write_new = write_new;
+  p->user = user;
+  p->state = STATE_CONTROL;
+  *patch = p;
+  return OTA_PATCH_OK;
+}
+
+int ota_patch_write(ota_patch_t *patch, const uint8_t *data, size_t len)
+{
+  int rc = OTA_PATCH_OK;
+
+  if (patch == NULL || (data == NULL && len > 0))
+  {
+    return OTA_PATCH_ERR_ARG;
+  }
+  if (patch->err != OTA_PATCH_OK)
+  {
+    return patch->err;
+  }
+
+  if (patch->header_len < OTA_PATCH_HEADER_LEN)
+  {
+    size_t n = OTA_PATCH_HEADER_LEN - patch->header_len;
+    if (n > len)
+    {
+      n = len;
+    }
+    memcpy(&patch->header[patch->header_len], data, n);
+    patch->header_len += n;
+    data += n;
+    len -= n;
+    if (patch->header_len == OTA_PATCH_HEADER_LEN)
+    {
+      rc = start_patch(patch);
+    }
+  }
+  if (rc == OTA_PATCH_OK && len > 0)
+  {
+    rc = patch->compression == COMPRESS_DEFLATE ? inflate_input(patch, data, len) : process(patch, data, len);
+  }
+  patch->err = rc;
+  return rc;
+}
+
+/* Flush the new image and check it, without freeing the patch */
+static int finish(ota_patch_t *p)
+{
+  int rc = p->err;
+
+  if (rc == OTA_PATCH_OK)
+  {
+    if (p->header_len < OTA_PATCH_HEADER_LEN || (p->compression == COMPRESS_DEFLATE && !p->stream_done) ||
+        p->state != STATE_CONTROL || p->field != 0 || p->shift != 0)
+    {
+      rc = OTA_PATCH_ERR_CORRUPT;
+    }
+    else
+    {
+      rc = flush_output(p);
+    }
+  }
+  if (rc == OTA_PATCH_OK && p->new_pos != p->new_size)
+  {
+    rc = OTA_PATCH_ERR_CORRUPT;
+  }
+  if (rc == OTA_PATCH_OK && p->crc != p->new_crc)
+  {
+    rc = OTA_PATCH_ERR_CRC;
+  }
+  p->err = rc;
+  return rc;
+}
+
+static void free_patch(ota_patch_t *p)
+{
+#if defined(OTA_PATCH_USE_ZLIB) && !defined(OTA_PATCH_TINFL)
+  if (p->zs_init)
+  {
+    inflateEnd(&p->zs);
+  }
+#endif
+  free(p->dict);
+  free(p);
+}
+
+int ota_patch_end(ota_patch_t *patch)
+{
+  int rc;
+
+  if (patch == NULL)
+  {
+    return OTA_PATCH_ERR_ARG;
+  }
+  rc = finish(patch);
+  free_patch(patch);
+  return rc;
+}
+
+void ota_patch_abort(ota_patch_t *patch)
+{
+  if (patch == NULL)
+  {
+    return;
+  }
+#ifdef ESP_PLATFORM
+  if (patch->ota_active)
+  {
+    esp_ota_abort(patch->ota_handle);
+  }
+#endif
+  free_patch(patch);
+}
+
+uint32_t ota_patch_new_size(const ota_patch_t *patch)
+{
+  return patch != NULL && patch->header_len == OTA_PATCH_HEADER_LEN ? patch->new_size : 0;
+}
+
+const char *ota_patch_err_to_name(int err)
+{
+  switch (err)
+  {
+    case OTA_PATCH_OK:            return "ok";
+    case OTA_PATCH_ERR_ARG:       return "invalid argument";
+    case OTA_PATCH_ERR_FORMAT:    return "not a supported OTA patch";
+    case OTA_PATCH_ERR_BASE:      return "patch made for another firmware";
+    case OTA_PATCH_ERR_CORRUPT:   return "damaged or truncated patch";
+    case OTA_PATCH_ERR_CRC:       return "CRC mismatch";
+    case OTA_PATCH_ERR_NO_MEM:    return "out of memory";
+    case OTA_PATCH_ERR_IO:        return "read or write error";
+    default:                      return "unknown error";
+  }
+}
+
+#ifdef ESP_PLATFORM
+
+static const char *TAG = "ota_patch";
+
+static int partition_read_old(void *user, uint32_t offset, uint8_t *buf, uint32_t len)
+{
+  ota_patch_t *p = user;
+  p->ota_err = esp_partition_read(p->running, offset, buf, len);
+  return p->ota_err == ESP_OK ? 0 : -1;
+}
+
+static int partition_write_new(void *user, const uint8_t *buf, uint32_t len)
+{
+  ota_patch_t *p = user;
+  p->ota_err = esp_ota_write(p->ota_handle, buf, len);
+  return p->ota_err == ESP_OK ? 0 : -1;
+}
+
+static esp_err_t to_esp_err(ota_patch_t *p, int err)
+{
+  switch (err)
+  {
+    case OTA_PATCH_OK:            return ESP_OK;
+    case OTA_PATCH_ERR_ARG:       return ESP_ERR_INVALID_ARG;
+    case OTA_PATCH_ERR_NO_MEM:    return ESP_ERR_NO_MEM;
+    case OTA_PATCH_ERR_CRC:       return ESP_ERR_INVALID_CRC;
+    case OTA_PATCH_ERR_BASE:      return ESP_ERR_INVALID_VERSION;
+    case OTA_PATCH_ERR_IO:        return p->ota_err != ESP_OK ? p->ota_err : ESP_FAIL;
+    default:                      return ESP_ERR_INVALID_RESPONSE;
+  }
+}
+
+esp_err_t ota_patch_ota_begin(ota_patch_t **patch)
+{
+  ota_patch_t *p;
+  esp_err_t err;
+  int rc;
+
+  if (patch == NULL)
+  {
+    return ESP_ERR_INVALID_ARG;
+  }
+  rc = ota_patch_begin(&p, partition_read_old, partition_write_new, NULL);
+  if (rc != OTA_PATCH_OK)
+  {
+    return rc == OTA_PATCH_ERR_NO_MEM ? ESP_ERR_NO_MEM : ESP_ERR_INVALID_ARG;
+  }
+  p->user = p;
+  p->running = esp_ota_get_running_partition();
+  p->update = esp_ota_get_next_update_partition(NULL);
+  if (p->running == NULL || p->update == NULL)
+  {
+    ESP_LOGE(TAG, "no OTA partition to write to");
+    free_patch(p);
+    return ESP_ERR_NOT_FOUND;
+  }
+  err = esp_ota_begin(p->update, OTA_WITH_SEQUENTIAL_WRITES, &p->ota_handle);
+  if (err != ESP_OK)
+  {
+    ESP_LOGE(TAG, "esp_ota_begin failed: %s", esp_err_to_name(err));
+    free_patch(p);
+    return err;
+  }
+  p->ota_active = 1;
+  ESP_LOGI(TAG, "patching %s into %s", p->running->label, p->update->label);
+  *patch = p;
+  return ESP_OK;
+}
+
+esp_err_t ota_patch_ota_write(ota_patch_t *patch, const void *data, size_t len)
+{
+  int rc;
+
+  if (patch == NULL)
+  {
+    return ESP_ERR_INVALID_ARG;
+  }
+  rc = ota_patch_write(patch, data, len);
+  if (rc != OTA_PATCH_OK)
+  {
+    ESP_LOGE(TAG, "%s", ota_patch_err_to_name(rc));
+  }
+  return to_esp_err(patch, rc);
+}
+
+esp_err_t ota_patch_ota_end(ota_patch_t *patch)
+{
+  esp_err_t err;
+  int rc;
+
+  if (patch == NULL || !patch->ota_active)
+  {
+    return ESP_ERR_INVALID_ARG;
+  }
+  rc = finish(patch);
+  if (rc != OTA_PATCH_OK)
+  {
+    err = to_esp_err(patch, rc);
+    ESP_LOGE(TAG, "%s", ota_patch_err_to_name(rc));
+    ota_patch_abort(patch);
+    return err;
+  }
+
+  // esp_ota_end() validates the app image and its SHA-256
+  err = esp_ota_end(patch->ota_handle);
+  if (err == ESP_OK)
+  {
+    err = esp_ota_set_boot_partition(patch->update);
+  }
+  if (err != ESP_OK)
+  {
+    ESP_LOGE(TAG, "finishing the OTA failed: %s", esp_err_to_name(err));
+  }
+  else
+  {
+    ESP_LOGI(TAG, "%lu bytes written to %s", (unsigned long)patch->new_size, patch->update->label);
+  }
+  free_patch(patch);
+  return err;
+}
+
+#endif
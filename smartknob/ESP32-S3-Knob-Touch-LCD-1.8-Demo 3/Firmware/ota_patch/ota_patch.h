@@ -0,0 +1,78 @@
+#ifndef OTA_PATCH_H
+#define OTA_PATCH_H
+
+/*
+ * Applies the OTA patches made by Firmware/ota_delta.py while they're
+ * downloaded: the new app is rebuilt from the running one and written out
+ * block by block, so the memory needed doesn't depend on the image size
+ * (the deflate window of the patch, 4 KB by default, the decompressor state
+ * and OTA_PATCH_OUT_BUF_SIZE + OTA_PATCH_OLD_CHUNK_SIZE bytes).
+ *
+ *   ota_patch_t *patch;
+ *   ota_patch_ota_begin(&patch);                 // or ota_patch_begin() with your own callbacks
+ *   while (received = http_read(buf, sizeof(buf)))
+ *     ota_patch_ota_write(patch, buf, received);
+ *   ota_patch_ota_end(patch);                    // checks the image, sets it as boot partition
+ */
+
+#include <stddef.h>
+#include <stdint.h>
+
+#ifdef ESP_PLATFORM
+#include "esp_err.h"
+#endif
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+#define OTA_PATCH_HEADER_LEN        24
+
+#ifndef OTA_PATCH_OUT_BUF_SIZE
+#define OTA_PATCH_OUT_BUF_SIZE      4096    // new image bytes written at once, one flash sector
+#endif
+#ifndef OTA_PATCH_OLD_CHUNK_SIZE
+#define OTA_PATCH_OLD_CHUNK_SIZE    512     // old image bytes read at once
+#endif
+
+#define OTA_PATCH_OK                0
+#define OTA_PATCH_ERR_ARG           -1      // NULL pointer or call after an error
+#define OTA_PATCH_ERR_FORMAT        -2      // not an OTA patch, or an unsupported compression
+#define OTA_PATCH_ERR_BASE          -3      // the patch was made for another old image
+#define OTA_PATCH_ERR_CORRUPT       -4      // damaged or truncated patch
+#define OTA_PATCH_ERR_CRC           -5      // the rebuilt image doesn't match the patch
+#define OTA_PATCH_ERR_NO_MEM        -6
+#define OTA_PATCH_ERR_IO            -7      // a callback failed
+
+/* Read `len` bytes of the old image at `offset`, return 0 on success */
+typedef int (*ota_patch_read_old_t)(void *user, uint32_t offset, uint8_t *buf, uint32_t len);
+/* Write the next `len` bytes of the new image, return 0 on success */
+typedef int (*ota_patch_write_new_t)(void *user, const uint8_t *buf, uint32_t len);
+
+typedef struct ota_patch ota_patch_t;
+
+int ota_patch_begin(ota_patch_t **patch, ota_patch_read_old_t read_old, ota_patch_write_new_t write_new,
+                    void *user);
+/* Feed the next bytes of the patch, in pieces of any size */
+int ota_patch_write(ota_patch_t *patch, const uint8_t *data, size_t len);
+/* Check that the whole patch was received and the new image is the expected one, free `patch` */
+int ota_patch_end(ota_patch_t *patch);
+void ota_patch_abort(ota_patch_t *patch);
+
+/* Size of the new image, 0 until the header was received */
+uint32_t ota_patch_new_size(const ota_patch_t *patch);
+const char *ota_patch_err_to_name(int err);
+
+#ifdef ESP_PLATFORM
+/* Patch the running app into the next OTA partition */
+esp_err_t ota_patch_ota_begin(ota_patch_t **patch);
+esp_err_t ota_patch_ota_write(ota_patch_t *patch, const void *data, size_t len);
+/* Finish the OTA and make the new app the boot partition */
+esp_err_t ota_patch_ota_end(ota_patch_t *patch);
+#endif
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif
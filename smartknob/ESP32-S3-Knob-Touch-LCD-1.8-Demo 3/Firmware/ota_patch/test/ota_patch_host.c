@@ -0,0 +1,130 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include "ota_patch.h"
+
+/*
+ * Host driver of ota_patch.c for test_ota_patch.py:
+ *
+ *   ota_patch_host OLD PATCH NEW CHUNK...
+ *
+ * feeds PATCH to ota_patch_write() in pieces of the CHUNK sizes (used in
+ * turn), writes the rebuilt image to NEW and prints the result code and its
+ * name. A read outside of OLD aborts: the applier has to check the entries.
+ */
+
+typedef struct
+{
+  uint8_t *old;
+  uint32_t old_size;
+  uint8_t *new_data;
+  uint32_t new_len;
+  uint32_t new_cap;
+} image_t;
+
+static uint8_t *read_file(const char *path, uint32_t *size)
+{
+  FILE *f = fopen(path, "rb");
+  uint8_t *data;
+  long len;
+
+  if (f == NULL || fseek(f, 0, SEEK_END) != 0 || (len = ftell(f)) < 0 || fseek(f, 0, SEEK_SET) != 0)
+  {
+    perror(path);
+    exit(2);
+  }
+  data = malloc(len ? (size_t)len : 1);
+  if (data == NULL || fread(data, 1, (size_t)len, f) != (size_t)len)
+  {
+    perror(path);
+    exit(2);
+  }
+  fclose(f);
+  *size = (uint32_t)len;
+  return data;
+}
+
+static int read_old(void *user, uint32_t offset, uint8_t *buf, uint32_t len)
+{
+  image_t *image = user;
+
+  if (offset > image->old_size || len > image->old_size - offset)
+  {
+    fprintf(stderr, "read of %u bytes at %u, outside of the old image\n", (unsigned)len, (unsigned)offset);
+    abort();
+  }
+  memcpy(buf, image->old + offset, len);
+  return 0;
+}
+
+static int write_new(void *user, const uint8_t *buf, uint32_t len)
+{
+  image_t *image = user;
+
+  if (image->new_len + len > image->new_cap)
+  {
+    image->new_cap = (image->new_len + len) * 2;
+    image->new_data = realloc(image->new_data, image->new_cap);
+    if (image->new_data == NULL)
+    {
+      return -1;
+    }
+  }
+  memcpy(image->new_data + image->new_len, buf, len);
+  image->new_len += len;
+  return 0;
+}
+
+int main(int argc, char **argv)
+{
+  image_t image = {0};
+  ota_patch_t *patch = NULL;
+  uint8_t *data;
+  uint32_t size;
+  uint32_t pos = 0;
+  int chunk = 0;
+  int rc;
+  FILE *out;
+
+  if (argc < 5)
+  {
+    fprintf(stderr, "usage: %s OLD PATCH NEW CHUNK...\n", argv[0]);
+    return 2;
+  }
+  image.old = read_file(argv[1], &image.old_size);
+  data = read_file(argv[2], &size);
+
+  rc = ota_patch_begin(&patch, read_old, write_new, &image);
+  while (rc == OTA_PATCH_OK && pos < size)
+  {
+    uint32_t n = (uint32_t)atoi(argv[4 + chunk]);
+    chunk = (chunk + 1) % (argc - 4);
+    if (n > size - pos)
+    {
+      n = size - pos;
+    }
+    rc = ota_patch_write(patch, data + pos, n);
+    pos += n;
+  }
+  if (rc == OTA_PATCH_OK)
+  {
+    rc = ota_patch_end(patch);
+  }
+  else
+  {
+    ota_patch_abort(patch);
+  }
+
+  out = fopen(argv[3], "wb");
+  if (out == NULL || (image.new_len && fwrite(image.new_data, 1, image.new_len, out) != image.new_len) ||
+      fclose(out) != 0)
+  {
+    perror(argv[3]);
+    return 2;
+  }
+  printf("%d %s\n", rc, ota_patch_err_to_name(rc));
+  free(image.old);
+  free(image.new_data);
+  free(data);
+  return 0;
+}
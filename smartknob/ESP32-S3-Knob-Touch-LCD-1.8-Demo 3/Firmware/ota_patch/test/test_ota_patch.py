@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+'''
+Host round trip of the OTA patches: Firmware/ota_delta.py makes them,
+ota_patch.c (built here with ota_patch_host.c) applies them
+
+    python3 -m pytest Firmware/ota_patch/test     (or python3 test_ota_patch.py)
+
+The applier is built once per inflate backend: zlib (-DOTA_PATCH_USE_ZLIB),
+none (uncompressed patches only) and, if MINIZ_DIR points to the miniz.c and
+miniz.h of a miniz release, the tinfl decoder the ESP32 ROM has
+(-DOTA_PATCH_USE_MINIZ). Every build uses AddressSanitizer and UBSan when
+the compiler has them. The patches are fed in pieces of 1, 7 and 4096 bytes
+and mixed sizes, damaged and truncated patches must fail cleanly.
+
+Dependencies: (PYTHON-3) numpy, a C compiler (CC, default cc), zlib
+'''
+
+import io
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+patch_dir = os.path.dirname(test_dir)
+firmware_dir = os.path.dirname(patch_dir)
+sys.path.insert(0, firmware_dir)
+
+import ota_delta  # noqa: E402
+
+CC = os.environ.get("CC", "cc")
+MINIZ_DIR = os.environ.get("MINIZ_DIR")
+SANITIZE = ["-fsanitize=address,undefined", "-fno-omit-frame-pointer"]
+CHUNKS = ((1,), (7,), (4096,), (1, 7, 4096, 3, 65536))
+
+OK = 0
+ERR_FORMAT = -2
+ERR_BASE = -3
+ERR_CORRUPT = -4
+ERR_CRC = -5
+
+
+def _build(out_dir, name, flags, sources=()):
+    '''Build ota_patch_host with `flags`, with the sanitizers if the compiler has them. Return its path.'''
+    exe = os.path.join(out_dir, name)
+    cmd = [CC, "-std=c99", "-O1", "-g", "-Wall", "-Wextra", "-I" + patch_dir, os.path.join(patch_dir, "ota_patch.c"),
+           os.path.join(test_dir, "ota_patch_host.c")] + list(sources) + flags + ["-o", exe]
+    if subprocess.run(cmd[:1] + SANITIZE + cmd[1:], capture_output=True).returncode != 0:
+        subprocess.run(cmd, check=True, capture_output=True)
+    return exe
+
+
+def _images(seed=1):
+    '''An old app image and a new one, like a release: code moved, addresses shifted, bytes added and removed.'''
+    rng = random.Random(seed)
+    words = [rng.randrange(0x3C000000, 0x3C040000) if rng.random() < 0.3 else rng.getrandbits(32)
+             for _ in range(24 * 1024)]
+    old = b"".join(w.to_bytes(4, "little") for w in words)
+    new = bytearray(old[:10000])
+    new += bytes(rng.getrandbits(8) for _ in range(777))
+    new += b"".join(((w + 0x40) & 0xFFFFFFFF).to_bytes(4, "little") for w in words[2500:15000])
+    new += old[70000:]
+    new[5:9] = b"v1.3"
+    return old, bytes(new)
+
+
+def _diff(old, new, **options):
+    out = io.BytesIO()
+    ota_delta.diff(old, new, out, **options)
+    return out.getvalue()
+
+
+@unittest.skipUnless(shutil.which(CC), "no C compiler (%s)" % CC)
+class TestOtaPatch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.builds = {
+            "zlib": _build(cls.tmp, "zlib", ["-DOTA_PATCH_USE_ZLIB", "-lz"]),
+            "none": _build(cls.tmp, "none", []),
+        }
+        if MINIZ_DIR:
+            cls.builds["tinfl"] = _build(cls.tmp, "tinfl", ["-DOTA_PATCH_USE_MINIZ", "-I" + MINIZ_DIR],
+                                         [os.path.join(MINIZ_DIR, "miniz.c")])
+        cls.old, cls.new = _images()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def apply(self, build, old, patch, chunks=(4096,)):
+        '''Return (result code, rebuilt image).'''
+        paths = [os.path.join(self.tmp, n) for n in ("old.bin", "patch.otad", "new.bin")]
+        for path, data in zip(paths, (old, patch)):
+            with open(path, "wb") as f:
+                f.write(data)
+        run = subprocess.run([self.builds[build]] + paths + [str(c) for c in chunks],
+                             capture_output=True, text=True, timeout=60)
+        self.assertEqual(run.returncode, 0, run.stderr)
+        self.assertEqual(run.stderr, "")
+        with open(paths[2], "rb") as f:
+            return int(run.stdout.split()[0]), f.read()
+
+    def compressing(self):
+        return [b for b in self.builds if b != "none"]
+
+    def test_round_trip(self):
+        for window_bits in (9, 12, 15):
+            patch = _diff(self.old, self.new, window_bits=window_bits)
+            for build in self.compressing():
+                for chunks in CHUNKS:
+                    with self.subTest(build=build, window_bits=window_bits, chunks=chunks):
+                        self.assertEqual(self.apply(build, self.old, patch, chunks), (OK, self.new))
+
+    def test_uncompressed(self):
+        patch = _diff(self.old, self.new, compression=ota_delta.COMPRESS_NONE)
+        for build in self.builds:
+            for chunks in CHUNKS:
+                with self.subTest(build=build, chunks=chunks):
+                    self.assertEqual(self.apply(build, self.old, patch, chunks), (OK, self.new))
+
+    def test_deflate_needs_a_backend(self):
+        self.assertEqual(self.apply("none", self.old, _diff(self.old, self.new))[0], ERR_FORMAT)
+
+    def test_edge_images(self):
+        for old, new in ((self.old, b""), (b"", self.new[:5000]), (self.old, self.old)):
+            patch = _diff(old, new)
+            for build in self.compressing():
+                with self.subTest(build=build, old=len(old), new=len(new)):
+                    self.assertEqual(self.apply(build, old, patch, (7,)), (OK, new))
+
+    def test_other_base(self):
+        patch = _diff(self.old, self.new)
+        old = bytearray(self.old)
+        old[1234] ^= 1
+        for build in self.compressing():
+            with self.subTest(build=build):
+                self.assertEqual(self.apply(build, bytes(old), patch)[0], ERR_BASE)
+
+    def test_not_a_patch(self):
+        for patch in (b"OTAD\x02" + bytes(19), b"PK\x03\x04" + bytes(40), b"OTAD\x01\x01\x08" + bytes(17)):
+            with self.subTest(patch=patch[:8]):
+                self.assertEqual(self.apply("zlib", self.old, patch)[0], ERR_FORMAT)
+
+    def test_truncated(self):
+        for compression in (ota_delta.COMPRESS_NONE, ota_delta.COMPRESS_DEFLATE):
+            patch = _diff(self.old, self.new, compression=compression)
+            for size in (10, ota_delta.HEADER.size, ota_delta.HEADER.size + 1, len(patch) // 2, len(patch) - 1):
+                for build in self.compressing():
+                    with self.subTest(compression=compression, size=size, build=build):
+                        self.assertEqual(self.apply(build, self.old, patch[:size], (7,))[0], ERR_CORRUPT)
+
+    def test_damaged(self):
+        rng = random.Random(2)
+        for compression in (ota_delta.COMPRESS_NONE, ota_delta.COMPRESS_DEFLATE):
+            patch = _diff(self.old, self.new, compression=compression)
+            for _ in range(12):
+                damaged = bytearray(patch)
+                pos = rng.randrange(ota_delta.HEADER.size, len(patch))
+                damaged[pos] ^= 1 << rng.randrange(8)
+                for build in self.compressing():
+                    with self.subTest(compression=compression, pos=pos, build=build):
+                        self.assertIn(self.apply(build, self.old, bytes(damaged), (1, 7, 4096))[0],
+                                      (ERR_CORRUPT, ERR_CRC))
+
+    def test_overlong_varint(self):
+        header = _diff(self.old, self.new, compression=ota_delta.COMPRESS_NONE)[:ota_delta.HEADER.size]
+        for varint in (b"\xff" * 5 + b"\x01", b"\xff" * 4 + b"\x10"):
+            with self.subTest(varint=varint):
+                self.assertEqual(self.apply("zlib", self.old, header + varint)[0], ERR_CORRUPT)
+
+    def test_trailing_data(self):
+        patch = _diff(self.old, self.new) + b"\0"
+        for build in self.compressing():
+            with self.subTest(build=build):
+                self.assertEqual(self.apply(build, self.old, patch)[0], ERR_CORRUPT)
+
+
+if __name__ == "__main__":
+    if not MINIZ_DIR:
+        print("MINIZ_DIR isn't set, the tinfl (ESP32 ROM) build isn't tested", file=sys.stderr)
+    unittest.main()